@@ -1,22 +1,38 @@
 import streamlit as st
 import google.generativeai as genai
-from datetime import datetime
+from datetime import datetime, timedelta
 import json
 import re
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Tuple
 import pandas as pd
 from io import StringIO
-import io
-import base64
-from tinydb import TinyDB, Query
 import os
 import hmac
 import time
-import PyPDF2
 
-import markdown2
-from weasyprint import HTML
-from gtts import gTTS
+from homeoclinic.analytics import AnalyticsJob, AnalyticsStore
+from homeoclinic.assets import data_uri, encode_background, publish_static
+from homeoclinic.chat_history import document_text
+from homeoclinic.consultation_state import ConsultationState, StatePublisher, open_state_store
+from homeoclinic.context_window import ContextWindow, estimate_content_tokens, estimate_tokens
+from homeoclinic.fakes import FakeStreamingModel, FakeTTSEngine
+from homeoclinic.export import (COMPRESSIONS, IMPORT_ERRORS, ExportCheckpoint, available_compressions, export_data,
+                                import_data, remove_stale_exports)
+from homeoclinic.gateway import LLMGateway
+from homeoclinic.images import ImagePart, ImagePipeline, ImageStore, attached_image_hashes, image_attachment
+from homeoclinic.ingest import DocumentIngestor, IngestLimits, document_context, is_supported
+from homeoclinic.journal import MessageJournal
+from homeoclinic.pdf_service import PDFRenderService, prescription_filename
+from homeoclinic.prescription_json import extract_prescription
+from homeoclinic.prompt_cache import GeminiContextCache, PromptPrefixCache
+from homeoclinic.render_cache import RenderCache, prescription_key
+from homeoclinic.repertory import DEFAULT_REPERTORY, Repertory
+from homeoclinic.rendering import format_prescription_table, generate_prescription_markdown
+from homeoclinic.storage import ConsultationFilter, ConsultationSummary, SessionSummary, StorageBackend, open_storage
+from homeoclinic.streaming import StreamAccumulator, consume_stream
+from homeoclinic.symptoms import DEFAULT_VOCABULARY, SymptomExtractor, record_mentions
+from homeoclinic.tts import TTSPrefetcher, TTSService, open_engine
+from homeoclinic.writebehind import WriteBehindQueue
 
 # Page configuration
 st.set_page_config(
@@ -26,11 +42,22 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
-def get_base64_of_bin_file(bin_file):
-    """Encodes a binary file to a base64 string."""
-    with open(bin_file, 'rb') as f:
-        data = f.read()
-    return base64.b64encode(data).decode()
+# The background is downscaled and re-encoded once per process. With
+# server.enableStaticServing it is served from ./static under a content-hashed name,
+# otherwise it is inlined as a (much smaller) data URI.
+BACKGROUND_MAX_WIDTH = int(os.environ.get("HOMEO_BACKGROUND_MAX_WIDTH", "1600"))
+BACKGROUND_FORMAT = os.environ.get("HOMEO_BACKGROUND_FORMAT", "webp")
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+
+@st.cache_resource
+def get_page_css(file_path: str, mtime: float) -> str:
+    """Build the page stylesheet once per process (mtime invalidates it when the image changes)"""
+    data, mime = encode_background(file_path, max_width=BACKGROUND_MAX_WIDTH, fmt=BACKGROUND_FORMAT)
+    if st.get_option("server.enableStaticServing"):
+        image_url = publish_static(data, mime, STATIC_DIR)
+    else:
+        image_url = data_uri(data, mime)
+    return build_page_css(image_url)
 
 def set_page_background_and_style(file_path):
     """Sets the background image and applies custom CSS styles."""
@@ -38,12 +65,16 @@ def set_page_background_and_style(file_path):
         st.error(f"Error: Background image not found at '{file_path}'.")
         return
 
-    base64_img = get_base64_of_bin_file(file_path)
+    # Streamlit drops elements that are not re-emitted, so the CSS is sent on every
+    # rerun; it is built once and only references the image by URL when served statically.
+    st.markdown(get_page_css(file_path, os.path.getmtime(file_path)), unsafe_allow_html=True)
 
+def build_page_css(image_url: str) -> str:
+    """Return the custom CSS with the given background image URL."""
     css_text = f'''
     <style>
     .stApp {{
-        background-image: url("data:image/png;base64,{base64_img}");
+        background-image: url("{image_url}");
         background-size: cover;
         background-position: center center;
         background-repeat: no-repeat;
@@ -304,68 +335,170 @@ def set_page_background_and_style(file_path):
     }}
     </style>
     '''
-    st.markdown(css_text, unsafe_allow_html=True)
-
-def extract_text_from_pdf(pdf_file):
-    """Extract text from PDF file."""
-    try:
-        pdf_reader = PyPDF2.PdfReader(pdf_file)
-        text = ""
-        for page in pdf_reader.pages:
-            text += page.extract_text() + "\n"
-        return text.strip()
-    except Exception as e:
-        return f"Error reading PDF: {str(e)}"
+    return css_text
 
 set_page_background_and_style("Gemini_Generated_Image_qaqiocqaqiocqaqi.png")
 
 # Database setup
-DB_PATH = "homeo_clinic.json"
-
-def init_database():
-    """Initialize TinyDB database"""
-    db = TinyDB(DB_PATH)
-    return db
-
-def get_sessions_table():
-    """Get sessions table"""
-    db = init_database()
-    return db.table('sessions')
-
-def get_consultations_table():
-    """Get consultations table"""
-    db = init_database()
-    return db.table('consultations')
+# DB_BACKEND selects the storage engine: "sqlite" (default) or the legacy "tinydb".
+# Migrate an existing TinyDB file with: python -m homeoclinic.migrate homeo_clinic.json homeo_clinic.db
+DB_BACKEND = os.environ.get("HOMEO_DB_BACKEND", "sqlite")
+DB_PATH = os.environ.get("HOMEO_DB_PATH", "homeo_clinic.db" if DB_BACKEND == "sqlite" else "homeo_clinic.json")
+# Incremental persistence appends new messages to a per-session journal instead of
+# rewriting the whole messages array on every save.
+INCREMENTAL_PERSISTENCE = os.environ.get("HOMEO_INCREMENTAL_PERSISTENCE", "1") == "1"
+JOURNAL_DIR = os.environ.get("HOMEO_JOURNAL_DIR", "homeo_clinic_journal")
+
+# Session saves are coalesced per session and written SAVE_DEBOUNCE_SECONDS later by a
+# background thread, so the repeated saves of one chat turn become a single write.
+SAVE_DEBOUNCE_SECONDS = float(os.environ.get("HOMEO_SAVE_DEBOUNCE_SECONDS", "0.5"))
+
+# Consultations shown per page of the history view
+HISTORY_PAGE_SIZE = int(os.environ.get("HOMEO_HISTORY_PAGE_SIZE", "20"))
+# Chat messages rendered at first; older ones are added this many at a time on request
+CHAT_WINDOW_SIZE = int(os.environ.get("HOMEO_CHAT_WINDOW", "30"))
+
+# When running several app replicas, set this so each consultation is also kept as one
+# versioned document (messages, summary checkpoint, prescription) in a store they share
+# and any process can serve any turn: sqlite:///<file on a shared volume> or
+# redis://host:6379/0. Empty (the default, a single replica) disables it.
+STATE_STORE_URL = os.environ.get("HOMEO_STATE_STORE", "")
+# Session ids accepted from the ?session= URL parameter
+SESSION_ID_PATTERN = re.compile(r'[A-Za-z0-9_-]{1,64}')
+
+@st.cache_resource
+def init_database() -> StorageBackend:
+    """Open the configured storage backend once per process"""
+    return open_storage(DB_BACKEND, DB_PATH)
+
+@st.cache_resource
+def get_state_publisher() -> Optional[StatePublisher]:
+    """Background writer to the shared consultation state store, once per process"""
+    if not STATE_STORE_URL:
+        return None
+    return StatePublisher(open_state_store(STATE_STORE_URL), delay=SAVE_DEBOUNCE_SECONDS)
+
+@st.cache_resource
+def get_message_journal() -> MessageJournal:
+    """Shared append-only message journal for this process"""
+    return MessageJournal(JOURNAL_DIR)
+
+@st.cache_resource
+def get_session_writer() -> WriteBehindQueue:
+    """Shared write-behind queue for session saves"""
+    storage = init_database()
+    journal = get_message_journal() if INCREMENTAL_PERSISTENCE else None
+
+    def persist_session(session_id: str, session_data: Dict):
+        if journal is not None:
+            # Only messages the journal hasn't seen are written; the session row keeps metadata
+            session_data = dict(session_data)
+            journal.sync(session_id, session_data.pop('messages'))
+        storage.save_session(session_data)
+
+    return WriteBehindQueue(persist_session, delay=SAVE_DEBOUNCE_SECONDS)
+
+# Symptoms are extracted from each patient message against this vocabulary
+# (canonical term<TAB>repertory chapter<TAB>synonyms separated by |).
+SYMPTOM_VOCABULARY = os.environ.get("HOMEO_SYMPTOM_VOCABULARY", DEFAULT_VOCABULARY)
+
+@st.cache_resource
+def get_symptom_extractor() -> SymptomExtractor:
+    """Compile the symptom vocabulary once per process"""
+    return SymptomExtractor.from_file(SYMPTOM_VOCABULARY)
+
+# Consultations are copied into month-partitioned Parquet under ANALYTICS_DIR by a
+# background job (every ANALYTICS_SYNC_SECONDS and right after each new consultation).
+ANALYTICS_DIR = os.environ.get("HOMEO_ANALYTICS_DIR", "homeo_clinic_analytics")
+ANALYTICS_SYNC_SECONDS = float(os.environ.get("HOMEO_ANALYTICS_SYNC_SECONDS", "300"))
+
+@st.cache_resource
+def get_analytics_store() -> AnalyticsStore:
+    """Shared columnar analytics store for this process"""
+    return AnalyticsStore(ANALYTICS_DIR)
+
+@st.cache_resource
+def get_analytics_job() -> Optional[AnalyticsJob]:
+    """Background sync into the analytics store; None when pyarrow is not installed"""
+    store = get_analytics_store()
+    if not store.available():
+        return None
+    return AnalyticsJob(store, init_database(), interval=ANALYTICS_SYNC_SECONDS)
 
 def save_session_to_db(session_id: str, messages: List[Dict], patient_info: Dict, symptoms: List[str], current_prescription: Dict = None):
-    """Save current session to database"""
-    sessions = get_sessions_table()
+    """Queue the current session for saving; duplicate saves in one turn are merged"""
     session_data = {
         'session_id': session_id,
-        'messages': messages,
+        'messages': list(messages),
         'current_prescription': current_prescription,
-        'patient_info': patient_info,
-        'symptoms_collected': symptoms,
+        'patient_info': dict(patient_info),
+        'symptoms_collected': list(symptoms),
         'last_updated': datetime.now().isoformat(),
         'message_count': len(messages)
     }
-    
-    SessionQuery = Query()
-    if sessions.search(SessionQuery.session_id == session_id):
-        sessions.update(session_data, SessionQuery.session_id == session_id)
+    get_session_writer().submit(session_id, session_data)
+    publish_consultation_state(session_data)
+
+def publish_consultation_state(session_data: Dict):
+    """Queue the consultation document for the shared state store"""
+    publisher = get_state_publisher()
+    if publisher is None:
+        return
+    publisher.publish(ConsultationState(
+        session_id=session_data['session_id'],
+        messages=session_data['messages'],
+        patient_info=session_data['patient_info'],
+        symptoms_collected=session_data['symptoms_collected'],
+        current_prescription=session_data['current_prescription'],
+        context=st.session_state.context_window.checkpoint_state(),
+        model={'name': MODEL_NAME, 'prompt_version': get_prompt_prefix_cache().key},
+    ))
+
+def apply_consultation_state(state: ConsultationState):
+    """Continue a consultation from its shared state document"""
+    st.session_state.messages = list(state.messages)
+    st.session_state.patient_info = dict(state.patient_info)
+    st.session_state.symptoms_collected = list(state.symptoms_collected)
+    st.session_state.current_prescription = state.current_prescription
+    st.session_state.prescription_generated = state.current_prescription is not None
+    # The chat session is rebuilt from the messages and the summary checkpoint when next needed
+    st.session_state.context_window = new_context_window().restore_checkpoint(state.context)
+    st.session_state.chat_session = None
+    st.session_state.image_hashes = attached_image_hashes(st.session_state.messages)
+
+def sync_consultation_state():
+    """Adopt the shared copy of this consultation when another process has saved a newer one"""
+    session_id = st.session_state.session_id
+    if st.query_params.get('session') != session_id:
+        st.query_params['session'] = session_id
+    publisher = get_state_publisher()
+    if publisher is None:
+        return
+    if st.session_state.get('state_session') != session_id:
+        # A new page, or a reconnect to this process, starts from the shared copy
+        st.session_state.state_session = session_id
+        state = publisher.current(session_id)
     else:
-        sessions.insert(session_data)
+        state = publisher.newer(session_id)
+    if state is not None:
+        apply_consultation_state(state)
+        if publisher.take_merged(session_id):
+            st.toast("This consultation was also continued elsewhere; both sets of messages were kept.")
 
 def load_session_from_db(session_id: str) -> Dict:
     """Load session from database"""
-    sessions = get_sessions_table()
-    SessionQuery = Query()
-    result = sessions.search(SessionQuery.session_id == session_id)
-    return result[0] if result else None
+    pending = get_session_writer().pending(session_id)
+    if pending is not None:
+        return dict(pending)
+    session = init_database().load_session(session_id)
+    if session and INCREMENTAL_PERSISTENCE:
+        journaled = get_message_journal().read(session_id)
+        if journaled is not None:
+            session['messages'] = journaled
+    return session
 
 def save_consultation_to_db(session_id: str, prescription: Dict, messages: List[Dict]):
-    """Save completed consultation to database"""
-    consultations = get_consultations_table()
+    """Save completed consultation to database; the search index is updated in the same transaction"""
     consultation_data = {
         'session_id': session_id,
         'date': datetime.now().isoformat(),
@@ -374,23 +507,47 @@ def save_consultation_to_db(session_id: str, prescription: Dict, messages: List[
         'chief_complaint': prescription.get('chief_complaint', 'N/A'),
         'diagnosis': prescription.get('diagnosis', 'N/A')
     }
-    consultations.insert(consultation_data)
+    init_database().save_consultation(consultation_data)
+    analytics_job = get_analytics_job()
+    if analytics_job is not None:
+        analytics_job.poke()
 
 def get_all_consultations() -> List[Dict]:
     """Get all consultations from database"""
-    consultations = get_consultations_table()
-    return consultations.all()
-
-def get_session_list() -> List[Dict]:
-    """Get list of all sessions"""
-    sessions = get_sessions_table()
-    return sessions.all()
+    return init_database().all_consultations()
+
+def pending_session_summaries() -> List[SessionSummary]:
+    """Session saves still queued in the write-behind writer"""
+    return [SessionSummary(data['session_id'], data.get('last_updated'), data.get('message_count', 0))
+            for data in get_session_writer().pending_items().values()]
+
+def get_database_stats() -> Dict[str, int]:
+    """Session, consultation and message totals from the aggregates, without reading any records"""
+    stats = dict(init_database().stats())
+    # Count this turn's queued saves on top, rather than waiting for them to be written
+    pending = pending_session_summaries()
+    if pending:
+        stored = init_database().session_summaries([s.session_id for s in pending])
+        for summary in pending:
+            previous = stored.get(summary.session_id)
+            stats['sessions'] = stats.get('sessions', 0) + (previous is None)
+            stats['messages'] = stats.get('messages', 0) + summary.message_count - (
+                previous.message_count if previous else 0)
+    return stats
+
+def get_recent_sessions(limit: int = 10) -> List[SessionSummary]:
+    """Most recently updated sessions (id, message count, last update) for the session picker"""
+    pending = {s.session_id: s for s in pending_session_summaries()}
+    stored = [s for s in init_database().recent_sessions(limit) if s.session_id not in pending]
+    return sorted(list(pending.values()) + stored, key=lambda s: s.last_updated or '', reverse=True)[:limit]
 
 # Initialize session state
 def initialize_session_state():
     """Initialize all session state variables"""
     if 'session_id' not in st.session_state:
-        st.session_state.session_id = datetime.now().strftime('%Y%m%d_%H%M%S_%f')
+        # The URL carries the session id, so reconnecting to any app process resumes the consultation
+        requested = st.query_params.get('session', '')
+        st.session_state.session_id = requested if SESSION_ID_PATTERN.fullmatch(requested) else datetime.now().strftime('%Y%m%d_%H%M%S_%f')
     
     if 'messages' not in st.session_state:
         st.session_state.messages = []
@@ -416,6 +573,9 @@ def initialize_session_state():
     if 'symptoms_collected' not in st.session_state:
         st.session_state.symptoms_collected = []
     
+    if 'chat_window' not in st.session_state:
+        st.session_state.chat_window = CHAT_WINDOW_SIZE
+
     if 'consultation_history' not in st.session_state:
         st.session_state.consultation_history = []
     
@@ -424,6 +584,9 @@ def initialize_session_state():
     
     if 'chat_session' not in st.session_state:
         st.session_state.chat_session = None
+
+    if 'context_window' not in st.session_state:
+        st.session_state.context_window = new_context_window()
     
     if 'processed_files' not in st.session_state:
         st.session_state.processed_files = set()
@@ -443,13 +606,20 @@ def initialize_session_state():
             st.session_state.patient_info = saved_session.get('patient_info', {})
             st.session_state.symptoms_collected = saved_session.get('symptoms_collected', [])
             st.session_state.current_prescription = saved_session.get('current_prescription', None)
+            st.session_state.image_hashes = attached_image_hashes(st.session_state.messages)
+
+    sync_consultation_state()
+
+# Run against a scripted local model, without an API key or network access
+USE_FAKE_LLM = os.environ.get("HOMEO_FAKE_LLM") == "1"
+# Stream replies into the chat pane as they are generated (0 waits for the full reply)
+STREAM_RESPONSES = os.environ.get("HOMEO_STREAM_RESPONSES", "1") == "1"
 
 # Configure Gemini API
 def configure_gemini():
-    """Configure Gemini API with the key from secrets"""
+    """Configure Gemini API with the key from secrets (once per process)"""
     try:
-        api_key = st.secrets["GEMINI_API_KEY"]
-        genai.configure(api_key=api_key)
+        get_llm_gateway()
         return True
     except Exception as e:
         st.error(f"Error configuring Gemini API: {str(e)}")
@@ -488,7 +658,7 @@ You read symptoms like data — patterns that reveal the language of the vital f
 
 ## 2. ADVANCED CASE ANALYSIS:
 **Repertorization & Remedy Selection**
-- Perform repertorization mentally, weighting rubrics by intensity and rarity.
+- Start from the local repertorization attached to patient messages (rubrics weighted by grade and rarity); confirm or refute its top remedies with keynotes instead of repertorizing again.
 - Integrate constitutional type, miasmatic background, and totality.
 - Identify rare and keynote symptoms that lead to specific remedies.
 - Compare similar remedies; clarify subtle distinctions with precision.
@@ -573,244 +743,273 @@ Prioritize truth, clarity, and effectiveness.
 
 
 
-def initialize_chat_model():
-    """Initialize the chat model and start a persistent chat session"""
-    if st.session_state.chat_model is None:
-        st.session_state.chat_model = genai.GenerativeModel('gemma-3-27b-it')
-
-        # Start chat with system prompt
-        st.session_state.chat_session = st.session_state.chat_model.start_chat(
-            history=[
-                {"role": "user", "parts": [SYSTEM_PROMPT]},
-                {"role": "model", "parts": ["I understand. I am Dr. Elysian. My purpose is to perceive the root of disharmony and guide you back to a state of complete well-being. I will remember all that you share. I am ready to begin."]}
-            ]
-        )
+MODEL_NAME = 'gemma-3-27b-it'
 
-def get_ai_response(user_message: str) -> str:
-    """Get response from Gemini AI using persistent chat session"""
-    try:
-        if st.session_state.chat_session is None:
-            initialize_chat_model()
-        
-        # Send message in the ongoing chat session
-        response = st.session_state.chat_session.send_message(user_message)
-        
-        return response.text
-    except Exception as e:
-        return f"I apologize, but I encountered an error: {str(e)}. Please try again."
+SYSTEM_ACKNOWLEDGEMENT = "I understand. I am Dr. Elysian. My purpose is to perceive the root of disharmony and guide you back to a state of complete well-being. I will remember all that you share. I am ready to begin."
 
-def extract_prescription_json(text: str) -> Dict[str, Any]:
-    """Extract JSON prescription from AI response"""
-    try:
-        # Find JSON block in the text
-        json_match = re.search(r'\{[\s\S]*\}', text)
-        if json_match:
-            json_str = json_match.group()
-            return json.loads(json_str)
-        return None
-    except Exception as e:
-        st.error(f"Error parsing prescription: {str(e)}")
-        return None
-
-def format_prescription_table(prescription: Dict) -> pd.DataFrame:
-    """Format prescription as a beautiful DataFrame"""
-    remedies = prescription.get('remedies', [])
-    
-    df_data = []
-    for i, remedy in enumerate(remedies, 1):
-        df_data.append({
-            'S.No': i,
-            'Medicine': remedy.get('medicine', ''),
-            'Potency': remedy.get('potency', ''),
-            'Dosage': remedy.get('dosage', ''),
-            'Instructions': remedy.get('instructions', ''),
-            'Purpose': remedy.get('purpose', ''),
-            'Keynote Match': remedy.get('keynote_match', ''), # New column
-            'Sphere of Action': remedy.get('sphere_of_action', '') # New column (placeholder for future AI output)
-        })
-    
-    return pd.DataFrame(df_data)
-
-def generate_prescription_markdown(prescription: Dict) -> str:
-    """Generate beautiful markdown prescription"""
-    md = f"""# 🌿 HomeoClinic AI - Prescription
-
----
-
-## Patient Information
-- **Date**: {prescription.get('date', datetime.now().strftime('%Y-%m-%d'))}
-- **Patient**: {prescription.get('patient_name', 'Patient')}
-- **Chief Complaint**: {prescription.get('chief_complaint', 'N/A')}
-
----
+# Once the estimated chat history exceeds CONTEXT_TOKEN_BUDGET tokens, all but the last
+# CONTEXT_KEEP_RECENT_TURNS turns are folded into a structured case summary.
+CONTEXT_TOKEN_BUDGET = int(os.environ.get("HOMEO_CONTEXT_TOKEN_BUDGET", "6000"))
+CONTEXT_KEEP_RECENT_TURNS = int(os.environ.get("HOMEO_CONTEXT_KEEP_RECENT_TURNS", "6"))
 
-## Homeopathic Diagnosis
-{prescription.get('diagnosis', 'Based on symptoms presented')}
+# The system prompt and acknowledgement turns are registered once per process. With
+# CONTEXT_CACHE the prefix is uploaded as Gemini cached content (kept CONTEXT_CACHE_TTL
+# seconds); otherwise, or if the model does not support it, chats share a local copy
+# whose exact token count is kept in PROMPT_CACHE_PATH per prompt version.
+CONTEXT_CACHE = os.environ.get("HOMEO_CONTEXT_CACHE", "1") == "1"
+CONTEXT_CACHE_TTL = float(os.environ.get("HOMEO_CONTEXT_CACHE_TTL", "3600"))
+PROMPT_CACHE_PATH = os.environ.get("HOMEO_PROMPT_CACHE_PATH", "homeo_clinic_prompt_cache.json")
 
----
-
-## Prescribed Remedies
-
-"""
-    
-    remedies = prescription.get('remedies', [])
-    for i, remedy in enumerate(remedies, 1):
-        md += f"""### {i}. {remedy.get('medicine', '')} - {remedy.get('potency', '')}
-
-- **Dosage**: {remedy.get('dosage', '')}
-- **Instructions**: {remedy.get('instructions', '')}
-- **Keynote Match**: {remedy.get('keynote_match', 'N/A')}
-- **Sphere of Action**: {remedy.get('sphere_of_action', 'N/A')}
-- **Purpose**: {remedy.get('purpose', '')}
-
-"""
-    
-    md += """---
-
-## Dietary Advice
-
-"""
-    for advice in prescription.get('dietary_advice', []):
-        md += f"- {advice}\n"
-    
-    md += """
----
-
-## Lifestyle Recommendations
-
-"""
-    for rec in prescription.get('lifestyle_recommendations', []):
-        md += f"- {rec}\n"
-    
-    md += f"""
----
-
-## Important Precautions
-
-"""
-    for precaution in prescription.get('precautions', []):
-        md += f"- {precaution}\n"
-    
-    md += f"""
----
+@st.cache_resource
+def get_prompt_prefix_cache() -> PromptPrefixCache:
+    """Shared cache of the static chat prefix for this process"""
+    if USE_FAKE_LLM:
+        return PromptPrefixCache(MODEL_NAME, SYSTEM_PROMPT, SYSTEM_ACKNOWLEDGEMENT)
+    return PromptPrefixCache(
+        MODEL_NAME, SYSTEM_PROMPT, SYSTEM_ACKNOWLEDGEMENT,
+        path=PROMPT_CACHE_PATH or None,
+        backend=GeminiContextCache() if CONTEXT_CACHE else None,
+        ttl=CONTEXT_CACHE_TTL,
+        count_tokens=lambda history: get_llm_gateway().model.count_tokens(history).total_tokens
+    )
 
-## Follow-Up
-{prescription.get('follow_up', 'Please follow up after 2 weeks or if symptoms worsen')}
+def new_context_window() -> ContextWindow:
+    """Create an empty context window for a consultation"""
+    return ContextWindow(SYSTEM_PROMPT, SYSTEM_ACKNOWLEDGEMENT, token_budget=CONTEXT_TOKEN_BUDGET, keep_recent_turns=CONTEXT_KEEP_RECENT_TURNS,
+                         prefix_cache=get_prompt_prefix_cache(), load_image=get_image_store().load_part)
+
+def prior_messages() -> List[Dict]:
+    """Messages already in the chat history, excluding a trailing user message about to be sent"""
+    messages = st.session_state.messages
+    if messages and messages[-1]['role'] == 'user':
+        return messages[:-1]
+    return messages
+
+# All model calls in this process share one gateway: at most LLM_MAX_CONCURRENCY requests
+# in flight, LLM_REQUEST_TIMEOUT seconds per attempt and LLM_MAX_RETRIES retries with backoff.
+LLM_MAX_CONCURRENCY = int(os.environ.get("HOMEO_LLM_MAX_CONCURRENCY", "8"))
+LLM_REQUEST_TIMEOUT = float(os.environ.get("HOMEO_LLM_REQUEST_TIMEOUT", "60"))
+LLM_MAX_RETRIES = int(os.environ.get("HOMEO_LLM_MAX_RETRIES", "3"))
+
+@st.cache_resource
+def get_llm_gateway() -> LLMGateway:
+    """Configure the provider once per process and return the shared model gateway"""
+    if USE_FAKE_LLM:
+        model = FakeStreamingModel(MODEL_NAME)
+    else:
+        genai.configure(api_key=st.secrets["GEMINI_API_KEY"])
+        model = genai.GenerativeModel(MODEL_NAME)
+    return LLMGateway(
+        model,
+        max_concurrency=LLM_MAX_CONCURRENCY,
+        max_retries=LLM_MAX_RETRIES,
+        request_timeout=LLM_REQUEST_TIMEOUT
+    )
 
----
+def create_chat_model():
+    """Return the process-wide generative model (or the offline fake)"""
+    return get_llm_gateway().model
 
-### Disclaimer
-*This prescription is generated by HomeoClinic AI based on homeopathic principles. For serious or persistent symptoms, please consult a qualified healthcare professional. Homeopathy should complement, not replace, conventional medical treatment when necessary.*
+def initialize_chat_model():
+    """Initialize the chat model and start a persistent chat session"""
+    if st.session_state.chat_model is None:
+        st.session_state.chat_model = create_chat_model()
 
----
+        # Start chat with system prompt plus any stored conversation
+        st.session_state.chat_session = st.session_state.context_window.start_chat(
+            st.session_state.chat_model,
+            prior_messages()
+        )
 
-**Generated by HomeoClinic AI** | *Your Virtual Homeopathy Doctor*
-"""
-    
-    return md
+def prepare_chat_session():
+    """Make sure a chat session exists and checkpoint it if over the token budget"""
+    if st.session_state.chat_session is None:
+        if st.session_state.chat_model is None:
+            initialize_chat_model()
+        else:
+            st.session_state.chat_session = st.session_state.context_window.start_chat(
+                st.session_state.chat_model, prior_messages()
+            )
 
-def generate_prescription_pdf(prescription: Dict) -> bytes:
-    """Generate a beautiful PDF prescription from the markdown content."""
-    md_content = generate_prescription_markdown(prescription)
+    # Fold older turns into the case summary once the history outgrows the token budget
+    context_window = st.session_state.context_window
+    if context_window.prefix_cache is not None:
+        context_window.prefix_cache.keep_alive()
+    history_messages = prior_messages()
+    checkpointed = context_window.needs_checkpoint(history_messages)
+    if checkpointed:
+        st.session_state.chat_session = context_window.start_chat(st.session_state.chat_model, history_messages)
+    return history_messages, checkpointed
+
+def message_content(user_message: str, images: Optional[List[Dict]] = None):
+    """The text message, followed by any inline image parts"""
+    return [user_message, *images] if images else user_message
+
+def get_ai_response(user_message: str, images: Optional[List[Dict]] = None) -> str:
+    """Get response from Gemini AI using persistent chat session"""
+    try:
+        history_messages, checkpointed = prepare_chat_session()
 
-    # Convert markdown to HTML
-    # Using extras for better table and code block rendering if they were ever in the markdown
-    html_body = markdown2.markdown(md_content, extras=["fenced-code-blocks", "tables"])
+        # Send message in the ongoing chat session, recording tokens and latency
+        chat_session = st.session_state.chat_session
+        response = st.session_state.context_window.timed_send(
+            chat_session, message_content(user_message, images), history_messages, checkpointed=checkpointed,
+            send=lambda message: get_llm_gateway().send_message(chat_session, message)
+        )
 
-    # Embed CSS for styling the PDF
-    # Taking inspiration from the existing CSS for consistency and adding print-specific styles
-    pdf_css = """
-    <style>
-        @page { size: A4; margin: 1cm; }
-        body { font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif; line-height: 1.6; color: #333; font-size: 11pt; }
-        h1, h2, h3, h4, h5, h6 { color: #667eea; margin-top: 1.5em; margin-bottom: 0.5em; page-break-after: avoid; }
-        h1 { font-size: 2.2em; text-align: center; border-bottom: 2px solid #764ba2; padding-bottom: 0.5em; color: #764ba2; }
-        h2 { font-size: 1.8em; color: #764ba2; }
-        h3 { font-size: 1.4em; color: #667eea; }
-        p { margin-bottom: 1em; }
-        ul { list-style-type: disc; margin-left: 20px; margin-bottom: 1em; }
-        li { margin-bottom: 0.5em; }
-        strong { font-weight: bold; }
-        em { font-style: italic; }
-        .prescription-card {
-            background: #f9f9f9;
-            border: 1px solid #eee;
-            padding: 1.5rem;
-            border-radius: 8px;
-            margin: 1.5rem 0;
-            box-shadow: 0 2px 4px rgba(0, 0, 0, 0.05);
-        }
-        .prescription-header {
-            text-align: center;
-            color: #667eea;
-            border-bottom: 2px solid #764ba2;
-            padding-bottom: 1rem;
-            margin-bottom: 1.5rem;
-        }
-        table {
-            width: 100%;
-            border-collapse: collapse;
-            margin-bottom: 1em;
-            page-break-inside: auto;
-        }
-        tr { page-break-inside: avoid; page-break-after: auto; }
-        th, td {
-            border: 1px solid #ddd;
-            padding: 8px;
-            text-align: left;
-            vertical-align: top;
-        }
-        th {
-            background-color: #f2f2f2;
-            color: #333;
-            font-weight: bold;
-        }
-        .warning-box {
-            background-color: #fff3cd;
-            border-left: 4px solid #ffc107;
-            padding: 1em;
-            margin: 1em 0;
-            border-radius: 4px;
-            color: #856404;
-        }
-        .info-box {
-            background-color: #d4edda;
-            border-left: 4px solid #28a745;
-            padding: 1em;
-            margin: 1em 0;
-            border-radius: 4px;
-            color: #155724;
-        }
-        a { color: #667eea; text-decoration: none; }
-        a:hover { text-decoration: underline; }
-    </style>
-    """
+        return response.text
+    except Exception as e:
+        return f"I apologize, but I encountered an error: {str(e)}. Please try again."
 
-    # Combine CSS and HTML content
-    final_html = f"<!DOCTYPE html><html><head><meta charset='utf-8'>{pdf_css}</head><body>{html_body}</body></html>"
+def stream_ai_response(user_message: str, images: Optional[List[Dict]] = None) -> StreamAccumulator:
+    """Stream the reply into the chat pane as it is generated and return the accumulated result"""
+    placeholder = st.empty()
 
-    # Generate PDF
-    pdf_bytes = HTML(string=final_html).write_pdf()
-    return pdf_bytes
+    def render(accumulator: StreamAccumulator):
+        status = "<br><em>Preparing your prescription...</em>" if accumulator.prescription_ready else " ▌"
+        placeholder.markdown(f"""
+        <div class="chat-message assistant-message">
+            <div class="message-role">🩺 Dr. Elysian</div>
+            <div class="message-content">{accumulator.visible_text}{status}</div>
+        </div>
+        """, unsafe_allow_html=True)
 
-def text_to_speech(text: str) -> bytes:
-    """Converts text to speech using gTTS and returns audio bytes."""
-    # Clean up text for TTS. Remove markdown characters that might be read aloud.
-    cleaned_text = re.sub(r'[\*#]', '', text)
-    if not cleaned_text.strip():
-        return None
-    
+    history_messages = prior_messages()
     try:
-        tts = gTTS(text=cleaned_text, lang='en', slow=False)
-        fp = io.BytesIO()
-        tts.write_to_fp(fp)
-        fp.seek(0)
-        return fp.read()
+        history_messages, checkpointed = prepare_chat_session()
+        started = time.perf_counter()
+        content = message_content(user_message, images)
+        stream = get_llm_gateway().stream_message(st.session_state.chat_session, content)
+        accumulator, metrics = consume_stream(stream, on_update=render, started_at=started, estimate_tokens=estimate_tokens)
+        usage = getattr(stream, 'usage_metadata', None)
+        st.session_state.context_window.record_turn(
+            history_messages,
+            prompt_tokens=getattr(usage, 'prompt_token_count', 0) or estimate_content_tokens(content),
+            response_tokens=metrics.response_tokens,
+            latency_s=metrics.total_s,
+            checkpointed=checkpointed,
+            ttft_s=metrics.ttft_s,
+            tokens_per_s=metrics.tokens_per_s,
+            cached_tokens=st.session_state.context_window.cached_tokens(usage),
+        )
     except Exception as e:
-        # Log the error for debugging but don't show a warning to the user
-        # This prevents the app from breaking if the TTS service fails.
-        print(f"gTTS Error: {e}")
+        # A broken stream leaves the chat session mid-turn; rebuild it from the stored messages
+        if st.session_state.chat_model is not None:
+            st.session_state.chat_session = st.session_state.context_window.start_chat(
+                st.session_state.chat_model, history_messages
+            )
+        accumulator = StreamAccumulator()
+        accumulator.feed(f"I apologize, but I encountered an error: {str(e)}. Please try again.")
+    placeholder.empty()
+    return accumulator
+
+# The collected symptoms are scored against a local repertory and the REPERTORY_TOP_K best
+# remedies are attached to the next message sent to the model (only when the case changed).
+REPERTORY_PATH = os.environ.get("HOMEO_REPERTORY", DEFAULT_REPERTORY)
+REPERTORY_TOP_K = int(os.environ.get("HOMEO_REPERTORY_TOP_K", "5"))
+
+@st.cache_resource
+def get_repertory() -> Optional[Repertory]:
+    """Load the repertory once per process; None when disabled or scipy is not installed"""
+    if not REPERTORY_PATH or not Repertory.available():
         return None
+    return Repertory.from_file(REPERTORY_PATH)
+
+def with_repertory_shortlist(message_for_ai: str) -> str:
+    """Prefix the message with the remedy shortlist when the symptom case has changed since it was last sent"""
+    repertory = get_repertory()
+    if repertory is None:
+        return message_for_ai
+    findings = st.session_state.patient_info.get('symptoms', {})
+    # Repeated mentions raise a rubric's intensity (up to 3); older sessions only have the symptom list
+    case = {term: min(finding.get('mentions', 1), 3) for term, finding in findings.items()
+            if finding.get('status') == 'present'} or {term: 1 for term in st.session_state.symptoms_collected}
+    previous = st.session_state.patient_info.get('repertorization')
+    if not case or (previous and previous.get('case') == case):
+        return message_for_ai
+    shortlist = repertory.shortlist(case, k=REPERTORY_TOP_K)
+    if not shortlist.remedies:
+        return message_for_ai
+    # Kept with the session so the ranking behind a prescription can be audited
+    st.session_state.patient_info['repertorization'] = dict(shortlist.to_dict(), case=case)
+    return f"{shortlist.to_prompt()}\n\n{message_for_ai}"
+
+def respond_to_user(message_for_ai: str, spinner_text: str, images: Optional[List[Dict]] = None):
+    """Get the AI reply (streamed when enabled) and process it"""
+    message_for_ai = with_repertory_shortlist(message_for_ai)
+    if STREAM_RESPONSES:
+        reply = stream_ai_response(message_for_ai, images)
+        process_ai_response(reply.text, prescription=reply.prescription)
+    else:
+        with st.spinner(spinner_text):
+            response = get_ai_response(message_for_ai, images)
+            process_ai_response(response)
+
+def extract_prescription_json(text: str) -> Optional[Dict[str, Any]]:
+    """Extract, repair and validate the JSON prescription from an AI response"""
+    result = extract_prescription(text)
+    if result.prescription is None:
+        # Logged rather than shown: the reply is still displayed as a normal message
+        print(f"Prescription extraction failed: {'; '.join(result.errors)}")
+    return result.prescription
+
+# Text-to-speech: HOMEO_TTS_ENGINE is tried first, then HOMEO_TTS_FALLBACK (e.g. a local
+# espeak for offline use). Audio is cached by text hash in memory and under TTS_CACHE_DIR,
+# trimmed to TTS_CACHE_MAX_MB; long replies are split into TTS_CHUNK_CHARS chunks.
+TTS_ENGINE = os.environ.get("HOMEO_TTS_ENGINE", "gtts")
+TTS_FALLBACK_ENGINE = os.environ.get("HOMEO_TTS_FALLBACK", "espeak")
+TTS_CACHE_DIR = os.environ.get("HOMEO_TTS_CACHE_DIR", "homeo_clinic_tts")
+TTS_CACHE_MAX_MB = int(os.environ.get("HOMEO_TTS_CACHE_MAX_MB", "200"))
+TTS_CHUNK_CHARS = int(os.environ.get("HOMEO_TTS_CHUNK_CHARS", "400"))
+
+@st.cache_resource
+def get_tts_service() -> TTSService:
+    """Shared TTS service and audio cache for this process"""
+    if USE_FAKE_LLM:
+        engines = [FakeTTSEngine()]
+    else:
+        engines = [open_engine(TTS_ENGINE)]
+        if TTS_FALLBACK_ENGINE and TTS_FALLBACK_ENGINE != TTS_ENGINE:
+            fallback = open_engine(TTS_FALLBACK_ENGINE)
+            if fallback.available():
+                engines.append(fallback)
+    cache = RenderCache(max_entries=32, disk_dir=TTS_CACHE_DIR or None, max_disk_bytes=TTS_CACHE_MAX_MB * 1024 * 1024)
+    return TTSService(engines, cache=cache, max_chunk_chars=TTS_CHUNK_CHARS)
+
+# Opt-in: synthesize each new assistant reply in the background so 🔊 plays from the cache.
+# At most TTS_PREFETCH_WORKERS prefetch jobs run at once in this process.
+TTS_PREFETCH = os.environ.get("HOMEO_TTS_PREFETCH") == "1"
+TTS_PREFETCH_WORKERS = int(os.environ.get("HOMEO_TTS_PREFETCH_WORKERS", "2"))
+
+@st.cache_resource
+def get_tts_prefetcher() -> TTSPrefetcher:
+    """Shared background TTS prefetcher for this process"""
+    return TTSPrefetcher(get_tts_service(), max_concurrent=TTS_PREFETCH_WORKERS)
+
+def prefetch_latest_reply():
+    """Start synthesizing the newest assistant message when prefetching is enabled"""
+    if TTS_PREFETCH and st.session_state.messages and st.session_state.messages[-1]["role"] == "assistant":
+        get_tts_prefetcher().prefetch(st.session_state.session_id, st.session_state.messages[-1]["content"])
+
+def cancel_tts_prefetch():
+    """Cancel background synthesis for the session being left"""
+    if TTS_PREFETCH:
+        get_tts_prefetcher().cancel(st.session_state.session_id)
+
+def text_to_speech(text: str) -> Optional[Tuple[bytes, str]]:
+    """Converts text to speech and returns (audio bytes, mime type), or None on failure."""
+    if TTS_PREFETCH:
+        # Wait for a prefetch of this text instead of synthesizing it twice
+        future = get_tts_prefetcher().in_flight(text)
+        if future is not None:
+            try:
+                audio = future.result()
+            except Exception:
+                audio = None
+            if audio:
+                return audio
+    # Failures are logged by the service; the app keeps working without audio
+    return get_tts_service().synthesize(text)
 
 def login_page():
     """Displays the login page and handles authentication."""
@@ -851,6 +1050,18 @@ def login_page():
             except KeyError:
                 st.error("Application is not configured correctly. Password secret is missing.")
 
+@st.fragment
+def display_chat_messages():
+    """Display the most recent messages; older ones are loaded on demand without a full-page rerun"""
+    messages = st.session_state.messages
+    start = max(0, len(messages) - st.session_state.chat_window)
+    if start and st.button(f"⬆️ Show {min(start, CHAT_WINDOW_SIZE)} older messages ({start} hidden)",
+                           key="chat_load_older", use_container_width=True):
+        st.session_state.chat_window += CHAT_WINDOW_SIZE
+        start = max(0, len(messages) - st.session_state.chat_window)
+    for i in range(start, len(messages)):
+        display_chat_message(messages[i], i)
+
 def display_chat_message(message: Dict, message_key: int):
     """Display a chat message with appropriate styling and on-demand audio."""
     role = message["role"]
@@ -870,23 +1081,7 @@ def display_chat_message(message: Dict, message_key: int):
             <div class="message-content">{content}</div>
         </div>
         """, unsafe_allow_html=True)
-        
-        # Create columns for a button and an ephemeral audio player
-        button_col, audio_col = st.columns([1, 15])
-
-        with button_col:
-            # A unique key is crucial for each button in the loop
-            button_clicked = st.button("🔊", key=f"tts_{message_key}", help="Listen to this message")
-        
-        with audio_col:
-            # This placeholder will temporarily hold the audio player
-            audio_placeholder = st.empty()
-
-        if button_clicked:
-            with st.spinner("🎤 Generating audio..."):
-                audio_bytes = text_to_speech(content)
-            if audio_bytes:
-                audio_placeholder.audio(audio_bytes, format="audio/mp3", autoplay=True)
+        display_audio_control(content, message_key)
 
     else:
         st.markdown(f"""
@@ -896,6 +1091,27 @@ def display_chat_message(message: Dict, message_key: int):
         </div>
         """, unsafe_allow_html=True)
 
+@st.fragment
+def display_audio_control(content: str, message_key: int):
+    """Listen button for one message; clicking it reruns only this control"""
+    # Create columns for a button and an ephemeral audio player
+    button_col, audio_col = st.columns([1, 15])
+
+    with button_col:
+        # A unique key is crucial for each button in the loop
+        button_clicked = st.button("🔊", key=f"tts_{message_key}", help="Listen to this message")
+
+    with audio_col:
+        # This placeholder will temporarily hold the audio player
+        audio_placeholder = st.empty()
+
+    if button_clicked:
+        with st.spinner("🎤 Generating audio..."):
+            audio = text_to_speech(content)
+        if audio:
+            audio_bytes, mime = audio
+            audio_placeholder.audio(audio_bytes, format=mime, autoplay=True)
+
 def save_consultation_history(prescription: Dict):
     """Save consultation to history and database"""
     consultation_record = {
@@ -923,159 +1139,218 @@ def display_header():
     </div>
     """, unsafe_allow_html=True)
 
+@st.fragment
 def display_sidebar():
     """Display sidebar with information and statistics"""
-    with st.sidebar:
-        st.markdown("### 📊 Session Statistics")
-        
-        col1, col2 = st.columns(2)
-        with col1:
-            st.markdown(f"""
-            <div class="stat-card">
-                <div class="stat-value">{len(st.session_state.messages)}</div>
-                <div class="stat-label">Messages</div>
-            </div>
-            """, unsafe_allow_html=True)
-        
-        with col2:
-            st.markdown(f"""
-            <div class="stat-card">
-                <div class="stat-value">{len(st.session_state.symptoms_collected)}</div>
-                <div class="stat-label">Symptoms</div>
-            </div>
-            """, unsafe_allow_html=True)
-        
-        st.markdown("---")
-        
-        # Session management
-        st.markdown("### 💾 Session Management")
-        
-        col1, col2 = st.columns(2)
-        with col1:
-            if st.button("💾 Save", use_container_width=True):
-                save_session_to_db(
-                    st.session_state.session_id,
-                    st.session_state.messages,
-                    st.session_state.patient_info,
-                    st.session_state.symptoms_collected,
-                    st.session_state.current_prescription
-                )
-                st.success("Session saved!")
-        
-        with col2:
-            if st.button("🔄 New", use_container_width=True):
-                # Save current session before starting new
-                save_session_to_db(
-                    st.session_state.session_id,
-                    st.session_state.messages,
-                    st.session_state.patient_info,
-                    st.session_state.symptoms_collected,
-                    st.session_state.current_prescription
-                )
-                # Reset for new session
-                st.session_state.session_id = datetime.now().strftime('%Y%m%d_%H%M%S_%f')
-                st.session_state.messages = []
-                st.session_state.consultation_stage = 'initial'
-                st.session_state.prescription_generated = False
-                st.session_state.current_prescription = None
-                st.session_state.symptoms_collected = []
-                st.session_state.patient_info = {}
-                st.session_state.chat_session = None
-                st.session_state.chat_model = None
-                st.session_state.processed_files = set()
-                st.rerun()
-        
-        # Load previous sessions
-        st.markdown("### 📂 Previous Sessions")
-        sessions = get_session_list()
-        if sessions:
-            session_options = [f"{s['session_id']} ({s.get('message_count', 0)} msgs)" for s in reversed(sessions[-10:])]
-            selected = st.selectbox("Load Session:", ["Current"] + session_options, key="session_selector")
-            
-            if selected != "Current":
-                session_id = selected.split(" ")[0]
-                if st.button("📥 Load Selected", use_container_width=True):
-                    loaded = load_session_from_db(session_id)
-                    if loaded:
-                        st.session_state.session_id = session_id
-                        st.session_state.messages = loaded.get('messages', [])
-                        st.session_state.patient_info = loaded.get('patient_info', {})
-                        st.session_state.symptoms_collected = loaded.get('symptoms_collected', [])
-                        st.session_state.current_prescription = loaded.get('current_prescription', None)
-                        st.session_state.prescription_generated = st.session_state.current_prescription is not None
-                        st.session_state.chat_session = None
-                        st.session_state.chat_model = None
-                        st.session_state.processed_files = set()
-                        st.success(f"Loaded session: {session_id}")
-                        st.rerun()
-        
-        st.markdown("---")
-        
-        if st.button("📜 View All Consultations", use_container_width=True):
-            st.session_state.show_history = not st.session_state.get('show_history', False)
-            st.rerun()
-        
-        st.markdown("---")
-        
-        st.markdown("### ℹ️ About HomeoClinic AI")
-        st.markdown("""
-        **Features:**
-        - 💬 Interactive consultation
-        - 🧠 Persistent memory
-        - 💾 Auto-save to database
-        - 📥 Downloadable reports
-        - 📚 Complete history
-        """)
-        
-        st.markdown("---")
-        
-        st.markdown("### 🌟 Homeopathy Principles")
-        st.markdown("""
-        - **Like Cures Like**
-        - **Minimum Dose**
-        - **Individualization**
-        - **Holistic Approach**
-        """)
-        
-        st.markdown("---")
-        
+    st.markdown("### 📊 Session Statistics")
+
+    col1, col2 = st.columns(2)
+    with col1:
         st.markdown(f"""
-        <div class="info-box">
-            <small><strong>Session ID:</strong><br>{st.session_state.session_id[:20]}...</small>
+        <div class="stat-card">
+            <div class="stat-value">{len(st.session_state.messages)}</div>
+            <div class="stat-label">Messages</div>
         </div>
         """, unsafe_allow_html=True)
-        
-        st.markdown("""
-        <div class="warning-box">
-            <strong>⚠️ Disclaimer:</strong> AI consultation for informational purposes. 
-            Consult professionals for serious conditions.
+
+    with col2:
+        st.markdown(f"""
+        <div class="stat-card">
+            <div class="stat-value">{len(st.session_state.symptoms_collected)}</div>
+            <div class="stat-label">Symptoms</div>
         </div>
         """, unsafe_allow_html=True)
 
+    st.markdown("---")
+
+    # Session management
+    st.markdown("### 💾 Session Management")
+
+    col1, col2 = st.columns(2)
+    with col1:
+        if st.button("💾 Save", use_container_width=True):
+            save_session_to_db(
+                st.session_state.session_id,
+                st.session_state.messages,
+                st.session_state.patient_info,
+                st.session_state.symptoms_collected,
+                st.session_state.current_prescription
+            )
+            st.success("Session saved!")
+
+    with col2:
+        if st.button("🔄 New", use_container_width=True):
+            # Save current session before starting new
+            save_session_to_db(
+                st.session_state.session_id,
+                st.session_state.messages,
+                st.session_state.patient_info,
+                st.session_state.symptoms_collected,
+                st.session_state.current_prescription
+            )
+            # Reset for new session
+            cancel_tts_prefetch()
+            st.session_state.session_id = datetime.now().strftime('%Y%m%d_%H%M%S_%f')
+            st.session_state.messages = []
+            st.session_state.consultation_stage = 'initial'
+            st.session_state.prescription_generated = False
+            st.session_state.current_prescription = None
+            st.session_state.symptoms_collected = []
+            st.session_state.patient_info = {}
+            st.session_state.chat_session = None
+            st.session_state.chat_model = None
+            st.session_state.context_window = new_context_window()
+            st.session_state.processed_files = set()
+            st.session_state.image_hashes = []
+            st.session_state.chat_window = CHAT_WINDOW_SIZE
+            st.rerun()
+
+    # Load previous sessions
+    st.markdown("### 📂 Previous Sessions")
+    sessions = get_recent_sessions(10)
+    if sessions:
+        session_options = [f"{s.session_id} ({s.message_count} msgs)" for s in sessions]
+        selected = st.selectbox("Load Session:", ["Current"] + session_options, key="session_selector")
+
+        if selected != "Current":
+            session_id = selected.split(" ")[0]
+            if st.button("📥 Load Selected", use_container_width=True):
+                loaded = load_session_from_db(session_id)
+                if loaded:
+                    cancel_tts_prefetch()
+                    st.session_state.session_id = session_id
+                    st.session_state.messages = loaded.get('messages', [])
+                    st.session_state.patient_info = loaded.get('patient_info', {})
+                    st.session_state.symptoms_collected = loaded.get('symptoms_collected', [])
+                    st.session_state.current_prescription = loaded.get('current_prescription', None)
+                    st.session_state.prescription_generated = st.session_state.current_prescription is not None
+                    st.session_state.chat_session = None
+                    st.session_state.chat_model = None
+                    st.session_state.context_window = new_context_window()
+                    st.session_state.processed_files = set()
+                    st.session_state.image_hashes = attached_image_hashes(st.session_state.messages)
+                    st.session_state.chat_window = CHAT_WINDOW_SIZE
+                    st.success(f"Loaded session: {session_id}")
+                    st.rerun()
+
+    st.markdown("---")
+
+    if st.button("📜 View All Consultations", use_container_width=True):
+        st.session_state.show_history = not st.session_state.get('show_history', False)
+        st.rerun()
+
+    st.markdown("---")
+
+    st.markdown("### ℹ️ About HomeoClinic AI")
+    st.markdown("""
+    **Features:**
+    - 💬 Interactive consultation
+    - 🧠 Persistent memory
+    - 💾 Auto-save to database
+    - 📥 Downloadable reports
+    - 📚 Complete history
+    """)
+
+    st.markdown("---")
+
+    st.markdown("### 🌟 Homeopathy Principles")
+    st.markdown("""
+    - **Like Cures Like**
+    - **Minimum Dose**
+    - **Individualization**
+    - **Holistic Approach**
+    """)
+
+    st.markdown("---")
+
+    st.markdown(f"""
+    <div class="info-box">
+        <small><strong>Session ID:</strong><br>{st.session_state.session_id[:20]}...</small>
+    </div>
+    """, unsafe_allow_html=True)
+
+    st.markdown("""
+    <div class="warning-box">
+        <strong>⚠️ Disclaimer:</strong> AI consultation for informational purposes.
+        Consult professionals for serious conditions.
+    </div>
+    """, unsafe_allow_html=True)
+
 def display_consultation_history():
-    """Display all consultations from database"""
+    """Display consultations one page at a time, newest first, with server-side filters"""
     if st.session_state.get('show_history', False):
         st.markdown("## 📚 All Consultations History")
-        
-        consultations = get_all_consultations()
-        
-        if consultations:
-            for i, consultation in enumerate(reversed(consultations), 1):
-                with st.expander(f"Consultation {len(consultations) - i + 1} - {consultation.get('date', 'N/A')[:16]}"):
-                    st.markdown(f"**Session ID:** {consultation.get('session_id', 'N/A')}")
-                    st.markdown(f"**Chief Complaint:** {consultation.get('chief_complaint', 'N/A')}")
-                    st.markdown(f"**Diagnosis:** {consultation.get('diagnosis', 'N/A')}")
-                    
-                    prescription = consultation.get('full_prescription', {})
-                    if prescription:
-                        st.markdown("**Remedies:**")
-                        for remedy in prescription.get('remedies', []):
-                            st.markdown(f"- {remedy.get('medicine', '')} {remedy.get('potency', '')}")
-                    
-                    if st.button(f"View Full Details", key=f"view_hist_{i}"):
-                        st.json(prescription)
-        else:
-            st.info("No consultation history yet. Complete a consultation to see it here.")
+
+        with st.form("history_filter_form"):
+            query = st.text_input("Search complaints, diagnoses, remedies and transcripts")
+            col1, col2 = st.columns(2)
+            date_from = col1.date_input("From", value=None)
+            date_to = col2.date_input("To", value=None)
+            complaint = col1.text_input("Chief complaint contains")
+            remedy = col2.text_input("Remedy starts with")
+            if st.form_submit_button("Apply filters"):
+                st.session_state.history_filters = ConsultationFilter(
+                    date_from, date_to, complaint.strip(), remedy.strip()
+                )
+                st.session_state.history_query = query.strip()
+                # Cursors of the pages visited so far; the first page starts at None
+                st.session_state.history_cursors = [None]
+
+        filters = st.session_state.setdefault('history_filters', ConsultationFilter())
+        if st.session_state.get('history_query'):
+            display_consultation_search(st.session_state.history_query, filters)
+            return
+        cursors = st.session_state.setdefault('history_cursors', [None])
+        page = init_database().consultation_page(filters, after=cursors[-1], limit=HISTORY_PAGE_SIZE)
+
+        if not page.items:
+            if len(cursors) == 1:
+                st.info("No consultation history yet. Complete a consultation to see it here.")
+            return
+
+        for summary in page.items:
+            display_consultation_summary(summary)
+
+        col1, col2, col3 = st.columns([1, 2, 1])
+        if col1.button("← Newer", disabled=len(cursors) == 1, key="history_newer"):
+            cursors.pop()
+            st.rerun()
+        col2.caption(f"Page {len(cursors)}")
+        if col3.button("Older →", disabled=page.next_cursor is None, key="history_older"):
+            cursors.append(page.next_cursor)
+            st.rerun()
+
+def display_consultation_summary(summary: ConsultationSummary):
+    """One history row; the stored record (prescription and messages) is only read when asked for"""
+    remedies = ', '.join(summary.remedies) or 'none'
+    with st.expander(f"{summary.date[:16]} - {summary.chief_complaint or 'N/A'}"):
+        st.markdown(f"**Session ID:** {summary.session_id or 'N/A'}")
+        st.markdown(f"**Diagnosis:** {summary.diagnosis or 'N/A'}")
+        st.markdown(f"**Remedies:** {remedies}")
+        if st.toggle("Show full details", key=f"view_hist_{summary.id}"):
+            consultation = init_database().get_consultation(summary.id) or {}
+            st.json(consultation.get('prescription') or consultation.get('full_prescription') or {})
+
+def display_consultation_search(query: str, filters: ConsultationFilter):
+    """Ranked full-text hits with remedy, complaint and month facets"""
+    start = time.perf_counter()
+    result = init_database().search_consultations(query, filters, limit=HISTORY_PAGE_SIZE)
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    st.caption(f"{result.total} consultations match “{query}” ({elapsed_ms:.0f} ms)")
+    if not result.hits:
+        st.info("No consultations match this search.")
+        return
+
+    columns = st.columns(3)
+    for column, (name, title) in zip(columns, [('remedy', 'Top remedies'), ('complaint', 'Complaints'),
+                                               ('month', 'Months')]):
+        with column:
+            st.markdown(f"**{title}**")
+            for value, count in result.facets.get(name, []):
+                st.markdown(f"- {value} ({count})")
+
+    for hit in result.hits:
+        display_consultation_summary(hit.summary)
 
 def display_welcome_message():
     """Display welcome message for new consultations"""
@@ -1090,12 +1365,13 @@ def display_welcome_message():
         </div>
         """, unsafe_allow_html=True)
 
-def process_ai_response(response_text: str):
+def process_ai_response(response_text: str, prescription: Dict = None):
     """Process AI response and check for prescription"""
     # Check if prescription is ready
     if "PRESCRIPTION_READY" in response_text:
-        # Extract prescription
-        prescription = extract_prescription_json(response_text)
+        # Extract prescription unless it was already parsed while streaming
+        if prescription is None:
+            prescription = extract_prescription_json(response_text)
         
         if prescription:
             # Add current date if not present
@@ -1138,6 +1414,25 @@ def process_ai_response(response_text: str):
         st.session_state.symptoms_collected,
         st.session_state.current_prescription
     )
+    prefetch_latest_reply()
+
+# Rendered prescriptions (table, MD, JSON, CSV, PDF) are kept in an LRU of RENDER_CACHE_ENTRIES
+# items; set HOMEO_RENDER_CACHE_DIR to add an on-disk tier shared across restarts.
+RENDER_CACHE_ENTRIES = int(os.environ.get("HOMEO_RENDER_CACHE_ENTRIES", "64"))
+RENDER_CACHE_DIR = os.environ.get("HOMEO_RENDER_CACHE_DIR", "")
+
+@st.cache_resource
+def get_render_cache() -> RenderCache:
+    """Shared render cache for this process"""
+    return RenderCache(max_entries=RENDER_CACHE_ENTRIES, disk_dir=RENDER_CACHE_DIR or None)
+
+# PDFs are rendered on a pool of PDF_WORKERS spawned processes (0 = one per CPU)
+PDF_WORKERS = int(os.environ.get("HOMEO_PDF_WORKERS", "2"))
+
+@st.cache_resource
+def get_pdf_service() -> PDFRenderService:
+    """Shared PDF rendering pool for this process"""
+    return PDFRenderService(max_workers=PDF_WORKERS or None)
 
 def display_prescription(prescription: Dict):
     """Display prescription in a beautiful format"""
@@ -1158,12 +1453,18 @@ def display_prescription(prescription: Dict):
     </div>
     """, unsafe_allow_html=True)
     
+    # Rendered artefacts are cached by the prescription's content hash, so reruns reuse them
+    render_cache = get_render_cache()
+    cache_key = prescription_key(prescription)
+
     # Remedies table
     st.markdown("### 💊 Prescribed Remedies")
-    df = format_prescription_table(prescription)
 
     # Display table as a markdown text table
-    st.markdown(df.to_markdown(index=False), unsafe_allow_html=True)
+    table_md = render_cache.get_or_render(
+        cache_key, 'table.md', lambda: format_prescription_table(prescription).to_markdown(index=False)
+    )
+    st.markdown(table_md, unsafe_allow_html=True)
     
     # Additional sections in columns
     col1, col2 = st.columns(2)
@@ -1192,7 +1493,7 @@ def display_prescription(prescription: Dict):
     col1, col2, col3, col4 = st.columns(4) # Added one more column for PDF
     
     with col1:
-        md_content = generate_prescription_markdown(prescription)
+        md_content = render_cache.get_or_render(cache_key, 'md', lambda: generate_prescription_markdown(prescription))
         st.download_button(
             label="📥 Download MD",
             data=md_content,
@@ -1203,7 +1504,7 @@ def display_prescription(prescription: Dict):
         )
     
     with col2:
-        json_content = json.dumps(prescription, indent=2)
+        json_content = render_cache.get_or_render(cache_key, 'json', lambda: json.dumps(prescription, indent=2))
         st.download_button(
             label="📥 Download JSON",
             data=json_content,
@@ -1214,9 +1515,9 @@ def display_prescription(prescription: Dict):
         )
     
     with col3:
-        csv_buffer = io.StringIO()
-        df.to_csv(csv_buffer, index=False)
-        csv_content = csv_buffer.getvalue()
+        csv_content = render_cache.get_or_render(
+            cache_key, 'csv', lambda: format_prescription_table(prescription).to_csv(index=False)
+        )
         st.download_button(
             label="📥 Download CSV",
             data=csv_content,
@@ -1227,11 +1528,10 @@ def display_prescription(prescription: Dict):
         )
 
     with col4:
-        # Generate PDF bytes
-        pdf_bytes = generate_prescription_pdf(prescription)
+        # The PDF is only rendered when the download is clicked (and then served from the cache)
         st.download_button(
             label="📥 Download PDF",
-            data=pdf_bytes,
+            data=lambda: render_cache.get_or_render(cache_key, 'pdf', lambda: get_pdf_service().render(prescription)),
             file_name=f"prescription_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf",
             mime="application/pdf",
             key="download_pdf",
@@ -1258,14 +1558,14 @@ def display_database_stats():
         st.markdown("---")
         st.markdown("### 📊 Database Statistics")
         
-        sessions = get_session_list()
-        consultations = get_all_consultations()
+        stats = get_database_stats()
+        consultation_count = stats.get('consultations', 0)
         
         col1, col2 = st.columns(2)
         with col1:
             st.markdown(f"""
             <div class="stat-card">
-                <div class="stat-value">{len(sessions)}</div>
+                <div class="stat-value">{stats.get('sessions', 0)}</div>
                 <div class="stat-label">Total Sessions</div>
             </div>
             """, unsafe_allow_html=True)
@@ -1273,44 +1573,258 @@ def display_database_stats():
         with col2:
             st.markdown(f"""
             <div class="stat-card">
-                <div class="stat-value">{len(consultations)}</div>
+                <div class="stat-value">{consultation_count}</div>
                 <div class="stat-label">Consultations</div>
             </div>
             """, unsafe_allow_html=True)
 
+        if get_analytics_job() is not None and consultation_count:
+            analytics = get_analytics_store()
+            with st.expander("📈 Remedy Analytics"):
+                st.markdown("**Most prescribed**")
+                for medicine, count in analytics.remedy_frequency(5):
+                    st.markdown(f"- {medicine} ({count})")
+                st.markdown("**Potencies**")
+                st.markdown(", ".join(f"{label} ({count})" for label, count in analytics.potency_distribution(6)))
+                intervals = analytics.follow_up_intervals()
+                if intervals['count']:
+                    st.markdown(f"**Follow-ups:** {intervals['count']}, median {intervals['median_days']:.0f} days, "
+                                f"90% within {intervals['p90_days']:.0f} days")
+
+# Exports are streamed to a temp file in EXPORT_DIR (system temp dir when empty); the
+# checkpoint of the last downloaded export lets "only changes" exports pick up where it stopped.
+EXPORT_DIR = os.environ.get("HOMEO_EXPORT_DIR", "")
+EXPORT_CHECKPOINT_PATH = os.environ.get("HOMEO_EXPORT_CHECKPOINT", "homeo_clinic_export_checkpoint.json")
+# Seconds before an export that was never downloaded (e.g. its session ended) is deleted
+EXPORT_MAX_AGE = int(os.environ.get("HOMEO_EXPORT_MAX_AGE", "3600"))
+
+def export_downloaded(result):
+    """Download callback: advance the checkpoint only now, and drop the temp file"""
+    result.checkpoint.save(EXPORT_CHECKPOINT_PATH)
+    if st.session_state.get('export_result') is result:
+        del st.session_state['export_result']
+    try:
+        os.remove(result.path)
+    except OSError:
+        pass
+
+@st.fragment
 def export_all_data():
-    """Export all database data"""
-    with st.sidebar:
-        st.markdown("---")
-        st.markdown("### 📤 Data Export")
-        
-        if st.button("Export All Data", use_container_width=True):
-            db = init_database()
-            all_data = {
-                'sessions': db.table('sessions').all(),
-                'consultations': db.table('consultations').all(),
-                'export_date': datetime.now().isoformat()
-            }
-            
-            json_content = json.dumps(all_data, indent=2)
-            b64 = base64.b64encode(json_content.encode()).decode()
-            
-            st.markdown(
-                f'<a href="data:application/json;base64,{b64}" download="homeo_clinic_export_{datetime.now().strftime("%Y%m%d_%H%M%S")}.json" style="text-decoration: none;"><button style="background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); color: white; border: none; padding: 0.5rem 2rem; border-radius: 25px; font-weight: bold; cursor: pointer; width: 100%;">💾 Download Export</button></a>',
-                unsafe_allow_html=True
-            )
+    """Stream all (or only new) data to a JSON Lines file, offer it for download, and import exports"""
+    st.markdown("---")
+    st.markdown("### 📤 Data Export")
+
+    compression = st.selectbox("Format", available_compressions(), key="export_compression",
+                               format_func=lambda name: COMPRESSIONS[name][0])
+    incremental = st.checkbox("Only changes since the last export", key="export_incremental")
+    if st.button("Export All Data", use_container_width=True):
+        # Include this turn's queued session saves
+        get_session_writer().flush()
+        previous = st.session_state.pop('export_result', None)
+        if previous is not None and os.path.exists(previous.path):
+            os.remove(previous.path)
+        remove_stale_exports(EXPORT_DIR or None, EXPORT_MAX_AGE)
+        since = ExportCheckpoint.load(EXPORT_CHECKPOINT_PATH) if incremental else None
+        journal = get_message_journal() if INCREMENTAL_PERSISTENCE else None
+        with st.spinner("Exporting..."):
+            result = export_data(init_database(), EXPORT_DIR or None, compression, since,
+                                 session_messages=journal.read if journal else None)
+        st.session_state.export_result = result
+
+    result = st.session_state.get('export_result')
+    if result is not None and os.path.exists(result.path):
+        st.caption(f"{result.sessions} sessions, {result.consultations} consultations, "
+                   f"{result.bytes_written / 1024:.0f} KB")
+        with open(result.path, 'rb') as export_file:
+            st.download_button("💾 Download Export", export_file, file_name=result.file_name,
+                               mime=result.mime, use_container_width=True,
+                               on_click=export_downloaded, args=(result,))
+
+    uploaded = st.file_uploader("Import an export", type=['gz', 'zst', 'ndjson', 'jsonl', 'json'],
+                                key="import_file")
+    if uploaded is not None and st.button("Import", use_container_width=True):
+        try:
+            with st.spinner("Importing..."):
+                counts = import_data(init_database(), uploaded)
+        except IMPORT_ERRORS as e:
+            st.error(f"Could not import {uploaded.name}: {e}")
+        else:
+            st.success(f"Imported {counts['sessions']} session(s) and {counts['consultations']} "
+                       f"consultation(s); {counts['skipped_consultations']} already present.")
+
+# Uploaded documents: extracted text is cached by content hash under INGEST_CACHE_DIR;
+# uploads over INGEST_MAX_MB or past INGEST_MAX_PAGES pages are rejected / truncated.
+INGEST_CACHE_DIR = os.environ.get("HOMEO_INGEST_CACHE_DIR", "homeo_clinic_ingest")
+INGEST_MAX_MB = int(os.environ.get("HOMEO_INGEST_MAX_MB", "25"))
+INGEST_MAX_PAGES = int(os.environ.get("HOMEO_INGEST_MAX_PAGES", "500"))
+INGEST_WORKERS = int(os.environ.get("HOMEO_INGEST_WORKERS", "2"))
+# Characters of summarised document text added to the consultation per upload
+INGEST_CONTEXT_CHARS = int(os.environ.get("HOMEO_INGEST_CONTEXT_CHARS", "6000"))
+
+@st.cache_resource
+def get_document_ingestor() -> DocumentIngestor:
+    """Shared document ingestion pipeline for this process"""
+    limits = IngestLimits(max_bytes=INGEST_MAX_MB * 1024 * 1024, max_pages=INGEST_MAX_PAGES)
+    cache = RenderCache(max_entries=16, disk_dir=INGEST_CACHE_DIR or None)
+    return DocumentIngestor(cache=cache, limits=limits, max_workers=INGEST_WORKERS)
+
+def ingest_uploaded_documents(uploaded_files) -> List[Dict]:
+    """Extract text from document uploads; returns attachments carrying the summarised text for the model"""
+    documents = [f for f in uploaded_files if is_supported(f.name)]
+    if not documents:
+        return []
+    with st.spinner(f"📄 Reading {len(documents)} document(s)..."):
+        results = get_document_ingestor().ingest([(f.name, f.getvalue()) for f in documents])
+
+    attachments = []
+    for name, document, error in results:
+        if error:
+            st.warning(f"Could not read {name}: {error}")
+            continue
+        details = {'name': name, 'sha256': document.sha256, 'pages': document.page_count, 'truncated': document.truncated}
+        st.session_state.patient_info.setdefault('documents', []).append(details)
+        # Kept on the message, so a rebuilt chat history still holds the document text
+        attachments.append(dict(details, type='document', context=document_context(document, INGEST_CONTEXT_CHARS)))
+    return attachments
+
+# Uploaded images are downscaled to IMAGE_MAX_PIXELS, re-encoded as IMAGE_FORMAT and
+# deduplicated by perceptual hash before being sent to the model as inline parts.
+IMAGE_MAX_PIXELS = int(os.environ.get("HOMEO_IMAGE_MAX_PIXELS", "1000000"))
+IMAGE_FORMAT = os.environ.get("HOMEO_IMAGE_FORMAT", "webp")
+IMAGE_WORKERS = int(os.environ.get("HOMEO_IMAGE_WORKERS", "2"))
+# Sent images are kept here by content hash so a rebuilt chat history still includes them
+IMAGE_STORE_DIR = os.environ.get("HOMEO_IMAGE_STORE_DIR", "homeo_clinic_images")
+
+@st.cache_resource
+def get_image_pipeline() -> ImagePipeline:
+    """Shared image preprocessing pool for this process"""
+    return ImagePipeline(max_pixels=IMAGE_MAX_PIXELS, fmt=IMAGE_FORMAT, max_workers=IMAGE_WORKERS)
+
+@st.cache_resource
+def get_image_store() -> ImageStore:
+    """Shared store of sent images for this process"""
+    return ImageStore(IMAGE_STORE_DIR)
+
+def prepare_uploaded_images(uploaded_files) -> List[ImagePart]:
+    """Downscale and deduplicate image uploads against those already sent this session"""
+    images = [f for f in uploaded_files if f.type and f.type.startswith("image")]
+    if not images:
+        return []
+    with st.spinner(f"🖼️ Preparing {len(images)} image(s)..."):
+        parts, errors = get_image_pipeline().process(
+            [(f.name, f.getvalue()) for f in images],
+            seen=st.session_state.get('image_hashes', [])
+        )
+    for error in errors:
+        st.warning(error)
+    st.session_state.image_hashes = st.session_state.get('image_hashes', []) + [
+        (p.name, p.phash) for p in parts if p.phash is not None and p.duplicate_of is None
+    ]
+    return parts
+
+# Consultations read per keyset page when collecting a month for batch export
+BATCH_EXPORT_PAGE_SIZE = 200
+# Seconds between progress updates while a batch export renders
+BATCH_EXPORT_POLL_SECONDS = 0.5
+
+def month_prescriptions(month: str) -> List[Dict]:
+    """Consultations with a prescription dated in a YYYY-MM month, oldest first.
+
+    Walks the date-filtered consultation pages (idx_consultations_date on SQLite),
+    so only that month's rows are read; raises ValueError for a malformed month.
+    """
+    first_day = datetime.strptime(month, '%Y-%m').date()
+    next_month = (first_day + timedelta(days=32)).replace(day=1)
+    filters = ConsultationFilter(date_from=first_day, date_to=next_month - timedelta(days=1))
+    storage = init_database()
+    consultations, cursor = [], None
+    while True:
+        page = storage.consultation_page(filters, after=cursor, limit=BATCH_EXPORT_PAGE_SIZE)
+        for summary in page.items:
+            consultation = storage.get_consultation(summary.id)
+            if consultation and consultation.get('prescription'):
+                consultations.append(consultation)
+        cursor = page.next_cursor
+        if cursor is None:
+            break
+    consultations.reverse()
+    return consultations
+
+
+@st.fragment
+def batch_export_prescriptions():
+    """Export every prescription from one month as a ZIP or a combined PDF"""
+    with st.expander("📦 Batch Prescription Export"):
+        month = st.text_input("Month (YYYY-MM):", value=datetime.now().strftime('%Y-%m'), key="batch_export_month")
+        output = st.radio("Format:", ["ZIP of PDFs", "Single PDF"], key="batch_export_format", horizontal=True)
+
+        if st.button("Export Prescriptions", use_container_width=True):
+            try:
+                consultations = month_prescriptions(month.strip())
+            except ValueError:
+                st.error("Enter the month as YYYY-MM.")
+            else:
+                if not consultations:
+                    st.info(f"No prescriptions found for {month}.")
+                else:
+                    names = [prescription_filename(dict(c['prescription'], date=c['date']), i)
+                             for i, c in enumerate(consultations)]
+                    st.session_state.batch_export_job = get_pdf_service().submit_batch(
+                        [c['prescription'] for c in consultations],
+                        output='pdf' if output == "Single PDF" else 'zip',
+                        names=names
+                    )
+                    st.session_state.batch_export_month_done = month.strip()
+
+        job = st.session_state.get('batch_export_job')
+        if job is not None and not job.done():
+            batch_export_progress()
+        elif job is not None:
+            try:
+                data = job.result()
+            except Exception as e:
+                data = None
+                st.error(f"Batch export failed: {e}")
+            if job.errors:
+                st.warning(f"{len(job.errors)} of {job.total} prescriptions could not be rendered.")
+            if data:
+                extension = 'pdf' if job.output == 'pdf' else 'zip'
+                st.download_button(
+                    label="💾 Download Prescriptions",
+                    data=data,
+                    file_name=f"prescriptions_{st.session_state.batch_export_month_done}.{extension}",
+                    mime="application/pdf" if extension == 'pdf' else "application/zip",
+                    use_container_width=True
+                )
+
+@st.fragment(run_every=BATCH_EXPORT_POLL_SECONDS)
+def batch_export_progress():
+    """Progress of the running batch export, polled without holding the script"""
+    job = st.session_state.get('batch_export_job')
+    if job is None:
+        return
+    if job.done():
+        # Stop polling and show the result
+        st.rerun()
+    st.progress(job.fraction, text=f"Rendered {job.completed}/{job.total}")
 
+@st.fragment
 def clear_database():
     """Clear all database data"""
-    with st.sidebar:
-        with st.expander("⚠️ Danger Zone"):
-            st.warning("This will delete all saved data!")
-            confirm = st.text_input("Type 'DELETE' to confirm:")
-            if st.button("Clear All Data") and confirm == "DELETE":
-                db = init_database()
-                db.drop_tables()
-                st.success("All data cleared!")
-                st.rerun()
+    with st.expander("⚠️ Danger Zone"):
+        st.warning("This will delete all saved data!")
+        confirm = st.text_input("Type 'DELETE' to confirm:")
+        if st.button("Clear All Data") and confirm == "DELETE":
+            get_session_writer().discard()
+            init_database().clear()
+            get_message_journal().clear()
+            get_image_store().clear()
+            if get_state_publisher() is not None:
+                get_state_publisher().clear()
+            get_analytics_store().reset()
+            st.session_state.history_cursors = [None]
+            st.success("All data cleared!")
+            st.rerun()
 
 def display_chat_history_summary():
     """Display summary of current chat for context"""
@@ -1331,19 +1845,43 @@ def display_chat_history_summary():
                 if len(user_messages) > 5:
                     st.markdown(f"*...and {len(user_messages) - 5} more messages*")
 
+def display_context_metrics():
+    """Display per-turn token and latency metrics for tuning the context budget"""
+    metrics = st.session_state.context_window.metrics_table()
+    if metrics:
+        with st.sidebar:
+            with st.expander("⏱️ Context Metrics"):
+                latest = metrics[-1]
+                caption = f"History ≈ {latest['history_tokens']} / {CONTEXT_TOKEN_BUDGET} tokens · last reply {latest['latency_s']}s"
+                if latest['ttft_s'] is not None:
+                    caption += f" · first token {latest['ttft_s']}s · {latest['tokens_per_s']} tok/s"
+                st.caption(caption)
+                prefix_cache = st.session_state.context_window.prefix_cache
+                if prefix_cache is not None:
+                    st.caption(f"Prompt prefix ({prefix_cache.tokens} tokens, {prefix_cache.mode}) · "
+                               f"{st.session_state.context_window.tokens_saved} tokens served from cache this session")
+                st.dataframe(pd.DataFrame(metrics), hide_index=True, use_container_width=True)
+
+def display_tts_metrics():
+    """Display audio cache hit rate and synthesis latency"""
+    metrics = get_tts_service().metrics.summary()
+    if metrics['requests']:
+        with st.sidebar:
+            with st.expander("🔊 Audio Metrics"):
+                st.caption(f"Cache hit rate {metrics['hit_rate']:.0%} over {metrics['requests']} requests")
+                st.json(metrics)
+
 def restore_chat_context():
-    """Restore chat context when loading a session"""
-    if st.session_state.messages and st.session_state.chat_session is None:
-        # Reinitialize chat model
-        initialize_chat_model()
-        
-        # Replay conversation to restore context
-        for msg in st.session_state.messages:
-            try:
-                if msg['role'] == 'user':
-                    st.session_state.chat_session.send_message(msg['content'])
-            except:
-                pass  # Skip if there's an error
+    """Restore chat context when loading a session, without any model calls"""
+    if st.session_state.messages:
+        if st.session_state.chat_model is None:
+            st.session_state.chat_model = create_chat_model()
+
+        # Rebuild history from the stored messages, continuing from any summary checkpoint
+        st.session_state.chat_session = st.session_state.context_window.start_chat(
+            st.session_state.chat_model,
+            prior_messages()
+        )
 
 def main():
     """Main application function"""
@@ -1356,20 +1894,24 @@ def main():
     if st.session_state.chat_model is None:
         initialize_chat_model()
     
-    # Restore context if loading a session
-    if st.session_state.messages and len(st.session_state.messages) > 0:
-        if st.session_state.chat_session is None or len(st.session_state.chat_session.history) <= 2:
-            restore_chat_context()
+    # Restore context if loading a session or continuing one saved by another process
+    if st.session_state.messages and st.session_state.chat_session is None:
+        restore_chat_context()
     
     # Display header
     display_header()
     
-    # Display sidebar
-    display_sidebar()
+    # Display sidebar; panels with their own widgets are fragments, so using them reruns only that panel
+    with st.sidebar:
+        display_sidebar()
     display_database_stats()
     display_chat_history_summary()
-    export_all_data()
-    clear_database()
+    display_context_metrics()
+    display_tts_metrics()
+    with st.sidebar:
+        export_all_data()
+        batch_export_prescriptions()
+        clear_database()
     
     # Display consultation history if requested
     if st.session_state.get('show_history', False):
@@ -1380,8 +1922,7 @@ def main():
     display_welcome_message()
     
     # Display chat messages
-    for i, message in enumerate(st.session_state.messages):
-        display_chat_message(message, i)
+    display_chat_messages()
     
     # Display prescription if generated
     if st.session_state.prescription_generated and st.session_state.current_prescription:
@@ -1415,30 +1956,43 @@ def main():
         if new_files_to_process:
             # We will handle only one batch of new files at a time and then rerun
             file_names = []
+            image_parts = prepare_uploaded_images(new_files_to_process)
+            previews = {part.name: part for part in image_parts}
             # Display a preview for the user immediately
             with st.chat_message("user", avatar="👤"):
                 for uploaded_file in new_files_to_process:
                     st.session_state.processed_files.add(uploaded_file.file_id)
                     file_names.append(uploaded_file.name)
-                    if "image" in uploaded_file.type:
-                        st.image(uploaded_file, caption=f"Uploaded: {uploaded_file.name}", width=300)
+                    part = previews.get(uploaded_file.name)
+                    if part is not None:
+                        # Show the downscaled copy rather than the full-resolution upload
+                        caption = f"Uploaded: {uploaded_file.name}"
+                        if part.duplicate_of:
+                            caption += f" (same image as {part.duplicate_of}, not sent again)"
+                        st.image(part.data, caption=caption, width=300)
                     else:
                         st.write(f"📄 Uploaded file: {uploaded_file.name}")
 
             # Create a single message for the AI about all newly uploaded files
             upload_message_for_ai = f"I have just uploaded {len(file_names)} file(s): {', '.join(file_names)}. Please acknowledge this and ask me to describe them if necessary for the consultation."
+            attachments = ingest_uploaded_documents(new_files_to_process)
+            upload_message_for_ai += document_text(attachments)
+            sent_images = [part for part in image_parts if part.duplicate_of is None]
+            attachments += [image_attachment(part, get_image_store().put(part)) for part in sent_images]
             
             # Add a user message to the history for display
-            st.session_state.messages.append({
+            upload_message = {
                 "role": "user",
                 "content": f"Uploaded {len(file_names)} file(s): {', '.join(file_names)}"
-            })
+            }
+            if attachments:
+                upload_message["attachments"] = attachments
+            st.session_state.messages.append(upload_message)
             st.session_state.total_messages += 1
             
             # Get AI response
-            with st.spinner("🩺 Dr. Elysian is reviewing the file(s)..."):
-                response = get_ai_response(upload_message_for_ai)
-                process_ai_response(response)
+            images_for_ai = [part.to_content() for part in sent_images]
+            respond_to_user(upload_message_for_ai, "🩺 Dr. Elysian is reviewing the file(s)...", images=images_for_ai)
             
             # Auto-save and rerun
             save_session_to_db(st.session_state.session_id, st.session_state.messages, st.session_state.patient_info, st.session_state.symptoms_collected, st.session_state.current_prescription)
@@ -1449,17 +2003,12 @@ def main():
         st.session_state.messages.append({"role": "user", "content": user_input})
         st.session_state.total_messages += 1
         
-        # Extract symptoms (simple keyword extraction)
-        symptom_keywords = ['pain', 'ache', 'fever', 'cough', 'cold', 'headache', 'nausea', 'vomit', 'diarrhea', 'constipation', 'anxiety', 'stress', 'insomnia', 'fatigue', 'weakness', 'dizzy', 'swelling', 'rash', 'itch', 'burn', 'cramp', 'sore', 'inflammation', 'infection', 'allergy', 'bleeding']
-        
-        for keyword in symptom_keywords:
-            if keyword in user_input.lower() and keyword not in st.session_state.symptoms_collected:
-                st.session_state.symptoms_collected.append(keyword)
+        # Extract symptoms against the vocabulary; denied ones are kept in patient_info only
+        record_mentions(get_symptom_extractor().extract(user_input), st.session_state.symptoms_collected,
+                        st.session_state.patient_info.setdefault('symptoms', {}), datetime.now().isoformat())
         
         # Get AI response (using persistent chat session)
-        with st.spinner("🩺 Dr. Elysian is contemplating..."):
-            response = get_ai_response(user_input)
-            process_ai_response(response)
+        respond_to_user(user_input, "🩺 Dr. Elysian is contemplating...")
         
         # Auto-save after interaction
         save_session_to_db(st.session_state.session_id, st.session_state.messages, st.session_state.patient_info, st.session_state.symptoms_collected, st.session_state.current_prescription)
@@ -1476,6 +2025,15 @@ def get_conversation_summary() -> str:
     summary = "Conversation Summary:\n"
     summary += f"Total Messages: {len(st.session_state.messages)}\n"
     summary += f"Symptoms Discussed: {', '.join(st.session_state.symptoms_collected)}\n"
+    denied = [term for term, finding in st.session_state.patient_info.get('symptoms', {}).items()
+              if finding.get('status') == 'absent']
+    if denied:
+        summary += f"Symptoms Denied: {', '.join(denied)}\n"
+
+    # Include the structured case summary once older turns have been folded
+    context_window = st.session_state.get('context_window')
+    if context_window and context_window.checkpoint_index:
+        summary += context_window.summary.to_text() + "\n"
     
     # Get first user message (usually the chief complaint)
     user_messages = [m for m in st.session_state.messages if m['role'] == 'user']
@@ -0,0 +1 @@
+"""Supporting services for the HomeoClinic AI Streamlit app."""
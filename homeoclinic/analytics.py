@@ -0,0 +1,344 @@
+"""Columnar analytics store for consultations and prescribed remedies.
+
+A background job flattens new consultations into two Arrow tables and
+appends them as Parquet files partitioned by month:
+
+    <root>/consultations/month=2026-03/part-<first id>-<last id>.parquet
+    <root>/remedies/month=2026-03/part-<first id>-<last id>.parquet
+
+``_state.json`` records the last consultation id written, so every sync only
+reads rows added since. Queries read just the columns they need. Results are
+memoised until the next sync, so the sidebar rereads nothing on a rerun.
+DuckDB is used for ad-hoc SQL when it is installed; the built-in queries only
+need pyarrow.
+"""
+import atexit
+import json
+import os
+import re
+import shutil
+import threading
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+except ImportError:  # analytics is optional; the app runs without it
+    pa = None
+
+try:
+    import duckdb
+except ImportError:  # only needed for ad-hoc SQL
+    duckdb = None
+
+from .storage import StorageBackend
+
+TABLES = ('consultations', 'remedies')
+STATE_FILE = '_state.json'
+
+# "30C", "200 ch", "6X", "1M", "LM 1", "0/3", "Q" (mother tincture)
+POTENCY = re.compile(r'^\s*(?:(LM|Q)\s*(\d+)?|0/(\d+)|(\d+(?:\.\d+)?)\s*(C|CH|X|D|M|LM)?)\b', re.IGNORECASE)
+SCALE_ALIASES = {'CH': 'C', 'D': 'X'}
+
+
+def parse_potency(potency: Any) -> Tuple[Optional[float], Optional[str]]:
+    """Split a potency into (value, scale): '30C' -> (30.0, 'C'), 'LM 1' -> (1.0, 'LM'), '0/3' -> (3.0, 'LM')"""
+    match = POTENCY.match(str(potency or ''))
+    if not match:
+        return None, None
+    prefix, prefix_value, fifty_millesimal, value, scale = match.groups()
+    if prefix:
+        return (float(prefix_value) if prefix_value else None), prefix.upper()
+    if fifty_millesimal:
+        return float(fifty_millesimal), 'LM'
+    scale = (scale or 'C').upper()
+    return float(value), SCALE_ALIASES.get(scale, scale)
+
+
+def potency_label(value: Optional[float], scale: Optional[str]) -> str:
+    """Normalised potency for grouping: '30C', '1M', 'LM1', 'Q'"""
+    if scale is None:
+        return 'unspecified'
+    number = '' if value is None else f"{value:g}"
+    return f"{scale}{number}" if scale in ('LM', 'Q') else f"{number}{scale}"
+
+
+def _timestamp(value: Any) -> Optional[datetime]:
+    try:
+        return datetime.fromisoformat(str(value))
+    except ValueError:
+        return None
+
+
+def flatten_consultations(rows: Iterable[Tuple[int, Dict[str, Any]]]) -> Tuple[Dict[str, list], Dict[str, list]]:
+    """Column lists for the consultations and remedies tables"""
+    consultations = {name: [] for name in ('id', 'session_id', 'date', 'month', 'chief_complaint',
+                                            'diagnosis', 'remedy_count')}
+    remedies = {name: [] for name in ('consultation_id', 'session_id', 'date', 'month', 'position',
+                                       'medicine', 'potency', 'potency_value', 'potency_scale')}
+    for consultation_id, consultation in rows:
+        when = _timestamp(consultation.get('date'))
+        month = when.strftime('%Y-%m') if when else 'unknown'
+        prescription = consultation.get('prescription') or consultation.get('full_prescription') or {}
+        items = prescription.get('remedies') if isinstance(prescription, dict) else None
+        items = [items] if isinstance(items, dict) else items if isinstance(items, list) else []
+        items = [r for r in items if isinstance(r, dict) and str(r.get('medicine') or '').strip()]
+
+        consultations['id'].append(consultation_id)
+        consultations['session_id'].append(consultation.get('session_id'))
+        consultations['date'].append(when)
+        consultations['month'].append(month)
+        consultations['chief_complaint'].append(consultation.get('chief_complaint'))
+        consultations['diagnosis'].append(consultation.get('diagnosis'))
+        consultations['remedy_count'].append(len(items))
+        for position, remedy in enumerate(items):
+            value, scale = parse_potency(remedy.get('potency'))
+            remedies['consultation_id'].append(consultation_id)
+            remedies['session_id'].append(consultation.get('session_id'))
+            remedies['date'].append(when)
+            remedies['month'].append(month)
+            remedies['position'].append(position)
+            remedies['medicine'].append(str(remedy['medicine']).strip())
+            remedies['potency'].append(str(remedy.get('potency') or '').strip() or None)
+            remedies['potency_value'].append(value)
+            remedies['potency_scale'].append(scale)
+    return consultations, remedies
+
+
+def _schemas() -> Dict[str, 'pa.Schema']:
+    return {
+        'consultations': pa.schema([
+            ('id', pa.int64()), ('session_id', pa.string()), ('date', pa.timestamp('us')),
+            ('month', pa.string()), ('chief_complaint', pa.string()), ('diagnosis', pa.string()),
+            ('remedy_count', pa.int32()),
+        ]),
+        'remedies': pa.schema([
+            ('consultation_id', pa.int64()), ('session_id', pa.string()), ('date', pa.timestamp('us')),
+            ('month', pa.string()), ('position', pa.int32()), ('medicine', pa.string()),
+            ('potency', pa.string()), ('potency_value', pa.float64()), ('potency_scale', pa.string()),
+        ]),
+    }
+
+
+class AnalyticsStore:
+    """Month-partitioned Parquet copy of the consultations, appended incrementally"""
+
+    def __init__(self, root: str, batch_size: int = 5000, max_files_per_partition: int = 16):
+        self.root = root
+        self.batch_size = batch_size
+        self.max_files_per_partition = max_files_per_partition
+        # _sync_lock serialises writers; _lock guards the memo and file deletion by compaction
+        self._sync_lock = threading.Lock()
+        self._lock = threading.RLock()
+        self._memo: Dict[Tuple, Any] = {}
+
+    @staticmethod
+    def available() -> bool:
+        return pa is not None
+
+    def _state_path(self) -> str:
+        return os.path.join(self.root, STATE_FILE)
+
+    def state(self) -> Dict[str, int]:
+        try:
+            with open(self._state_path(), encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {'last_id': 0, 'consultations': 0, 'remedies': 0}
+
+    def _save_state(self, state: Dict[str, int]) -> None:
+        tmp_path = f"{self._state_path()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self._state_path())
+
+    def sync(self, storage: StorageBackend) -> int:
+        """Append consultations added since the last sync; returns how many were written"""
+        if pa is None:
+            return 0
+        with self._sync_lock:
+            os.makedirs(self.root, exist_ok=True)
+            state = self.state()
+            written = 0
+            batch: List[Tuple[int, Dict[str, Any]]] = []
+            for row in storage.iter_consultations(state['last_id']):
+                batch.append(row)
+                if len(batch) >= self.batch_size:
+                    written += self._append(batch, state)
+                    batch = []
+            if batch:
+                written += self._append(batch, state)
+            if written:
+                with self._lock:
+                    self._memo.clear()
+            return written
+
+    def _append(self, batch: List[Tuple[int, Dict[str, Any]]], state: Dict[str, int]) -> int:
+        first, last = batch[0][0], batch[-1][0]
+        columns = dict(zip(TABLES, flatten_consultations(batch)))
+        schemas = _schemas()
+        touched = set()
+        for name in TABLES:
+            table = pa.table(columns[name], schema=schemas[name])
+            state[name] = state.get(name, 0) + table.num_rows
+            for month in pc.unique(table['month']).to_pylist():
+                part = table.filter(pc.equal(table['month'], month))
+                part = part.select([column for column in part.column_names if column != 'month'])
+                directory = os.path.join(self.root, name, f"month={month}")
+                os.makedirs(directory, exist_ok=True)
+                # Written under a dot-name first: dataset scans skip those until the rename
+                path = os.path.join(directory, f"part-{first:012d}-{last:012d}.parquet")
+                tmp_path = os.path.join(directory, f".part-{first:012d}-{last:012d}.tmp")
+                pq.write_table(part, tmp_path)
+                os.replace(tmp_path, path)
+                touched.add((name, directory))
+        state['last_id'] = last
+        self._save_state(state)
+        with self._lock:
+            for name, directory in touched:
+                self._maybe_compact(name, directory)
+        return len(batch)
+
+    def _maybe_compact(self, name: str, directory: str) -> None:
+        """Merge a month's small incremental files into one once there are too many"""
+        files = sorted(f for f in os.listdir(directory) if f.endswith('.parquet'))
+        if len(files) <= self.max_files_per_partition:
+            return
+        table = pa.concat_tables(pq.read_table(os.path.join(directory, f)) for f in files)
+        first, last = files[0].split('-')[1], files[-1].split('-')[2].split('.')[0]
+        tmp_path = os.path.join(directory, f".compact-{first}-{last}.tmp")
+        pq.write_table(table, tmp_path)
+        os.replace(tmp_path, os.path.join(directory, f"part-{first}-{last}.parquet"))
+        for f in files:
+            if f != f"part-{first}-{last}.parquet":
+                os.remove(os.path.join(directory, f))
+
+    def reset(self) -> None:
+        """Drop every file; the next sync rebuilds from the database"""
+        with self._sync_lock, self._lock:
+            shutil.rmtree(self.root, ignore_errors=True)
+            self._memo.clear()
+
+    def _dataset(self, name: str) -> Optional['ds.Dataset']:
+        directory = os.path.join(self.root, name)
+        if pa is None or not os.path.isdir(directory):
+            return None
+        partitioning = ds.partitioning(pa.schema([('month', pa.string())]), flavor='hive')
+        return ds.dataset(directory, format='parquet', partitioning=partitioning, schema=_schemas()[name])
+
+    def _memoised(self, key: Tuple, compute: Callable[[], Any]) -> Any:
+        with self._lock:
+            if key not in self._memo:
+                self._memo[key] = compute()
+            return self._memo[key]
+
+    def total_consultations(self) -> int:
+        return self.state().get('consultations', 0)
+
+    def remedy_frequency(self, top: int = 10) -> List[Tuple[str, int]]:
+        """Most prescribed medicines with how often they were prescribed"""
+        return self._memoised(('remedy_frequency',), lambda: self._value_counts('medicine'))[:top]
+
+    def potency_distribution(self, top: int = 10) -> List[Tuple[str, int]]:
+        """Most used potencies, normalised to value + scale ('30C', '1M', 'LM1')"""
+        def compute():
+            dataset = self._dataset('remedies')
+            if dataset is None:
+                return []
+            table = dataset.to_table(columns=['potency_value', 'potency_scale'])
+            grouped = table.group_by(['potency_value', 'potency_scale'], use_threads=False).aggregate([([], 'count_all')])
+            counts: Dict[str, int] = {}
+            for row in grouped.to_pylist():
+                label = potency_label(row['potency_value'], row['potency_scale'])
+                counts[label] = counts.get(label, 0) + row['count_all']
+            return sorted(counts.items(), key=lambda item: (-item[1], item[0]))
+        return self._memoised(('potency_distribution',), compute)[:top]
+
+    def follow_up_intervals(self) -> Dict[str, Optional[float]]:
+        """Days between consecutive consultations of the same session: count, median, mean, p90"""
+        def compute():
+            dataset = self._dataset('consultations')
+            empty = {'count': 0, 'median_days': None, 'mean_days': None, 'p90_days': None}
+            if dataset is None:
+                return empty
+            table = dataset.to_table(columns=['session_id', 'date']).filter(pc.is_valid(pc.field('date')))
+            table = table.sort_by([('session_id', 'ascending'), ('date', 'ascending')])
+            if table.num_rows < 2:
+                return empty
+            sessions, dates = table['session_id'], table['date'].cast(pa.int64())
+            same = pc.equal(sessions.slice(1), sessions.slice(0, table.num_rows - 1))
+            gaps = pc.subtract(dates.slice(1), dates.slice(0, table.num_rows - 1))
+            days = pc.divide(pc.filter(gaps, same).cast(pa.float64()), 86_400 * 1e6)
+            if len(days) == 0:
+                return empty
+            median, p90 = pc.quantile(days, q=[0.5, 0.9]).to_pylist()
+            return {'count': len(days), 'median_days': median, 'mean_days': pc.mean(days).as_py(), 'p90_days': p90}
+        return self._memoised(('follow_up_intervals',), compute)
+
+    def warm(self) -> None:
+        """Compute the built-in queries now so the next reader finds them memoised"""
+        self.remedy_frequency()
+        self.potency_distribution()
+        self.follow_up_intervals()
+
+    def _value_counts(self, column: str) -> List[Tuple[str, int]]:
+        dataset = self._dataset('remedies')
+        if dataset is None:
+            return []
+        counts = pc.value_counts(dataset.to_table(columns=[column])[column].combine_chunks()).to_pylist()
+        counts = [(item['values'], item['counts']) for item in counts if item['values'] is not None]
+        return sorted(counts, key=lambda item: (-item[1], item[0]))
+
+    def query(self, sql: str):
+        """Run SQL over the ``consultations`` and ``remedies`` views with DuckDB; returns a DataFrame"""
+        if duckdb is None:
+            raise RuntimeError("ad-hoc analytics queries need the 'duckdb' package")
+        con = duckdb.connect()
+        try:
+            for name in TABLES:
+                pattern = os.path.join(self.root, name, '*', '*.parquet').replace("'", "''")
+                con.execute(f"CREATE VIEW {name} AS SELECT * FROM read_parquet('{pattern}', hive_partitioning = true)")
+            return con.execute(sql).fetchdf()
+        finally:
+            con.close()
+
+
+class AnalyticsJob:
+    """Background thread that syncs the store every ``interval`` seconds or when poked"""
+
+    def __init__(self, store: AnalyticsStore, storage: StorageBackend, interval: float = 300.0):
+        self.store = store
+        self.storage = storage
+        self.interval = interval
+        self._wake = threading.Event()
+        self._closed = False
+        self.stats = {'syncs': 0, 'rows': 0, 'failed': 0, 'last_sync': None}
+        self._thread = threading.Thread(target=self._run, name="analytics-sync", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def poke(self) -> None:
+        """Sync soon, e.g. right after a consultation was saved"""
+        self._wake.set()
+
+    def _run(self) -> None:
+        while not self._closed:
+            try:
+                rows = self.store.sync(self.storage)
+                if rows:
+                    self.store.warm()
+                self.stats['rows'] += rows
+                self.stats['syncs'] += 1
+                self.stats['last_sync'] = datetime.now().isoformat(timespec='seconds')
+            except Exception as e:
+                self.stats['failed'] += 1
+                print(f"Analytics sync error: {e}")
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+    def close(self) -> None:
+        self._closed = True
+        self._wake.set()
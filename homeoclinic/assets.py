@@ -0,0 +1,66 @@
+"""Background image pipeline for the page stylesheet.
+
+The background used to be read and base64-encoded on every rerun and inlined
+as roughly 1 MB of CSS. Here the image is downscaled and re-encoded (WebP by
+default) once per process. It is either published to Streamlit's static folder
+under a content-hashed name, so the browser caches it and each rerun only sends
+a short URL, or inlined as a much smaller data URI when static serving is off.
+"""
+import base64
+import hashlib
+import io
+import os
+from typing import Tuple
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow is optional; fall back to the original file
+    Image = None
+
+MIME_TYPES = {'webp': 'image/webp', 'avif': 'image/avif', 'jpeg': 'image/jpeg', 'png': 'image/png'}
+
+
+def encode_background(path: str, max_width: int = 1600, fmt: str = 'webp', quality: int = 80) -> Tuple[bytes, str]:
+    """Return (image bytes, mime type) for the background, downscaled and re-encoded when possible"""
+    with open(path, 'rb') as f:
+        original = f.read()
+    fmt = fmt.lower()
+    if Image is None or fmt not in MIME_TYPES:
+        return original, 'image/png'
+
+    try:
+        with Image.open(io.BytesIO(original)) as img:
+            if img.width > max_width:
+                img = img.resize((max_width, round(img.height * max_width / img.width)), Image.LANCZOS)
+            if fmt == 'jpeg' and img.mode != 'RGB':
+                img = img.convert('RGB')
+            buffer = io.BytesIO()
+            img.save(buffer, format=fmt.upper(), quality=quality)
+    except (OSError, ValueError, KeyError):
+        # Encoder not available in this Pillow build (e.g. AVIF)
+        return original, 'image/png'
+
+    encoded = buffer.getvalue()
+    if len(encoded) >= len(original):
+        return original, 'image/png'
+    return encoded, MIME_TYPES[fmt]
+
+
+def data_uri(data: bytes, mime: str) -> str:
+    """Inline image bytes as a data: URI"""
+    return f"data:{mime};base64,{base64.b64encode(data).decode()}"
+
+
+def publish_static(data: bytes, mime: str, static_dir: str, prefix: str = 'background') -> str:
+    """Write the image under a content-hashed name in the static folder and return its URL"""
+    extension = next((ext for ext, m in MIME_TYPES.items() if m == mime), 'bin')
+    name = f"{prefix}-{hashlib.sha256(data).hexdigest()[:16]}.{extension}"
+    os.makedirs(static_dir, exist_ok=True)
+    target = os.path.join(static_dir, name)
+    if not os.path.exists(target):
+        tmp = target + '.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, target)
+    # Streamlit serves <app dir>/static/* at app/static/*
+    return f"app/static/{name}"
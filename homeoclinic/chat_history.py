@@ -0,0 +1,114 @@
+"""Rebuild Gemini chat history from stored consultation messages.
+
+Restoring a session used to replay every earlier user message through
+``send_message``, one blocking model call each, and the saved replies were
+thrown away. Here the stored user and assistant messages are turned straight
+into ``start_chat(history=[...])`` contents, so no network call is needed.
+
+A stored message may carry ``attachments``: for an uploaded document,
+``{'type': 'document', 'name', 'sha256', 'pages', 'truncated', 'context'}``
+where ``context`` is the summarised text the model was sent. It is added back
+to the message when the history is rebuilt. An image attachment references a
+stored image (``homeoclinic.images.image_attachment``); ``load_image`` turns it
+back into an inline part.
+"""
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+ROLE_MAP = {'user': 'user', 'assistant': 'model'}
+
+# Placeholder model turn used when a stored history ends on an unanswered user message
+UNANSWERED_REPLY = "(No reply was recorded for this message.)"
+
+DOCUMENTS_HEADER = "Summarised text extracted from the document(s), by page range:"
+
+
+def document_text(attachments: Iterable[Dict]) -> str:
+    """The extracted text of attached documents, as appended to the message sent with them"""
+    contexts = [a['context'] for a in attachments if a.get('type') == 'document' and a.get('context')]
+    if not contexts:
+        return ''
+    return f"\n\n{DOCUMENTS_HEADER}\n\n" + "\n\n".join(contexts)
+
+
+def message_text(message: Dict) -> str:
+    """Text of a stored message as the model saw it"""
+    return str(message.get('content', '')) + document_text(message.get('attachments', ()))
+
+
+def summarise_messages(messages: List[Dict]) -> str:
+    """Condense earlier messages into a plain-text case note without calling the model"""
+    lines = ["Case notes from the earlier part of this consultation:"]
+    for message in messages:
+        if message.get('role') != 'user':
+            continue
+        content = ' '.join(str(message.get('content', '')).split())
+        if len(content) > 300:
+            content = content[:297] + "..."
+        lines.append(f"- Patient said: {content}")
+    return '\n'.join(lines)
+
+
+def message_parts(message: Dict, load_image: Optional[Callable[[Dict], Optional[Dict]]] = None) -> List[Any]:
+    """History parts for a stored message: its text, then the images sent with it"""
+    parts: List[Any] = [message_text(message)]
+    for attachment in message.get('attachments', ()):
+        if attachment.get('type') != 'image':
+            continue
+        part = load_image(attachment) if load_image is not None else None
+        parts.append(part if part is not None else
+                     f"(The image {attachment.get('name', '')} was shared here but is no longer available.)")
+    return parts
+
+
+def build_chat_history(
+    messages: List[Dict],
+    system_prompt: str,
+    acknowledgement: str,
+    summarise_after: Optional[int] = None,
+    summariser: Callable[[List[Dict]], str] = summarise_messages,
+    load_image: Optional[Callable[[Dict], Optional[Dict]]] = None,
+) -> List[Dict[str, Any]]:
+    """Translate stored messages into alternating user/model history contents.
+
+    When ``summarise_after`` is set and the conversation has more messages than
+    that, everything but the last ``summarise_after`` messages is folded into a
+    single summarised prefix turn produced by ``summariser``. ``load_image``
+    maps an image attachment to an inline part.
+    """
+    history = [
+        {"role": "user", "parts": [system_prompt]},
+        {"role": "model", "parts": [acknowledgement]},
+    ]
+
+    conversation = [m for m in messages if m.get('role') in ROLE_MAP]
+    if summarise_after is not None and len(conversation) > summarise_after:
+        split = len(conversation) - summarise_after
+        older = conversation[:split]
+        conversation = conversation[split:]
+        history.append({"role": "user", "parts": [summariser(older)]})
+        history.append({"role": "model", "parts": ["Understood. I have the earlier case details in mind."]})
+
+    for message in conversation:
+        role = ROLE_MAP[message['role']]
+        parts = message_parts(message, load_image)
+        if history[-1]['role'] == role:
+            # Gemini expects alternating roles, so consecutive turns of one role are merged
+            history[-1]['parts'].extend(parts)
+        else:
+            history.append({"role": role, "parts": parts})
+
+    if history[-1]['role'] == 'user':
+        history.append({"role": "model", "parts": [UNANSWERED_REPLY]})
+    return history
+
+
+def rehydrate_chat(
+    model: Any,
+    messages: List[Dict],
+    system_prompt: str,
+    acknowledgement: str,
+    summarise_after: Optional[int] = None,
+) -> Any:
+    """Start a chat session whose history already contains the stored conversation"""
+    history = build_chat_history(messages, system_prompt, acknowledgement, summarise_after=summarise_after)
+    return model.start_chat(history=history)
@@ -0,0 +1,345 @@
+"""Serializable consultation state kept in a store shared by app replicas.
+
+Everything needed to serve the next turn of a consultation is one JSON
+document: messages, patient details, collected symptoms, the prescription,
+the context window's summary checkpoint and the model configuration. The
+live chat session is not part of it; any process rebuilds that from the
+document without calling the model (``ContextWindow.start_chat``), so
+consecutive turns can be served by different replicas.
+
+Every save increments the document's version and is a compare-and-set
+against the version that was loaded. Two replicas writing the same
+consultation therefore get a :class:`StaleStateError` rather than silently
+overwriting each other. Backends: SQLite (a file on a volume shared by the
+replicas) and Redis (redis-py, or fakeredis in tests). :class:`StatePublisher`
+writes documents from a write-behind queue, so saves stay off the request path
+and the saves of one turn collapse into one write; when its save conflicts it
+merges the two copies with :func:`merge_states` rather than dropping a turn.
+"""
+import json
+import sqlite3
+import threading
+from dataclasses import asdict, dataclass, field, fields
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Set
+
+from .writebehind import WriteBehindQueue
+
+try:
+    import redis
+except ImportError:  # only needed for the Redis store
+    redis = None
+
+STATE_FORMAT_VERSION = 1
+
+
+class StaleStateError(RuntimeError):
+    """The stored consultation changed since this copy was loaded."""
+
+
+@dataclass
+class ConsultationState:
+    session_id: str
+    messages: List[Dict[str, Any]] = field(default_factory=list)
+    patient_info: Dict[str, Any] = field(default_factory=dict)
+    symptoms_collected: List[str] = field(default_factory=list)
+    current_prescription: Optional[Dict[str, Any]] = None
+    # ContextWindow.checkpoint_state(): the folded-history summary and where it ends
+    context: Dict[str, Any] = field(default_factory=dict)
+    # Model name and prompt version the consultation was served with
+    model: Dict[str, Any] = field(default_factory=dict)
+    updated: Optional[str] = None
+    # Stored version this copy is based on; 0 when it has never been saved
+    version: int = 0
+
+    def to_json(self) -> str:
+        document = asdict(self)
+        del document['version']
+        document['format'] = STATE_FORMAT_VERSION
+        return json.dumps(document, ensure_ascii=False, separators=(',', ':'))
+
+    @classmethod
+    def from_json(cls, data: str, version: int) -> 'ConsultationState':
+        document = json.loads(data)
+        if document.get('format', 1) > STATE_FORMAT_VERSION:
+            raise ValueError(f"consultation state format {document['format']} is newer than this app supports")
+        known = {f.name for f in fields(cls)} - {'version'}
+        return cls(**{k: v for k, v in document.items() if k in known}, version=version)
+
+
+def _message_key(message: Dict[str, Any]) -> tuple:
+    return message.get('role'), message.get('content'), message.get('timestamp')
+
+
+def merge_states(theirs: ConsultationState, ours: ConsultationState) -> ConsultationState:
+    """Combine a stored copy with a conflicting local one, keeping both sides' turns.
+
+    The stored messages come first and the local messages it lacks follow, so
+    the stored summary checkpoint (which covers a prefix of its messages) stays
+    valid. Local patient details and prescription win over the stored ones.
+    """
+    seen = {_message_key(m) for m in theirs.messages}
+    messages = list(theirs.messages) + [m for m in ours.messages if _message_key(m) not in seen]
+    symptoms = list(theirs.symptoms_collected)
+    symptoms += [s for s in ours.symptoms_collected if s not in symptoms]
+    return ConsultationState(
+        session_id=theirs.session_id,
+        messages=messages,
+        patient_info={**theirs.patient_info, **ours.patient_info},
+        symptoms_collected=symptoms,
+        current_prescription=ours.current_prescription or theirs.current_prescription,
+        context=theirs.context,
+        model=ours.model or theirs.model,
+        version=theirs.version,
+    )
+
+
+class StateStore:
+    """Versioned consultation state documents shared between processes."""
+
+    def load(self, session_id: str) -> Optional[ConsultationState]:
+        raise NotImplementedError
+
+    def version(self, session_id: str) -> int:
+        """Stored version of a consultation; 0 when there is none"""
+        raise NotImplementedError
+
+    def save(self, state: ConsultationState) -> int:
+        """Store ``state`` if the stored version still equals ``state.version``.
+
+        On success ``state.version`` is advanced and returned; otherwise
+        :class:`StaleStateError` is raised and the store is unchanged.
+        """
+        raise NotImplementedError
+
+    def delete(self, session_id: str) -> None:
+        raise NotImplementedError
+
+    def clear(self) -> None:
+        """Delete every consultation document"""
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+
+class SQLiteStateStore(StateStore):
+    """State documents in a SQLite file (WAL mode), safe for several processes."""
+
+    def __init__(self, path: str, timeout: float = 10.0):
+        self.path = path
+        self._conn = sqlite3.connect(path, timeout=timeout, check_same_thread=False, isolation_level=None)
+        self._lock = threading.RLock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS consultation_state (
+                    session_id TEXT PRIMARY KEY,
+                    version INTEGER NOT NULL,
+                    updated TEXT NOT NULL,
+                    data TEXT NOT NULL
+                )
+                """
+            )
+
+    def load(self, session_id: str) -> Optional[ConsultationState]:
+        with self._lock:
+            row = self._conn.execute("SELECT version, data FROM consultation_state WHERE session_id = ?",
+                                     (session_id,)).fetchone()
+        return ConsultationState.from_json(row[1], row[0]) if row else None
+
+    def version(self, session_id: str) -> int:
+        with self._lock:
+            row = self._conn.execute("SELECT version FROM consultation_state WHERE session_id = ?",
+                                     (session_id,)).fetchone()
+        return row[0] if row else 0
+
+    def save(self, state: ConsultationState) -> int:
+        expected = state.version
+        state.updated = datetime.now().isoformat()
+        data = state.to_json()
+        with self._lock:
+            if expected == 0:
+                cursor = self._conn.execute(
+                    "INSERT INTO consultation_state (session_id, version, updated, data) VALUES (?, 1, ?, ?) "
+                    "ON CONFLICT(session_id) DO NOTHING", (state.session_id, state.updated, data))
+            else:
+                cursor = self._conn.execute(
+                    "UPDATE consultation_state SET version = version + 1, updated = ?, data = ? "
+                    "WHERE session_id = ? AND version = ?", (state.updated, data, state.session_id, expected))
+        if cursor.rowcount != 1:
+            raise StaleStateError(f"consultation {state.session_id} changed since version {expected}")
+        state.version = expected + 1
+        return state.version
+
+    def delete(self, session_id: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM consultation_state WHERE session_id = ?", (session_id,))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM consultation_state")
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class RedisStateStore(StateStore):
+    """State documents as Redis hashes ({version, data}), saved with WATCH/MULTI."""
+
+    def __init__(self, url: Optional[str] = None, client: Any = None, prefix: str = 'homeoclinic:state:',
+                 ttl: Optional[int] = None):
+        if client is None:
+            if redis is None:
+                raise RuntimeError("the Redis state store needs the 'redis' package")
+            client = redis.Redis.from_url(url)
+        self._client = client
+        self.prefix = prefix
+        # Optional expiry (seconds) so abandoned consultations age out of Redis
+        self.ttl = ttl
+
+    def _key(self, session_id: str) -> str:
+        return f"{self.prefix}{session_id}"
+
+    def load(self, session_id: str) -> Optional[ConsultationState]:
+        version, data = self._client.hmget(self._key(session_id), 'version', 'data')
+        if data is None:
+            return None
+        return ConsultationState.from_json(data.decode('utf-8') if isinstance(data, bytes) else data, int(version))
+
+    def version(self, session_id: str) -> int:
+        return int(self._client.hget(self._key(session_id), 'version') or 0)
+
+    def save(self, state: ConsultationState) -> int:
+        from redis.exceptions import WatchError
+        expected = state.version
+        state.updated = datetime.now().isoformat()
+        key = self._key(state.session_id)
+        with self._client.pipeline() as pipe:
+            try:
+                pipe.watch(key)
+                if int(pipe.hget(key, 'version') or 0) != expected:
+                    raise StaleStateError(f"consultation {state.session_id} changed since version {expected}")
+                pipe.multi()
+                pipe.hset(key, mapping={'version': expected + 1, 'data': state.to_json()})
+                if self.ttl:
+                    pipe.expire(key, self.ttl)
+                pipe.execute()
+            except WatchError:
+                raise StaleStateError(f"consultation {state.session_id} changed while saving") from None
+        state.version = expected + 1
+        return state.version
+
+    def delete(self, session_id: str) -> None:
+        self._client.delete(self._key(session_id))
+
+    def clear(self) -> None:
+        for key in self._client.scan_iter(match=f"{self.prefix}*"):
+            self._client.delete(key)
+
+    def close(self) -> None:
+        self._client.close()
+
+
+class StatePublisher:
+    """Saves consultation documents in the background and tracks the versions this process knows.
+
+    Each write is a compare-and-set against the version this process last
+    wrote or loaded for the session. When it fails another replica saved
+    first: the two copies are merged with :func:`merge_states` and saved on
+    top of the stored version, :meth:`newer` then reports the merged document
+    so the caller adopts it, and :meth:`take_merged` tells it a merge happened.
+    """
+
+    # Conflicting saves merged in a row before the write is left to the queue's retries
+    MERGE_ATTEMPTS = 3
+
+    def __init__(self, store: StateStore, delay: float = 0.5):
+        self.store = store
+        self._versions: Dict[str, int] = {}
+        self._merged: Set[str] = set()
+        self._lock = threading.Lock()
+        self._writer = WriteBehindQueue(self._write, delay=delay)
+
+    def _write(self, session_id: str, state: ConsultationState) -> None:
+        with self._lock:
+            state.version = self._versions.get(session_id, 0)
+        merged = False
+        for _ in range(self.MERGE_ATTEMPTS):
+            try:
+                version = self.store.save(state)
+            except StaleStateError:
+                theirs = self.store.load(session_id)
+                if theirs is None:
+                    # Deleted meanwhile: save this copy afresh
+                    state.version = 0
+                else:
+                    state, merged = merge_states(theirs, state), True
+                continue
+            with self._lock:
+                if merged:
+                    # Leave the known version behind so newer() hands the merged copy to the caller
+                    self._merged.add(session_id)
+                else:
+                    self._versions[session_id] = version
+            return
+        raise StaleStateError(f"consultation {session_id} kept changing while merging")
+
+    def publish(self, state: ConsultationState) -> None:
+        """Queue a document; several publishes of one session before it is written collapse into one"""
+        self._writer.submit(state.session_id, state)
+
+    def current(self, session_id: str) -> Optional[ConsultationState]:
+        """The latest document of a session: the one queued here, else the stored one"""
+        pending = self._writer.pending(session_id)
+        if pending is not None:
+            return pending
+        state = self.store.load(session_id)
+        with self._lock:
+            self._versions[session_id] = state.version if state is not None else 0
+        return state
+
+    def newer(self, session_id: str) -> Optional[ConsultationState]:
+        """The stored document when another process saved a version this one has not seen, else None"""
+        if self._writer.pending(session_id) is not None:
+            return None
+        with self._lock:
+            known = self._versions.get(session_id, 0)
+        if self.store.version(session_id) == known:
+            return None
+        return self.current(session_id)
+
+    def take_merged(self, session_id: str) -> bool:
+        """Whether a save of this session was merged with another replica's copy since last asked"""
+        with self._lock:
+            if session_id in self._merged:
+                self._merged.discard(session_id)
+                return True
+            return False
+
+    def flush(self) -> None:
+        self._writer.flush()
+
+    def clear(self) -> None:
+        """Drop queued writes and delete every stored document"""
+        self._writer.discard()
+        self.store.clear()
+        with self._lock:
+            self._versions.clear()
+            self._merged.clear()
+
+    def close(self) -> None:
+        self._writer.close()
+        self.store.close()
+
+
+def open_state_store(url: str) -> StateStore:
+    """Open a state store from a URL: 'sqlite:///path/to/state.db' or 'redis://host:6379/0'"""
+    if url.startswith('sqlite:///'):
+        return SQLiteStateStore(url[len('sqlite:///'):])
+    if url.startswith(('redis://', 'rediss://', 'unix://')):
+        return RedisStateStore(url)
+    raise ValueError(f"Unknown state store '{url}'. Use sqlite:///<path> or redis://<host>[:port]/<db>")
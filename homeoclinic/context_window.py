@@ -0,0 +1,239 @@
+"""Rolling context window with summarisation checkpoints for long consultations.
+
+The chat history sent to the model starts with the long system prompt and grows
+with every turn. :class:`ContextWindow` keeps a token estimate of that history;
+once it exceeds the budget, every turn except the most recent ones is folded
+into a structured :class:`CaseSummary` and the chat is rebuilt from the summary
+plus the recent window.
+"""
+import math
+import re
+import time
+from dataclasses import asdict, dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+from .chat_history import ROLE_MAP, build_chat_history, message_text
+
+MODALITY_PATTERN = re.compile(r'\b(worse|better|aggravat\w*|ameliorat\w*|relieved|triggered|after|before|when)\b', re.I)
+PQRS_PATTERN = re.compile(r'\b(strange|peculiar|unusual|odd|weird|rare|as if|as though|sensation of)\b', re.I)
+SENTENCE_SPLIT = re.compile(r'(?<=[.!?])\s+|\n+')
+
+
+def conversation_messages(messages: List[Dict]) -> List[Dict]:
+    """Messages that become chat history (user and assistant turns only)"""
+    return [m for m in messages if m.get('role') in ROLE_MAP]
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token estimate (about four characters per token)"""
+    return math.ceil(len(text) / 4) if text else 0
+
+
+# Gemini bills each inline image as a fixed number of tokens, independent of its size
+IMAGE_PART_TOKENS = 258
+
+
+def estimate_content_tokens(content: Any) -> int:
+    """Token estimate for a message that may be a list of text and inline image parts"""
+    if isinstance(content, (list, tuple)):
+        return sum(estimate_content_tokens(part) for part in content)
+    if isinstance(content, dict) and 'data' in content:
+        return IMAGE_PART_TOKENS
+    return estimate_tokens(str(content))
+
+
+@dataclass
+class CaseSummary:
+    """Structured summary of the folded part of a consultation."""
+    symptoms: List[str] = field(default_factory=list)
+    modalities: List[str] = field(default_factory=list)
+    pqrs: List[str] = field(default_factory=list)
+    # Header and opening summary of each document (name of each image) attached to a folded message
+    documents: List[str] = field(default_factory=list)
+    folded_messages: int = 0
+    max_items: int = 25
+
+    def update(self, messages: List[Dict]) -> None:
+        """Fold patient statements from messages into the summary"""
+        for message in messages:
+            self.folded_messages += 1
+            if message.get('role') != 'user':
+                continue
+            for attachment in message.get('attachments', ()):
+                if attachment.get('type') == 'document' and attachment.get('context'):
+                    note = ' '.join(attachment['context'].split())
+                    self.documents.append(note if len(note) <= 400 else note[:397] + "...")
+                elif attachment.get('type') == 'image':
+                    self.documents.append(f"[{attachment.get('name', 'image')}: image shared earlier]")
+            for sentence in SENTENCE_SPLIT.split(str(message.get('content', ''))):
+                sentence = ' '.join(sentence.split())
+                if len(sentence) < 3:
+                    continue
+                if len(sentence) > 200:
+                    sentence = sentence[:197] + "..."
+                if PQRS_PATTERN.search(sentence):
+                    bucket = self.pqrs
+                elif MODALITY_PATTERN.search(sentence):
+                    bucket = self.modalities
+                else:
+                    bucket = self.symptoms
+                if sentence not in bucket:
+                    if len(bucket) >= self.max_items:
+                        # Keep the first (usually the chief complaint) and the most recent entries
+                        del bucket[1]
+                    bucket.append(sentence)
+
+    def to_text(self) -> str:
+        """Render the summary as a case note for the model"""
+        lines = [f"Case summary of the first {self.folded_messages} messages of this consultation:"]
+        for title, items in (("Symptoms", self.symptoms), ("Modalities", self.modalities), ("PQRS", self.pqrs)):
+            lines.append(f"{title}:")
+            if items:
+                lines.extend(f"- {item}" for item in items)
+            else:
+                lines.append("- none recorded")
+        if self.documents:
+            lines.append("Documents:")
+            lines.extend(f"- {item}" for item in self.documents)
+        return '\n'.join(lines)
+
+
+@dataclass
+class TurnMetrics:
+    """Token and latency figures for one model call."""
+    turn: int
+    prompt_tokens: int
+    response_tokens: int
+    history_tokens: int
+    latency_s: float
+    checkpointed: bool = False
+    ttft_s: Optional[float] = None
+    tokens_per_s: Optional[float] = None
+    cached_tokens: int = 0
+
+
+class ContextWindow:
+    """Tracks history size and rebuilds the chat from a summary when over budget."""
+
+    def __init__(self, system_prompt: str, acknowledgement: str, token_budget: int = 6000, keep_recent_turns: int = 6,
+                 prefix_cache: Optional[Any] = None, load_image: Optional[Callable[[Dict], Optional[Dict]]] = None):
+        self.system_prompt = system_prompt
+        self.acknowledgement = acknowledgement
+        self.token_budget = token_budget
+        self.keep_recent_turns = keep_recent_turns
+        # A PromptPrefixCache for the system prompt and acknowledgement turns, if any
+        self.prefix_cache = prefix_cache
+        self.prefix_context_cached = False
+        # Turns an image attachment of a stored message back into an inline part
+        self.load_image = load_image
+        self.summary = CaseSummary()
+        self.checkpoint_index = 0
+        self.metrics: List[TurnMetrics] = []
+
+    @property
+    def keep_recent_messages(self) -> int:
+        return self.keep_recent_turns * 2
+
+    def history_tokens(self, messages: List[Dict]) -> int:
+        """Estimated tokens of the history the model currently sees"""
+        if self.prefix_cache is not None:
+            tokens = self.prefix_cache.tokens
+        else:
+            tokens = estimate_tokens(self.system_prompt) + estimate_tokens(self.acknowledgement)
+        if self.checkpoint_index:
+            tokens += estimate_tokens(self.summary.to_text())
+        for message in conversation_messages(messages)[self.checkpoint_index:]:
+            tokens += estimate_tokens(message_text(message))
+            tokens += IMAGE_PART_TOKENS * sum(a.get('type') == 'image' for a in message.get('attachments', ()))
+        return tokens
+
+    def needs_checkpoint(self, messages: List[Dict]) -> bool:
+        """Whether the history exceeds the budget and has turns left to fold"""
+        foldable = len(conversation_messages(messages)) - self.keep_recent_messages - self.checkpoint_index
+        return foldable > 0 and self.history_tokens(messages) > self.token_budget
+
+    def _summarise(self, older: List[Dict]) -> str:
+        self.summary.update(older[self.checkpoint_index:])
+        self.checkpoint_index = len(older)
+        return self.summary.to_text()
+
+    def build_history(self, messages: List[Dict]) -> List[Dict[str, Any]]:
+        """History for start_chat: summary checkpoint (if any) plus the recent window"""
+        if self.needs_checkpoint(messages):
+            keep = self.keep_recent_messages
+        elif self.checkpoint_index:
+            # Keep the existing checkpoint; everything after it stays verbatim
+            keep = len(conversation_messages(messages)) - self.checkpoint_index
+        else:
+            return build_chat_history(messages, self.system_prompt, self.acknowledgement, load_image=self.load_image)
+        return build_chat_history(
+            messages, self.system_prompt, self.acknowledgement,
+            summarise_after=keep, summariser=self._summarise, load_image=self.load_image,
+        )
+
+    def start_chat(self, model: Any, messages: List[Dict]) -> Any:
+        """Start a chat session over the windowed history"""
+        history = self.build_history(messages)
+        if self.prefix_cache is None:
+            return model.start_chat(history=history)
+        chat, self.prefix_context_cached = self.prefix_cache.start_chat(model, history)
+        return chat
+
+    def checkpoint_state(self) -> Dict[str, Any]:
+        """The summary checkpoint as plain data (per-process metrics are not included)"""
+        return {'checkpoint_index': self.checkpoint_index, 'summary': asdict(self.summary)}
+
+    def restore_checkpoint(self, state: Optional[Dict[str, Any]]) -> 'ContextWindow':
+        """Continue from a checkpoint saved by checkpoint_state()"""
+        if state:
+            self.checkpoint_index = int(state.get('checkpoint_index', 0))
+            self.summary = CaseSummary(**state.get('summary', {}))
+        return self
+
+    def cached_tokens(self, usage: Any) -> int:
+        """Prompt tokens served from a cache: as reported, else the context-cached prefix"""
+        reported = getattr(usage, 'cached_content_token_count', 0) or 0
+        if not reported and self.prefix_context_cached:
+            return self.prefix_cache.tokens
+        return reported
+
+    @property
+    def tokens_saved(self) -> int:
+        return sum(m.cached_tokens for m in self.metrics)
+
+    def record_turn(self, messages: List[Dict], prompt_tokens: int, response_tokens: int, latency_s: float,
+                    checkpointed: bool = False, ttft_s: Optional[float] = None,
+                    tokens_per_s: Optional[float] = None, cached_tokens: int = 0) -> TurnMetrics:
+        """Append metrics for a completed model call"""
+        metrics = TurnMetrics(
+            turn=len(self.metrics) + 1,
+            prompt_tokens=prompt_tokens,
+            response_tokens=response_tokens,
+            history_tokens=self.history_tokens(messages),
+            latency_s=round(latency_s, 3),
+            checkpointed=checkpointed,
+            ttft_s=ttft_s,
+            tokens_per_s=tokens_per_s,
+            cached_tokens=cached_tokens,
+        )
+        self.metrics.append(metrics)
+        return metrics
+
+    def timed_send(self, chat_session: Any, message: Any, messages: List[Dict], checkpointed: bool = False,
+                   send: Optional[Callable[[Any], Any]] = None) -> Any:
+        """Send a message and record token and latency metrics for the turn"""
+        start = time.perf_counter()
+        response = send(message) if send else chat_session.send_message(message)
+        latency = time.perf_counter() - start
+
+        usage = getattr(response, 'usage_metadata', None)
+        prompt_tokens = getattr(usage, 'prompt_token_count', 0) or (
+            self.history_tokens(messages) + estimate_content_tokens(message))
+        response_tokens = getattr(usage, 'candidates_token_count', 0) or estimate_tokens(getattr(response, 'text', ''))
+        self.record_turn(messages, prompt_tokens, response_tokens, latency, checkpointed=checkpointed,
+                         cached_tokens=self.cached_tokens(usage))
+        return response
+
+    def metrics_table(self) -> List[Dict[str, Any]]:
+        """Per-turn metrics as plain dicts for display"""
+        return [asdict(m) for m in self.metrics]
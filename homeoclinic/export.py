@@ -0,0 +1,224 @@
+"""Streaming export and import of sessions and consultations.
+
+An export is JSON Lines: a header record, one record per session and per
+consultation, then a footer carrying the checkpoint to resume from. Records
+are written to the file one at a time, optionally through gzip or zstd, so
+memory use does not grow with the size of the database. Incremental exports
+contain only sessions updated and consultations added after a previous
+export's checkpoint. The importer streams the same format back (and still
+reads the legacy single-document ``.json`` export).
+"""
+import gzip
+import io
+import json
+import os
+import tempfile
+import time
+from dataclasses import asdict, dataclass
+from datetime import datetime
+from typing import Any, BinaryIO, Callable, Dict, Iterator, List, Optional
+
+try:
+    import zstandard
+except ImportError:  # zstd is optional; gzip and plain NDJSON always work
+    zstandard = None
+
+from .storage import StorageBackend
+
+EXPORT_FORMAT_VERSION = 1
+
+# name -> (file suffix, mime type)
+COMPRESSIONS = {
+    'gzip': ('.jsonl.gz', 'application/gzip'),
+    'zstd': ('.jsonl.zst', 'application/zstd'),
+    'none': ('.ndjson', 'application/x-ndjson'),
+}
+
+GZIP_MAGIC = b'\x1f\x8b'
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+
+# Temp export files are named with this prefix so stale ones can be found again
+EXPORT_PREFIX = 'homeo_export_'
+
+# What reading a damaged, truncated or mislabelled upload can raise
+IMPORT_ERRORS = (ValueError, EOFError, gzip.BadGzipFile, OSError)
+if zstandard is not None:
+    IMPORT_ERRORS += (zstandard.ZstdError,)
+
+
+def available_compressions() -> List[str]:
+    return [name for name in COMPRESSIONS if name != 'zstd' or zstandard is not None]
+
+
+@dataclass
+class ExportCheckpoint:
+    """Where the previous export stopped: the newest consultation id and session update"""
+    consultation_id: int = 0
+    session_updated: Optional[str] = None
+
+    @classmethod
+    def load(cls, path: str) -> 'ExportCheckpoint':
+        try:
+            with open(path, encoding='utf-8') as f:
+                return cls(**json.load(f))
+        except (OSError, ValueError, TypeError):
+            return cls()
+
+    def save(self, path: str) -> None:
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(asdict(self), f)
+        os.replace(tmp_path, path)
+
+
+@dataclass
+class ExportResult:
+    path: str
+    file_name: str
+    mime: str
+    sessions: int
+    consultations: int
+    bytes_written: int
+    checkpoint: ExportCheckpoint
+
+
+def _open_writer(path: str, compression: str) -> BinaryIO:
+    if compression == 'gzip':
+        return gzip.open(path, 'wb', compresslevel=6)
+    if compression == 'zstd':
+        if zstandard is None:
+            raise ValueError("zstd export needs the 'zstandard' package")
+        return zstandard.ZstdCompressor(level=6).stream_writer(open(path, 'wb'), closefd=True)
+    if compression == 'none':
+        return open(path, 'wb')
+    raise ValueError(f"Unknown compression '{compression}'. Choose one of: {', '.join(COMPRESSIONS)}")
+
+
+def _line(record: Dict[str, Any]) -> bytes:
+    return json.dumps(record, ensure_ascii=False, separators=(',', ':')).encode('utf-8') + b'\n'
+
+
+def export_data(storage: StorageBackend, directory: Optional[str] = None, compression: str = 'gzip',
+                since: Optional[ExportCheckpoint] = None,
+                session_messages: Optional[Callable[[str], Optional[List[Dict]]]] = None) -> ExportResult:
+    """Write an export file record by record and return where it is.
+
+    ``since`` limits the export to records newer than a previous checkpoint;
+    ``session_messages`` supplies a session's messages when they are kept
+    outside the session row (the message journal).
+    """
+    suffix, mime = COMPRESSIONS.get(compression, ('', ''))
+    stamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    file_name = f"homeo_clinic_export_{stamp}{'_incremental' if since else ''}{suffix}"
+    fd, path = tempfile.mkstemp(prefix=EXPORT_PREFIX, suffix=suffix, dir=directory)
+    os.close(fd)
+
+    checkpoint = ExportCheckpoint(**asdict(since)) if since else ExportCheckpoint()
+    counts = {'sessions': 0, 'consultations': 0}
+    try:
+        with _open_writer(path, compression) as out:
+            out.write(_line({'type': 'header', 'version': EXPORT_FORMAT_VERSION,
+                             'export_date': datetime.now().isoformat(),
+                             'since': asdict(since) if since else None}))
+            for session in storage.iter_sessions(since.session_updated if since else None):
+                if session_messages is not None:
+                    messages = session_messages(session['session_id'])
+                    if messages is not None:
+                        session['messages'] = messages
+                out.write(_line({'type': 'session', 'data': session}))
+                counts['sessions'] += 1
+                updated = session.get('last_updated')
+                if updated and (checkpoint.session_updated is None or updated > checkpoint.session_updated):
+                    checkpoint.session_updated = updated
+            for consultation_id, consultation in storage.iter_consultations(since.consultation_id if since else 0):
+                out.write(_line({'type': 'consultation', 'data': consultation}))
+                counts['consultations'] += 1
+                checkpoint.consultation_id = max(checkpoint.consultation_id, consultation_id)
+            out.write(_line({'type': 'footer', 'counts': counts, 'checkpoint': asdict(checkpoint)}))
+    except BaseException:
+        os.remove(path)
+        raise
+    return ExportResult(path, file_name, mime, counts['sessions'], counts['consultations'],
+                        os.path.getsize(path), checkpoint)
+
+
+def remove_stale_exports(directory: Optional[str] = None, max_age: float = 3600) -> int:
+    """Delete export files older than ``max_age`` seconds that were never downloaded; returns how many"""
+    directory = directory or tempfile.gettempdir()
+    cutoff = time.time() - max_age
+    removed = 0
+    try:
+        entries = list(os.scandir(directory))
+    except OSError:
+        return 0
+    for entry in entries:
+        if not entry.name.startswith(EXPORT_PREFIX) or not entry.is_file():
+            continue
+        try:
+            if entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+                removed += 1
+        except OSError:
+            pass  # removed concurrently
+    return removed
+
+
+def _open_reader(fileobj: BinaryIO) -> BinaryIO:
+    """Undo gzip or zstd compression, detected from the first bytes"""
+    buffered = fileobj if hasattr(fileobj, 'peek') else io.BufferedReader(fileobj)
+    magic = buffered.peek(4)[:4]
+    if magic.startswith(GZIP_MAGIC):
+        return gzip.GzipFile(fileobj=buffered, mode='rb')
+    if magic == ZSTD_MAGIC:
+        if zstandard is None:
+            raise ValueError("this export is zstd-compressed; install the 'zstandard' package to import it")
+        return zstandard.ZstdDecompressor().stream_reader(buffered)
+    return buffered
+
+
+def iter_export_records(fileobj: BinaryIO) -> Iterator[Dict[str, Any]]:
+    """Yield the records of an export one line at a time"""
+    stream = _open_reader(fileobj)
+    reader = stream if hasattr(stream, 'peek') else io.BufferedReader(stream)
+    head = reader.peek(64).lstrip()
+    if head.startswith(b'{') and not head.startswith(b'{"type"'):
+        # Legacy export: one indented JSON document with 'sessions' and 'consultations' lists
+        legacy = json.load(io.TextIOWrapper(reader, encoding='utf-8'))
+        for session in legacy.get('sessions', []):
+            yield {'type': 'session', 'data': session}
+        for consultation in legacy.get('consultations', []):
+            yield {'type': 'consultation', 'data': consultation}
+        return
+    for number, line in enumerate(io.TextIOWrapper(reader, encoding='utf-8'), 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            raise ValueError(f"line {number} is not valid JSON: {e}") from None
+        if not isinstance(record, dict) or 'type' not in record:
+            raise ValueError(f"line {number} is not an export record")
+        yield record
+
+
+def import_data(storage: StorageBackend, fileobj: BinaryIO) -> Dict[str, int]:
+    """Stream an export into storage.
+
+    Sessions are upserted and consultations already present (same session_id
+    and date) are skipped, so importing the same file twice is harmless.
+    """
+    counts = {'sessions': 0, 'consultations': 0, 'skipped_consultations': 0}
+    for record in iter_export_records(fileobj):
+        data = record.get('data')
+        if record['type'] == 'session' and isinstance(data, dict) and data.get('session_id'):
+            data.setdefault('message_count', len(data.get('messages', [])))
+            storage.save_session(data)
+            counts['sessions'] += 1
+        elif record['type'] == 'consultation' and isinstance(data, dict):
+            session_id, date = data.get('session_id'), data.get('date')
+            if not session_id or not date or storage.has_consultation(session_id, date):
+                counts['skipped_consultations'] += 1
+                continue
+            storage.save_consultation(data)
+            counts['consultations'] += 1
+    return counts
@@ -0,0 +1,226 @@
+"""Offline stand-ins for the Gemini SDK objects the app uses.
+
+Set ``HOMEO_FAKE_LLM=1`` to run the app against :class:`FakeStreamingModel`
+without an API key or network access. The fake can also emulate provider
+behaviour under load (latency, a concurrency quota answered with HTTP 429-style
+``ResourceExhausted`` errors, random transient failures) to exercise the
+gateway's retries and circuit breaker.
+"""
+import asyncio
+import io
+import json
+import random
+import threading
+import time
+import wave
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from google.api_core import exceptions as google_exceptions
+
+from homeoclinic.tts import TTSEngine, join_wav
+
+SAMPLE_PRESCRIPTION = {
+    "patient_name": "Patient",
+    "chief_complaint": "Throbbing headache",
+    "case_summary": "Sudden throbbing headache, worse from sun and jarring, with a red face.",
+    "diagnosis": "Acute congestive headache",
+    "remedies": [
+        {
+            "medicine": "Belladonna",
+            "potency": "30C",
+            "dosage": "3 pills every 4 hours",
+            "instructions": "Dissolve under the tongue",
+            "purpose": "Relieve congestion",
+            "keynote_match": "Sudden onset, throbbing, worse from jar",
+        }
+    ],
+    "dietary_advice": ["Stay hydrated"],
+    "lifestyle_recommendations": ["Rest in a dark, quiet room"],
+    "precautions": ["Seek care if the headache is the worst of your life"],
+    "follow_up": "Review in 3 days",
+}
+
+DEFAULT_SCRIPT = [
+    "Thank you for sharing that. When did this begin, and what makes it better or worse?",
+    "I see. Is there any thirst, and do you prefer warmth or cold?",
+    "PRESCRIPTION_READY\n```json\n" + json.dumps(SAMPLE_PRESCRIPTION, indent=2) + "\n```",
+]
+
+
+class FakeUsage:
+    def __init__(self, prompt_token_count: int, candidates_token_count: int):
+        self.prompt_token_count = prompt_token_count
+        self.candidates_token_count = candidates_token_count
+
+
+class FakeChunk:
+    def __init__(self, text: str):
+        self.text = text
+
+
+class FakeResponse:
+    """Mimics GenerateContentResponse for blocking and streamed (sync or async) calls."""
+
+    def __init__(self, text: str, chunk_size: int, chunk_delay: float, prompt_tokens: int,
+                 on_done: Optional[Callable[[], None]] = None):
+        self.text = text
+        self._chunk_size = chunk_size
+        self._chunk_delay = chunk_delay
+        # Called once the stream has been read to the end (or abandoned)
+        self._on_done = on_done
+        self.usage_metadata = FakeUsage(prompt_tokens, max(1, len(text) // 4))
+
+    def _chunks(self) -> List[str]:
+        return [self.text[i:i + self._chunk_size] for i in range(0, len(self.text), self._chunk_size)]
+
+    def _done(self) -> None:
+        on_done, self._on_done = self._on_done, None
+        if on_done is not None:
+            on_done()
+
+    def __iter__(self) -> Iterator[FakeChunk]:
+        try:
+            for chunk in self._chunks():
+                time.sleep(self._chunk_delay)
+                yield FakeChunk(chunk)
+        finally:
+            self._done()
+
+    async def __aiter__(self):
+        try:
+            for chunk in self._chunks():
+                await asyncio.sleep(self._chunk_delay)
+                yield FakeChunk(chunk)
+        finally:
+            self._done()
+
+    def resolve(self) -> None:
+        self._done()
+
+
+class FakeChatSession:
+    """Chat session that answers from a fixed script."""
+
+    def __init__(self, model: "FakeStreamingModel", history: Optional[List[Dict]] = None):
+        self.model = model
+        self.history = list(history or [])
+
+    def _reply(self, content: Any, stream: bool, admission: "_Admission") -> FakeResponse:
+        turn = sum(1 for h in self.history if h.get('role') == 'user') - 1
+        reply = self.model.script[min(max(turn, 0), len(self.model.script) - 1)]
+        prompt_tokens = sum(len(str(p)) for h in self.history for p in h.get('parts', [])) // 4
+        self.history.append({"role": "user", "parts": [content]})
+        self.history.append({"role": "model", "parts": [reply]})
+        if not stream:
+            return FakeResponse(reply, self.model.chunk_size, 0.0, prompt_tokens)
+        # A streamed reply keeps its place in the quota until its last chunk has been read
+        return FakeResponse(reply, self.model.chunk_size, self.model.chunk_delay, prompt_tokens,
+                            on_done=admission.hand_off())
+
+    def send_message(self, content: Any, stream: bool = False, **kwargs) -> FakeResponse:
+        with self.model.admit() as admission:
+            time.sleep(self.model.first_token_delay)
+            return self._reply(content, stream, admission)
+
+    async def send_message_async(self, content: Any, stream: bool = False, **kwargs) -> FakeResponse:
+        with self.model.admit() as admission:
+            await asyncio.sleep(self.model.first_token_delay)
+            return self._reply(content, stream, admission)
+
+
+class _Admission:
+    def __init__(self, model: "FakeStreamingModel"):
+        self.model = model
+        self._held = False
+        self._handed_off = False
+
+    def __enter__(self):
+        model = self.model
+        with model._lock:
+            model.calls += 1
+            if model.max_concurrent is not None and model.in_flight >= model.max_concurrent:
+                model.rejected += 1
+                raise google_exceptions.ResourceExhausted("Fake quota exceeded (429)")
+            if model.failure_rate and random.random() < model.failure_rate:
+                model.rejected += 1
+                raise google_exceptions.ServiceUnavailable("Fake transient failure (503)")
+            model.in_flight += 1
+            model.peak_in_flight = max(model.peak_in_flight, model.in_flight)
+            self._held = True
+        return self
+
+    def hand_off(self) -> Callable[[], None]:
+        """Keep the request admitted past the with block; the returned callable releases it"""
+        self._handed_off = True
+        return self.release
+
+    def release(self) -> None:
+        with self.model._lock:
+            if self._held:
+                self._held = False
+                self.model.in_flight -= 1
+
+    def __exit__(self, exc_type, *exc_info):
+        if exc_type is not None or not self._handed_off:
+            self.release()
+        return False
+
+
+class FakeStreamingModel:
+    """Drop-in for genai.GenerativeModel that streams scripted replies."""
+
+    def __init__(self, model_name: str = "fake", script: Optional[List[str]] = None,
+                 chunk_size: int = 12, chunk_delay: float = 0.02, first_token_delay: float = 0.2,
+                 max_concurrent: Optional[int] = None, failure_rate: float = 0.0):
+        self.model_name = model_name
+        self.script = script or DEFAULT_SCRIPT
+        self.chunk_size = chunk_size
+        self.chunk_delay = chunk_delay
+        self.first_token_delay = first_token_delay
+        self.max_concurrent = max_concurrent
+        self.failure_rate = failure_rate
+        self.calls = 0
+        self.rejected = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self._lock = threading.Lock()
+
+    def admit(self) -> _Admission:
+        """Enforce the emulated provider quota for one request"""
+        return _Admission(self)
+
+    def start_chat(self, history: Optional[List[Dict]] = None) -> FakeChatSession:
+        return FakeChatSession(self, history)
+
+
+class FakeTTSEngine(TTSEngine):
+    """Offline TTS stand-in: silent WAV audio whose length follows the text"""
+
+    format = 'wav'
+    mime = 'audio/wav'
+
+    def __init__(self, delay_per_char: float = 0.0005, sample_rate: int = 8000, fail_on: Optional[str] = None):
+        self.delay_per_char = delay_per_char
+        self.sample_rate = sample_rate
+        self.fail_on = fail_on
+        self.name = 'fake'
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def synthesize(self, text: str) -> bytes:
+        with self._lock:
+            self.calls += 1
+        time.sleep(self.delay_per_char * len(text))
+        if self.fail_on and self.fail_on in text:
+            raise RuntimeError("fake TTS failure")
+        buffer = io.BytesIO()
+        with wave.open(buffer, 'wb') as out:
+            out.setnchannels(1)
+            out.setsampwidth(2)
+            out.setframerate(self.sample_rate)
+            # Roughly 15 characters per second of speech
+            out.writeframes(b'\0\0' * (self.sample_rate * len(text) // 15))
+        return buffer.getvalue()
+
+    def join(self, parts) -> bytes:
+        return join_wav(parts)
@@ -0,0 +1,217 @@
+"""Process-wide gateway for model calls.
+
+All model requests from every Streamlit session go through one asyncio event
+loop running on a background thread. A bounded semaphore caps concurrent
+requests to the provider, transient failures are retried with jittered
+exponential backoff, every attempt has a deadline, and a circuit breaker stops
+sending requests for a while after repeated failures.
+"""
+import asyncio
+import queue
+import random
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterator, Optional
+
+try:
+    from google.api_core import exceptions as google_exceptions
+    PROVIDER_TRANSIENT_ERRORS = (
+        google_exceptions.ResourceExhausted,
+        google_exceptions.ServiceUnavailable,
+        google_exceptions.InternalServerError,
+        google_exceptions.DeadlineExceeded,
+    )
+except ImportError:
+    PROVIDER_TRANSIENT_ERRORS = ()
+
+RETRYABLE_ERRORS = PROVIDER_TRANSIENT_ERRORS + (asyncio.TimeoutError, ConnectionError)
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised when the circuit breaker is rejecting requests."""
+
+
+class CircuitBreaker:
+    """Opens after consecutive failures and lets one trial request through after a cool-down."""
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return 'half-open'
+        return 'open'
+
+    def allow(self) -> bool:
+        """Whether a request may be sent now"""
+        with self._lock:
+            state = self.state
+            if state == 'closed':
+                return True
+            if state == 'half-open' and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self._trial_in_flight or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+            self._trial_in_flight = False
+
+    def release(self) -> None:
+        """End a request whose outcome says nothing about the service's health"""
+        with self._lock:
+            self._trial_in_flight = False
+
+
+class GatewayStream:
+    """Synchronous iterator over chunks produced on the gateway loop."""
+
+    _DONE = object()
+
+    def __init__(self, idle_timeout: float):
+        self.idle_timeout = idle_timeout
+        self.usage_metadata = None
+        self._queue: "queue.Queue" = queue.Queue()
+
+    def _put(self, item: Any) -> None:
+        self._queue.put(item)
+
+    def __iter__(self) -> Iterator[Any]:
+        while True:
+            try:
+                item = self._queue.get(timeout=self.idle_timeout)
+            except queue.Empty:
+                raise TimeoutError(f"No data from the model for {self.idle_timeout}s")
+            if item is self._DONE:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+
+
+class LLMGateway:
+    """Shared, rate-limited entry point for chat model calls."""
+
+    def __init__(self, model: Any, max_concurrency: int = 8, max_retries: int = 3, base_delay: float = 0.5,
+                 max_delay: float = 8.0, request_timeout: float = 60.0,
+                 breaker: Optional[CircuitBreaker] = None):
+        self.model = model
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.request_timeout = request_timeout
+        self.breaker = breaker or CircuitBreaker()
+        self.stats: Dict[str, int] = {'requests': 0, 'retries': 0, 'failures': 0, 'rejected': 0, 'in_flight': 0}
+
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="llm-gateway", daemon=True)
+        self._thread.start()
+        self._semaphore = self._run(self._make_semaphore())
+
+    async def _make_semaphore(self) -> asyncio.Semaphore:
+        return asyncio.Semaphore(self.max_concurrency)
+
+    def _run(self, coro: Awaitable, timeout: Optional[float] = None) -> Any:
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result(timeout)
+
+    def backoff(self, attempt: int) -> float:
+        """Full-jitter exponential backoff delay for a retry attempt"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    async def _with_retries(self, request: Callable[[], Awaitable]) -> Any:
+        for attempt in range(self.max_retries + 1):
+            if not self.breaker.allow():
+                self.stats['rejected'] += 1
+                raise CircuitOpenError("The model service is temporarily unavailable; please try again shortly.")
+            try:
+                result = await asyncio.wait_for(request(), timeout=self.request_timeout)
+            except RETRYABLE_ERRORS:
+                self.breaker.record_failure()
+                if attempt == self.max_retries:
+                    self.stats['failures'] += 1
+                    raise
+                self.stats['retries'] += 1
+                await asyncio.sleep(self.backoff(attempt))
+            except Exception:
+                # Not transient (bad request, safety block...): retrying will not help. It does
+                # not count against the service either, but a half-open trial must end with it.
+                self.breaker.release()
+                self.stats['failures'] += 1
+                raise
+            except asyncio.CancelledError:
+                self.breaker.release()
+                raise
+            else:
+                self.breaker.record_success()
+                return result
+
+    def _deadline(self) -> float:
+        """Upper bound for a whole call including every retry and backoff"""
+        return (self.max_retries + 1) * (self.request_timeout + self.max_delay)
+
+    async def _send(self, chat_session: Any, content: Any, kwargs: Dict) -> Any:
+        self.stats['requests'] += 1
+        async with self._semaphore:
+            self.stats['in_flight'] += 1
+            try:
+                return await self._with_retries(lambda: chat_session.send_message_async(content, **kwargs))
+            finally:
+                self.stats['in_flight'] -= 1
+
+    def send_message(self, chat_session: Any, content: Any, **kwargs) -> Any:
+        """Send a chat message through the gateway and block until the reply arrives"""
+        return self._run(self._send(chat_session, content, kwargs), timeout=self._deadline())
+
+    async def _stream(self, stream: GatewayStream, chat_session: Any, content: Any, kwargs: Dict) -> None:
+        self.stats['requests'] += 1
+        try:
+            async with self._semaphore:
+                self.stats['in_flight'] += 1
+                try:
+                    # Only the initial request is retried; once chunks flow a failure is surfaced
+                    response = await self._with_retries(
+                        lambda: chat_session.send_message_async(content, stream=True, **kwargs)
+                    )
+                    chunks = response.__aiter__()
+                    while True:
+                        try:
+                            chunk = await asyncio.wait_for(chunks.__anext__(), timeout=self.request_timeout)
+                        except StopAsyncIteration:
+                            break
+                        stream._put(chunk)
+                    stream.usage_metadata = getattr(response, 'usage_metadata', None)
+                finally:
+                    self.stats['in_flight'] -= 1
+        except BaseException as e:
+            stream._put(e)
+        finally:
+            stream._put(GatewayStream._DONE)
+
+    def stream_message(self, chat_session: Any, content: Any, **kwargs) -> GatewayStream:
+        """Start a streamed chat message and return a synchronous chunk iterator"""
+        stream = GatewayStream(idle_timeout=self._deadline())
+        asyncio.run_coroutine_threadsafe(self._stream(stream, chat_session, content, kwargs), self._loop)
+        return stream
+
+    def close(self) -> None:
+        """Stop the event loop thread"""
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=5)
@@ -0,0 +1,194 @@
+"""Preprocessing for uploaded images before they are sent to the model.
+
+Phone photos are often 12 MP or more: decoded at full size they take ~36 MB of
+RAM each, and the raw upload bloats every later request in the chat. Each
+upload is decoded once (JPEGs are decoded directly at a reduced scale),
+downscaled to ``max_pixels``, re-encoded compactly and fingerprinted with a
+perceptual hash so the same photo uploaded twice is only sent once. The work
+runs on a thread pool; Pillow releases the GIL while decoding, resizing and
+encoding.
+
+Images that are sent are also kept in an :class:`ImageStore` under their
+content hash. The upload message references them (``image_attachment``), so
+the chat history can be rebuilt with the images after a reload.
+"""
+import hashlib
+import io
+import math
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow is optional; images are then passed through untouched
+    Image = None
+
+from homeoclinic.assets import MIME_TYPES
+
+
+@dataclass
+class ImagePart:
+    name: str
+    data: bytes
+    mime: str
+    width: int
+    height: int
+    phash: Optional[int]
+    original_bytes: int
+    duplicate_of: Optional[str] = None
+
+    def to_content(self) -> Dict[str, object]:
+        """Inline blob part accepted by ``ChatSession.send_message``"""
+        return {'mime_type': self.mime, 'data': self.data}
+
+
+def dhash(img, size: int = 8) -> int:
+    """64-bit difference hash: robust to rescaling and re-encoding"""
+    small = img.convert('L').resize((size + 1, size), Image.BILINEAR)
+    pixels = list(small.getdata())
+    bits = 0
+    for row in range(size):
+        for col in range(size):
+            left = pixels[row * (size + 1) + col]
+            bits = (bits << 1) | (left > pixels[row * (size + 1) + col + 1])
+    return bits
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count('1')
+
+
+def guess_mime(name: str) -> str:
+    extension = name.rsplit('.', 1)[-1].lower()
+    return MIME_TYPES.get('jpeg' if extension == 'jpg' else extension, f"image/{extension}")
+
+
+def prepare_image(name: str, data: bytes, max_pixels: int = 1_000_000, fmt: str = 'webp',
+                  quality: int = 80) -> ImagePart:
+    """Decode once, downscale to at most max_pixels, re-encode and hash"""
+    if Image is None:
+        return ImagePart(name, data, guess_mime(name), 0, 0, None, len(data))
+
+    with Image.open(io.BytesIO(data)) as img:
+        width, height = img.size
+        scale = math.sqrt(max_pixels / (width * height)) if width * height > max_pixels else 1.0
+        target = (max(1, int(width * scale)), max(1, int(height * scale)))
+        # JPEG only: decode straight to the nearest 1/2, 1/4 or 1/8 scale at or above the target
+        img.draft('RGB', target)
+        img = ImageOps.exif_transpose(img)
+        if img.mode not in ('RGB', 'L'):
+            img = img.convert('RGB')
+        target = (target[1], target[0]) if (img.width > img.height) != (width > height) else target
+        if img.size != target and scale < 1.0:
+            img = img.resize(target, Image.LANCZOS, reducing_gap=2.0)
+        fingerprint = dhash(img)
+
+        buffer = io.BytesIO()
+        try:
+            img.save(buffer, format=fmt.upper(), quality=quality)
+            mime = MIME_TYPES.get(fmt.lower(), f"image/{fmt.lower()}")
+        except (KeyError, OSError):
+            # Encoder missing from this Pillow build
+            buffer = io.BytesIO()
+            img.save(buffer, format='JPEG', quality=quality)
+            mime = 'image/jpeg'
+        encoded = buffer.getvalue()
+        if scale == 1.0 and len(encoded) >= len(data):
+            # Already small; keep the original bytes
+            return ImagePart(name, data, guess_mime(name), img.width, img.height, fingerprint, len(data))
+        return ImagePart(name, encoded, mime, img.width, img.height, fingerprint, len(data))
+
+
+class ImagePipeline:
+    """Prepares batches of uploads on a worker pool and drops near-duplicates"""
+
+    def __init__(self, max_pixels: int = 1_000_000, fmt: str = 'webp', quality: int = 80,
+                 max_workers: int = 2, dedupe_distance: int = 4):
+        self.max_pixels = max_pixels
+        self.fmt = fmt
+        self.quality = quality
+        self.dedupe_distance = dedupe_distance
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='image-prep')
+
+    def process(self, files: Sequence[Tuple[str, bytes]],
+                seen: Iterable[Tuple[str, int]] = ()) -> Tuple[List[ImagePart], List[str]]:
+        """Return (parts, errors); a part matching an earlier upload or a ``seen`` (name, hash) pair gets duplicate_of"""
+        futures = [self._pool.submit(prepare_image, name, data, self.max_pixels, self.fmt, self.quality)
+                   for name, data in files]
+        known = list(seen)
+        parts, errors = [], []
+        for (name, _), future in zip(files, futures):
+            try:
+                part = future.result()
+            except Exception as e:
+                errors.append(f"{name}: could not be read as an image ({type(e).__name__})")
+                continue
+            if part.phash is not None:
+                part.duplicate_of = next((other for other, h in known
+                                          if hamming(h, part.phash) <= self.dedupe_distance), None)
+                known.append((name, part.phash))
+            parts.append(part)
+        return parts, errors
+
+    def close(self) -> None:
+        self._pool.shutdown(wait=False)
+
+
+EXTENSIONS = {'image/jpeg': 'jpg', 'image/png': 'png', 'image/webp': 'webp', 'image/gif': 'gif'}
+IMAGE_REF = re.compile(r'[0-9a-f]{64}\.[a-z]{2,5}')
+
+
+def image_attachment(part: ImagePart, ref: str) -> Dict[str, Any]:
+    """Reference to a stored image, kept on the message it was sent with"""
+    return {'type': 'image', 'name': part.name, 'ref': ref, 'mime': part.mime, 'phash': part.phash,
+            'width': part.width, 'height': part.height}
+
+
+def attached_image_hashes(messages: Iterable[Dict]) -> List[Tuple[str, int]]:
+    """(name, perceptual hash) of every image sent in a conversation, for deduplicating new uploads"""
+    return [(a['name'], a['phash']) for message in messages for a in message.get('attachments', ())
+            if a.get('type') == 'image' and a.get('phash') is not None]
+
+
+class ImageStore:
+    """Processed images on disk, named by the SHA-256 of their bytes"""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def put(self, part: ImagePart) -> str:
+        """Store an image (once per content) and return its reference"""
+        ref = f"{hashlib.sha256(part.data).hexdigest()}.{EXTENSIONS.get(part.mime, 'bin')}"
+        path = os.path.join(self.directory, ref)
+        if not os.path.exists(path):
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(part.data)
+            os.replace(tmp_path, path)
+        return ref
+
+    def get(self, ref: str) -> Optional[bytes]:
+        if not IMAGE_REF.fullmatch(ref or ''):
+            return None
+        try:
+            with open(os.path.join(self.directory, ref), 'rb') as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def load_part(self, attachment: Dict[str, Any]) -> Optional[Dict[str, object]]:
+        """Inline part for an image attachment, or None when its file is gone"""
+        data = self.get(attachment.get('ref', ''))
+        if data is None:
+            return None
+        return {'mime_type': attachment.get('mime', 'image/jpeg'), 'data': data}
+
+    def clear(self) -> None:
+        """Remove every stored image"""
+        for name in os.listdir(self.directory):
+            if IMAGE_REF.fullmatch(name):
+                os.remove(os.path.join(self.directory, name))
@@ -0,0 +1,337 @@
+"""Text extraction for uploaded documents (PDF, DOCX, ODT, TXT, RTF).
+
+Each format has a generator that yields one page (or page-sized block) of text
+at a time, so a 300-page report is never held as one growing string. Results
+are cached by content hash, large files are extracted on a process pool, and
+the text reaches the model as short per-chunk summaries rather than raw pages.
+"""
+import hashlib
+import io
+import json
+import multiprocessing
+import os
+import re
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass, field
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+from xml.etree import ElementTree
+
+from homeoclinic.render_cache import RenderCache
+
+# Plain-text formats have no pages; split them into blocks of about this size
+TEXT_BLOCK_CHARS = 3000
+
+
+class IngestError(ValueError):
+    """An upload was rejected (unsupported type, too large, unreadable)"""
+
+
+@dataclass
+class IngestLimits:
+    max_bytes: int = 25 * 1024 * 1024
+    max_pages: int = 500
+    # Files at least this large are extracted on the process pool
+    process_threshold_bytes: int = 256 * 1024
+
+
+@dataclass
+class ExtractedDocument:
+    name: str
+    sha256: str
+    pages: List[str] = field(default_factory=list)
+    truncated: bool = False
+
+    @property
+    def page_count(self) -> int:
+        return len(self.pages)
+
+    @property
+    def chars(self) -> int:
+        return sum(len(page) for page in self.pages)
+
+
+def iter_pdf_pages(data: bytes) -> Iterator[str]:
+    from PyPDF2 import PdfReader
+    for page in PdfReader(io.BytesIO(data)).pages:
+        yield page.extract_text() or ''
+
+
+def _decode(data: bytes) -> str:
+    for encoding in ('utf-8-sig', 'cp1252'):
+        try:
+            return data.decode(encoding)
+        except UnicodeDecodeError:
+            continue
+    return data.decode('latin-1')
+
+
+def _blocks(text: str) -> Iterator[str]:
+    """Split plain text at form feeds, then into blocks of whole lines"""
+    for section in text.split('\f'):
+        lines: List[str] = []
+        size = 0
+        for line in section.splitlines():
+            lines.append(line)
+            size += len(line) + 1
+            if size >= TEXT_BLOCK_CHARS:
+                yield '\n'.join(lines)
+                lines, size = [], 0
+        if lines:
+            yield '\n'.join(lines)
+
+
+def iter_txt_pages(data: bytes) -> Iterator[str]:
+    yield from _blocks(_decode(data))
+
+
+RTF_CONTROL = re.compile(r"\\([a-z]{1,32})(-?\d{1,10})? ?|\\'([0-9a-f]{2})|\\([^a-z])|([{}])|[\r\n]+|(.)", re.I)
+# Destinations whose contents are not document text
+RTF_SKIP = {'fonttbl', 'colortbl', 'stylesheet', 'info', 'pict', 'header', 'footer', 'object', 'themedata',
+            'datastore', 'latentstyles', 'listtable', 'listoverridetable', 'rsidtbl', 'generator', 'xmlnstbl'}
+
+
+def iter_rtf_pages(data: bytes) -> Iterator[str]:
+    """Strip RTF control words; \\page and \\sect start a new page"""
+    out: List[str] = []
+    stack: List[bool] = []
+    skipping = False
+    skip_fallback = False
+    for word, param, hex_char, symbol, brace, char in RTF_CONTROL.findall(_decode(data)):
+        if skip_fallback and (char or hex_char):
+            # \uN is followed by a one-character fallback for non-Unicode readers
+            skip_fallback = False
+            continue
+        skip_fallback = False
+        if brace == '{':
+            stack.append(skipping)
+        elif brace == '}':
+            skipping = stack.pop() if stack else False
+        elif symbol == '*':
+            skipping = True
+        elif skipping:
+            continue
+        elif word:
+            if word in RTF_SKIP:
+                skipping = True
+            elif word == 'u' and param:
+                out.append(chr(int(param) % 65536))
+                skip_fallback = True
+            elif word in ('par', 'line'):
+                out.append('\n')
+            elif word == 'tab':
+                out.append('\t')
+            elif word in ('page', 'sect'):
+                yield ''.join(out).strip()
+                out = []
+        elif hex_char:
+            out.append(bytes.fromhex(hex_char).decode('cp1252', errors='replace'))
+        elif symbol:
+            out.append(symbol if symbol in '\\{}' else '')
+        elif char:
+            out.append(char)
+    if out:
+        yield ''.join(out).strip()
+
+
+W_NS = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+
+
+def iter_docx_pages(data: bytes) -> Iterator[str]:
+    """Paragraphs of word/document.xml, split at explicit and rendered page breaks"""
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        xml = archive.read('word/document.xml')
+    paragraphs: List[str] = []
+    for _, element in ElementTree.iterparse(io.BytesIO(xml)):
+        if element.tag != f'{W_NS}p':
+            continue
+        texts = []
+        page_break = False
+        for node in element.iter():
+            if node.tag == f'{W_NS}t' and node.text:
+                texts.append(node.text)
+            elif node.tag == f'{W_NS}tab':
+                texts.append('\t')
+            elif node.tag == f'{W_NS}lastRenderedPageBreak' or (
+                    node.tag == f'{W_NS}br' and node.get(f'{W_NS}type') == 'page'):
+                page_break = True
+        if page_break and paragraphs:
+            yield '\n'.join(paragraphs)
+            paragraphs = []
+        paragraphs.append(''.join(texts))
+        element.clear()
+    if paragraphs:
+        yield '\n'.join(paragraphs)
+
+
+def iter_odt_pages(data: bytes) -> Iterator[str]:
+    """ODT has no stored pagination; yield its paragraphs in text-sized blocks"""
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        xml = archive.read('content.xml')
+    text_ns = '{urn:oasis:names:tc:opendocument:xmlns:text:1.0}'
+    lines = []
+    for _, element in ElementTree.iterparse(io.BytesIO(xml)):
+        if element.tag in (f'{text_ns}p', f'{text_ns}h'):
+            lines.append(''.join(element.itertext()))
+            element.clear()
+    yield from _blocks('\n'.join(lines))
+
+
+EXTRACTORS: Dict[str, Callable[[bytes], Iterator[str]]] = {
+    '.pdf': iter_pdf_pages,
+    '.docx': iter_docx_pages,
+    '.odt': iter_odt_pages,
+    '.txt': iter_txt_pages,
+    '.rtf': iter_rtf_pages,
+}
+
+
+def is_supported(name: str) -> bool:
+    return os.path.splitext(name)[1].lower() in EXTRACTORS
+
+
+def iter_pages(name: str, data: bytes) -> Iterator[str]:
+    """Yield the text of each page of an upload"""
+    extension = os.path.splitext(name)[1].lower()
+    try:
+        extractor = EXTRACTORS[extension]
+    except KeyError:
+        raise IngestError(f"{name}: unsupported file type '{extension or 'none'}'")
+    yield from extractor(data)
+
+
+def extract_document(name: str, data: bytes, limits: Optional[IngestLimits] = None) -> ExtractedDocument:
+    """Extract an upload page by page, stopping at the page limit"""
+    limits = limits or IngestLimits()
+    if len(data) > limits.max_bytes:
+        raise IngestError(f"{name}: {len(data) / 1e6:.1f} MB exceeds the {limits.max_bytes / 1e6:.0f} MB limit")
+    document = ExtractedDocument(name=name, sha256=hashlib.sha256(data).hexdigest())
+    try:
+        for page in iter_pages(name, data):
+            if len(document.pages) >= limits.max_pages:
+                document.truncated = True
+                break
+            document.pages.append(page.strip())
+    except IngestError:
+        raise
+    except Exception as e:
+        raise IngestError(f"{name}: could not be read ({type(e).__name__}: {e})")
+    return document
+
+
+# Lines that usually carry the clinically relevant part of a report
+FLAG_WORDS = re.compile(r'\b(high|low|abnormal|positive|negative|elevated|reduced|deficien\w*|impression|'
+                        r'diagnosis|conclusion|finding\w*|result\w*)\b', re.I)
+# A lab table's H / L (or (H) / (L)) flag column: a capital letter standing alone, unlike the l in mg/L
+LAB_FLAG = re.compile(r'(?<!\S)\(?[HL]\)?(?!\S)')
+SENTENCE_SPLIT = re.compile(r'(?<=[.!?])\s+|\n+')
+
+
+def summarise_text(text: str, max_chars: int = 600) -> str:
+    """Extractive summary: flagged and numeric lines first, in document order"""
+    sentences = [re.sub(r'[ \t]+', ' ', s).strip() for s in SENTENCE_SPLIT.split(text)]
+    sentences = [s for s in sentences if len(s) > 3]
+    scored = []
+    for index, sentence in enumerate(sentences):
+        flagged = FLAG_WORDS.search(sentence) or LAB_FLAG.search(sentence)
+        score = 2 * bool(flagged) + bool(re.search(r'\d', sentence))
+        scored.append((-score, index, sentence))
+    chosen, used = [], 0
+    for _, index, sentence in sorted(scored):
+        if used + len(sentence) + 1 > max_chars:
+            continue
+        chosen.append((index, sentence))
+        used += len(sentence) + 1
+    return ' '.join(sentence for _, sentence in sorted(chosen))
+
+
+def summarise_chunks(document: ExtractedDocument, pages_per_chunk: int = 10,
+                     chars_per_chunk: int = 600) -> List[Tuple[str, str]]:
+    """(page range label, summary) for consecutive groups of pages"""
+    chunks = []
+    for start in range(0, document.page_count, pages_per_chunk):
+        pages = document.pages[start:start + pages_per_chunk]
+        end = start + len(pages)
+        label = f"p{start + 1}" if end == start + 1 else f"p{start + 1}-{end}"
+        summary = summarise_text('\n'.join(pages), chars_per_chunk)
+        if summary:
+            chunks.append((label, summary))
+    return chunks
+
+
+def document_context(document: ExtractedDocument, max_chars: int = 6000) -> str:
+    """Compact, summarised view of a document for the consultation context"""
+    header = f"[{document.name}: {document.page_count} page(s){', truncated' if document.truncated else ''}]"
+    chunks = summarise_chunks(document)
+    if not chunks:
+        return f"{header} (no extractable text)"
+    per_chunk = max(120, (max_chars - len(header)) // len(chunks))
+    lines = [header]
+    for label, summary in chunks:
+        lines.append(f"{label}: {summary[:per_chunk]}")
+    return '\n'.join(lines)[:max_chars]
+
+
+class DocumentIngestor:
+    """Extracts uploads with a content-hash cache and a process pool for large files"""
+
+    def __init__(self, cache: Optional[RenderCache] = None, limits: Optional[IngestLimits] = None,
+                 max_workers: int = 2):
+        self.cache = cache or RenderCache(max_entries=32)
+        self.limits = limits or IngestLimits()
+        self.max_workers = max_workers
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self.stats = {'cached': 0, 'inline': 0, 'pooled': 0, 'rejected': 0}
+
+    def _pool(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers,
+                                                 mp_context=multiprocessing.get_context('spawn'))
+        return self._executor
+
+    def _cache_key(self, data: bytes) -> str:
+        return hashlib.sha256(data).hexdigest() + f"-{self.limits.max_pages}"
+
+    def ingest(self, files: Sequence[Tuple[str, bytes]]) -> List[Tuple[str, Optional[ExtractedDocument], Optional[str]]]:
+        """Extract each (name, bytes) upload; returns (name, document or None, error or None) in order"""
+        results: List[Tuple[str, Optional[ExtractedDocument], Optional[str]]] = [None] * len(files)
+        pending = {}
+        for index, (name, data) in enumerate(files):
+            if len(data) > self.limits.max_bytes:
+                self.stats['rejected'] += 1
+                results[index] = (name, None, f"{name}: {len(data) / 1e6:.1f} MB exceeds the "
+                                              f"{self.limits.max_bytes / 1e6:.0f} MB limit")
+                continue
+            cached = self.cache.get(self._cache_key(data), 'pages.json')
+            if cached is not None:
+                self.stats['cached'] += 1
+                document = ExtractedDocument(**json.loads(cached))
+                document.name = name
+                results[index] = (name, document, None)
+            elif len(data) >= self.limits.process_threshold_bytes:
+                self.stats['pooled'] += 1
+                pending[index] = self._pool().submit(extract_document, name, data, self.limits)
+            else:
+                self.stats['inline'] += 1
+                results[index] = self._finish(name, data, lambda: extract_document(name, data, self.limits))
+        for index, future in pending.items():
+            name, data = files[index]
+            results[index] = self._finish(name, data, future.result)
+        return results
+
+    def _finish(self, name: str, data: bytes, extract: Callable[[], ExtractedDocument]):
+        try:
+            document = extract()
+        except IngestError as e:
+            self.stats['rejected'] += 1
+            return name, None, str(e)
+        except Exception as e:
+            # A crashed worker process; report it like any unreadable upload
+            self.stats['rejected'] += 1
+            return name, None, f"{name}: extraction failed ({type(e).__name__}: {e})"
+        self.cache.get_or_render(self._cache_key(data), 'pages.json', lambda: json.dumps(asdict(document)))
+        return name, document, None
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,195 @@
+"""Append-only per-session message journal.
+
+Each session gets a JSON-lines file holding one record per message, keyed by
+``(session_id, seq)``. Saving a turn appends only the messages the journal has
+not seen yet, so the bytes written per turn stay flat however long the
+consultation gets. A ``{"truncate": n}`` record drops every message with
+``seq >= n`` (used when a history is rewound); files that accumulate such dead
+records are compacted on a background thread.
+"""
+import json
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, List, Optional
+
+
+class MessageJournal:
+    """Per-session append-only message log stored as JSON lines."""
+
+    def __init__(self, directory: str, compact_min_dead: int = 32, compact_ratio: float = 0.5):
+        self.directory = directory
+        self.compact_min_dead = compact_min_dead
+        self.compact_ratio = compact_ratio
+        os.makedirs(directory, exist_ok=True)
+        self._lengths: Dict[str, int] = {}
+        self._records: Dict[str, int] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        self._locks_guard = threading.Lock()
+        self._compactor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="journal-compact")
+        self._pending_compactions = set()
+
+    def _path(self, session_id: str) -> str:
+        safe_id = re.sub(r'[^A-Za-z0-9_.-]', '_', session_id)
+        return os.path.join(self.directory, f"{safe_id}.jsonl")
+
+    def _lock(self, session_id: str) -> threading.Lock:
+        with self._locks_guard:
+            return self._locks.setdefault(session_id, threading.Lock())
+
+    def _repair_tail(self, session_id: str) -> None:
+        """Cut a torn final line left by a crash mid-append, so new records start on a fresh line"""
+        path = self._path(session_id)
+        if not os.path.exists(path):
+            return
+        with open(path, 'r+b') as f:
+            end = position = f.seek(0, os.SEEK_END)
+            while position > 0:
+                step = min(4096, position)
+                f.seek(position - step)
+                newline = f.read(step).rfind(b'\n')
+                if newline != -1:
+                    position += newline + 1 - step
+                    break
+                position -= step
+            if position != end:
+                f.truncate(position)
+
+    def _scan(self, session_id: str) -> None:
+        """Populate the cached live length and record count from disk"""
+        self._repair_tail(session_id)
+        length = 0
+        records = 0
+        for record in self._iter_records(session_id):
+            records += 1
+            if 'truncate' in record:
+                length = min(length, record['truncate'])
+            else:
+                length = max(length, record['seq'] + 1)
+        self._lengths[session_id] = length
+        self._records[session_id] = records
+
+    def _iter_records(self, session_id: str) -> Iterator[Dict]:
+        path = self._path(session_id)
+        if not os.path.exists(path):
+            return
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    # A torn line from a crash mid-append; the records around it are intact
+                    continue
+
+    def length(self, session_id: str) -> int:
+        """Number of live messages journaled for a session"""
+        with self._lock(session_id):
+            if session_id not in self._lengths:
+                self._scan(session_id)
+            return self._lengths[session_id]
+
+    def exists(self, session_id: str) -> bool:
+        """Whether a journal file exists for the session"""
+        return os.path.exists(self._path(session_id))
+
+    def sync(self, session_id: str, messages: List[Dict]) -> int:
+        """Append messages not yet journaled and return the number of bytes written"""
+        with self._lock(session_id):
+            if session_id not in self._lengths:
+                self._scan(session_id)
+            known = self._lengths[session_id]
+            lines = []
+            if len(messages) < known:
+                lines.append(json.dumps({'truncate': len(messages)}))
+                known = len(messages)
+            for seq in range(known, len(messages)):
+                lines.append(json.dumps({'seq': seq, 'message': messages[seq]}, ensure_ascii=False))
+            if not lines:
+                return 0
+
+            payload = ('\n'.join(lines) + '\n').encode('utf-8')
+            with open(self._path(session_id), 'ab') as f:
+                f.write(payload)
+            self._lengths[session_id] = len(messages)
+            self._records[session_id] += len(lines)
+            dead = self._records[session_id] - self._lengths[session_id]
+
+        if dead >= self.compact_min_dead and dead > self.compact_ratio * self._lengths[session_id]:
+            self.schedule_compaction(session_id)
+        return len(payload)
+
+    def read(self, session_id: str) -> Optional[List[Dict]]:
+        """Rebuild a session's messages by streaming its journal, or None if absent"""
+        if not self.exists(session_id):
+            return None
+        with self._lock(session_id):
+            return self._replay(session_id)
+
+    def _replay(self, session_id: str) -> List[Dict]:
+        messages: List[Dict] = []
+        for record in self._iter_records(session_id):
+            if 'truncate' in record:
+                del messages[record['truncate']:]
+            elif record['seq'] == len(messages):
+                messages.append(record['message'])
+            elif record['seq'] < len(messages):
+                messages[record['seq']] = record['message']
+        return messages
+
+    def schedule_compaction(self, session_id: str) -> None:
+        """Queue a background rewrite of the session's journal without dead records"""
+        with self._locks_guard:
+            if session_id in self._pending_compactions:
+                return
+            self._pending_compactions.add(session_id)
+        self._compactor.submit(self._compact_job, session_id)
+
+    def _compact_job(self, session_id: str) -> None:
+        try:
+            self.compact(session_id)
+        finally:
+            with self._locks_guard:
+                self._pending_compactions.discard(session_id)
+
+    def compact(self, session_id: str) -> None:
+        """Rewrite the journal so it holds exactly one record per live message"""
+        with self._lock(session_id):
+            path = self._path(session_id)
+            if not os.path.exists(path):
+                return
+            messages = self._replay(session_id)
+            tmp_path = path + '.compact'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                for seq, message in enumerate(messages):
+                    f.write(json.dumps({'seq': seq, 'message': message}, ensure_ascii=False) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+            self._lengths[session_id] = len(messages)
+            self._records[session_id] = len(messages)
+
+    def delete(self, session_id: str) -> None:
+        """Remove a session's journal"""
+        with self._lock(session_id):
+            path = self._path(session_id)
+            if os.path.exists(path):
+                os.remove(path)
+            self._lengths.pop(session_id, None)
+            self._records.pop(session_id, None)
+
+    def clear(self) -> None:
+        """Remove every journal in the directory"""
+        for name in os.listdir(self.directory):
+            if name.endswith('.jsonl'):
+                os.remove(os.path.join(self.directory, name))
+        with self._locks_guard:
+            self._lengths.clear()
+            self._records.clear()
+
+    def close(self) -> None:
+        """Wait for pending compactions to finish"""
+        self._compactor.shutdown(wait=True)
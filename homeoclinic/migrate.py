@@ -0,0 +1,62 @@
+"""One-shot migration of a legacy TinyDB ``homeo_clinic.json`` into SQLite.
+
+Usage::
+
+    python -m homeoclinic.migrate homeo_clinic.json homeo_clinic.db
+"""
+import argparse
+import os
+from typing import Dict
+
+from .storage import SQLiteStorage, TinyDBStorage
+
+
+def migrate_tinydb_to_sqlite(json_path: str, sqlite_path: str) -> Dict[str, int]:
+    """Copy every session and consultation from TinyDB into SQLite.
+
+    Sessions are upserted and consultations already present (same session_id
+    and date) are skipped, so re-running the migration is harmless.
+    """
+    if not os.path.exists(json_path):
+        raise FileNotFoundError(f"TinyDB file not found: {json_path}")
+
+    source = TinyDBStorage(json_path)
+    target = SQLiteStorage(sqlite_path)
+    counts = {'sessions': 0, 'consultations': 0, 'skipped_consultations': 0}
+    try:
+        for session in source.list_sessions():
+            if not session.get('session_id'):
+                continue
+            session.setdefault('message_count', len(session.get('messages', [])))
+            target.save_session(session)
+            counts['sessions'] += 1
+
+        for consultation in source.all_consultations():
+            session_id = consultation.get('session_id')
+            date = consultation.get('date')
+            if not session_id or not date or target.has_consultation(session_id, date):
+                counts['skipped_consultations'] += 1
+                continue
+            target.save_consultation(consultation)
+            counts['consultations'] += 1
+    finally:
+        source.close()
+        target.close()
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Migrate a TinyDB homeo_clinic.json into SQLite.")
+    parser.add_argument("json_path", nargs="?", default="homeo_clinic.json")
+    parser.add_argument("sqlite_path", nargs="?", default="homeo_clinic.db")
+    args = parser.parse_args(argv)
+
+    counts = migrate_tinydb_to_sqlite(args.json_path, args.sqlite_path)
+    print(
+        f"Migrated {counts['sessions']} session(s) and {counts['consultations']} consultation(s) "
+        f"into {args.sqlite_path} ({counts['skipped_consultations']} consultation(s) skipped)."
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""Process pool for PDF rendering and batch prescription export.
+
+WeasyPrint is CPU bound and holds the GIL, so rendering on the request thread
+stalls the whole Streamlit server. Workers are started with the ``spawn``
+context (WeasyPrint's native libraries are not fork safe) and parse the print
+stylesheet once, in the pool initializer, instead of once per PDF.
+"""
+import io
+import multiprocessing
+import re
+import threading
+import zipfile
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from homeoclinic.rendering import generate_prescription_pdf, get_pdf_stylesheet
+
+OUTPUT_FORMATS = ('zip', 'pdf')
+
+
+def _warm_worker() -> None:
+    """Pool initializer: parse the stylesheet before the first job arrives"""
+    try:
+        get_pdf_stylesheet()
+    except (ImportError, OSError):
+        # WeasyPrint unavailable; the render call reports the error per item
+        pass
+
+
+def prescription_filename(prescription: Dict, index: int) -> str:
+    """File name for one prescription inside a batch archive"""
+    date = re.sub(r'[^0-9A-Za-z]+', '-', str(prescription.get('date', '')))[:19].strip('-')
+    remedies = prescription.get('remedies') or [{}]
+    label = prescription.get('patient_name') or remedies[0].get('medicine') or ''
+    label = re.sub(r'[^0-9A-Za-z]+', '_', str(label))[:40].strip('_')
+    return f"{index + 1:04d}_{date or 'undated'}_{label or 'prescription'}.pdf"
+
+
+def combine_pdfs(documents: Sequence[bytes]) -> bytes:
+    """Concatenate PDF documents into one"""
+    from PyPDF2 import PdfReader, PdfWriter
+    writer = PdfWriter()
+    for document in documents:
+        for page in PdfReader(io.BytesIO(document)).pages:
+            writer.add_page(page)
+    buffer = io.BytesIO()
+    writer.write(buffer)
+    return buffer.getvalue()
+
+
+def zip_pdfs(files: Sequence[Tuple[str, bytes]]) -> bytes:
+    """Pack (name, PDF bytes) pairs into a ZIP archive"""
+    buffer = io.BytesIO()
+    # PDFs are already compressed; storing them keeps packing cheap
+    with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_STORED) as archive:
+        for name, data in files:
+            archive.writestr(name, data)
+    return buffer.getvalue()
+
+
+class BatchJob:
+    """Progress and result of one batch export"""
+
+    def __init__(self, names: List[str], output: str):
+        self.names = names
+        self.output = output
+        self.total = len(names)
+        self.completed = 0
+        self.errors: Dict[str, str] = {}
+        self._documents: List[Optional[bytes]] = [None] * self.total
+        self._lock = threading.Lock()
+        self._finished = threading.Event()
+        self._result: Optional[bytes] = None
+        self._failure: Optional[BaseException] = None
+        if not self.total:
+            self._finish()
+
+    @property
+    def fraction(self) -> float:
+        return self.completed / self.total if self.total else 1.0
+
+    def done(self) -> bool:
+        return self._finished.is_set()
+
+    def _item_done(self, index: int, future: Future) -> None:
+        document, error = None, None
+        try:
+            document = future.result()
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+        with self._lock:
+            if document is None:
+                self.errors[self.names[index]] = error
+            self._documents[index] = document
+            self.completed += 1
+            last = self.completed == self.total
+        if last:
+            self._finish()
+
+    def _finish(self) -> None:
+        try:
+            rendered = [(name, doc) for name, doc in zip(self.names, self._documents) if doc is not None]
+            if not rendered:
+                self._result = None
+            elif self.output == 'pdf':
+                self._result = combine_pdfs([doc for _, doc in rendered])
+            else:
+                self._result = zip_pdfs(rendered)
+        except Exception as e:
+            self._failure = e
+        self._finished.set()
+
+    def result(self, timeout: Optional[float] = None) -> Optional[bytes]:
+        """Wait for the batch and return the ZIP / combined PDF (None if nothing rendered)"""
+        if not self._finished.wait(timeout):
+            raise TimeoutError(f"batch export not finished ({self.completed}/{self.total})")
+        if self._failure is not None:
+            raise self._failure
+        return self._result
+
+
+class PDFRenderService:
+    """Renders prescription PDFs on a pool of worker processes"""
+
+    def __init__(self, max_workers: Optional[int] = None,
+                 render_fn: Callable[[Dict], bytes] = generate_prescription_pdf):
+        self.render_fn = render_fn
+        self._executor = ProcessPoolExecutor(
+            max_workers=max_workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_warm_worker,
+        )
+
+    def render(self, prescription: Dict, timeout: Optional[float] = None) -> bytes:
+        """Render a single PDF off the calling thread and wait for it"""
+        return self._executor.submit(self.render_fn, prescription).result(timeout)
+
+    def submit_batch(self, prescriptions: Sequence[Dict], output: str = 'zip',
+                     names: Optional[Sequence[str]] = None) -> BatchJob:
+        """Queue PDFs for every prescription and return a job to poll for progress"""
+        if output not in OUTPUT_FORMATS:
+            raise ValueError(f"Unknown batch output {output!r}; expected one of {', '.join(OUTPUT_FORMATS)}")
+        names = list(names) if names is not None else [
+            prescription_filename(p, i) for i, p in enumerate(prescriptions)
+        ]
+        job = BatchJob(names, output)
+        for index, prescription in enumerate(prescriptions):
+            future = self._executor.submit(self.render_fn, prescription)
+            future.add_done_callback(lambda f, i=index: job._item_done(i, f))
+        return job
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
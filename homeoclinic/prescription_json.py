@@ -0,0 +1,391 @@
+"""Prescription JSON extraction, repair and validation.
+
+Replaces the greedy ``\\{[\\s\\S]*\\}`` regex, which backtracks on long replies
+and swallows any brace the model writes after the JSON. :class:`JsonScanner`
+walks the reply once (and can be fed chunk by chunk while streaming), tracking
+fenced code blocks and string-aware brace depth. Each balanced object becomes
+a candidate. Candidates inside a fence are preferred, and a fence that closes
+with the object still open yields its contents for repair. Candidates are
+parsed as-is, then once more after :func:`repair_json`, and the first one that
+fits the :class:`Prescription` schema wins.
+"""
+import json
+import re
+from dataclasses import dataclass, field, fields
+from typing import Any, Dict, List, Optional, Tuple
+
+PRESCRIPTION_MARKER = "PRESCRIPTION_READY"
+
+OPEN_QUOTES = '"“”„'
+# Quotes that end a string, by the quote that opened it (repair_json turns the smart ones into ")
+CLOSING_QUOTES = {'"': '"', '“': '”"', '„': '”"', '”': '”"'}
+SIGNIFICANT = re.compile('[`{}\\[\\]\\\\' + OPEN_QUOTES + ']')
+SMART_SINGLE = '‘’'
+
+
+class PrescriptionSchemaError(ValueError):
+    """Parsed JSON does not describe a usable prescription"""
+
+    def __init__(self, problems: List[str]):
+        super().__init__('; '.join(problems))
+        self.problems = problems
+
+
+@dataclass
+class Candidate:
+    text: str
+    fenced: bool
+    complete: bool = True
+
+
+class JsonScanner:
+    """Single-pass, incremental scanner for JSON object candidates.
+
+    Every character is examined once across all :meth:`feed` calls, so the work
+    per chunk is bounded by the chunk size.
+    """
+
+    def __init__(self):
+        self.text = ''
+        self.candidates: List[Candidate] = []
+        self._pos = 0
+        self._ticks = 0
+        self._last_tick = -2
+        self._in_fence = False
+        self._start: Optional[int] = None
+        self._start_fenced = False
+        self._depth = 0
+        self._closing: Optional[str] = None  # closing quotes of the string being scanned
+        self._escaped_at = -1
+
+    def feed(self, chunk: str) -> List[Candidate]:
+        """Scan newly arrived text and return the candidates it completed"""
+        self.text += chunk
+        found = []
+        text = self.text
+        # Only these characters change the scanner state; the regex skips the rest in C
+        for match in SIGNIFICANT.finditer(text, self._pos):
+            i = match.start()
+            char = text[i]
+            if self._closing is not None:
+                if i == self._escaped_at:
+                    continue
+                if char == '\\':
+                    self._escaped_at = i + 1
+                elif char in self._closing:
+                    self._closing = None
+                continue
+
+            if char == '`':
+                self._ticks = self._ticks + 1 if i == self._last_tick + 1 else 1
+                self._last_tick = i
+                if self._ticks == 3:
+                    self._ticks = 0
+                    self._toggle_fence(i, found)
+                continue
+
+            if self._start is None:
+                if char == '{':
+                    self._start, self._start_fenced, self._depth = i, self._in_fence, 1
+                continue
+            if char in OPEN_QUOTES:
+                self._closing = CLOSING_QUOTES[char]
+            elif char in '{[':
+                self._depth += 1
+            elif char in '}]':
+                self._depth -= 1
+                if self._depth == 0:
+                    found.append(Candidate(text[self._start:i + 1], self._start_fenced))
+                    self._start = None
+        self._pos = len(text)
+        self.candidates.extend(found)
+        return found
+
+    def _toggle_fence(self, index: int, found: List[Candidate]) -> None:
+        if self._in_fence and self._start is not None and self._start_fenced:
+            # The fence closed with the object still open: hand its contents to the repairer
+            found.append(Candidate(self.text[self._start:index - 2], fenced=True, complete=False))
+            self._start = None
+        self._in_fence = not self._in_fence
+
+    def pending(self) -> Optional[Candidate]:
+        """The object still open at the end of the text (e.g. a truncated reply)"""
+        if self._start is None:
+            return None
+        return Candidate(self.text[self._start:], self._start_fenced, complete=False)
+
+
+def _is_word(text: str, i: int, word: str) -> bool:
+    end = i + len(word)
+    return (text.startswith(word, i) and (i == 0 or not text[i - 1].isalnum())
+            and (end == len(text) or not text[end].isalnum()))
+
+
+PYTHON_LITERALS = (('True', 'true'), ('False', 'false'), ('None', 'null'))
+
+
+def repair_json(text: str) -> str:
+    """Fix common LLM JSON mistakes in one pass.
+
+    Handles smart or single-quoted strings, trailing commas, // and /* */
+    comments, Python literals, raw newlines inside strings and missing closing
+    brackets from a truncated reply.
+    """
+    out: List[str] = []
+    stack: List[str] = []
+    quote: Optional[str] = None  # closing delimiter of the string being copied
+    pending_comma: Optional[int] = None
+    i, n = 0, len(text)
+    while i < n:
+        char = text[i]
+        if quote is not None:
+            if char == '\\' and i + 1 < n:
+                # \' is valid in single-quoted strings but not in JSON
+                out.append("'" if text[i + 1] == "'" else text[i:i + 2])
+                i += 2
+                continue
+            if char in quote:
+                out.append('"')
+                quote = None
+            elif char == '"':
+                out.append('\\"')  # a bare " inside a single- or smart-quoted string
+            elif char == '\n':
+                out.append('\\n')
+            elif char == '\t':
+                out.append('\\t')
+            elif char == '\r':
+                pass
+            else:
+                out.append(char)
+            i += 1
+            continue
+
+        if char in ' \t\r\n':
+            out.append(char)
+            i += 1
+            continue
+        if text.startswith('//', i):
+            newline = text.find('\n', i)
+            i = n if newline == -1 else newline
+            continue
+        if text.startswith('/*', i):
+            close = text.find('*/', i + 2)
+            i = n if close == -1 else close + 2
+            continue
+
+        if char in '}]' and pending_comma is not None:
+            del out[pending_comma]
+        pending_comma = None
+
+        if char == '"':
+            quote = '"'
+            out.append('"')
+        elif char in '“„':
+            quote = '”"'
+            out.append('"')
+        elif char == '”':
+            quote = '”"'
+            out.append('"')
+        elif char == "'" or char in SMART_SINGLE:
+            quote = "'" + SMART_SINGLE
+            out.append('"')
+        elif char in '{[':
+            stack.append('}' if char == '{' else ']')
+            out.append(char)
+        elif char in '}]':
+            if stack:
+                stack.pop()
+            out.append(char)
+        elif char == ',':
+            pending_comma = len(out)
+            out.append(char)
+        else:
+            for python, json_literal in PYTHON_LITERALS:
+                if _is_word(text, i, python):
+                    out.append(json_literal)
+                    i += len(python)
+                    break
+            else:
+                out.append(char)
+                i += 1
+            continue
+        i += 1
+
+    if quote is not None:
+        out.append('"')
+    if pending_comma is not None and stack:
+        del out[pending_comma]
+    out.extend(reversed(stack))
+    return ''.join(out)
+
+
+def _text(value: Any) -> Optional[str]:
+    if value is None:
+        return None
+    if isinstance(value, (list, tuple)):
+        return '; '.join(str(v) for v in value if v is not None)
+    if isinstance(value, dict):
+        return json.dumps(value, ensure_ascii=False)
+    return str(value)
+
+
+def _text_list(value: Any) -> Optional[List[str]]:
+    if value is None:
+        return None
+    if isinstance(value, (list, tuple)):
+        return [_text(v) for v in value if v is not None and _text(v)]
+    return [_text(value)]
+
+
+@dataclass
+class Remedy:
+    medicine: str
+    potency: Optional[str] = None
+    dosage: Optional[str] = None
+    instructions: Optional[str] = None
+    purpose: Optional[str] = None
+    keynote_match: Optional[str] = None
+    sphere_of_action: Optional[str] = None
+    extra: Dict[str, Any] = field(default_factory=dict)
+
+    @classmethod
+    def from_dict(cls, data: Any, index: int, problems: List[str]) -> Optional['Remedy']:
+        if isinstance(data, str) and data.strip():
+            data = {'medicine': data}
+        if not isinstance(data, dict):
+            problems.append(f"remedies[{index}] is not an object")
+            return None
+        medicine = _text(data.get('medicine') or data.get('remedy') or data.get('name'))
+        if not medicine or not medicine.strip():
+            problems.append(f"remedies[{index}] has no medicine")
+            return None
+        known = {f.name for f in fields(cls)} - {'extra'}
+        values = {name: _text(data.get(name)) for name in known if name != 'medicine'}
+        extra = {k: v for k, v in data.items() if k not in known and k not in ('remedy', 'name')}
+        return cls(medicine=medicine.strip(), extra=extra, **values)
+
+    def to_dict(self) -> Dict[str, Any]:
+        result = {f.name: getattr(self, f.name) for f in fields(self)
+                  if f.name != 'extra' and getattr(self, f.name) is not None}
+        result.update(self.extra)
+        return result
+
+
+TEXT_FIELDS = ('patient_name', 'date', 'chief_complaint', 'case_summary', 'constitutional_type',
+               'miasmatic_assessment', 'diagnosis', 'healing_progression', 'possible_initial_aggravation',
+               'follow_up', 'when_to_repeat_remedy', 'red_flags', 'disclaimer')
+LIST_FIELDS = ('dietary_advice', 'lifestyle_recommendations', 'mind_body_guidance',
+               'complementary_support', 'precautions')
+
+
+@dataclass
+class Prescription:
+    """Typed view of the prescription JSON requested in the system prompt"""
+    remedies: List[Remedy]
+    text: Dict[str, str] = field(default_factory=dict)
+    lists: Dict[str, List[str]] = field(default_factory=dict)
+    extra: Dict[str, Any] = field(default_factory=dict)
+    # Key order of the model's JSON, kept for display and download
+    order: List[str] = field(default_factory=list)
+
+    @classmethod
+    def from_dict(cls, data: Any) -> 'Prescription':
+        """Validate and coerce parsed JSON; raises PrescriptionSchemaError"""
+        if not isinstance(data, dict):
+            raise PrescriptionSchemaError(["top level is not an object"])
+        problems: List[str] = []
+        raw_remedies = data.get('remedies')
+        if isinstance(raw_remedies, dict):
+            raw_remedies = [raw_remedies]
+        if not isinstance(raw_remedies, list) or not raw_remedies:
+            raise PrescriptionSchemaError(["'remedies' must be a non-empty list"])
+        remedies = [r for r in (Remedy.from_dict(item, i, problems) for i, item in enumerate(raw_remedies)) if r]
+        if not remedies:
+            raise PrescriptionSchemaError(problems)
+
+        text = {name: _text(data[name]) for name in TEXT_FIELDS if data.get(name) is not None}
+        lists = {name: _text_list(data[name]) for name in LIST_FIELDS if data.get(name) is not None}
+        known = set(TEXT_FIELDS) | set(LIST_FIELDS) | {'remedies'}
+        extra = {k: v for k, v in data.items() if k not in known}
+        return cls(remedies=remedies, text=text, lists=lists, extra=extra, order=list(data))
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Plain dict in the shape the rest of the app stores and renders"""
+        values: Dict[str, Any] = dict(self.text, remedies=[r.to_dict() for r in self.remedies])
+        values.update(self.lists)
+        values.update(self.extra)
+        ordered = {key: values[key] for key in self.order if key in values}
+        ordered.update(values)
+        return ordered
+
+
+@dataclass
+class ExtractionResult:
+    prescription: Optional[Dict[str, Any]] = None
+    repaired: bool = False
+    fenced: bool = False
+    errors: List[str] = field(default_factory=list)
+
+
+def parse_candidate(candidate: Candidate) -> Tuple[Optional[Dict[str, Any]], bool, Optional[str]]:
+    """(validated prescription, repaired?, error) for one candidate"""
+    attempts = [(candidate.text, False)] if candidate.complete else []
+    attempts.append((None, True))
+    error = None
+    for raw, repaired in attempts:
+        try:
+            data = json.loads(raw if raw is not None else repair_json(candidate.text))
+            return Prescription.from_dict(data).to_dict(), repaired, None
+        except PrescriptionSchemaError as e:
+            # Valid JSON of the wrong shape; repairing will not change that
+            return None, repaired, f"schema: {e}"
+        except ValueError as e:
+            error = f"json: {e}"
+    return None, True, error
+
+
+# extract_prescription scans in blocks so it can stop at the first valid fenced object
+SCAN_BLOCK_CHARS = 16 * 1024
+
+
+def extract_prescription(text: str, marker: Optional[str] = PRESCRIPTION_MARKER) -> ExtractionResult:
+    """Extract and validate the prescription from a full reply (after the marker when present).
+
+    The first valid object inside a code fence wins; failing that, the first
+    valid bare object. Scanning stops as soon as a fenced prescription is found,
+    so prose and stray braces after it cost nothing.
+    """
+    if marker:
+        index = text.find(marker)
+        if index != -1:
+            text = text[index + len(marker):]
+    result = ExtractionResult()
+    fallback: Optional[Tuple[Dict[str, Any], bool]] = None
+    scanner = JsonScanner()
+
+    def consider(candidates: List[Candidate]) -> bool:
+        nonlocal fallback
+        for candidate in candidates:
+            if fallback is not None and not candidate.fenced:
+                continue
+            prescription, repaired, error = parse_candidate(candidate)
+            if prescription is None:
+                result.errors.append(error)
+            elif candidate.fenced:
+                result.prescription, result.repaired, result.fenced = prescription, repaired, True
+                return True
+            else:
+                fallback = (prescription, repaired)
+        return False
+
+    for offset in range(0, len(text), SCAN_BLOCK_CHARS):
+        if consider(scanner.feed(text[offset:offset + SCAN_BLOCK_CHARS])):
+            return result
+    pending = scanner.pending()
+    if pending is not None and consider([pending]):
+        return result
+    if fallback is not None:
+        result.prescription, result.repaired = fallback
+    elif not scanner.candidates and pending is None:
+        result.errors.append("no JSON object found")
+    return result
@@ -0,0 +1,179 @@
+"""Process-wide cache for the static prefix every chat starts with.
+
+Every chat history opens with the same two turns: the system prompt and the
+model's fixed acknowledgement. :class:`PromptPrefixCache` registers that
+prefix once per process, under a key hashed from the model name and the
+prefix text, so editing the prompt invalidates it:
+
+* When the backend supports context caching (Gemini ``CachedContent``), the
+  prefix is uploaded once and chats start on a model bound to the cached
+  content, with only the conversation as history. Requests then reference the
+  prefix instead of resending it at the full input rate.
+* Otherwise (the model does not support it, the prefix is below the
+  provider's minimum size, the call fails) chats fall back to one shared copy
+  of the prefix turns. Its exact token count is measured once per prompt
+  version and kept on disk. Sending a byte-identical prefix is also what lets
+  the provider's implicit prefix caching apply.
+
+Tokens saved come from ``cached_content_token_count`` in the response usage
+when the provider reports it, and otherwise from the cached prefix size for
+chats started on the context cache.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from datetime import timedelta
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from .chat_history import build_chat_history
+from .context_window import estimate_tokens
+
+PREFIX_CACHE_VERSION = 1
+
+
+def prefix_key(model_name: str, system_prompt: str, acknowledgement: str) -> str:
+    """Version of a prefix: changes whenever the model or either text changes"""
+    digest = hashlib.sha256()
+    for part in (str(PREFIX_CACHE_VERSION), model_name, system_prompt, acknowledgement):
+        digest.update(part.encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()[:16]
+
+
+class GeminiContextCache:
+    """Server-side prefix caching through google.generativeai's CachedContent"""
+
+    def create(self, model_name: str, display_name: str, history: List[Dict], ttl: float) -> Tuple[Any, Any, int]:
+        """Upload the prefix; returns (cached content, model bound to it, cached tokens)"""
+        import google.generativeai as genai
+        from google.generativeai import caching
+        cached = caching.CachedContent.create(model=model_name, display_name=display_name, contents=history,
+                                              ttl=timedelta(seconds=ttl))
+        tokens = getattr(getattr(cached, 'usage_metadata', None), 'total_token_count', 0) or 0
+        return cached, genai.GenerativeModel.from_cached_content(cached_content=cached), tokens
+
+    def extend(self, cached: Any, ttl: float) -> None:
+        cached.update(ttl=timedelta(seconds=ttl))
+
+
+class PromptPrefixCache:
+    """Registers the static chat prefix once and starts chats that reference it"""
+
+    def __init__(self, model_name: str, system_prompt: str, acknowledgement: str, path: Optional[str] = None,
+                 backend: Optional[Any] = None, ttl: float = 3600.0, retry_after: float = 3600.0,
+                 count_tokens: Optional[Callable[[List[Dict]], int]] = None):
+        self.model_name = model_name
+        self.key = prefix_key(model_name, system_prompt, acknowledgement)
+        self.history = build_chat_history([], system_prompt, acknowledgement)
+        self.path = path
+        self.backend = backend
+        self.ttl = ttl
+        self.retry_after = retry_after
+        self._count_tokens = count_tokens
+        self._tokens: Optional[int] = None
+        self._cached: Any = None
+        self._cached_model: Any = None
+        self._expires_at = 0.0
+        self._failed_at: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self.stats: Dict[str, int] = {'chats': 0, 'context_cached_chats': 0, 'context_cache_creates': 0,
+                                      'context_cache_failures': 0}
+        self._lock = threading.Lock()
+
+    @property
+    def mode(self) -> str:
+        return 'context-cache' if self._cached_model is not None else 'local'
+
+    @property
+    def tokens(self) -> int:
+        """Exact (or, without a counter, estimated) token size of the prefix"""
+        if self._tokens is None:
+            with self._lock:
+                if self._tokens is None:
+                    self._tokens = self._load_tokens()
+        return self._tokens
+
+    def _read_index(self) -> Dict[str, Dict[str, Any]]:
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                index = json.load(f)
+            return index if isinstance(index, dict) else {}
+        except (OSError, ValueError):
+            return {}
+
+    def _load_tokens(self) -> int:
+        index = self._read_index() if self.path else {}
+        entry = index.get(self.key)
+        if isinstance(entry, dict) and isinstance(entry.get('tokens'), int):
+            return entry['tokens']
+        tokens = None
+        if self._count_tokens is not None:
+            try:
+                tokens = int(self._count_tokens(self.history))
+            except Exception as e:
+                self.last_error = f"token count failed: {e}"
+        measured = tokens is not None
+        if tokens is None:
+            tokens = sum(estimate_tokens(str(part)) for turn in self.history for part in turn['parts'])
+        if self.path and measured:
+            # Older versions of this model's prefix are invalidated by the new key
+            index = {k: v for k, v in index.items() if isinstance(v, dict) and v.get('model') != self.model_name}
+            index[self.key] = {'model': self.model_name, 'tokens': tokens}
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(index, f)
+            os.replace(tmp_path, self.path)
+        return tokens
+
+    def _context_model(self) -> Any:
+        """The model bound to the cached prefix, creating or extending it as needed; None to fall back"""
+        if self.backend is None:
+            return None
+        now = time.time()
+        with self._lock:
+            if self._cached_model is not None and now < self._expires_at:
+                if self._expires_at - now < self.ttl / 2:
+                    try:
+                        self.backend.extend(self._cached, self.ttl)
+                        self._expires_at = now + self.ttl
+                    except Exception as e:
+                        self.last_error = f"context cache refresh failed: {e}"
+                return self._cached_model
+            if self._failed_at is not None and now - self._failed_at < self.retry_after:
+                return None
+            try:
+                cached, model, tokens = self.backend.create(self.model_name, f"homeoclinic-prefix-{self.key}",
+                                                            self.history, self.ttl)
+            except Exception as e:
+                self._cached = self._cached_model = None
+                self._failed_at = now
+                self.stats['context_cache_failures'] += 1
+                self.last_error = f"context cache unavailable: {e}"
+                return None
+            self._cached, self._cached_model = cached, model
+            self._expires_at = now + self.ttl
+            self._failed_at = None
+            self.stats['context_cache_creates'] += 1
+            if tokens:
+                self._tokens = tokens
+            return model
+
+    def keep_alive(self) -> None:
+        """Extend the server-side cache when past half its lifetime (call once per turn)"""
+        if self._cached_model is not None:
+            self._context_model()
+
+    def start_chat(self, model: Any, history: List[Dict]) -> Tuple[Any, bool]:
+        """Start a chat over ``history`` (prefix included); returns (chat, prefix is context-cached)"""
+        if history[:len(self.history)] != self.history:
+            return model.start_chat(history=history), False
+        conversation = history[len(self.history):]
+        self.stats['chats'] += 1
+        context_model = self._context_model()
+        if context_model is not None:
+            self.stats['context_cached_chats'] += 1
+            return context_model.start_chat(history=conversation), True
+        # Share one copy of the prefix turns between every chat in the process
+        return model.start_chat(history=self.history + conversation), False
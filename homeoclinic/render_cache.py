@@ -0,0 +1,109 @@
+"""Content-addressed cache for rendered prescription artefacts."""
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple, Union
+
+Rendered = Union[str, bytes]
+
+
+def prescription_key(prescription: Dict[str, Any]) -> str:
+    """Stable hash of a prescription dict (independent of key order)"""
+    canonical = json.dumps(prescription, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+class RenderCache:
+    """LRU cache of rendered outputs keyed by (content hash, format).
+
+    An optional disk tier keeps outputs across restarts and shares them between
+    processes; it is trimmed to ``max_disk_bytes`` by evicting the least
+    recently used files.
+    """
+
+    def __init__(self, max_entries: int = 64, disk_dir: Optional[str] = None, max_disk_bytes: int = 200 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.disk_dir = disk_dir
+        self.max_disk_bytes = max_disk_bytes
+        self._entries: "OrderedDict[Tuple[str, str], Rendered]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'disk_hits': 0, 'misses': 0}
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    def _disk_path(self, key: str, fmt: str, is_text: bool) -> str:
+        return os.path.join(self.disk_dir, f"{key}.{fmt}.{'txt' if is_text else 'bin'}")
+
+    def _read_disk(self, key: str, fmt: str) -> Optional[Rendered]:
+        for is_text in (False, True):
+            path = self._disk_path(key, fmt, is_text)
+            try:
+                with open(path, 'rb') as f:
+                    data = f.read()
+            except FileNotFoundError:
+                continue
+            os.utime(path)
+            return data.decode('utf-8') if is_text else data
+        return None
+
+    def _write_disk(self, key: str, fmt: str, value: Rendered) -> None:
+        is_text = isinstance(value, str)
+        path = self._disk_path(key, fmt, is_text)
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp, 'wb') as f:
+            f.write(value.encode('utf-8') if is_text else value)
+        os.replace(tmp, path)
+        self._trim_disk()
+
+    def _trim_disk(self) -> None:
+        files = []
+        for entry in os.scandir(self.disk_dir):
+            if entry.is_file() and not entry.name.endswith('.tmp'):
+                stat = entry.stat()
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_disk_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def get(self, key: str, fmt: str) -> Optional[Rendered]:
+        """Return a cached output or None"""
+        with self._lock:
+            value = self._entries.get((key, fmt))
+            if value is not None:
+                self._entries.move_to_end((key, fmt))
+                self.stats['hits'] += 1
+                return value
+        if self.disk_dir:
+            value = self._read_disk(key, fmt)
+            if value is not None:
+                self.stats['disk_hits'] += 1
+                self._remember(key, fmt, value)
+                return value
+        return None
+
+    def _remember(self, key: str, fmt: str, value: Rendered) -> None:
+        with self._lock:
+            self._entries[(key, fmt)] = value
+            self._entries.move_to_end((key, fmt))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_or_render(self, key: str, fmt: str, render: Callable[[], Rendered]) -> Rendered:
+        """Return the cached output for (key, fmt), rendering and storing it on a miss"""
+        value = self.get(key, fmt)
+        if value is not None:
+            return value
+        self.stats['misses'] += 1
+        value = render()
+        self._remember(key, fmt, value)
+        if self.disk_dir:
+            self._write_disk(key, fmt, value)
+        return value
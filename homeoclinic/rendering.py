@@ -0,0 +1,196 @@
+"""Prescription rendering to a table, Markdown and PDF."""
+from datetime import datetime
+from functools import lru_cache
+from typing import Dict
+
+import markdown2
+import pandas as pd
+
+# Print stylesheet for PDFs, taking inspiration from the app CSS for consistency
+PDF_CSS = """
+    @page { size: A4; margin: 1cm; }
+    body { font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif; line-height: 1.6; color: #333; font-size: 11pt; }
+    h1, h2, h3, h4, h5, h6 { color: #667eea; margin-top: 1.5em; margin-bottom: 0.5em; page-break-after: avoid; }
+    h1 { font-size: 2.2em; text-align: center; border-bottom: 2px solid #764ba2; padding-bottom: 0.5em; color: #764ba2; }
+    h2 { font-size: 1.8em; color: #764ba2; }
+    h3 { font-size: 1.4em; color: #667eea; }
+    p { margin-bottom: 1em; }
+    ul { list-style-type: disc; margin-left: 20px; margin-bottom: 1em; }
+    li { margin-bottom: 0.5em; }
+    strong { font-weight: bold; }
+    em { font-style: italic; }
+    .prescription-card {
+        background: #f9f9f9;
+        border: 1px solid #eee;
+        padding: 1.5rem;
+        border-radius: 8px;
+        margin: 1.5rem 0;
+        box-shadow: 0 2px 4px rgba(0, 0, 0, 0.05);
+    }
+    .prescription-header {
+        text-align: center;
+        color: #667eea;
+        border-bottom: 2px solid #764ba2;
+        padding-bottom: 1rem;
+        margin-bottom: 1.5rem;
+    }
+    table {
+        width: 100%;
+        border-collapse: collapse;
+        margin-bottom: 1em;
+        page-break-inside: auto;
+    }
+    tr { page-break-inside: avoid; page-break-after: auto; }
+    th, td {
+        border: 1px solid #ddd;
+        padding: 8px;
+        text-align: left;
+        vertical-align: top;
+    }
+    th {
+        background-color: #f2f2f2;
+        color: #333;
+        font-weight: bold;
+    }
+    .warning-box {
+        background-color: #fff3cd;
+        border-left: 4px solid #ffc107;
+        padding: 1em;
+        margin: 1em 0;
+        border-radius: 4px;
+        color: #856404;
+    }
+    .info-box {
+        background-color: #d4edda;
+        border-left: 4px solid #28a745;
+        padding: 1em;
+        margin: 1em 0;
+        border-radius: 4px;
+        color: #155724;
+    }
+    a { color: #667eea; text-decoration: none; }
+    a:hover { text-decoration: underline; }
+"""
+
+
+def format_prescription_table(prescription: Dict) -> pd.DataFrame:
+    """Format prescription as a beautiful DataFrame"""
+    remedies = prescription.get('remedies', [])
+
+    df_data = []
+    for i, remedy in enumerate(remedies, 1):
+        df_data.append({
+            'S.No': i,
+            'Medicine': remedy.get('medicine', ''),
+            'Potency': remedy.get('potency', ''),
+            'Dosage': remedy.get('dosage', ''),
+            'Instructions': remedy.get('instructions', ''),
+            'Purpose': remedy.get('purpose', ''),
+            'Keynote Match': remedy.get('keynote_match', ''), # New column
+            'Sphere of Action': remedy.get('sphere_of_action', '') # New column (placeholder for future AI output)
+        })
+
+    return pd.DataFrame(df_data)
+
+def generate_prescription_markdown(prescription: Dict) -> str:
+    """Generate beautiful markdown prescription"""
+    md = f"""# 🌿 HomeoClinic AI - Prescription
+
+---
+
+## Patient Information
+- **Date**: {prescription.get('date', datetime.now().strftime('%Y-%m-%d'))}
+- **Patient**: {prescription.get('patient_name', 'Patient')}
+- **Chief Complaint**: {prescription.get('chief_complaint', 'N/A')}
+
+---
+
+## Homeopathic Diagnosis
+{prescription.get('diagnosis', 'Based on symptoms presented')}
+
+---
+
+## Prescribed Remedies
+
+"""
+
+    remedies = prescription.get('remedies', [])
+    for i, remedy in enumerate(remedies, 1):
+        md += f"""### {i}. {remedy.get('medicine', '')} - {remedy.get('potency', '')}
+
+- **Dosage**: {remedy.get('dosage', '')}
+- **Instructions**: {remedy.get('instructions', '')}
+- **Keynote Match**: {remedy.get('keynote_match', 'N/A')}
+- **Sphere of Action**: {remedy.get('sphere_of_action', 'N/A')}
+- **Purpose**: {remedy.get('purpose', '')}
+
+"""
+
+    md += """---
+
+## Dietary Advice
+
+"""
+    for advice in prescription.get('dietary_advice', []):
+        md += f"- {advice}\n"
+
+    md += """
+---
+
+## Lifestyle Recommendations
+
+"""
+    for rec in prescription.get('lifestyle_recommendations', []):
+        md += f"- {rec}\n"
+
+    md += f"""
+---
+
+## Important Precautions
+
+"""
+    for precaution in prescription.get('precautions', []):
+        md += f"- {precaution}\n"
+
+    md += f"""
+---
+
+## Follow-Up
+{prescription.get('follow_up', 'Please follow up after 2 weeks or if symptoms worsen')}
+
+---
+
+### Disclaimer
+*This prescription is generated by HomeoClinic AI based on homeopathic principles. For serious or persistent symptoms, please consult a qualified healthcare professional. Homeopathy should complement, not replace, conventional medical treatment when necessary.*
+
+---
+
+**Generated by HomeoClinic AI** | *Your Virtual Homeopathy Doctor*
+"""
+
+    return md
+
+def generate_prescription_html(prescription: Dict) -> str:
+    """Render the prescription Markdown to an HTML fragment."""
+    md_content = generate_prescription_markdown(prescription)
+
+    # Convert markdown to HTML
+    # Using extras for better table and code block rendering if they were ever in the markdown
+    return markdown2.markdown(md_content, extras=["fenced-code-blocks", "tables"])
+
+def generate_prescription_pdf(prescription: Dict) -> bytes:
+    """Generate a beautiful PDF prescription from the markdown content."""
+    return render_pdf_html(generate_prescription_html(prescription))
+
+@lru_cache(maxsize=1)
+def get_pdf_stylesheet():
+    """Parse the PDF stylesheet once per process."""
+    # WeasyPrint needs Pango/Cairo, so it is only imported when a PDF is rendered
+    from weasyprint import CSS
+    return CSS(string=PDF_CSS)
+
+def render_pdf_html(html_body: str) -> bytes:
+    """Render an HTML fragment to PDF bytes with the shared stylesheet."""
+    from weasyprint import HTML
+    final_html = f"<!DOCTYPE html><html><head><meta charset='utf-8'></head><body>{html_body}</body></html>"
+    return HTML(string=final_html).write_pdf(stylesheets=[get_pdf_stylesheet()])
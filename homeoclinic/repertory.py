@@ -0,0 +1,171 @@
+"""Local repertorization with a sparse rubric × remedy grade matrix.
+
+A repertory file lists, for each rubric, the remedies that cover it with
+their grade (1-3). It is loaded once into a SciPy CSR matrix. Every rubric
+gets a rarity weight, ``log(1 + remedies / remedies in the rubric)``, so a
+small, characteristic rubric counts for more than a large, common one; the
+weights are folded into the matrix at load time, so scoring a case is a
+single sparse matrix-vector product:
+
+    score[remedy] = sum(intensity[rubric] * rarity[rubric] * grade[rubric, remedy])
+
+The result is deterministic (ties break on rubrics covered, then file order)
+and the shortlist records the rubrics it was computed from, so it can be
+audited and attached to the prompt in place of "mental" repertorization.
+"""
+import os
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+try:
+    import scipy.sparse as sparse
+except ImportError:  # the repertory is optional; the app runs without it
+    sparse = None
+
+DEFAULT_REPERTORY = os.path.join(os.path.dirname(__file__), 'data', 'repertory_sample.tsv')
+MAX_GRADE = 4
+
+
+@dataclass
+class RemedyScore:
+    remedy: str
+    score: float
+    rubrics_covered: int
+    grade_total: int
+
+
+@dataclass
+class Shortlist:
+    """Top remedies for a case and the rubrics they were scored on"""
+    remedies: List[RemedyScore] = field(default_factory=list)
+    rubrics: List[str] = field(default_factory=list)
+    unmatched: List[str] = field(default_factory=list)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+    def to_prompt(self) -> str:
+        """Compact block for the model: one line of rubrics, one of ranked remedies"""
+        if not self.remedies:
+            return ''
+        total = len(self.rubrics)
+        ranked = '; '.join(f"{r.remedy} {r.score:.1f} ({r.rubrics_covered}/{total})" for r in self.remedies)
+        return (f"[Local repertorization of {total} rubric(s): {', '.join(self.rubrics)}]\n"
+                f"[Top remedies, score (rubrics covered): {ranked}]")
+
+
+def load_repertory_file(path: str) -> Tuple[List[str], List[str], List[str], Dict[Tuple[int, int], int]]:
+    """Parse a repertory TSV: rubric, chapter, 'Remedy:grade' entries separated by '|'"""
+    rubrics: List[str] = []
+    chapters: List[str] = []
+    rubric_index: Dict[str, int] = {}
+    remedies: List[str] = []
+    remedy_index: Dict[str, int] = {}
+    grades: Dict[Tuple[int, int], int] = {}
+    with open(path, encoding='utf-8') as f:
+        for number, line in enumerate(f, 1):
+            line = line.rstrip('\n')
+            if not line.strip() or line.startswith('#'):
+                continue
+            fields = line.split('\t')
+            if len(fields) != 3 or not fields[0].strip():
+                raise ValueError(f"{path}:{number}: expected 'rubric<TAB>chapter<TAB>Remedy:grade|...'")
+            name = fields[0].strip()
+            row = rubric_index.get(name.lower())
+            if row is None:
+                row = rubric_index[name.lower()] = len(rubrics)
+                rubrics.append(name)
+                chapters.append(fields[1].strip())
+            for entry in fields[2].split('|'):
+                remedy, _, grade = entry.rpartition(':')
+                remedy = remedy.strip()
+                if not remedy or not grade.strip().isdigit() or not 1 <= int(grade) <= MAX_GRADE:
+                    raise ValueError(f"{path}:{number}: bad remedy entry {entry!r}")
+                col = remedy_index.get(remedy)
+                if col is None:
+                    col = remedy_index[remedy] = len(remedies)
+                    remedies.append(remedy)
+                # A rubric listed twice keeps each remedy's highest grade
+                grades[row, col] = max(grades.get((row, col), 0), int(grade))
+    return rubrics, chapters, remedies, grades
+
+
+class Repertory:
+    """Rubric × remedy grades, scored with rarity weighting"""
+
+    def __init__(self, rubrics: Sequence[str], remedies: Sequence[str], grades, chapters: Optional[Sequence[str]] = None):
+        if sparse is None:
+            raise RuntimeError("the repertory needs the 'scipy' package")
+        self.rubrics = list(rubrics)
+        self.remedies = list(remedies)
+        self.chapters = list(chapters) if chapters is not None else [''] * len(self.rubrics)
+        self._rubric_index = {name.lower(): i for i, name in enumerate(self.rubrics)}
+
+        grades = sparse.csr_matrix(grades, dtype=np.float32)
+        grades.eliminate_zeros()
+        per_rubric = np.diff(grades.indptr)
+        self.rarity = np.where(per_rubric > 0, np.log1p(len(self.remedies) / np.maximum(per_rubric, 1)), 0.0)
+        self.rarity = self.rarity.astype(np.float32)
+        # Remedy-major, so each case is one product per quantity
+        self._weighted = (sparse.diags(self.rarity) @ grades).T.tocsr()
+        self._grades = grades.T.tocsr()
+        self._covered = self._grades.copy()
+        self._covered.data[:] = 1.0
+
+    @staticmethod
+    def available() -> bool:
+        return sparse is not None
+
+    @classmethod
+    def from_file(cls, path: str = DEFAULT_REPERTORY) -> 'Repertory':
+        if sparse is None:
+            raise RuntimeError("the repertory needs the 'scipy' package")
+        rubrics, chapters, remedies, grades = load_repertory_file(path)
+        rows, cols = zip(*grades) if grades else ((), ())
+        matrix = sparse.coo_matrix((np.fromiter(grades.values(), dtype=np.float32, count=len(grades)), (rows, cols)),
+                                   shape=(len(rubrics), len(remedies)))
+        return cls(rubrics, remedies, matrix, chapters)
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        return len(self.rubrics), len(self.remedies)
+
+    def case_vector(self, symptoms: Dict[str, float]) -> Tuple[np.ndarray, List[str], List[str]]:
+        """Dense intensity vector over rubrics, plus the matched and unmatched symptom names"""
+        vector = np.zeros(len(self.rubrics), dtype=np.float32)
+        matched, unmatched = [], []
+        for name, intensity in symptoms.items():
+            row = self._rubric_index.get(name.lower())
+            if row is None:
+                unmatched.append(name)
+            else:
+                vector[row] = intensity
+                matched.append(self.rubrics[row])
+        return vector, matched, unmatched
+
+    def scores(self, case: np.ndarray) -> np.ndarray:
+        """Weighted score of every remedy for an intensity vector over rubrics"""
+        return self._weighted @ case
+
+    def shortlist(self, symptoms: Dict[str, float], k: int = 5) -> Shortlist:
+        """The k best-scoring remedies for symptoms given as {rubric name: intensity}"""
+        case, matched, unmatched = self.case_vector(symptoms)
+        if not matched or k <= 0:
+            return Shortlist([], matched, unmatched)
+        return Shortlist(self.rank(case, k), matched, unmatched)
+
+    def rank(self, case: np.ndarray, k: int) -> List[RemedyScore]:
+        score = self.scores(case)
+        k = min(k, len(score))
+        selected = (case > 0).astype(np.float32)
+        covered = self._covered @ selected
+        # Keep everything tied with the k-th score so the tie-break below decides
+        threshold = score[np.argpartition(-score, k - 1)[k - 1]]
+        candidates = np.flatnonzero((score >= threshold) & (score > 0))
+        order = np.lexsort((candidates, -covered[candidates], -score[candidates]))
+        top = candidates[order][:k]
+        grade_total = self._grades[top] @ selected
+        return [RemedyScore(self.remedies[i], round(float(score[i]), 2), int(covered[i]), int(total))
+                for i, total in zip(top, grade_total)]
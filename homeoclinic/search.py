@@ -0,0 +1,70 @@
+"""Text preparation for the consultation full-text index.
+
+Each consultation is indexed as five weighted columns (see ``INDEX_COLUMNS``).
+SQLite stores them in a contentless FTS5 table keyed by the consultation id, so
+the transcripts are not stored a second time. Free-text queries are reduced to
+quoted terms before they reach FTS5, which means user input can never be a
+syntax error.
+"""
+import re
+from typing import Any, Dict, List, Optional
+
+# Column order of the FTS5 table and the bm25 weight of a match in each
+INDEX_COLUMNS = ('chief_complaint', 'diagnosis', 'case_summary', 'remedies', 'messages')
+COLUMN_WEIGHTS = (6.0, 4.0, 2.0, 5.0, 1.0)
+
+TERM = re.compile(r"\w+", re.UNICODE)
+
+
+def _prescription(consultation: Dict[str, Any]) -> Dict[str, Any]:
+    prescription = consultation.get('prescription') or consultation.get('full_prescription') or {}
+    return prescription if isinstance(prescription, dict) else {}
+
+
+def index_fields(consultation: Dict[str, Any]) -> Dict[str, str]:
+    """Text of each index column for one stored consultation"""
+    prescription = _prescription(consultation)
+    remedies = prescription.get('remedies')
+    if isinstance(remedies, dict):
+        remedies = [remedies]
+    remedy_text = []
+    for remedy in remedies if isinstance(remedies, list) else []:
+        if isinstance(remedy, dict):
+            remedy_text.extend(str(remedy.get(key) or '') for key in ('medicine', 'potency', 'keynote_match'))
+    messages = consultation.get('consultation_messages') or []
+    return {
+        'chief_complaint': str(consultation.get('chief_complaint') or prescription.get('chief_complaint') or ''),
+        'diagnosis': str(consultation.get('diagnosis') or prescription.get('diagnosis') or ''),
+        'case_summary': str(prescription.get('case_summary') or ''),
+        'remedies': '\n'.join(t for t in remedy_text if t),
+        'messages': '\n'.join(str(m.get('content') or '') for m in messages
+                              if isinstance(m, dict) and m.get('role') in ('user', 'assistant')),
+    }
+
+
+def query_terms(text: str) -> List[str]:
+    return [term.lower() for term in TERM.findall(text or '')]
+
+
+def fts_query(text: str) -> Optional[str]:
+    """FTS5 MATCH expression requiring every term; the last one also matches as a prefix"""
+    terms = query_terms(text)
+    if not terms:
+        return None
+    quoted = [f'"{term}"' for term in terms]
+    quoted[-1] += '*'
+    return ' AND '.join(quoted)
+
+
+def matches_terms(fields: Dict[str, str], terms: List[str]) -> float:
+    """Fallback scorer for stores without FTS: weighted term frequency, 0 when a term is missing"""
+    score = 0.0
+    lowered = [(fields[name].lower(), weight) for name, weight in zip(INDEX_COLUMNS, COLUMN_WEIGHTS)]
+    for i, term in enumerate(terms):
+        prefix = i == len(terms) - 1
+        pattern = re.compile(r"\b" + re.escape(term) + ("" if prefix else r"\b"))
+        found = sum(weight * len(pattern.findall(text)) for text, weight in lowered)
+        if not found:
+            return 0.0
+        score += found
+    return score
@@ -0,0 +1,727 @@
+"""Pluggable storage backends for sessions and consultations."""
+import json
+import sqlite3
+import threading
+from collections import Counter, OrderedDict
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from tinydb import TinyDB, Query
+
+from .search import COLUMN_WEIGHTS, INDEX_COLUMNS, fts_query, index_fields, matches_terms, query_terms
+
+
+# Keyset cursor for consultation pages: (date, id) of the last row shown
+Cursor = Tuple[str, int]
+
+
+@dataclass
+class ConsultationFilter:
+    """Server-side filters for the consultation history; empty fields match everything"""
+    date_from: Optional[date] = None
+    date_to: Optional[date] = None  # inclusive
+    complaint: str = ''  # case-insensitive substring of the chief complaint
+    remedy: str = ''  # case-insensitive prefix of any prescribed medicine
+
+    def date_bounds(self) -> Tuple[Optional[str], Optional[str]]:
+        """ISO strings for date >= lower and date < upper"""
+        lower = self.date_from.isoformat() if self.date_from else None
+        upper = (self.date_to + timedelta(days=1)).isoformat() if self.date_to else None
+        return lower, upper
+
+    def matches(self, record: Dict[str, Any]) -> bool:
+        lower, upper = self.date_bounds()
+        when = record.get('date') or ''
+        if (lower and when < lower) or (upper and when >= upper):
+            return False
+        if self.complaint and self.complaint.lower() not in (record.get('chief_complaint') or '').lower():
+            return False
+        if self.remedy:
+            wanted = self.remedy.lower()
+            return any(name.lower().startswith(wanted) for name in remedy_names(record))
+        return True
+
+
+@dataclass
+class ConsultationSummary:
+    id: int
+    session_id: str
+    date: str
+    chief_complaint: Optional[str]
+    diagnosis: Optional[str]
+    remedies: List[str] = field(default_factory=list)
+
+
+@dataclass
+class SessionSummary:
+    session_id: str
+    last_updated: Optional[str]
+    message_count: int
+
+
+@dataclass
+class ConsultationPage:
+    items: List[ConsultationSummary]
+    next_cursor: Optional[Cursor] = None  # None on the last page
+
+
+@dataclass
+class SearchHit:
+    summary: ConsultationSummary
+    score: float  # higher is a better match
+
+
+@dataclass
+class SearchResult:
+    hits: List[SearchHit]
+    total: int  # every match, not just the hits returned
+    # Facet name -> [(value, consultations)], most frequent first: 'remedy', 'complaint', 'month'
+    facets: Dict[str, List[Tuple[str, int]]] = field(default_factory=dict)
+
+
+def remedy_names(consultation: Dict[str, Any]) -> List[str]:
+    """Medicine names of a stored consultation's prescription"""
+    prescription = consultation.get('prescription') or consultation.get('full_prescription') or {}
+    remedies = prescription.get('remedies') if isinstance(prescription, dict) else None
+    if isinstance(remedies, dict):
+        remedies = [remedies]
+    if not isinstance(remedies, list):
+        return []
+    return [str(r['medicine']).strip() for r in remedies
+            if isinstance(r, dict) and str(r.get('medicine') or '').strip()]
+
+
+def summarise_consultation(consultation_id: int, consultation: Dict[str, Any]) -> ConsultationSummary:
+    return ConsultationSummary(
+        id=consultation_id,
+        session_id=consultation.get('session_id', ''),
+        date=consultation.get('date', ''),
+        chief_complaint=consultation.get('chief_complaint'),
+        diagnosis=consultation.get('diagnosis'),
+        remedies=remedy_names(consultation),
+    )
+
+
+class StorageBackend:
+    """Interface shared by every session/consultation store."""
+
+    def save_session(self, session_data: Dict[str, Any]) -> None:
+        """Insert or replace a session keyed by its session_id"""
+        raise NotImplementedError
+
+    def load_session(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """Return a stored session or None"""
+        raise NotImplementedError
+
+    def save_consultation(self, consultation_data: Dict[str, Any]) -> None:
+        """Append a completed consultation"""
+        raise NotImplementedError
+
+    def all_consultations(self) -> List[Dict[str, Any]]:
+        """Return all consultations in insertion order"""
+        raise NotImplementedError
+
+    def consultation_page(self, filters: Optional[ConsultationFilter] = None, after: Optional[Cursor] = None,
+                          limit: int = 20) -> ConsultationPage:
+        """Newest-first page of consultation summaries, continuing after a keyset cursor"""
+        raise NotImplementedError
+
+    def get_consultation(self, consultation_id: int) -> Optional[Dict[str, Any]]:
+        """Return one full consultation by id, or None"""
+        raise NotImplementedError
+
+    def search_consultations(self, query: str, filters: Optional[ConsultationFilter] = None, limit: int = 20,
+                             facet_limit: int = 10) -> SearchResult:
+        """Ranked full-text hits over complaints, diagnoses, remedies and transcripts, with facet counts"""
+        raise NotImplementedError
+
+    def list_sessions(self) -> List[Dict[str, Any]]:
+        """Return all sessions in creation order"""
+        raise NotImplementedError
+
+    def iter_sessions(self, updated_after: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+        """Yield sessions in creation order, optionally only those updated after an ISO timestamp"""
+        raise NotImplementedError
+
+    def stats(self) -> Dict[str, int]:
+        """Totals: 'sessions', 'consultations' and 'messages' (summed session message counts)"""
+        raise NotImplementedError
+
+    def recent_sessions(self, limit: int = 10) -> List[SessionSummary]:
+        """Most recently updated sessions first, without loading their messages"""
+        raise NotImplementedError
+
+    def session_summaries(self, session_ids: List[str]) -> Dict[str, SessionSummary]:
+        """Summaries of the given sessions that are stored, keyed by session id"""
+        raise NotImplementedError
+
+    def iter_consultations(self, after_id: int = 0) -> Iterator[Tuple[int, Dict[str, Any]]]:
+        """Yield (id, consultation) in id order for ids greater than after_id"""
+        raise NotImplementedError
+
+    def has_consultation(self, session_id: str, date: str) -> bool:
+        """Check whether a consultation with this session_id and date exists"""
+        raise NotImplementedError
+
+    def clear(self) -> None:
+        """Delete every session and consultation"""
+        raise NotImplementedError
+
+    def close(self) -> None:
+        """Release any open handles"""
+
+
+class TinyDBStorage(StorageBackend):
+    """Legacy JSON-file store; every write rewrites the whole file."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._db = TinyDB(path)
+        self._lock = threading.Lock()
+
+    def save_session(self, session_data: Dict[str, Any]) -> None:
+        sessions = self._db.table('sessions')
+        SessionQuery = Query()
+        with self._lock:
+            sessions.upsert(session_data, SessionQuery.session_id == session_data['session_id'])
+
+    def load_session(self, session_id: str) -> Optional[Dict[str, Any]]:
+        SessionQuery = Query()
+        with self._lock:
+            result = self._db.table('sessions').get(SessionQuery.session_id == session_id)
+        return dict(result) if result else None
+
+    def save_consultation(self, consultation_data: Dict[str, Any]) -> None:
+        with self._lock:
+            self._db.table('consultations').insert(consultation_data)
+
+    def all_consultations(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [dict(doc) for doc in self._db.table('consultations').all()]
+
+    def consultation_page(self, filters: Optional[ConsultationFilter] = None, after: Optional[Cursor] = None,
+                          limit: int = 20) -> ConsultationPage:
+        # TinyDB has no indexes: filter and sort the whole table, then slice after the cursor
+        filters = filters or ConsultationFilter()
+        with self._lock:
+            docs = self._db.table('consultations').all()
+        keyed = sorted(((doc.get('date', ''), doc.doc_id), doc) for doc in docs if filters.matches(doc))
+        keyed.reverse()
+        if after is not None:
+            keyed = [(key, doc) for key, doc in keyed if key < tuple(after)]
+        items = [summarise_consultation(key[1], doc) for key, doc in keyed[:limit]]
+        next_cursor = (items[-1].date, items[-1].id) if len(keyed) > limit else None
+        return ConsultationPage(items, next_cursor)
+
+    def get_consultation(self, consultation_id: int) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            doc = self._db.table('consultations').get(doc_id=consultation_id)
+        return dict(doc, id=consultation_id) if doc else None
+
+    def search_consultations(self, query: str, filters: Optional[ConsultationFilter] = None, limit: int = 20,
+                             facet_limit: int = 10) -> SearchResult:
+        # No index: score every consultation in Python
+        filters = filters or ConsultationFilter()
+        terms = query_terms(query)
+        if not terms:
+            return SearchResult([], 0)
+        with self._lock:
+            docs = self._db.table('consultations').all()
+        scored = []
+        for doc in docs:
+            if filters.matches(doc):
+                score = matches_terms(index_fields(doc), terms)
+                if score:
+                    scored.append((score, doc))
+        scored.sort(key=lambda item: (-item[0], item[1].get('date', ''), item[1].doc_id))
+        hits = [SearchHit(summarise_consultation(doc.doc_id, doc), score) for score, doc in scored[:limit]]
+        facets = {'remedy': Counter(), 'complaint': Counter(), 'month': Counter()}
+        for _, doc in scored:
+            facets['remedy'].update(set(remedy_names(doc)))
+            facets['complaint'][doc.get('chief_complaint') or ''] += 1
+            facets['month'][(doc.get('date') or '')[:7]] += 1
+        return SearchResult(hits, len(scored), {
+            name: [(value, count) for value, count in counter.most_common(facet_limit) if value]
+            for name, counter in facets.items()
+        })
+
+    def list_sessions(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [dict(doc) for doc in self._db.table('sessions').all()]
+
+    def iter_sessions(self, updated_after: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+        for session in self.list_sessions():
+            if updated_after is None or (session.get('last_updated') or '') > updated_after:
+                yield session
+
+    def stats(self) -> Dict[str, int]:
+        # No aggregates in TinyDB: every call reads both tables
+        with self._lock:
+            sessions = self._db.table('sessions').all()
+            consultations = len(self._db.table('consultations'))
+        return {'sessions': len(sessions), 'consultations': consultations,
+                'messages': sum(s.get('message_count', 0) for s in sessions)}
+
+    def recent_sessions(self, limit: int = 10) -> List[SessionSummary]:
+        sessions = sorted(self.list_sessions(), key=lambda s: s.get('last_updated') or '', reverse=True)
+        return [SessionSummary(s['session_id'], s.get('last_updated'), s.get('message_count', 0))
+                for s in sessions[:limit]]
+
+    def session_summaries(self, session_ids: List[str]) -> Dict[str, SessionSummary]:
+        wanted = set(session_ids)
+        return {s['session_id']: SessionSummary(s['session_id'], s.get('last_updated'), s.get('message_count', 0))
+                for s in self.list_sessions() if s['session_id'] in wanted}
+
+    def iter_consultations(self, after_id: int = 0) -> Iterator[Tuple[int, Dict[str, Any]]]:
+        with self._lock:
+            docs = self._db.table('consultations').all()
+        for doc in docs:
+            if doc.doc_id > after_id:
+                yield doc.doc_id, dict(doc)
+
+    def has_consultation(self, session_id: str, date: str) -> bool:
+        ConsultationQuery = Query()
+        with self._lock:
+            return self._db.table('consultations').contains(
+                (ConsultationQuery.session_id == session_id) & (ConsultationQuery.date == date)
+            )
+
+    def clear(self) -> None:
+        with self._lock:
+            self._db.drop_tables()
+
+    def close(self) -> None:
+        self._db.close()
+
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    session_id TEXT PRIMARY KEY,
+    last_updated TEXT,
+    message_count INTEGER NOT NULL DEFAULT 0,
+    data TEXT NOT NULL
+);
+-- Covering index: the recent-sessions list is read without touching the data column
+CREATE INDEX IF NOT EXISTS idx_sessions_recent ON sessions(last_updated, session_id, message_count);
+
+CREATE TABLE IF NOT EXISTS consultations (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    session_id TEXT NOT NULL,
+    date TEXT NOT NULL,
+    chief_complaint TEXT,
+    diagnosis TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_consultations_session_id ON consultations(session_id);
+CREATE INDEX IF NOT EXISTS idx_consultations_date ON consultations(date);
+
+CREATE TABLE IF NOT EXISTS consultation_remedies (
+    consultation_id INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    medicine TEXT NOT NULL COLLATE NOCASE,
+    PRIMARY KEY (consultation_id, position)
+);
+CREATE INDEX IF NOT EXISTS idx_consultation_remedies_medicine ON consultation_remedies(medicine, consultation_id);
+
+-- Running totals kept exact by the triggers below, so counting never scans a table
+CREATE TABLE IF NOT EXISTS stats (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL DEFAULT 0
+);
+CREATE TRIGGER IF NOT EXISTS trg_sessions_insert AFTER INSERT ON sessions BEGIN
+    UPDATE stats SET value = value + 1 WHERE name = 'sessions';
+    UPDATE stats SET value = value + NEW.message_count WHERE name = 'messages';
+END;
+CREATE TRIGGER IF NOT EXISTS trg_sessions_update AFTER UPDATE OF message_count ON sessions BEGIN
+    UPDATE stats SET value = value + NEW.message_count - OLD.message_count WHERE name = 'messages';
+END;
+CREATE TRIGGER IF NOT EXISTS trg_sessions_delete AFTER DELETE ON sessions BEGIN
+    UPDATE stats SET value = value - 1 WHERE name = 'sessions';
+    UPDATE stats SET value = value - OLD.message_count WHERE name = 'messages';
+END;
+CREATE TRIGGER IF NOT EXISTS trg_consultations_insert AFTER INSERT ON consultations BEGIN
+    UPDATE stats SET value = value + 1 WHERE name = 'consultations';
+END;
+CREATE TRIGGER IF NOT EXISTS trg_consultations_delete AFTER DELETE ON consultations BEGIN
+    UPDATE stats SET value = value - 1 WHERE name = 'consultations';
+END;
+
+-- Contentless: rowid is the consultation id and the text itself stays in consultations.data
+CREATE VIRTUAL TABLE IF NOT EXISTS consultations_fts USING fts5(
+    chief_complaint, diagnosis, case_summary, remedies, messages,
+    content='', tokenize='porter unicode61 remove_diacritics 2'
+);
+"""
+
+# Rows fetched per query by iter_sessions / iter_consultations
+ITER_BATCH_SIZE = 500
+
+# Searches remembered per connection (Streamlit repeats the same search on every rerun)
+SEARCH_CACHE_SIZE = 32
+
+# Bumped whenever an upgrade step is added to SQLiteStorage._migrate (stored in PRAGMA user_version)
+SQLITE_SCHEMA_VERSION = 3
+
+
+class SQLiteStorage(StorageBackend):
+    """SQLite store in WAL mode with indexed session_id and date columns."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._lock = threading.RLock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(SQLITE_SCHEMA)
+            self._migrate()
+        self._writes = 0
+        self._search_cache: 'OrderedDict[tuple, Tuple[Tuple[int, int], SearchResult]]' = OrderedDict()
+
+    def _migrate(self) -> None:
+        version = self._conn.execute("PRAGMA user_version").fetchone()[0]
+        if version >= SQLITE_SCHEMA_VERSION:
+            return
+        self._conn.execute("BEGIN")
+        try:
+            if version < 1:
+                # Backfill the remedy index for consultations saved before it existed
+                rows = self._conn.execute("SELECT id, data FROM consultations").fetchall()
+                for consultation_id, data in rows:
+                    self._insert_remedies(consultation_id, json.loads(data))
+            if version < 2:
+                # Build the full-text index over existing consultations
+                for consultation_id, data in self._conn.execute("SELECT id, data FROM consultations").fetchall():
+                    self._index_consultation(consultation_id, json.loads(data))
+            if version < 3:
+                # Seed the trigger-maintained totals; idx_sessions_recent replaces the old date index
+                self._conn.execute("DROP INDEX IF EXISTS idx_sessions_last_updated")
+                self._conn.execute(
+                    """
+                    INSERT OR REPLACE INTO stats (name, value) VALUES
+                        ('sessions', (SELECT COUNT(*) FROM sessions)),
+                        ('messages', (SELECT COALESCE(SUM(message_count), 0) FROM sessions)),
+                        ('consultations', (SELECT COUNT(*) FROM consultations))
+                    """
+                )
+            self._conn.execute(f"PRAGMA user_version = {SQLITE_SCHEMA_VERSION}")
+            self._conn.execute("COMMIT")
+        except Exception:
+            self._conn.execute("ROLLBACK")
+            raise
+
+    def _insert_remedies(self, consultation_id: int, consultation_data: Dict[str, Any]) -> None:
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO consultation_remedies (consultation_id, position, medicine) VALUES (?, ?, ?)",
+            [(consultation_id, i, name) for i, name in enumerate(remedy_names(consultation_data))],
+        )
+
+    def _index_consultation(self, consultation_id: int, consultation_data: Dict[str, Any]) -> None:
+        fields = index_fields(consultation_data)
+        self._conn.execute(
+            f"INSERT INTO consultations_fts (rowid, {', '.join(INDEX_COLUMNS)})"
+            f" VALUES (?{', ?' * len(INDEX_COLUMNS)})",
+            (consultation_id, *(fields[name] for name in INDEX_COLUMNS)),
+        )
+
+    def save_session(self, session_data: Dict[str, Any]) -> None:
+        with self._lock:
+            self._conn.execute(
+                """
+                INSERT INTO sessions (session_id, last_updated, message_count, data)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT(session_id) DO UPDATE SET
+                    last_updated = excluded.last_updated,
+                    message_count = excluded.message_count,
+                    data = excluded.data
+                """,
+                (
+                    session_data['session_id'],
+                    session_data.get('last_updated'),
+                    session_data.get('message_count', 0),
+                    json.dumps(session_data),
+                ),
+            )
+
+    def load_session(self, session_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data FROM sessions WHERE session_id = ?", (session_id,)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def save_consultation(self, consultation_data: Dict[str, Any]) -> None:
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                cursor = self._conn.execute(
+                    """
+                    INSERT INTO consultations (session_id, date, chief_complaint, diagnosis, data)
+                    VALUES (?, ?, ?, ?, ?)
+                    """,
+                    (
+                        consultation_data['session_id'],
+                        consultation_data['date'],
+                        consultation_data.get('chief_complaint'),
+                        consultation_data.get('diagnosis'),
+                        json.dumps(consultation_data),
+                    ),
+                )
+                self._insert_remedies(cursor.lastrowid, consultation_data)
+                self._index_consultation(cursor.lastrowid, consultation_data)
+                self._conn.execute("COMMIT")
+                self._writes += 1
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def all_consultations(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = self._conn.execute("SELECT data FROM consultations ORDER BY id").fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def consultation_page(self, filters: Optional[ConsultationFilter] = None, after: Optional[Cursor] = None,
+                          limit: int = 20) -> ConsultationPage:
+        # Walks idx_consultations_date (date, rowid) backwards from the cursor; only the
+        # summary columns of limit + 1 rows are read, however large the table is
+        filters = filters or ConsultationFilter()
+        clauses, params = _filter_sql(filters)
+        if after is not None:
+            clauses.append("(c.date, c.id) < (?, ?)")
+            params.extend(after)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        with self._lock:
+            rows = self._conn.execute(
+                f"""
+                SELECT c.id, c.session_id, c.date, c.chief_complaint, c.diagnosis
+                FROM consultations c {where}
+                ORDER BY c.date DESC, c.id DESC
+                LIMIT ?
+                """,
+                (*params, limit + 1),
+            ).fetchall()
+            page = rows[:limit]
+            remedies = self._remedies_for([row[0] for row in page])
+        items = [ConsultationSummary(*row, remedies=remedies.get(row[0], [])) for row in page]
+        next_cursor = (items[-1].date, items[-1].id) if len(rows) > limit else None
+        return ConsultationPage(items, next_cursor)
+
+    def _remedies_for(self, ids: List[int]) -> Dict[int, List[str]]:
+        remedies: Dict[int, List[str]] = {}
+        if ids:
+            for consultation_id, medicine in self._conn.execute(
+                f"SELECT consultation_id, medicine FROM consultation_remedies"
+                f" WHERE consultation_id IN ({','.join('?' * len(ids))}) ORDER BY consultation_id, position",
+                ids,
+            ):
+                remedies.setdefault(consultation_id, []).append(medicine)
+        return remedies
+
+    def search_consultations(self, query: str, filters: Optional[ConsultationFilter] = None, limit: int = 20,
+                             facet_limit: int = 10) -> SearchResult:
+        match = fts_query(query)
+        if match is None:
+            return SearchResult([], 0)
+        filters = filters or ConsultationFilter()
+        with self._lock:
+            # data_version changes when another connection commits; _writes counts our own
+            version = (self._conn.execute("PRAGMA data_version").fetchone()[0], self._writes)
+            key = (match, repr(filters), limit, facet_limit)
+            cached = self._search_cache.get(key)
+            if cached is not None and cached[0] == version:
+                self._search_cache.move_to_end(key)
+                return cached[1]
+            result = self._search(match, filters, limit, facet_limit)
+            self._search_cache[key] = (version, result)
+            if len(self._search_cache) > SEARCH_CACHE_SIZE:
+                self._search_cache.popitem(last=False)
+        return result
+
+    def _search(self, match: str, filters: ConsultationFilter, limit: int, facet_limit: int) -> SearchResult:
+        clauses, params = _filter_sql(filters)
+        # Each query re-runs the MATCH: reading an FTS doclist is cheaper than materialising it
+        matched = "consultations_fts f"
+        if clauses:
+            matched += f" JOIN consultations c ON c.id = f.rowid AND {' AND '.join(clauses)}"
+        where = "WHERE consultations_fts MATCH ?"
+        params = (*params, match)
+        # bm25 is "lower is better"; negate it so SearchHit.score grows with relevance
+        rows = self._conn.execute(
+            f"""
+            SELECT f.rowid, -bm25(consultations_fts, {', '.join(map(str, COLUMN_WEIGHTS))}) AS score
+            FROM {matched} {where}
+            ORDER BY score DESC, f.rowid DESC
+            LIMIT ?
+            """,
+            (*params, limit),
+        ).fetchall()
+        if not rows:
+            return SearchResult([], 0)
+        scores = dict(rows)
+        ids = list(scores)
+        summaries = {
+            row[0]: row for row in self._conn.execute(
+                f"SELECT id, session_id, date, chief_complaint, diagnosis FROM consultations"
+                f" WHERE id IN ({','.join('?' * len(ids))})",
+                ids,
+            )
+        }
+        remedies = self._remedies_for(ids)
+        hits = [SearchHit(ConsultationSummary(*summaries[i], remedies=remedies.get(i, [])), scores[i])
+                for i in ids if i in summaries]
+
+        # Complaint and month come from one grouped pass; the per-value counts are summed here
+        complaints: Counter = Counter()
+        months: Counter = Counter()
+        for complaint, month, count in self._conn.execute(
+            f"""
+            SELECT d.chief_complaint, substr(d.date, 1, 7), COUNT(*)
+            FROM {matched} JOIN consultations d ON d.id = f.rowid {where}
+            GROUP BY 1, 2
+            """,
+            params,
+        ):
+            if complaint:
+                complaints[complaint] += count
+            months[month] += count
+        remedy_counts = self._conn.execute(
+            f"""
+            SELECT r.medicine, COUNT(DISTINCT r.consultation_id) AS n
+            FROM {matched} JOIN consultation_remedies r ON r.consultation_id = f.rowid {where}
+            GROUP BY r.medicine ORDER BY n DESC, r.medicine LIMIT ?
+            """,
+            (*params, facet_limit),
+        ).fetchall()
+        facets = {
+            'remedy': [tuple(row) for row in remedy_counts],
+            'complaint': sorted(complaints.items(), key=lambda item: (-item[1], item[0]))[:facet_limit],
+            'month': sorted(months.items(), key=lambda item: (-item[1], item[0]))[:facet_limit],
+        }
+        return SearchResult(hits, sum(months.values()), facets)
+
+    def get_consultation(self, consultation_id: int) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data FROM consultations WHERE id = ?", (consultation_id,)
+            ).fetchone()
+        return dict(json.loads(row[0]), id=consultation_id) if row else None
+
+    def list_sessions(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = self._conn.execute("SELECT data FROM sessions ORDER BY rowid").fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._conn.execute("SELECT name, value FROM stats").fetchall())
+
+    def recent_sessions(self, limit: int = 10) -> List[SessionSummary]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT session_id, last_updated, message_count FROM sessions"
+                " ORDER BY last_updated DESC LIMIT ?",
+                (limit,),
+            ).fetchall()
+        return [SessionSummary(*row) for row in rows]
+
+    def session_summaries(self, session_ids: List[str]) -> Dict[str, SessionSummary]:
+        if not session_ids:
+            return {}
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT session_id, last_updated, message_count FROM sessions"
+                f" WHERE session_id IN ({', '.join('?' * len(session_ids))})",
+                list(session_ids),
+            ).fetchall()
+        return {row[0]: SessionSummary(*row) for row in rows}
+
+    def iter_sessions(self, updated_after: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+        # Keyset batches on rowid; the lock is only held while a batch is fetched
+        last = 0
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT rowid, data FROM sessions WHERE rowid > ? AND (? IS NULL OR last_updated > ?)"
+                    " ORDER BY rowid LIMIT ?",
+                    (last, updated_after, updated_after, ITER_BATCH_SIZE),
+                ).fetchall()
+            for last, data in rows:
+                yield json.loads(data)
+            if len(rows) < ITER_BATCH_SIZE:
+                return
+
+    def iter_consultations(self, after_id: int = 0) -> Iterator[Tuple[int, Dict[str, Any]]]:
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT id, data FROM consultations WHERE id > ? ORDER BY id LIMIT ?",
+                    (after_id, ITER_BATCH_SIZE),
+                ).fetchall()
+            for after_id, data in rows:
+                yield after_id, json.loads(data)
+            if len(rows) < ITER_BATCH_SIZE:
+                return
+
+    def has_consultation(self, session_id: str, date: str) -> bool:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM consultations WHERE session_id = ? AND date = ? LIMIT 1",
+                (session_id, date),
+            ).fetchone()
+        return row is not None
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.execute("DELETE FROM sessions")
+            self._conn.execute("DELETE FROM consultations")
+            self._conn.execute("DELETE FROM consultation_remedies")
+            self._conn.execute("INSERT INTO consultations_fts (consultations_fts) VALUES ('delete-all')")
+            self._conn.execute("COMMIT")
+            self._writes += 1
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def _filter_sql(filters: ConsultationFilter) -> Tuple[List[str], List[Any]]:
+    """WHERE clauses (over consultations aliased c) and parameters for a ConsultationFilter"""
+    clauses, params = [], []
+    lower, upper = filters.date_bounds()
+    if lower:
+        clauses.append("c.date >= ?")
+        params.append(lower)
+    if upper:
+        clauses.append("c.date < ?")
+        params.append(upper)
+    if filters.complaint:
+        clauses.append("c.chief_complaint LIKE ? ESCAPE '\\'")
+        params.append(f"%{_escape_like(filters.complaint)}%")
+    if filters.remedy:
+        clauses.append(
+            "EXISTS (SELECT 1 FROM consultation_remedies r"
+            " WHERE r.consultation_id = c.id AND r.medicine LIKE ? ESCAPE '\\')"
+        )
+        params.append(f"{_escape_like(filters.remedy)}%")
+    return clauses, params
+
+
+def _escape_like(text: str) -> str:
+    return text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+BACKENDS = {
+    'sqlite': SQLiteStorage,
+    'tinydb': TinyDBStorage,
+}
+
+
+def open_storage(backend: str, path: str) -> StorageBackend:
+    """Open a storage backend by name ('sqlite' or 'tinydb')"""
+    try:
+        backend_cls = BACKENDS[backend.lower()]
+    except KeyError:
+        raise ValueError(f"Unknown storage backend '{backend}'. Choose one of: {', '.join(BACKENDS)}")
+    return backend_cls(path)
@@ -0,0 +1,114 @@
+"""Incremental handling of streamed model replies."""
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from homeoclinic.prescription_json import PRESCRIPTION_MARKER, Candidate, JsonScanner, parse_candidate
+
+
+@dataclass
+class StreamMetrics:
+    """Timing figures for one streamed reply."""
+    ttft_s: Optional[float] = None
+    total_s: float = 0.0
+    chunks: int = 0
+    response_tokens: int = 0
+
+    @property
+    def tokens_per_s(self) -> float:
+        generation = self.total_s - (self.ttft_s or 0.0)
+        return round(self.response_tokens / generation, 1) if generation > 0 else 0.0
+
+
+class StreamAccumulator:
+    """Accumulates streamed text and detects the prescription as it arrives.
+
+    The marker search only looks at newly arrived text (plus enough overlap for
+    a marker split across chunks), and once the marker is seen a
+    :class:`JsonScanner` walks each new character once, so the work per chunk
+    is bounded by the chunk size rather than the reply length.
+    """
+
+    def __init__(self, marker: str = PRESCRIPTION_MARKER):
+        self.marker = marker
+        self.text = ""
+        self.marker_at: Optional[int] = None
+        self.prescription: Optional[Dict[str, Any]] = None
+        self.extraction_errors: List[str] = []
+        self._marker_scanned = 0
+        self._scanner: Optional[JsonScanner] = None
+
+    @property
+    def prescription_ready(self) -> bool:
+        return self.marker_at is not None
+
+    @property
+    def visible_text(self) -> str:
+        """Text to show while streaming: everything before the prescription marker"""
+        if self.marker_at is None:
+            return self.text
+        return self.text[:self.marker_at]
+
+    def feed(self, chunk: str) -> None:
+        """Append a chunk and advance marker and JSON detection"""
+        if not chunk:
+            return
+        self.text += chunk
+
+        if self.marker_at is None:
+            search_from = max(0, self._marker_scanned - len(self.marker) + 1)
+            index = self.text.find(self.marker, search_from)
+            self._marker_scanned = len(self.text)
+            if index == -1:
+                return
+            self.marker_at = index
+            self._scanner = JsonScanner()
+            chunk = self.text[index + len(self.marker):]
+
+        if self.prescription is None:
+            self._consider(self._scanner.feed(chunk))
+
+    def _consider(self, candidates: List[Candidate]) -> None:
+        for candidate in candidates:
+            prescription, _, error = parse_candidate(candidate)
+            if prescription is not None:
+                self.prescription = prescription
+                return
+            self.extraction_errors.append(error)
+
+    def finish(self) -> None:
+        """End of stream: try the object left open by a truncated reply"""
+        if self.prescription is None and self._scanner is not None:
+            pending = self._scanner.pending()
+            if pending is not None:
+                self._consider([pending])
+
+
+def consume_stream(
+    chunks: Iterable[Any],
+    on_update: Optional[Callable[[StreamAccumulator], None]] = None,
+    estimate_tokens: Callable[[str], int] = lambda text: len(text) // 4,
+    started_at: Optional[float] = None,
+) -> Tuple[StreamAccumulator, StreamMetrics]:
+    """Drain a streamed response, calling on_update after every chunk.
+
+    ``started_at`` is the ``time.perf_counter()`` value taken before the request
+    was sent, so time-to-first-token includes the request itself.
+    """
+    accumulator = StreamAccumulator()
+    metrics = StreamMetrics()
+    start = started_at if started_at is not None else time.perf_counter()
+    for chunk in chunks:
+        text = getattr(chunk, 'text', chunk) or ""
+        if metrics.ttft_s is None and text:
+            metrics.ttft_s = round(time.perf_counter() - start, 3)
+        metrics.chunks += 1
+        accumulator.feed(text)
+        if on_update is not None:
+            on_update(accumulator)
+    accumulator.finish()
+    metrics.total_s = round(time.perf_counter() - start, 3)
+
+    usage = getattr(chunks, 'usage_metadata', None)
+    metrics.response_tokens = getattr(usage, 'candidates_token_count', 0) or estimate_tokens(accumulator.text)
+    return accumulator, metrics
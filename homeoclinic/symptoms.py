@@ -0,0 +1,249 @@
+"""Vocabulary-driven symptom extraction from patient messages.
+
+The vocabulary (canonical term, repertory chapter, synonyms) is compiled once
+into an Aho-Corasick automaton over word tokens, so a single pass over a
+message finds every term and synonym whatever the size of the vocabulary, and
+terms only ever match whole words ("sore" is not found inside "pressure").
+Overlapping matches resolve to the longest one ("sore throat" over "sore"),
+and a term preceded by a negation cue in the same clause ("no fever",
+"denies any nausea") or followed by one ("the cough has gone") is reported as
+negated.
+"""
+import os
+import re
+from collections import deque
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, Iterable, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+DEFAULT_VOCABULARY = os.path.join(os.path.dirname(__file__), 'data', 'symptom_vocabulary.tsv')
+
+# Words (keeping contractions like "don't" whole) and the punctuation that ends a clause
+TOKEN = re.compile(r"[^\W_]+(?:'[^\W_]+)*|[.;:!?]")
+CLAUSE_END = frozenset('.;:!?')
+
+
+def _fold(word: str) -> str:
+    """Lower-case a token and strip a plural and final 'e', identically for vocabulary and text
+
+    "aches" and "ache" both become "ach", "itches" and "itch" both "itch".
+    """
+    word = word.lower()
+    if len(word) > 4 and word.endswith('ies'):
+        return word[:-3] + 'y'
+    if len(word) > 3 and word.endswith('s') and not word.endswith(('ss', 'us', 'is')):
+        word = word[:-1]
+    if len(word) > 3 and word.endswith('e') and not word.endswith('ee'):
+        word = word[:-1]
+    return word
+
+
+# Cue words go through _fold like message tokens do
+NEGATION_CUES = frozenset(map(_fold, {
+    'no', 'not', 'never', 'without', 'nor', 'none', 'deny', 'denies', 'denied', 'negative', 'free', 'absent',
+    "don't", "doesn't", "didn't", "haven't", "hasn't", "hadn't", "isn't", "aren't", "wasn't", "weren't",
+}))
+# Cues that follow the term: "the headache is gone"
+POST_NEGATION_CUES = frozenset(map(_fold, {'gone', 'resolved', 'disappeared', 'subsided', 'absent'}))
+# Cue pairs that do not negate anything: "not only headache but also ..."
+PSEUDO_NEGATIONS = frozenset((_fold(a), _fold(b)) for a, b in [('not', 'only'), ('not', 'just'), ('no', 'doubt')])
+# Words that end the scope of a negation: "no fever but a bad cough"
+SCOPE_BREAKS = frozenset(map(_fold, {'but', 'however', 'although', 'though', 'except', 'yet', 'whereas'}))
+NEGATION_WINDOW = 5
+POST_NEGATION_WINDOW = 3
+
+MAX_PHRASES_PER_FINDING = 5
+
+
+class VocabularyEntry(NamedTuple):
+    canonical: str
+    category: str
+    synonyms: Tuple[str, ...]
+
+
+@dataclass
+class SymptomMention:
+    """One vocabulary term found in a message"""
+    term: str
+    category: str
+    text: str
+    start: int
+    end: int
+    negated: bool = False
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+def tokenize(text: str) -> List[Tuple[str, int, int]]:
+    """(folded token, start, end) for every word and clause-ending mark in ``text``"""
+    text = text.replace('’', "'")
+    return [(_fold(m.group()), m.start(), m.end()) for m in TOKEN.finditer(text)]
+
+
+def load_vocabulary(path: str) -> Iterator[VocabularyEntry]:
+    """Read a vocabulary TSV: canonical term, category, synonyms separated by '|'"""
+    with open(path, encoding='utf-8') as f:
+        for number, line in enumerate(f, 1):
+            line = line.rstrip('\n')
+            if not line.strip() or line.startswith('#'):
+                continue
+            fields = line.split('\t')
+            if len(fields) < 2 or not fields[0].strip():
+                raise ValueError(f"{path}:{number}: expected 'term<TAB>category[<TAB>synonym|synonym...]'")
+            synonyms = fields[2].split('|') if len(fields) > 2 else []
+            yield VocabularyEntry(fields[0].strip(), fields[1].strip(),
+                                  tuple(s.strip() for s in synonyms if s.strip()))
+
+
+class TermAutomaton:
+    """Aho-Corasick automaton whose alphabet is word tokens rather than characters"""
+
+    def __init__(self):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        # (pattern length in tokens, value) for every pattern ending at a state, via suffix links
+        self._out: List[List[Tuple[int, int]]] = [[]]
+        self._patterns = 0
+        self._compiled = False
+
+    def __len__(self) -> int:
+        return self._patterns
+
+    def add(self, tokens: Sequence[str], value: int) -> bool:
+        """Add a pattern; returns False when the same token sequence is already present"""
+        if self._compiled:
+            raise RuntimeError("patterns cannot be added after compile()")
+        state = 0
+        for token in tokens:
+            following = self._goto[state].get(token)
+            if following is None:
+                following = len(self._goto)
+                self._goto[state][token] = following
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            state = following
+        if not tokens or self._out[state]:
+            return False
+        self._out[state].append((len(tokens), value))
+        self._patterns += 1
+        return True
+
+    def compile(self) -> 'TermAutomaton':
+        """Compute failure links breadth-first and merge outputs along them"""
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for token, following in self._goto[state].items():
+                queue.append(following)
+                fallback = self._fail[state]
+                while fallback and token not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[following] = self._goto[fallback].get(token, 0)
+                self._out[following] = self._out[following] + self._out[self._fail[following]]
+        self._compiled = True
+        return self
+
+    def find(self, tokens: Sequence[str]) -> Iterator[Tuple[int, int, int]]:
+        """Yield (first token, last token + 1, value) for every pattern occurrence"""
+        goto, fail, out = self._goto, self._fail, self._out
+        state = 0
+        for i, token in enumerate(tokens):
+            while state and token not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(token, 0)
+            for length, value in out[state]:
+                yield i + 1 - length, i + 1, value
+
+
+class SymptomExtractor:
+    """Finds vocabulary terms and their synonyms in free text"""
+
+    def __init__(self, entries: Iterable[VocabularyEntry]):
+        self._terms: List[Tuple[str, str]] = []
+        self._automaton = TermAutomaton()
+        for entry in entries:
+            index = len(self._terms)
+            self._terms.append((entry.canonical, entry.category))
+            for phrase in (entry.canonical,) + tuple(entry.synonyms):
+                tokens = [token for token, _, _ in tokenize(phrase) if token not in CLAUSE_END]
+                # The first entry to claim a phrase keeps it
+                self._automaton.add(tokens, index)
+        self._automaton.compile()
+
+    @classmethod
+    def from_file(cls, path: str = DEFAULT_VOCABULARY) -> 'SymptomExtractor':
+        return cls(load_vocabulary(path))
+
+    @property
+    def term_count(self) -> int:
+        return len(self._terms)
+
+    @property
+    def phrase_count(self) -> int:
+        return len(self._automaton)
+
+    def extract(self, text: str) -> List[SymptomMention]:
+        """Non-overlapping mentions in text order, longest match first at each position"""
+        if not text:
+            return []
+        tokens = tokenize(text)
+        words = [token for token, _, _ in tokens]
+        # Leftmost-longest: sort by start, then by length descending, and skip overlaps
+        matches = sorted(self._automaton.find(words), key=lambda m: (m[0], m[0] - m[1]))
+        mentions, taken_until = [], 0
+        for first, last, index in matches:
+            if first < taken_until:
+                continue
+            taken_until = last
+            term, category = self._terms[index]
+            start, end = tokens[first][1], tokens[last - 1][2]
+            mentions.append(SymptomMention(term, category, text[start:end], start, end,
+                                           _negated(words, first, last)))
+        return mentions
+
+
+def _negated(words: List[str], first: int, last: int) -> bool:
+    for i in range(first - 1, max(first - NEGATION_WINDOW, 0) - 1, -1):
+        word = words[i]
+        if word in CLAUSE_END or word in SCOPE_BREAKS:
+            break
+        if word in NEGATION_CUES:
+            return (word, words[i + 1]) not in PSEUDO_NEGATIONS
+    negated_cue = False
+    for word in words[last:last + POST_NEGATION_WINDOW]:
+        if word in CLAUSE_END or word in SCOPE_BREAKS:
+            break
+        if word in POST_NEGATION_CUES and not negated_cue:
+            return True
+        # "the headache is not gone": a negated post-cue means the symptom is still there
+        negated_cue = negated_cue or word in NEGATION_CUES
+    return False
+
+
+def record_mentions(mentions: Iterable[SymptomMention], collected: List[str],
+                    findings: Dict[str, Dict[str, Any]], when: Optional[str] = None) -> List[str]:
+    """Fold a message's mentions into a session's symptom list and structured findings.
+
+    ``collected`` gains each newly reported (not negated) term once;
+    ``findings`` maps every term mentioned so far to its category, latest
+    status ('present' or 'absent'), mention count and the phrases used.
+    Returns the terms added to ``collected``.
+    """
+    seen = set(collected)
+    added = []
+    for mention in mentions:
+        finding = findings.setdefault(mention.term, {
+            'category': mention.category, 'status': None, 'mentions': 0, 'phrases': [], 'first_reported': when,
+        })
+        finding['status'] = 'absent' if mention.negated else 'present'
+        finding['mentions'] += 1
+        finding['last_reported'] = when
+        phrase = mention.text.lower()
+        if phrase not in finding['phrases'] and len(finding['phrases']) < MAX_PHRASES_PER_FINDING:
+            finding['phrases'].append(phrase)
+        if not mention.negated and mention.term not in seen:
+            seen.add(mention.term)
+            collected.append(mention.term)
+            added.append(mention.term)
+    return added
@@ -0,0 +1,331 @@
+"""Text-to-speech with a content-addressed audio cache and pluggable engines.
+
+Text is cleaned and hashed; audio is looked up in a :class:`RenderCache` (memory
+plus a size-bounded disk tier) before any engine is called. Long replies are
+split at sentence boundaries and the chunks are synthesized in parallel, then
+joined, so one slow or failed request no longer costs the whole message.
+"""
+import hashlib
+import io
+import re
+import shutil
+import statistics
+import subprocess
+import threading
+import time
+import wave
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+
+from homeoclinic.render_cache import RenderCache
+
+# Markdown characters that would otherwise be read aloud
+MARKDOWN_CHARS = re.compile(r'[\*#`_>|]')
+SENTENCE_END = re.compile(r'(?<=[.!?…])\s+')
+
+
+def clean_text(text: str) -> str:
+    """Strip markdown and collapse whitespace"""
+    return re.sub(r'\s+', ' ', MARKDOWN_CHARS.sub('', text or '')).strip()
+
+
+def split_sentences(text: str, max_chars: int = 400) -> List[str]:
+    """Split text into chunks of whole sentences of at most max_chars (long sentences split at spaces)"""
+    chunks, current = [], ''
+    for sentence in SENTENCE_END.split(text):
+        sentence = sentence.strip()
+        while len(sentence) > max_chars:
+            cut = sentence.rfind(' ', 0, max_chars)
+            cut = cut if cut > 0 else max_chars
+            chunks.extend([current] if current else [])
+            chunks.append(sentence[:cut].strip())
+            current, sentence = '', sentence[cut:].strip()
+        if not sentence:
+            continue
+        if current and len(current) + 1 + len(sentence) > max_chars:
+            chunks.append(current)
+            current = sentence
+        else:
+            current = f"{current} {sentence}" if current else sentence
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def join_wav(parts: Sequence[bytes]) -> bytes:
+    """Concatenate WAV files that share the same format"""
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as out:
+        for i, part in enumerate(parts):
+            with wave.open(io.BytesIO(part), 'rb') as src:
+                if i == 0:
+                    out.setparams(src.getparams())
+                out.writeframes(src.readframes(src.getnframes()))
+    return buffer.getvalue()
+
+
+class SynthesisCancelled(Exception):
+    """A prefetch was cancelled before all chunks were synthesized"""
+
+
+class TTSEngine:
+    """Interface for speech synthesis engines"""
+
+    name = 'base'
+    format = 'mp3'
+    mime = 'audio/mp3'
+
+    def available(self) -> bool:
+        return True
+
+    def synthesize(self, text: str) -> bytes:
+        raise NotImplementedError
+
+    def join(self, parts: Sequence[bytes]) -> bytes:
+        """Join the audio of consecutive chunks"""
+        # MP3 is a sequence of self-contained frames, so concatenation plays back fine
+        return b''.join(parts)
+
+
+class GTTSEngine(TTSEngine):
+    """Google Translate TTS (needs network access)"""
+
+    def __init__(self, lang: str = 'en', slow: bool = False):
+        self.lang = lang
+        self.slow = slow
+        self.name = f"gtts-{lang}{'-slow' if slow else ''}"
+
+    def synthesize(self, text: str) -> bytes:
+        from gtts import gTTS
+        fp = io.BytesIO()
+        gTTS(text=text, lang=self.lang, slow=self.slow).write_to_fp(fp)
+        return fp.getvalue()
+
+
+class EspeakEngine(TTSEngine):
+    """Local espeak-ng / espeak synthesis; works offline"""
+
+    format = 'wav'
+    mime = 'audio/wav'
+
+    def __init__(self, voice: str = 'en', speed: int = 160, executable: Optional[str] = None):
+        self.executable = executable or shutil.which('espeak-ng') or shutil.which('espeak')
+        self.voice = voice
+        self.speed = speed
+        self.name = f"espeak-{voice}-{speed}"
+
+    def available(self) -> bool:
+        return self.executable is not None
+
+    def synthesize(self, text: str) -> bytes:
+        if not self.available():
+            raise RuntimeError("espeak-ng / espeak is not installed")
+        result = subprocess.run(
+            [self.executable, '-v', self.voice, '-s', str(self.speed), '--stdout'],
+            input=text.encode('utf-8'), capture_output=True, timeout=60, check=True,
+        )
+        return result.stdout
+
+    def join(self, parts: Sequence[bytes]) -> bytes:
+        return join_wav(parts)
+
+
+ENGINES = {
+    'gtts': GTTSEngine,
+    'espeak': EspeakEngine,
+}
+
+
+def open_engine(engine: str) -> TTSEngine:
+    """Create a TTS engine by name ('gtts' or 'espeak')"""
+    try:
+        engine_cls = ENGINES[engine.lower()]
+    except KeyError:
+        raise ValueError(f"Unknown TTS engine '{engine}'. Choose one of: {', '.join(ENGINES)}")
+    return engine_cls()
+
+
+class TTSMetrics:
+    """Cache hit rate and synthesis latency"""
+
+    def __init__(self, window: int = 200):
+        self.window = window
+        self.requests = 0
+        self.hits = 0
+        self.failures = 0
+        self.chunks = 0
+        self.latencies: List[float] = []
+        self._lock = threading.Lock()
+
+    def record(self, hit: bool, latency_s: Optional[float] = None, chunks: int = 0, failed: bool = False) -> None:
+        with self._lock:
+            self.requests += 1
+            self.hits += hit
+            self.failures += failed
+            self.chunks += chunks
+            if latency_s is not None:
+                self.latencies = (self.latencies + [latency_s])[-self.window:]
+
+    @property
+    def hit_rate(self) -> float:
+        return self.hits / self.requests if self.requests else 0.0
+
+    def summary(self) -> Dict[str, float]:
+        with self._lock:
+            latencies = sorted(self.latencies)
+        return {
+            'requests': self.requests,
+            'hit_rate': round(self.hit_rate, 3),
+            'failures': self.failures,
+            'chunks_synthesized': self.chunks,
+            'synthesis_p50_s': round(statistics.median(latencies), 3) if latencies else None,
+            'synthesis_p95_s': round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))], 3) if latencies else None,
+        }
+
+
+class TTSService:
+    """Cached, chunked speech synthesis over one or more engines (tried in order)"""
+
+    def __init__(self, engines: Sequence[TTSEngine], cache: Optional[RenderCache] = None,
+                 max_chunk_chars: int = 400, max_workers: int = 4):
+        if not engines:
+            raise ValueError("TTSService needs at least one engine")
+        self.engines = list(engines)
+        self.cache = cache or RenderCache(max_entries=32)
+        self.max_chunk_chars = max_chunk_chars
+        self.metrics = TTSMetrics()
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='tts-chunk')
+
+    @staticmethod
+    def cache_key(engine: TTSEngine, cleaned: str) -> str:
+        return hashlib.sha256(f"{engine.name}\0{cleaned}".encode('utf-8')).hexdigest()
+
+    def cached(self, text: str) -> Optional[Tuple[bytes, str]]:
+        """Return (audio, mime) from the cache without synthesizing"""
+        cleaned = clean_text(text)
+        for engine in self.engines:
+            audio = self.cache.get(self.cache_key(engine, cleaned), engine.format)
+            if audio is not None:
+                return audio, engine.mime
+        return None
+
+    def _synthesize(self, engine: TTSEngine, cleaned: str,
+                    cancel: Optional[threading.Event] = None) -> Tuple[bytes, int]:
+        def run(chunk: str) -> bytes:
+            if cancel is not None and cancel.is_set():
+                raise SynthesisCancelled()
+            return engine.synthesize(chunk)
+
+        chunks = split_sentences(cleaned, self.max_chunk_chars)
+        if len(chunks) == 1:
+            return run(chunks[0]), 1
+        # map() re-raises the first chunk failure, so a partial reply is never cached
+        return engine.join(list(self._pool.map(run, chunks))), len(chunks)
+
+    def synthesize(self, text: str, cancel: Optional[threading.Event] = None) -> Optional[Tuple[bytes, str]]:
+        """Return (audio, mime) for text, from the cache when possible; None if every engine fails or cancel is set"""
+        cleaned = clean_text(text)
+        if not cleaned:
+            return None
+        hit = self.cached(text)
+        if hit is not None:
+            self.metrics.record(hit=True)
+            return hit
+
+        start = time.perf_counter()
+        for engine in self.engines:
+            try:
+                audio, chunks = self._synthesize(engine, cleaned, cancel)
+            except SynthesisCancelled:
+                return None
+            except Exception as e:
+                # Log and fall through to the next engine; the UI simply gets no audio
+                print(f"TTS error ({engine.name}): {e}")
+                continue
+            self.cache.get_or_render(self.cache_key(engine, cleaned), engine.format, lambda: audio)
+            self.metrics.record(hit=False, latency_s=time.perf_counter() - start, chunks=chunks)
+            return audio, engine.mime
+        self.metrics.record(hit=False, failed=True)
+        return None
+
+    def close(self) -> None:
+        self._pool.shutdown(wait=False)
+
+
+class TTSPrefetcher:
+    """Synthesizes audio ahead of a click on a bounded pool of background workers.
+
+    Jobs are keyed by the cleaned text and remember every owner (session id)
+    that asked for them, so two sessions share one synthesis. A session change
+    cancels the session's jobs that no other session still wants: queued jobs
+    never start and running jobs stop before their next chunk.
+    """
+
+    def __init__(self, service: TTSService, max_concurrent: int = 2):
+        self.service = service
+        self._pool = ThreadPoolExecutor(max_workers=max_concurrent, thread_name_prefix='tts-prefetch')
+        self._lock = threading.Lock()
+        self._jobs: Dict[str, Tuple[Set[str], Future, threading.Event]] = {}
+        self.stats = {'submitted': 0, 'completed': 0, 'cancelled': 0, 'skipped': 0}
+
+    def prefetch(self, owner: str, text: str) -> Optional[Future]:
+        """Start synthesizing text for owner unless it is cached or already in flight"""
+        cleaned = clean_text(text)
+        if not cleaned or self.service.cached(text) is not None:
+            self.stats['skipped'] += 1
+            return None
+        with self._lock:
+            job = self._jobs.get(cleaned)
+            if job is not None and not job[1].done() and not job[2].is_set():
+                job[0].add(owner)
+                return job[1]
+            cancel = threading.Event()
+            future = self._pool.submit(self._run, text, cancel)
+            self._jobs[cleaned] = ({owner}, future, cancel)
+            self.stats['submitted'] += 1
+        future.add_done_callback(lambda f, key=cleaned: self._forget(key, f))
+        return future
+
+    def _run(self, text: str, cancel: threading.Event) -> Optional[Tuple[bytes, str]]:
+        if cancel.is_set():
+            return None
+        return self.service.synthesize(text, cancel=cancel)
+
+    def _forget(self, key: str, future: Future) -> None:
+        with self._lock:
+            job = self._jobs.get(key)
+            if job is not None and job[1] is future:
+                del self._jobs[key]
+            if future.cancelled() or job is not None and job[2].is_set():
+                self.stats['cancelled'] += 1
+            else:
+                self.stats['completed'] += 1
+
+    def in_flight(self, text: str) -> Optional[Future]:
+        """The running prefetch for text, if any"""
+        with self._lock:
+            job = self._jobs.get(clean_text(text))
+        return job[1] if job is not None else None
+
+    def cancel(self, owner: str) -> int:
+        """Withdraw owner from its prefetches and cancel those no other owner wants; returns how many were cancelled"""
+        with self._lock:
+            jobs = []
+            for owners, future, cancel in self._jobs.values():
+                if owner in owners:
+                    owners.discard(owner)
+                    if not owners:
+                        jobs.append((future, cancel))
+        # Outside the lock: cancelling a queued future runs its done callbacks right here
+        for future, cancel in jobs:
+            cancel.set()
+            future.cancel()
+        return len(jobs)
+
+    def close(self) -> None:
+        with self._lock:
+            jobs = list(self._jobs.values())
+        for _, future, cancel in jobs:
+            cancel.set()
+            future.cancel()
+        self._pool.shutdown(wait=False)
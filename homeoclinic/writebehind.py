@@ -0,0 +1,161 @@
+"""Write-behind queue that coalesces repeated writes to the same key."""
+import atexit
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Optional, Tuple
+
+
+class WriteBehindQueue:
+    """Buffers keyed writes and flushes them from a background thread.
+
+    Submitting a key that is already pending replaces its payload, so the
+    several saves a chat turn makes for one session collapse into one write.
+    The worker waits ``delay`` seconds after the first pending write before
+    flushing, and :meth:`close` (registered with ``atexit``) drains whatever
+    is left so nothing is lost on shutdown.
+
+    A failed write is retried with exponential backoff up to ``max_retries``
+    times, then logged and moved to :attr:`dead_letters`.
+    """
+
+    def __init__(self, flush_fn: Callable[[str, Any], None], delay: float = 0.5, max_retries: int = 5,
+                 retry_delay: float = 1.0, max_retry_delay: float = 60.0):
+        self._flush_fn = flush_fn
+        self.delay = delay
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self._pending: Dict[str, Any] = {}
+        self._inflight: Dict[str, Any] = {}
+        self._attempts: Dict[str, int] = {}
+        self._retry_at: Dict[str, float] = {}
+        # Bumped by discard(); writes taken before it are not retried
+        self._generation = 0
+        self.dead_letters: Deque[Tuple[str, Any, str]] = deque(maxlen=100)
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._closed = False
+        self.stats = {'submitted': 0, 'flushed': 0, 'failed': 0, 'dead': 0}
+        self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def submit(self, key: str, payload: Any) -> None:
+        """Queue a write, replacing any pending write for the same key"""
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("WriteBehindQueue is closed")
+            self._pending[key] = payload
+            # A new payload is written promptly, not at the failed one's retry time
+            self._attempts.pop(key, None)
+            self._retry_at.pop(key, None)
+            self.stats['submitted'] += 1
+            self._cond.notify()
+
+    def pending(self, key: str) -> Optional[Any]:
+        """Return the not-yet-persisted payload for a key, if any"""
+        with self._cond:
+            if key in self._pending:
+                return self._pending[key]
+            return self._inflight.get(key)
+
+    def pending_items(self) -> Dict[str, Any]:
+        """Every not-yet-persisted payload, keyed like :meth:`pending`"""
+        with self._cond:
+            return {**self._inflight, **self._pending}
+
+    def discard(self) -> None:
+        """Drop every pending write and wait for a flush in progress to finish"""
+        with self._cond:
+            self._generation += 1
+            self._pending.clear()
+            self._attempts.clear()
+            self._retry_at.clear()
+        # The caller may now remove persisted data without an in-flight write landing afterwards
+        with self._flush_lock:
+            pass
+
+    def flush(self) -> None:
+        """Synchronously persist everything pending, including writes waiting to be retried"""
+        self._flush(retry_all=True)
+
+    def _flush(self, retry_all: bool) -> None:
+        with self._flush_lock:
+            now = time.monotonic()
+            with self._cond:
+                generation = self._generation
+                batch = {key: payload for key, payload in self._pending.items()
+                         if retry_all or self._retry_at.get(key, 0) <= now}
+                for key in batch:
+                    del self._pending[key]
+                self._inflight = batch
+            try:
+                for key, payload in batch.items():
+                    if self._generation != generation:
+                        break
+                    try:
+                        self._flush_fn(key, payload)
+                    except Exception as e:
+                        self.stats['failed'] += 1
+                        self._failed(key, payload, e, generation)
+                    else:
+                        self.stats['flushed'] += 1
+                        with self._cond:
+                            if key not in self._pending:
+                                self._attempts.pop(key, None)
+                                self._retry_at.pop(key, None)
+            finally:
+                with self._cond:
+                    self._inflight = {}
+
+    def _failed(self, key: str, payload: Any, error: Exception, generation: int) -> None:
+        with self._cond:
+            if self._generation != generation or key in self._pending:
+                # Discarded, or superseded by a newer write
+                return
+            attempts = self._attempts.get(key, 0) + 1
+            if attempts > self.max_retries:
+                self._attempts.pop(key, None)
+                self._retry_at.pop(key, None)
+                self.dead_letters.append((key, payload, str(error)))
+                self.stats['dead'] += 1
+                # The payload (patient details, messages) stays in dead_letters, out of the logs
+                print(f"Write-behind gave up on {key} after {attempts} attempts: {error}")
+                return
+            self._attempts[key] = attempts
+            self._retry_at[key] = time.monotonic() + min(self.max_retry_delay,
+                                                         self.retry_delay * 2 ** (attempts - 1))
+            self._pending[key] = payload
+            print(f"Write-behind flush error for {key} (attempt {attempts}): {error}")
+            self._cond.notify()
+
+    def _wait_time(self) -> Optional[float]:
+        """Seconds until some pending write is due (0 if one is due now, None if nothing is pending)"""
+        if not self._pending:
+            return None
+        now = time.monotonic()
+        return max(0.0, min(self._retry_at.get(key, now) for key in self._pending) - now)
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                wait = self._wait_time()
+                while wait != 0 and not self._closed:
+                    self._cond.wait(wait)
+                    wait = self._wait_time()
+                if self._closed:
+                    return
+            # Debounce: let the remaining saves of the same turn land before writing
+            time.sleep(self.delay)
+            self._flush(retry_all=False)
+
+    def close(self) -> None:
+        """Stop the worker and flush what is left"""
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join(timeout=self.delay + 5)
+        self.flush()
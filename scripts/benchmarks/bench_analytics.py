@@ -0,0 +1,90 @@
+"""Remedy analytics: loading every consultation into pandas vs. the Parquet store.
+
+Fills a SQLite store with N consultations, then times the legacy approach
+(``all_consultations()`` -> pandas -> value_counts) against the analytics
+store: the initial sync, an incremental sync of a few new rows (each followed
+by the job's warm-up of the built-in queries), and the sidebar queries on a
+cold store and after the job has warmed them.
+
+    python scripts/benchmarks/bench_analytics.py --rows 50000
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from homeoclinic.analytics import AnalyticsStore  # noqa: E402
+from homeoclinic.storage import SQLiteStorage  # noqa: E402
+
+MEDICINES = ["Belladonna", "Bryonia alba", "Nux vomica", "Arsenicum album", "Pulsatilla", "Sulphur",
+             "Rhus toxicodendron", "Lycopodium", "Natrum muriaticum", "Sepia"]
+POTENCIES = ["6C", "30C", "200C", "1M", "LM 1", "6X"]
+
+
+def consultation(i, rng):
+    return {"session_id": f"s{rng.randrange(max(1, i // 3 + 1))}",
+            "date": f"20{20 + i % 6}-{1 + i % 12:02d}-{1 + i % 28:02d}T{i % 24:02d}:00:00",
+            "chief_complaint": "Insomnia", "diagnosis": "Constitutional",
+            "prescription": {"remedies": [{"medicine": rng.choice(MEDICINES), "potency": rng.choice(POTENCIES),
+                                           "dosage": "2 pills", "frequency": "Twice daily"}
+                                          for _ in range(rng.randint(1, 3))]},
+            "consultation_messages": [{"role": "user", "content": "Cannot sleep after midnight. " * 20}] * 6}
+
+
+def legacy_stats(storage):
+    consultations = storage.all_consultations()
+    remedies = pd.json_normalize(consultations, record_path=["prescription", "remedies"])
+    return len(consultations), remedies["medicine"].value_counts().head(5), remedies["potency"].value_counts().head(6)
+
+
+def sidebar_stats(store):
+    return (store.total_consultations(), store.remedy_frequency(5), store.potency_distribution(6),
+            store.follow_up_intervals())
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return (time.perf_counter() - start) * 1000, result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=50_000)
+    parser.add_argument("--new-rows", type=int, default=20)
+    args = parser.parse_args(argv)
+
+    rng = random.Random(3)
+    with tempfile.TemporaryDirectory() as tmp:
+        storage = SQLiteStorage(os.path.join(tmp, "clinic.db"))
+        for i in range(args.rows):
+            storage.save_consultation(consultation(i, rng))
+        store = AnalyticsStore(os.path.join(tmp, "analytics"))
+
+        legacy_ms, _ = timed(lambda: legacy_stats(storage))
+        initial_ms, _ = timed(lambda: store.sync(storage))
+        cold_ms, stats = timed(lambda: sidebar_stats(store))
+        for i in range(args.rows, args.rows + args.new_rows):
+            storage.save_consultation(consultation(i, rng))
+        incremental_ms, _ = timed(lambda: (store.sync(storage), store.warm()))
+        warm_ms, _ = timed(lambda: sidebar_stats(store))
+
+        print(f"{args.rows:,} consultations")
+        print(f"{'legacy: load all + pandas':<34} {legacy_ms:>9.1f} ms per sidebar render")
+        print(f"{'store: initial sync':<34} {initial_ms:>9.1f} ms (background, once)")
+        print(f"{'store: sync + warm, ' + str(args.new_rows) + ' new rows':<34} {incremental_ms:>9.1f} ms (background)")
+        print(f"{'store: sidebar stats, cold':<34} {cold_ms:>9.1f} ms (only before the first warm-up)")
+        print(f"{'store: sidebar stats, warmed':<34} {warm_ms:>9.3f} ms per sidebar render")
+        print(f"top remedies: {stats[1][:3]}, follow-ups: {stats[3]['count']:,} "
+              f"(median {stats[3]['median_days']:.0f} days)")
+        storage.close()
+
+
+if __name__ == "__main__":
+    main()
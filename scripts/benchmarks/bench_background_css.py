@@ -0,0 +1,70 @@
+"""Per-rerun cost of the page background: inline base64 PNG vs. the cached asset pipeline.
+
+Measures the time spent building the stylesheet on each rerun and the bytes of
+CSS sent to the browser per rerun for:
+
+* legacy   - read the PNG, base64-encode it and inline it on every rerun
+* data-uri - downscaled WebP encoded once per process, inlined as a data URI
+* static   - downscaled WebP published to ./static, CSS only carries the URL
+
+    python scripts/benchmarks/bench_background_css.py --reruns 50
+"""
+import argparse
+import base64
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+sys.path.insert(0, ROOT)
+
+from homeoclinic.assets import data_uri, encode_background, publish_static  # noqa: E402
+
+# Size of the rest of the stylesheet (everything except the image URL), roughly
+CSS_OVERHEAD = 7000
+
+
+def legacy_rerun(path):
+    with open(path, 'rb') as f:
+        encoded = base64.b64encode(f.read()).decode()
+    return f"url(\"data:image/png;base64,{encoded}\")" + " " * CSS_OVERHEAD
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--image", default=os.path.join(ROOT, "Gemini_Generated_Image_qaqiocqaqiocqaqi.png"))
+    parser.add_argument("--reruns", type=int, default=50)
+    parser.add_argument("--format", default="webp")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    for _ in range(args.reruns):
+        css = legacy_rerun(args.image)
+    legacy_ms = (time.perf_counter() - start) * 1000 / args.reruns
+    legacy_bytes = len(css)
+
+    start = time.perf_counter()
+    data, mime = encode_background(args.image, fmt=args.format)
+    encode_ms = (time.perf_counter() - start) * 1000
+    cache = {}
+    start = time.perf_counter()
+    for _ in range(args.reruns):
+        # After the first rerun this is a dictionary hit, like st.cache_resource
+        css = cache.setdefault(args.image, f"url(\"{data_uri(data, mime)}\")" + " " * CSS_OVERHEAD)
+    inline_ms = (time.perf_counter() - start) * 1000 / args.reruns
+    inline_bytes = len(css)
+
+    with tempfile.TemporaryDirectory() as static_dir:
+        static_css = f"url(\"{publish_static(data, mime, static_dir)}\")" + " " * CSS_OVERHEAD
+
+    print(f"original image: {os.path.getsize(args.image):,} B PNG; re-encoded: {len(data):,} B {mime} "
+          f"(one-off encode {encode_ms:.1f} ms)")
+    print(f"{'mode':<10} {'ms / rerun':>11} {'CSS bytes / rerun':>18}")
+    print(f"{'legacy':<10} {legacy_ms:>11.2f} {legacy_bytes:>18,}")
+    print(f"{'data-uri':<10} {inline_ms:>11.3f} {inline_bytes:>18,}")
+    print(f"{'static':<10} {inline_ms:>11.3f} {len(static_css):>18,}  (+ {len(data):,} B image once, browser-cached)")
+
+
+if __name__ == "__main__":
+    main()
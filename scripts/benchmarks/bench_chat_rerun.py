@@ -0,0 +1,82 @@
+"""Script rerun time with long consultations: every message rendered vs. the windowed chat.
+
+Runs app.py headless (``streamlit.testing`` AppTest, fake model) with a
+consultation of N messages preloaded and times a full rerun when every
+message is rendered, as before windowing, and when only the last
+``HOMEO_CHAT_WINDOW`` are. A click on a 🔊 button or a sidebar widget now
+reruns only its fragment. AppTest always reruns the whole script, so the
+last column times a script holding just one audio control instead, which
+is roughly what that fragment rerun executes.
+
+    python scripts/benchmarks/bench_chat_rerun.py --sizes 10 100 500
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+sys.path.insert(0, ROOT)
+os.environ.setdefault("HOMEO_FAKE_LLM", "1")
+
+from streamlit.testing.v1 import AppTest  # noqa: E402
+
+MESSAGE = "The headache is throbbing, worse from the sun and from jarring, better lying in a dark room. " * 3
+
+
+def one_audio_control():
+    import streamlit as st
+
+    button_col, audio_col = st.columns([1, 15])
+    with button_col:
+        st.button("🔊", key="tts_0", help="Listen to this message")
+    with audio_col:
+        st.empty()
+
+
+def app_with_messages(count, window):
+    app = AppTest.from_file(os.path.join(ROOT, "app.py"), default_timeout=120)
+    app.secrets["PASSWORD"] = "benchmark"
+    app.secrets["GEMINI_API_KEY"] = "benchmark"
+    app.session_state["logged_in"] = True
+    app.session_state["messages"] = [{"role": "user" if i % 2 == 0 else "assistant", "content": f"{i}. {MESSAGE}"}
+                                     for i in range(count)]
+    if window is not None:
+        app.session_state["chat_window"] = window
+    return app
+
+
+def timed_reruns(app, repeat):
+    app.run()
+    if app.exception:
+        raise RuntimeError(app.exception[0].value)
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        app.run()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 500])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # The app keeps its databases in the working directory
+        os.chdir(tmp)
+        control_ms = timed_reruns(AppTest.from_function(one_audio_control), args.repeat)
+        print(f"{'messages':>8} {'all rendered ms':>16} {'windowed ms':>12} {'audio control alone ms':>23}")
+        for size in args.sizes:
+            everything = timed_reruns(app_with_messages(size, size), args.repeat)
+            windowed = timed_reruns(app_with_messages(size, None), args.repeat)
+            print(f"{size:>8,} {everything:>16.0f} {windowed:>12.0f} {control_ms:>23.1f}")
+        os.chdir(ROOT)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""Consultation history: load-everything vs. one keyset page, as the table grows.
+
+Fills a SQLite store with N synthetic consultations (each with a stored chat
+transcript) and times what the history view reads per rerun: the legacy
+``all_consultations()`` + reverse, against the first and a deep page of
+``consultation_page`` with and without filters.
+
+    python scripts/benchmarks/bench_consultation_history.py --sizes 1000 10000 50000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from homeoclinic.storage import ConsultationFilter, SQLiteStorage  # noqa: E402
+
+COMPLAINTS = ["Migraine", "Dry cough", "Insomnia", "Eczema", "Acidity"]
+REMEDIES = ["Belladonna", "Bryonia alba", "Nux vomica", "Arsenicum album", "Pulsatilla", "Sulphur"]
+
+
+def consultation(i):
+    return {
+        "session_id": f"session-{i}",
+        "date": f"20{20 + i % 7}-{1 + i % 12:02d}-{1 + i % 28:02d}T{i % 24:02d}:00:00",
+        "chief_complaint": COMPLAINTS[i % len(COMPLAINTS)],
+        "diagnosis": "Constitutional picture",
+        "prescription": {"remedies": [{"medicine": REMEDIES[i % len(REMEDIES)], "potency": "30C"}]},
+        "consultation_messages": [{"role": "user", "content": "Symptoms described at length. " * 40}] * 12,
+    }
+
+
+def timed(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) * 1000 / repeat
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 50_000])
+    parser.add_argument("--page-size", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    filters = ConsultationFilter(complaint="cough", remedy="nux")
+    print(f"{'rows':>8} {'load all ms':>12} {'page 1 ms':>10} {'page 50 ms':>11} {'filtered ms':>12}")
+    with tempfile.TemporaryDirectory() as tmp:
+        storage = SQLiteStorage(os.path.join(tmp, "history.db"))
+        count = 0
+        for size in sorted(args.sizes):
+            while count < size:
+                storage.save_consultation(consultation(count))
+                count += 1
+            legacy_ms = timed(lambda: list(reversed(storage.all_consultations())), max(1, args.repeat // 2))
+            first_ms = timed(lambda: storage.consultation_page(limit=args.page_size), args.repeat)
+
+            after = None
+            for _ in range(49):
+                after = storage.consultation_page(after=after, limit=args.page_size).next_cursor
+            deep_ms = timed(lambda: storage.consultation_page(after=after, limit=args.page_size), args.repeat)
+            filtered_ms = timed(lambda: storage.consultation_page(filters, limit=args.page_size), args.repeat)
+            print(f"{size:>8,} {legacy_ms:>12.1f} {first_ms:>10.2f} {deep_ms:>11.2f} {filtered_ms:>12.2f}")
+        storage.close()
+
+
+if __name__ == "__main__":
+    main()
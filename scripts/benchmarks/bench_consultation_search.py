@@ -0,0 +1,92 @@
+"""Consultation search: scanning the stored JSON vs. the FTS5 index with facets.
+
+Fills a SQLite store with N synthetic consultations (complaint, diagnosis, case
+summary, remedies and a short transcript) and times a few typical queries:
+ranked hits plus remedy/complaint/month facets from ``search_consultations``
+(first run and a cached rerun), against loading every record and matching the
+text in Python.
+
+    python scripts/benchmarks/bench_consultation_search.py --rows 100000
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from homeoclinic.search import index_fields, matches_terms, query_terms  # noqa: E402
+from homeoclinic.storage import SQLiteStorage  # noqa: E402
+
+COMPLAINTS = ["Migraine", "Dry cough", "Insomnia", "Eczema", "Acidity", "Joint pain", "Anxiety", "Hay fever"]
+REMEDIES = ["Belladonna", "Bryonia alba", "Nux vomica", "Arsenicum album", "Pulsatilla", "Sulphur",
+            "Rhus toxicodendron", "Lycopodium", "Natrum muriaticum", "Sepia", "Ignatia", "Gelsemium"]
+MODALITIES = ["worse in the sun", "better from pressure", "worse at night", "better in open air",
+              "worse after eating", "better from warmth", "worse from motion", "thirstless"]
+QUERIES = ["migraine", "cough worse night", "nux vomica", "throbbing sun", "anxiety gels"]
+
+
+def consultation(i, rng):
+    complaint = rng.choice(COMPLAINTS)
+    remedies = rng.sample(REMEDIES, 2)
+    modality = rng.choice(MODALITIES)
+    return {
+        "session_id": f"session-{i}",
+        "date": f"20{20 + i % 7}-{1 + i % 12:02d}-{1 + i % 28:02d}T{i % 24:02d}:00:00",
+        "chief_complaint": complaint,
+        "diagnosis": f"{complaint} with {rng.choice(['throbbing', 'stitching', 'burning'])} character",
+        "prescription": {
+            "case_summary": f"Patient reports {complaint.lower()}, {modality}.",
+            "remedies": [{"medicine": name, "potency": rng.choice(["30C", "200C", "6X"]),
+                          "keynote_match": modality} for name in remedies],
+        },
+        "consultation_messages": [
+            {"role": "user", "content": f"I have {complaint.lower()} and it is {modality}."},
+            {"role": "assistant", "content": f"Is the {complaint.lower()} {rng.choice(MODALITIES)}?"},
+        ],
+    }
+
+
+def timed(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    return (time.perf_counter() - start) * 1000 / repeat, result
+
+
+def scan(storage, query):
+    terms = query_terms(query)
+    return sum(1 for c in storage.all_consultations() if matches_terms(index_fields(c), terms))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--scan", action="store_true", help="also time the full-scan baseline (slow)")
+    args = parser.parse_args(argv)
+
+    rng = random.Random(42)
+    with tempfile.TemporaryDirectory() as tmp:
+        storage = SQLiteStorage(os.path.join(tmp, "search.db"))
+        start = time.perf_counter()
+        for i in range(args.rows):
+            storage.save_consultation(consultation(i, rng))
+        insert_s = time.perf_counter() - start
+        print(f"{args.rows:,} consultations saved with incremental indexing in {insert_s:.1f}s "
+              f"({insert_s * 1e6 / args.rows:.0f} us each)")
+
+        print(f"{'query':<22} {'matches':>8} {'first ms':>9} {'rerun ms':>9} {'scan ms':>8}  top remedies")
+        for query in QUERIES:
+            first_ms, result = timed(lambda: storage.search_consultations(query, limit=20), 1)
+            rerun_ms, _ = timed(lambda: storage.search_consultations(query, limit=20), args.repeat)
+            scan_ms = f"{timed(lambda: scan(storage, query), 1)[0]:.0f}" if args.scan else "-"
+            top = ", ".join(f"{name} {count}" for name, count in result.facets.get("remedy", [])[:3])
+            print(f"{query:<22} {result.total:>8,} {first_ms:>9.1f} {rerun_ms:>9.2f} {scan_ms:>8}  {top}")
+        storage.close()
+
+
+if __name__ == "__main__":
+    main()
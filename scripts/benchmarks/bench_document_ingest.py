@@ -0,0 +1,135 @@
+"""Ingestion of a long lab report: legacy string concatenation vs. the ingestion pipeline.
+
+Generates a synthetic N-page lab report PDF (no external tools needed) and
+measures:
+
+* legacy   - the old extract_text_from_pdf loop (``text += page.extract_text()``)
+* pipeline - page generator + summarised chunks, first upload
+* cached   - the same upload again (content-hash cache hit)
+* parallel - several different reports at once on the process pool
+
+    python scripts/benchmarks/bench_document_ingest.py --pages 300
+"""
+import argparse
+import io
+import os
+import random
+import sys
+import time
+import zlib
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from homeoclinic.ingest import DocumentIngestor, IngestLimits, document_context  # noqa: E402
+
+TESTS = [("Haemoglobin", "g/dL", 12.0, 17.5), ("WBC", "x10^9/L", 4.0, 11.0), ("Platelets", "x10^9/L", 150, 400),
+         ("Sodium", "mmol/L", 135, 145), ("Potassium", "mmol/L", 3.5, 5.1), ("Creatinine", "umol/L", 60, 110),
+         ("ALT", "U/L", 7, 56), ("TSH", "mIU/L", 0.4, 4.0), ("Vitamin D", "ng/mL", 20, 50),
+         ("Ferritin", "ng/mL", 30, 400), ("CRP", "mg/L", 0, 5), ("HbA1c", "%", 4.0, 5.6)]
+
+
+def report_lines(page, rng):
+    yield f"City Diagnostics - Laboratory Report - Page {page}"
+    yield f"Patient: Test Patient   Sample date: 2026-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}"
+    for _ in range(4):
+        for name, unit, low, high in TESTS:
+            value = round(rng.uniform(low * 0.7, high * 1.3), 1)
+            flag = "H" if value > high else "L" if value < low else ""
+            yield f"{name:<12} {value:>8} {unit:<10} ({low} - {high}) {flag}"
+    yield "Comment: results to be interpreted in clinical context."
+
+
+def make_lab_report_pdf(pages, seed=0):
+    """Minimal multi-page PDF with one compressed text stream per page"""
+    rng = random.Random(seed)
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", None,
+               b"<< /Type /Font /Subtype /Type1 /BaseFont /Courier >>"]
+    kids = []
+    for page in range(1, pages + 1):
+        lines = [line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+                 for line in report_lines(page, rng)]
+        content = "BT /F1 8 Tf 10 TL 40 800 Td " + " ".join(f"({line}) Tj T*" for line in lines) + " ET"
+        stream = zlib.compress(content.encode("latin-1"))
+        objects.append(b"<< /Length %d /Filter /FlateDecode >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        content_id = len(objects)
+        objects.append(b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+                       b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % content_id)
+        kids.append(len(objects))
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (b" ".join(b"%d 0 R" % k for k in kids), len(kids))
+
+    out = io.BytesIO()
+    out.write(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(out.tell())
+        out.write(b"%d 0 obj\n" % number + body + b"\nendobj\n")
+    xref = out.tell()
+    out.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+    for offset in offsets:
+        out.write(b"%010d 00000 n \n" % offset)
+    out.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref))
+    return out.getvalue()
+
+
+def legacy_extract(data):
+    import PyPDF2
+    pdf_reader = PyPDF2.PdfReader(io.BytesIO(data))
+    text = ""
+    for page in pdf_reader.pages:
+        text += page.extract_text() + "\n"
+    return text.strip()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", type=int, default=300)
+    parser.add_argument("--reports", type=int, default=4, help="reports uploaded together for the parallel run")
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args(argv)
+
+    report = make_lab_report_pdf(args.pages)
+    print(f"synthetic report: {args.pages} pages, {len(report) / 1e6:.2f} MB")
+
+    start = time.perf_counter()
+    legacy_text = legacy_extract(report)
+    legacy_s = time.perf_counter() - start
+
+    # Single report inline; the pool only pays off once several uploads arrive together
+    ingestor = DocumentIngestor(limits=IngestLimits(max_pages=max(500, args.pages), process_threshold_bytes=1 << 40))
+    start = time.perf_counter()
+    (_, document, _), = ingestor.ingest([("lab_report.pdf", report)])
+    context = document_context(document)
+    pipeline_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    ingestor.ingest([("lab_report.pdf", report)])
+    cached_s = time.perf_counter() - start
+
+    reports = [(f"report_{i}.pdf", make_lab_report_pdf(args.pages, seed=i + 1)) for i in range(args.reports)]
+    start = time.perf_counter()
+    for name, data in reports:
+        legacy_extract(data)
+    serial_s = time.perf_counter() - start
+    pooled = DocumentIngestor(limits=IngestLimits(max_pages=max(500, args.pages), process_threshold_bytes=0),
+                              max_workers=args.workers)
+    start = time.perf_counter()
+    pooled.ingest(reports)
+    cold_s = time.perf_counter() - start
+    # Fresh content so nothing is cached, now with the workers already running
+    reports = [(f"report_{i}.pdf", make_lab_report_pdf(args.pages, seed=100 + i)) for i in range(args.reports)]
+    start = time.perf_counter()
+    results = pooled.ingest(reports)
+    parallel_s = time.perf_counter() - start
+    pooled.close()
+
+    print(f"{'legacy':<9} {legacy_s:7.2f}s  {len(legacy_text):>9,} chars of raw text")
+    print(f"{'pipeline':<9} {pipeline_s:7.2f}s  {len(context):>9,} chars of summarised chunks "
+          f"({document.page_count} pages)")
+    print(f"{'cached':<9} {cached_s * 1000:7.2f}ms re-upload")
+    print(f"{'parallel':<9} {args.reports} reports: serial {serial_s:.2f}s, pool {parallel_s:.2f}s "
+          f"({cold_s:.2f}s including worker start-up; {sum(1 for _, d, _ in results if d)} ok)")
+    print(f"ingestor stats {ingestor.stats}, pooled run {pooled.stats}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""Data export: one base64 data-URI vs. the streaming JSON Lines exporter.
+
+Fills a SQLite store with N sessions (each with a chat transcript) and
+consultations, then measures wall time, peak Python heap (tracemalloc) and
+output size for the legacy export (``json.dumps(indent=2)`` + base64 in an
+HTML link) and for ``export_data`` with each available compression, plus the
+streaming import of the gzip file into an empty store.
+
+    python scripts/benchmarks/bench_export.py --sessions 2000 --messages 40
+"""
+import argparse
+import base64
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from homeoclinic.export import available_compressions, export_data, import_data  # noqa: E402
+from homeoclinic.storage import SQLiteStorage  # noqa: E402
+
+
+def fill(storage, sessions, messages):
+    for i in range(sessions):
+        transcript = [{"role": "user" if j % 2 == 0 else "assistant",
+                       "content": f"Message {j} of session {i}: the pain is worse at night and better with warmth. " * 3}
+                      for j in range(messages)]
+        storage.save_session({"session_id": f"s{i}", "last_updated": f"2026-01-01T00:{i % 60:02d}:00",
+                              "message_count": messages, "messages": transcript, "patient_info": {},
+                              "symptoms_collected": ["pain"], "current_prescription": None})
+        storage.save_consultation({"session_id": f"s{i}", "date": f"2026-01-01T00:{i % 60:02d}:00",
+                                   "chief_complaint": "Joint pain", "diagnosis": "Rheumatic",
+                                   "prescription": {"remedies": [{"medicine": "Rhus toxicodendron"}]},
+                                   "consultation_messages": transcript})
+
+
+def measure(fn):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak, result
+
+
+def legacy_export(storage):
+    all_data = {"sessions": storage.list_sessions(), "consultations": storage.all_consultations(),
+                "export_date": "2026-01-01T00:00:00"}
+    b64 = base64.b64encode(json.dumps(all_data, indent=2).encode()).decode()
+    return len(f'<a href="data:application/json;base64,{b64}" download="export.json">Download</a>')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=2000)
+    parser.add_argument("--messages", type=int, default=40)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        storage = SQLiteStorage(os.path.join(tmp, "source.db"))
+        fill(storage, args.sessions, args.messages)
+        print(f"{args.sessions:,} sessions x {args.messages} messages, plus one consultation each")
+        print(f"{'export':<18} {'time s':>7} {'peak heap MB':>13} {'output MB':>10}")
+
+        elapsed, peak, size = measure(lambda: legacy_export(storage))
+        print(f"{'legacy data-URI':<18} {elapsed:>7.2f} {peak / 1e6:>13.1f} {size / 1e6:>10.1f}  (held in the page)")
+        gzip_path = None
+        for compression in available_compressions():
+            elapsed, peak, result = measure(lambda: export_data(storage, tmp, compression))
+            print(f"{'stream ' + compression:<18} {elapsed:>7.2f} {peak / 1e6:>13.1f} {result.bytes_written / 1e6:>10.1f}")
+            if compression == "gzip":
+                gzip_path = result.path
+
+        target = SQLiteStorage(os.path.join(tmp, "target.db"))
+        with open(gzip_path, "rb") as f:
+            elapsed, peak, counts = measure(lambda: import_data(target, f))
+        print(f"{'import gzip':<18} {elapsed:>7.2f} {peak / 1e6:>13.1f} {'':>10}  {counts}")
+        target.close()
+        storage.close()
+
+
+if __name__ == "__main__":
+    main()
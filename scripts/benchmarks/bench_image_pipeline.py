@@ -0,0 +1,115 @@
+"""Image uploads: raw phone photos vs. the preprocessing pipeline.
+
+Generates synthetic 12 MP JPEG "phone photos" (one of them uploaded twice) and
+reports, per batch:
+
+* decoded pixel memory - full-size decode vs. JPEG draft decode + downscale
+* bytes sent to the model, and bytes re-sent with the chat history each turn
+* preprocessing time on the script thread vs. on the worker pool
+* upload-to-reply latency against the fake model, with the upload time modelled
+  from --uplink-mbps (request bytes / bandwidth)
+
+    python scripts/benchmarks/bench_image_pipeline.py --photos 4 --uplink-mbps 10
+"""
+import argparse
+import io
+import os
+import sys
+import time
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from homeoclinic.fakes import FakeStreamingModel  # noqa: E402
+from homeoclinic.images import ImagePipeline, prepare_image  # noqa: E402
+
+
+def phone_photo(seed, size=(4032, 3024)):
+    """Distinct low-frequency scene per seed plus sensor-like noise"""
+    rng = np.random.default_rng(seed)
+    scene = Image.fromarray((rng.random((6, 8, 3)) * 255).astype(np.uint8)).resize(size, Image.BICUBIC)
+    base = np.asarray(scene, dtype=np.float32)
+    pixels = np.clip(base + rng.normal(0, 12, base.shape), 0, 255).astype(np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, format="JPEG", quality=92)
+    return buffer.getvalue()
+
+
+def legacy_decode(data):
+    with Image.open(io.BytesIO(data)) as img:
+        img.load()
+        return img.width * img.height * len(img.getbands())
+
+
+def draft_decode(data, max_pixels):
+    """Pixel buffer actually decoded by prepare_image (JPEG draft at a reduced scale)"""
+    with Image.open(io.BytesIO(data)) as img:
+        scale = min(1.0, (max_pixels / (img.width * img.height)) ** 0.5)
+        img.draft('RGB', (int(img.width * scale), int(img.height * scale)))
+        img.load()
+        return img.width * img.height * len(img.getbands())
+
+
+def reply_latency(content_bytes, uplink_mbps, model):
+    chat = model.start_chat(history=[])
+    upload_s = content_bytes * 8 / (uplink_mbps * 1e6)
+    start = time.perf_counter()
+    chat.send_message("I have uploaded photos")
+    return upload_s + time.perf_counter() - start
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--photos", type=int, default=4)
+    parser.add_argument("--max-pixels", type=int, default=1_000_000)
+    parser.add_argument("--format", default="webp")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--uplink-mbps", type=float, default=10.0)
+    parser.add_argument("--turns", type=int, default=5, help="later turns that re-send the chat history")
+    args = parser.parse_args(argv)
+
+    photos = [(f"IMG_{i:04d}.jpg", phone_photo(i)) for i in range(args.photos)]
+    photos.append(("IMG_copy.jpg", photos[0][1]))  # the same photo uploaded again
+    raw_bytes = sum(len(data) for _, data in photos)
+
+    start = time.perf_counter()
+    legacy_pixels = [legacy_decode(data) for _, data in photos]
+    legacy_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for name, data in photos:
+        prepare_image(name, data, args.max_pixels, args.format)
+    serial_s = time.perf_counter() - start
+
+    pipeline = ImagePipeline(max_pixels=args.max_pixels, fmt=args.format, max_workers=args.workers)
+    start = time.perf_counter()
+    parts, errors = pipeline.process(photos)
+    pooled_s = time.perf_counter() - start
+    pipeline.close()
+    sent = [p for p in parts if p.duplicate_of is None]
+    sent_bytes = sum(len(p.data) for p in sent)
+    pipeline_pixels = [draft_decode(data, args.max_pixels) for _, data in photos]
+
+    model = FakeStreamingModel(first_token_delay=0.3)
+    legacy_latency = reply_latency(raw_bytes, args.uplink_mbps, model)
+    pipeline_latency = pooled_s + reply_latency(sent_bytes, args.uplink_mbps, model)
+
+    print(f"{len(photos)} uploads ({args.photos} distinct 4032x3024 JPEGs + 1 duplicate), {raw_bytes / 1e6:.1f} MB raw")
+    print(f"{'':<22} {'legacy':>12} {'pipeline':>12}")
+    print(f"{'peak decoded pixels':<22} {max(legacy_pixels) / 1e6:>10.1f}MB {max(pipeline_pixels) / 1e6:>10.1f}MB  (per image)")
+    print(f"{'images sent':<22} {len(photos):>12} {len(sent):>12}  "
+          f"(duplicate: {next((p.name for p in parts if p.duplicate_of), '-')})")
+    print(f"{'bytes to model':<22} {raw_bytes / 1e6:>10.2f}MB {sent_bytes / 1e6:>10.2f}MB")
+    print(f"{'history re-sent':<22} {raw_bytes * args.turns / 1e6:>10.1f}MB {sent_bytes * args.turns / 1e6:>10.1f}MB  "
+          f"(over {args.turns} later turns)")
+    print(f"{'decode / prepare':<22} {legacy_s:>11.2f}s {serial_s:>11.2f}s  (pool of {args.workers}: {pooled_s:.2f}s)")
+    print(f"{'upload-to-reply':<22} {legacy_latency:>11.2f}s {pipeline_latency:>11.2f}s  "
+          f"(at {args.uplink_mbps:g} Mbit/s uplink)")
+    if errors:
+        print("errors:", errors)
+
+
+if __name__ == "__main__":
+    main()
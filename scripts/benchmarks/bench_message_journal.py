@@ -0,0 +1,65 @@
+"""Bytes written per turn: full-session rewrite vs. the append-only message journal.
+
+Simulates a consultation of N turns (one user + one assistant message each) and
+records how many bytes each persistence strategy writes on every save.
+
+    python scripts/benchmarks/bench_message_journal.py --turns 60
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from homeoclinic.journal import MessageJournal  # noqa: E402
+
+
+def make_turn(turn: int):
+    user = {"role": "user", "content": f"Turn {turn}: the headache is worse in the evening and better with pressure. " * 3}
+    assistant = {"role": "assistant", "content": f"Turn {turn}: thank you. Does the pain throb or stitch, and is there thirst? " * 6}
+    return [user, assistant]
+
+
+def session_row(session_id, messages, include_messages):
+    row = {
+        "session_id": session_id,
+        "current_prescription": None,
+        "patient_info": {},
+        "symptoms_collected": ["headache", "pain"],
+        "last_updated": "2026-01-01T00:00:00",
+        "message_count": len(messages),
+    }
+    if include_messages:
+        row["messages"] = messages
+    return json.dumps(row).encode("utf-8")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--turns", type=int, default=60)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        journal = MessageJournal(os.path.join(tmp, "journal"))
+        messages = []
+        full_total = 0
+        journal_total = 0
+        print(f"{'turn':>5} {'full rewrite (B)':>18} {'journal (B)':>12}")
+        for turn in range(1, args.turns + 1):
+            messages.extend(make_turn(turn))
+            full_bytes = len(session_row("bench", messages, include_messages=True))
+            journal_bytes = journal.sync("bench", messages) + len(session_row("bench", messages, include_messages=False))
+            full_total += full_bytes
+            journal_total += journal_bytes
+            if turn == 1 or turn % 10 == 0:
+                print(f"{turn:>5} {full_bytes:>18,} {journal_bytes:>12,}")
+        journal.close()
+
+        print(f"\nTotal over {args.turns} turns: full rewrite {full_total:,} B, journal {journal_total:,} B "
+              f"({full_total / journal_total:.1f}x less with the journal)")
+
+
+if __name__ == "__main__":
+    main()
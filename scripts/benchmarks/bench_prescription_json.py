@@ -0,0 +1,75 @@
+"""Prescription extraction: the legacy greedy regex vs. the single-pass extractor.
+
+Runs both over the captured-reply corpus in tests/homeoclinic/data (success
+rate) and over long replies with stray braces after the JSON (time per reply).
+
+    python scripts/benchmarks/bench_prescription_json.py --sizes 10000 100000 1000000
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+sys.path.insert(0, ROOT)
+
+from homeoclinic.fakes import SAMPLE_PRESCRIPTION  # noqa: E402
+from homeoclinic.prescription_json import PRESCRIPTION_MARKER, extract_prescription  # noqa: E402
+
+CORPUS = os.path.join(ROOT, "tests", "homeoclinic", "data", "prescription_replies.json")
+
+
+def legacy_extract(text):
+    try:
+        match = re.search(r'\{[\s\S]*\}', text)
+        return json.loads(match.group()) if match else None
+    except ValueError:
+        return None
+
+
+def first_medicine(prescription):
+    """Medicine of the first remedy, or None when the app could not render it"""
+    remedies = prescription.get("remedies") if isinstance(prescription, dict) else None
+    if isinstance(remedies, list) and remedies and isinstance(remedies[0], dict):
+        return remedies[0].get("medicine")
+    return None
+
+
+def timed(fn, text, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = fn(text)
+    return (time.perf_counter() - start) * 1000 / repeat, result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000],
+                        help="approximate reply lengths in characters")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    with open(CORPUS, encoding="utf-8") as f:
+        corpus = json.load(f)
+    legacy_ok = new_ok = 0
+    for case in corpus:
+        expected = case["expected"] and case["expected"]["medicine"]
+        legacy_ok += first_medicine(legacy_extract(case["reply"])) == expected
+        new_ok += first_medicine(extract_prescription(case["reply"]).prescription) == expected
+    print(f"corpus of {len(corpus)} captured replies: legacy correct {legacy_ok}, extractor correct {new_ok}")
+
+    body = f"{PRESCRIPTION_MARKER}\n```json\n{json.dumps(SAMPLE_PRESCRIPTION, indent=2)}\n```\n"
+    print(f"{'reply chars':>12} {'legacy ms':>10} {'ok':>4} {'extractor ms':>13} {'ok':>4}")
+    for size in args.sizes:
+        prose = "The {miasmatic} picture matters. " * (size // 70)
+        reply = prose + body + "Avoid {coffee} and [mint]. " * (size // 56)
+        legacy_ms, legacy = timed(legacy_extract, reply, args.repeat)
+        new_ms, result = timed(extract_prescription, reply, args.repeat)
+        print(f"{len(reply):>12,} {legacy_ms:>10.2f} {'yes' if legacy else 'no':>4} "
+              f"{new_ms:>13.2f} {'yes' if result.prescription else 'no':>4}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""Rerun latency with a prescription on screen: re-rendering vs. the render cache.
+
+Each "rerun" produces what display_prescription needs: the remedies table,
+Markdown, JSON, CSV and (before the cache) the PDF. The PDF is skipped when
+WeasyPrint's system libraries are not installed.
+
+    python scripts/benchmarks/bench_prescription_render.py --reruns 20
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from homeoclinic.fakes import SAMPLE_PRESCRIPTION  # noqa: E402
+from homeoclinic.render_cache import RenderCache, prescription_key  # noqa: E402
+from homeoclinic.rendering import (  # noqa: E402
+    format_prescription_table, generate_prescription_markdown, generate_prescription_pdf,
+)
+
+
+def pdf_available():
+    try:
+        import weasyprint  # noqa: F401
+        return True
+    except (ImportError, OSError):
+        return False
+
+
+def uncached_rerun(prescription, with_pdf):
+    df = format_prescription_table(prescription)
+    df.to_markdown(index=False)
+    generate_prescription_markdown(prescription)
+    json.dumps(prescription, indent=2)
+    df.to_csv(index=False)
+    if with_pdf:
+        generate_prescription_pdf(prescription)
+
+
+def cached_rerun(prescription, cache):
+    key = prescription_key(prescription)
+    cache.get_or_render(key, 'table.md', lambda: format_prescription_table(prescription).to_markdown(index=False))
+    cache.get_or_render(key, 'md', lambda: generate_prescription_markdown(prescription))
+    cache.get_or_render(key, 'json', lambda: json.dumps(prescription, indent=2))
+    cache.get_or_render(key, 'csv', lambda: format_prescription_table(prescription).to_csv(index=False))
+    # PDF is rendered lazily, only when the download button is clicked
+
+
+def timed(fn, reruns):
+    start = time.perf_counter()
+    for _ in range(reruns):
+        fn()
+    return (time.perf_counter() - start) * 1000 / reruns
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--reruns", type=int, default=20)
+    args = parser.parse_args(argv)
+
+    with_pdf = pdf_available()
+    prescription = dict(SAMPLE_PRESCRIPTION, date="2026-01-01")
+    cache = RenderCache()
+
+    before = timed(lambda: uncached_rerun(prescription, with_pdf), args.reruns)
+    cached_rerun(prescription, cache)  # first rerun fills the cache
+    after = timed(lambda: cached_rerun(prescription, cache), args.reruns)
+
+    print(f"PDF rendering included in baseline: {'yes' if with_pdf else 'no (WeasyPrint unavailable)'}")
+    print(f"per-rerun render time: before {before:.2f} ms, after {after:.3f} ms ({before / after:.0f}x faster)")
+    print(f"cache stats: {cache.stats}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""Repertorization latency: Python loops over a rubric dict vs. the sparse matrix.
+
+Builds a random repertory of R rubrics × M remedies (each rubric covering a
+log-normal number of remedies, as real repertories do), then times scoring a
+case and picking the top k, for cases of a few rubrics up to every rubric.
+
+    python scripts/benchmarks/bench_repertory.py --rubrics 5000 --remedies 2000
+"""
+import argparse
+import math
+import os
+import statistics
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+import scipy.sparse as sparse  # noqa: E402
+
+from homeoclinic.repertory import Repertory  # noqa: E402
+
+
+def random_repertory(rubrics, remedies, seed=7):
+    rng = np.random.default_rng(seed)
+    sizes = np.clip(rng.lognormal(mean=3.0, sigma=1.0, size=rubrics).astype(int), 1, remedies)
+    rows = np.repeat(np.arange(rubrics), sizes)
+    cols = np.concatenate([rng.choice(remedies, size=n, replace=False) for n in sizes])
+    grades = rng.choice([1, 1, 1, 2, 2, 3], size=len(rows)).astype(np.float32)
+    matrix = sparse.coo_matrix((grades, (rows, cols)), shape=(rubrics, remedies))
+    return Repertory([f"rubric {i}" for i in range(rubrics)], [f"remedy {j}" for j in range(remedies)], matrix)
+
+
+def python_shortlist(table, remedies, case, k):
+    """The same ranking with dicts: {rubric: [(remedy, grade), ...]}"""
+    scores, covered = {}, {}
+    for rubric, intensity in case.items():
+        entries = table[rubric]
+        rarity = math.log1p(remedies / len(entries))
+        for remedy, grade in entries:
+            scores[remedy] = scores.get(remedy, 0.0) + intensity * rarity * grade
+            covered[remedy] = covered.get(remedy, 0) + 1
+    return sorted(scores, key=lambda r: (-scores[r], -covered[r], r))[:k]
+
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples), max(samples)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rubrics", type=int, default=5_000)
+    parser.add_argument("--remedies", type=int, default=2_000)
+    parser.add_argument("--case-sizes", type=int, nargs="+", default=[10, 100, 1_000, 5_000])
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    repertory = random_repertory(args.rubrics, args.remedies)
+    build_ms = (time.perf_counter() - start) * 1000
+    grades = sparse.csr_matrix(repertory._grades.T)
+    table = {i: list(zip(grades.indices[grades.indptr[i]:grades.indptr[i + 1]].tolist(),
+                         grades.data[grades.indptr[i]:grades.indptr[i + 1]].tolist()))
+             for i in range(args.rubrics)}
+    print(f"{args.rubrics:,} rubrics x {args.remedies:,} remedies, {grades.nnz:,} grades, built in {build_ms:.0f} ms")
+    print(f"{'case rubrics':>12} {'python ms':>10} {'sparse ms':>10} {'sparse max ms':>14}")
+    rng = np.random.default_rng(1)
+    for size in args.case_sizes:
+        rows = rng.choice(args.rubrics, size=min(size, args.rubrics), replace=False)
+        case = {repertory.rubrics[i]: float(rng.integers(1, 4)) for i in rows}
+        by_index = {int(i): case[repertory.rubrics[i]] for i in rows}
+        python_ms, _ = timed(lambda: python_shortlist(table, args.remedies, by_index, args.top_k),
+                             max(1, args.repeat // 10))
+        sparse_ms, sparse_max = timed(lambda: repertory.shortlist(case, k=args.top_k), args.repeat)
+        expected = [repertory.remedies[i] for i in python_shortlist(table, args.remedies, by_index, args.top_k)]
+        assert [r.remedy for r in repertory.shortlist(case, k=args.top_k).remedies] == expected
+        print(f"{size:>12,} {python_ms:>10.2f} {sparse_ms:>10.3f} {sparse_max:>14.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""Sidebar statistics: deserialising every record vs. the aggregates table.
+
+Fills a SQLite store with N sessions (each with a stored transcript) and one
+consultation per session, then times what one sidebar render reads: the
+legacy ``list_sessions()`` twice + ``all_consultations()`` for the counts and
+the "Previous Sessions" picker, against ``stats()`` + ``recent_sessions(10)``.
+
+    python scripts/benchmarks/bench_sidebar_stats.py --sizes 1000 10000 50000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from homeoclinic.storage import SQLiteStorage  # noqa: E402
+
+TRANSCRIPT = [{"role": "user" if j % 2 == 0 else "assistant", "content": "Worse at night, better from warmth. " * 8}
+              for j in range(20)]
+
+
+def legacy_sidebar(storage):
+    sessions = storage.list_sessions()
+    counts = (len(sessions), len(storage.all_consultations()))
+    recent = [(s["session_id"], s.get("message_count", 0)) for s in reversed(storage.list_sessions()[-10:])]
+    return counts, recent
+
+
+def aggregate_sidebar(storage):
+    stats = storage.stats()
+    recent = [(s.session_id, s.message_count) for s in storage.recent_sessions(10)]
+    return (stats["sessions"], stats["consultations"]), recent
+
+
+def timed(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    return (time.perf_counter() - start) * 1000 / repeat, result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 50_000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    print(f"{'sessions':>9} {'legacy ms':>10} {'aggregates ms':>14}")
+    with tempfile.TemporaryDirectory() as tmp:
+        storage = SQLiteStorage(os.path.join(tmp, "clinic.db"))
+        count = 0
+        for size in sorted(args.sizes):
+            while count < size:
+                storage.save_session({"session_id": f"s{count:07d}", "last_updated": f"2026-01-01T00:00:{count:07d}",
+                                      "message_count": len(TRANSCRIPT), "messages": TRANSCRIPT})
+                storage.save_consultation({"session_id": f"s{count:07d}", "date": "2026-01-01T00:00:00",
+                                           "consultation_messages": TRANSCRIPT})
+                count += 1
+            legacy_ms, legacy = timed(lambda: legacy_sidebar(storage), max(1, args.repeat // 2))
+            new_ms, new = timed(lambda: aggregate_sidebar(storage), args.repeat)
+            assert legacy == new, (legacy, new)
+            print(f"{size:>9,} {legacy_ms:>10.1f} {new_ms:>14.3f}")
+        storage.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""Symptom extraction throughput: substring keyword loop vs. the token automaton.
+
+Times messages per second for the old 26-keyword ``keyword in text`` loop,
+the same substring loop run over every phrase of a vocabulary, and the
+Aho-Corasick extractor on that vocabulary. The bundled vocabulary is
+extended with synthetic "<location> <sensation>" terms up to each size, so
+the scaling with vocabulary size is visible.
+
+    python scripts/benchmarks/bench_symptom_extractor.py --sizes 1000 10000 50000
+"""
+import argparse
+import itertools
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from homeoclinic.symptoms import DEFAULT_VOCABULARY, SymptomExtractor, VocabularyEntry, load_vocabulary  # noqa: E402
+
+LEGACY_KEYWORDS = ['pain', 'ache', 'fever', 'cough', 'cold', 'headache', 'nausea', 'vomit', 'diarrhea', 'constipation',
+                   'anxiety', 'stress', 'insomnia', 'fatigue', 'weakness', 'dizzy', 'swelling', 'rash', 'itch', 'burn',
+                   'cramp', 'sore', 'inflammation', 'infection', 'allergy', 'bleeding']
+
+SENSATIONS = ["burning", "stitching", "pressing", "cramping", "tearing", "throbbing", "cutting", "boring", "gnawing",
+              "drawing", "sore", "shooting", "stinging", "pulsating", "smarting"]
+SIDES = ["", "left ", "right "]
+MODALITIES = ["", " worse at night", " better from warmth", " worse from motion", " on waking", " after eating",
+              " from cold air"]
+
+SENTENCES = [
+    "I have had a throbbing headache on the right side since Monday, worse in the sun.",
+    "No fever, but my throat is sore and I keep sneezing in the morning.",
+    "She denies nausea. The pressure behind her eyes gets better with cold compresses.",
+    "Burning pain in the stomach after eating, with sour belching and bloating.",
+    "Anxious and restless at night, can't sleep, thirsty for small sips of water.",
+    "The cough is dry and tickling, worse lying down; there is no expectoration.",
+]
+
+
+def vocabulary(size, base):
+    entries = list(base)
+    locations = sorted({entry.canonical for entry in base})
+    combos = itertools.product(SIDES, SENSATIONS, locations, MODALITIES)
+    for side, sensation, location, modality in combos:
+        if len(entries) >= size:
+            break
+        entries.append(VocabularyEntry(f"{side}{sensation} {location}{modality}", "Synthetic", ()))
+    return entries
+
+
+def legacy(messages):
+    collected = []
+    for text in messages:
+        for keyword in LEGACY_KEYWORDS:
+            if keyword in text.lower() and keyword not in collected:
+                collected.append(keyword)
+    return collected
+
+
+def substring_scan(phrases):
+    def run(messages):
+        return [[p for p in phrases if p in text.lower()] for text in messages]
+    return run
+
+
+def rate(fn, messages, min_seconds=0.5):
+    count, start = 0, time.perf_counter()
+    while True:
+        fn(messages)
+        count += len(messages)
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_seconds:
+            return count / elapsed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 50_000])
+    parser.add_argument("--messages", type=int, default=200)
+    args = parser.parse_args(argv)
+
+    rng = random.Random(7)
+    messages = [" ".join(rng.sample(SENTENCES, 3)) for _ in range(args.messages)]
+    base = list(load_vocabulary(DEFAULT_VOCABULARY))
+    print(f"legacy 26-keyword loop: {rate(legacy, messages):,.0f} msg/s")
+    print(f"{'terms':>7} {'phrases':>8} {'build s':>8} {'substring msg/s':>16} {'automaton msg/s':>16}")
+    for size in sorted(args.sizes):
+        entries = vocabulary(size, base)
+        start = time.perf_counter()
+        extractor = SymptomExtractor(entries)
+        build = time.perf_counter() - start
+        phrases = [p.lower() for e in entries for p in (e.canonical,) + e.synonyms]
+        scan = rate(substring_scan(phrases), messages[:20], min_seconds=0.2)
+        fast = rate(lambda batch: [extractor.extract(text) for text in batch], messages)
+        print(f"{extractor.term_count:>7,} {extractor.phrase_count:>8,} {build:>8.2f} {scan:>16,.0f} {fast:>16,.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""Load test for the LLM gateway against the local fake provider.
+
+Simulates many clinicians sending turns at once. The fake provider answers
+with HTTP 429-style errors above its concurrency quota and fails a fraction of
+requests at random, so the run exercises the semaphore, the retries with
+backoff and the circuit breaker.
+
+    python scripts/benchmarks/load_llm_gateway.py --clinicians 50 --turns 3
+"""
+import argparse
+import os
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from homeoclinic.fakes import FakeStreamingModel  # noqa: E402
+from homeoclinic.gateway import LLMGateway  # noqa: E402
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def run(clinicians, turns, gateway, stream):
+    latencies, errors = [], []
+    lock = threading.Lock()
+
+    def clinician():
+        chat = gateway.model.start_chat(history=[])
+        for turn in range(turns):
+            start = time.perf_counter()
+            try:
+                if stream:
+                    for _ in gateway.stream_message(chat, f"turn {turn}"):
+                        pass
+                else:
+                    gateway.send_message(chat, f"turn {turn}")
+                with lock:
+                    latencies.append(time.perf_counter() - start)
+            except Exception as e:
+                with lock:
+                    errors.append(type(e).__name__)
+
+    threads = [threading.Thread(target=clinician) for _ in range(clinicians)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, errors, time.perf_counter() - start
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--clinicians", type=int, default=50)
+    parser.add_argument("--turns", type=int, default=3)
+    parser.add_argument("--concurrency", type=int, default=8, help="gateway semaphore size")
+    parser.add_argument("--provider-quota", type=int, default=10, help="fake provider concurrent request quota")
+    parser.add_argument("--failure-rate", type=float, default=0.05)
+    parser.add_argument("--stream", action="store_true")
+    args = parser.parse_args(argv)
+
+    model = FakeStreamingModel(
+        first_token_delay=0.3, chunk_delay=0.005,
+        max_concurrent=args.provider_quota, failure_rate=args.failure_rate,
+    )
+    gateway = LLMGateway(model, max_concurrency=args.concurrency, base_delay=0.2, max_delay=2.0, request_timeout=10)
+    latencies, errors, elapsed = run(args.clinicians, args.turns, gateway, args.stream)
+    gateway.close()
+
+    total = args.clinicians * args.turns
+    print(f"{total} requests from {args.clinicians} clinicians in {elapsed:.2f}s "
+          f"({len(latencies) / elapsed:.1f} ok/s)")
+    if latencies:
+        print(f"latency p50 {statistics.median(latencies):.2f}s  p95 {percentile(latencies, 95):.2f}s  "
+              f"max {max(latencies):.2f}s")
+    print(f"succeeded {len(latencies)}, failed {len(errors)} {sorted(set(errors))}")
+    print(f"gateway stats {gateway.stats}, breaker {gateway.breaker.state}")
+    print(f"provider peak in-flight {model.peak_in_flight} (quota {args.provider_quota}), "
+          f"provider rejections {model.rejected}")
+
+
+if __name__ == "__main__":
+    main()
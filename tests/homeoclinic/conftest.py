@@ -0,0 +1,48 @@
+"""Shared fixtures: an empty storage backend of each kind and builders for the records tests seed into it."""
+import pytest
+
+from homeoclinic.storage import SQLiteStorage, TinyDBStorage
+
+COMPLAINTS = ["Migraine", "Dry cough", "Insomnia"]
+REMEDIES = ["Belladonna", "Bryonia alba", "Nux vomica", "Arsenicum album"]
+
+
+def build_session(i, updated, messages=2):
+    turns = [{"role": "user", "content": f"hello {i} – ünïcode"}, {"role": "assistant", "content": "hi"}]
+    return {"session_id": f"s{i}", "last_updated": updated, "message_count": messages,
+            "messages": [turns[n % 2] for n in range(messages)],
+            "patient_info": {}, "symptoms_collected": [], "current_prescription": None}
+
+
+def build_consultation(i):
+    return {
+        "session_id": f"s{i}",
+        # Several consultations share a timestamp so the id tie-breaker matters
+        "date": f"2026-{1 + i % 6:02d}-{1 + i % 28:02d}T09:00:00",
+        "chief_complaint": COMPLAINTS[i % 3],
+        "diagnosis": "Constitutional",
+        "prescription": {"remedies": [{"medicine": REMEDIES[i % 4], "potency": "30C"},
+                                      {"medicine": REMEDIES[(i + 1) % 4], "potency": "200C"}]},
+        "consultation_messages": [{"role": "user", "content": "x" * 50}],
+    }
+
+
+@pytest.fixture(params=["sqlite", "tinydb"])
+def storage(request, tmp_path):
+    """An empty backend; each test seeds the records it needs"""
+    if request.param == "sqlite":
+        backend = SQLiteStorage(str(tmp_path / "clinic.db"))
+    else:
+        backend = TinyDBStorage(str(tmp_path / "clinic.json"))
+    yield backend
+    backend.close()
+
+
+@pytest.fixture
+def make_session():
+    return build_session
+
+
+@pytest.fixture
+def make_consultation():
+    return build_consultation
@@ -0,0 +1,80 @@
+"""Incremental Parquet analytics over stored consultations."""
+import os
+
+import pytest
+
+pytest.importorskip("pyarrow")
+
+from homeoclinic.analytics import AnalyticsJob, AnalyticsStore, parse_potency, potency_label  # noqa: E402
+from homeoclinic.storage import SQLiteStorage  # noqa: E402
+
+MEDICINES = ["Nux vomica", "Sulphur", "Pulsatilla"]
+POTENCIES = ["30C", "200 ch", "LM 1", "1M"]
+
+
+def consultation(i):
+    return {"session_id": f"s{i % 5}", "date": f"2026-{1 + i % 3:02d}-{1 + i // 5:02d}T10:00:00",
+            "chief_complaint": "Insomnia", "diagnosis": "d",
+            "prescription": {"remedies": [{"medicine": MEDICINES[i % 3], "potency": POTENCIES[i % 4]}]}}
+
+
+@pytest.fixture
+def storage(tmp_path):
+    backend = SQLiteStorage(str(tmp_path / "clinic.db"))
+    yield backend
+    backend.close()
+
+
+@pytest.mark.parametrize("text,expected", [
+    ("30C", (30.0, "C")), ("200 ch", (200.0, "C")), ("6X", (6.0, "X")), ("1M", (1.0, "M")),
+    ("LM 1", (1.0, "LM")), ("0/3", (3.0, "LM")), ("Q", (None, "Q")), ("12", (12.0, "C")), ("", (None, None)),
+])
+def test_parse_potency(text, expected):
+    assert parse_potency(text) == expected
+
+
+def test_incremental_sync_and_queries(storage, tmp_path):
+    store = AnalyticsStore(str(tmp_path / "analytics"), batch_size=4, max_files_per_partition=3)
+    for i in range(10):
+        storage.save_consultation(consultation(i))
+    assert store.sync(storage) == 10
+    assert store.remedy_frequency()[0] == ("Nux vomica", 4)
+
+    for i in range(10, 24):
+        storage.save_consultation(consultation(i))
+    assert store.sync(storage) == 14
+    assert store.sync(storage) == 0
+    assert store.total_consultations() == 24
+    assert dict(store.remedy_frequency()) == {"Nux vomica": 8, "Sulphur": 8, "Pulsatilla": 8}
+    assert dict(store.potency_distribution()) == {"30C": 6, "200C": 6, "LM1": 6, "1M": 6}
+    # Compaction keeps each month partition small
+    for table in ("consultations", "remedies"):
+        for month in os.listdir(tmp_path / "analytics" / table):
+            assert len(os.listdir(tmp_path / "analytics" / table / month)) <= 3
+
+    # Session s0 has consultations 0, 5, 10, 15, 20 -> dates every day or so across months
+    intervals = store.follow_up_intervals()
+    assert intervals["count"] == 24 - 5
+    assert intervals["median_days"] is not None
+
+
+def test_reset_rebuilds_and_job_syncs(storage, tmp_path):
+    store = AnalyticsStore(str(tmp_path / "analytics"))
+    storage.save_consultation(consultation(0))
+    job = AnalyticsJob(store, storage, interval=0.05)
+    try:
+        for _ in range(100):
+            if store.total_consultations():
+                break
+            job._wake.wait(0.05)
+        assert store.total_consultations() == 1
+    finally:
+        job.close()
+    store.reset()
+    assert store.total_consultations() == 0 and store.remedy_frequency() == []
+    assert store.sync(storage) == 1
+
+
+def test_potency_label():
+    assert potency_label(*parse_potency("200 CH")) == "200C"
+    assert potency_label(None, None) == "unspecified"
@@ -0,0 +1,96 @@
+"""Tests for rebuilding chat history from stored messages."""
+from homeoclinic.chat_history import UNANSWERED_REPLY, build_chat_history, rehydrate_chat
+
+
+class FakeChatSession:
+    def __init__(self, history):
+        self.history = history
+        self.send_message_calls = 0
+
+    def send_message(self, content, **kwargs):
+        self.send_message_calls += 1
+        raise AssertionError("restoring a session must not call the model")
+
+
+class FakeGenerativeModel:
+    def __init__(self):
+        self.sessions = []
+
+    def start_chat(self, history=None):
+        session = FakeChatSession(history or [])
+        self.sessions.append(session)
+        return session
+
+
+STORED_MESSAGES = [
+    {"role": "user", "content": "I have a throbbing headache."},
+    {"role": "assistant", "content": "When is it worse?"},
+    {"role": "system", "content": "Session loaded"},
+    {"role": "user", "content": "Worse in the sun."},
+    {"role": "assistant", "content": "Is there thirst?"},
+]
+
+
+def test_restore_makes_no_send_message_calls():
+    model = FakeGenerativeModel()
+    chat = rehydrate_chat(model, STORED_MESSAGES, "SYSTEM", "ACK")
+
+    assert chat.send_message_calls == 0
+    assert len(model.sessions) == 1
+    assert [turn["role"] for turn in chat.history] == ["user", "model", "user", "model", "user", "model"]
+    assert chat.history[-1]["parts"] == ["Is there thirst?"]
+
+
+def test_history_keeps_assistant_replies_and_alternates_roles():
+    history = build_chat_history(
+        [
+            {"role": "user", "content": "first"},
+            {"role": "user", "content": "second"},
+        ],
+        "SYSTEM",
+        "ACK",
+    )
+
+    assert history[2] == {"role": "user", "parts": ["first", "second"]}
+    assert history[3] == {"role": "model", "parts": [UNANSWERED_REPLY]}
+
+
+def test_summarised_prefix_keeps_recent_messages_verbatim():
+    messages = []
+    for i in range(10):
+        messages.append({"role": "user", "content": f"symptom {i}"})
+        messages.append({"role": "assistant", "content": f"question {i}"})
+
+    history = build_chat_history(messages, "SYSTEM", "ACK", summarise_after=4)
+
+    assert "symptom 0" in history[2]["parts"][0]
+    assert "symptom 8" not in history[2]["parts"][0]
+    assert [turn["parts"][0] for turn in history[4:]] == ["symptom 8", "question 8", "symptom 9", "question 9"]
+
+
+def test_attached_documents_are_rebuilt_into_the_user_turn():
+    document = {"type": "document", "name": "labs.pdf", "sha256": "abc", "pages": 2, "truncated": False,
+                "context": "[labs.pdf: 2 page(s)]\np1-2: TSH 6.1 high."}
+    history = build_chat_history(
+        [{"role": "user", "content": "Uploaded 1 file(s): labs.pdf", "attachments": [document]},
+         {"role": "assistant", "content": "Your TSH is raised."}],
+        "SYSTEM", "ACK",
+    )
+    text = history[2]["parts"][0]
+    assert text.startswith("Uploaded 1 file(s): labs.pdf")
+    assert "by page range" in text and "TSH 6.1 high." in text
+
+
+def test_folded_documents_stay_in_the_case_summary():
+    from homeoclinic.context_window import ContextWindow
+
+    document = {"type": "document", "name": "labs.pdf", "context": "[labs.pdf: 2 page(s)]\np1-2: TSH 6.1 high."}
+    messages = [{"role": "user", "content": "Uploaded 1 file(s): labs.pdf", "attachments": [document]},
+                {"role": "assistant", "content": "Noted."}]
+    for i in range(10):
+        messages += [{"role": "user", "content": f"Symptom {i} is worse at night."},
+                     {"role": "assistant", "content": "Tell me more."}]
+    window = ContextWindow("SYSTEM", "ACK", token_budget=50, keep_recent_turns=2)
+    summary = window.build_history(messages)[2]["parts"][0]
+    assert window.checkpoint_index > 0
+    assert "Documents:\n- [labs.pdf: 2 page(s)] p1-2: TSH 6.1 high." in summary
@@ -0,0 +1,125 @@
+"""Keyset pagination, filtering and full-text search of the consultation history."""
+import json
+import sqlite3
+from datetime import date
+
+import pytest
+
+from homeoclinic.storage import ConsultationFilter, SQLiteStorage
+
+
+@pytest.fixture
+def history(storage, make_consultation):
+    for i in range(130):
+        storage.save_consultation(make_consultation(i))
+    return storage
+
+
+def walk(storage, filters, limit):
+    pages, after = [], None
+    while True:
+        page = storage.consultation_page(filters, after=after, limit=limit)
+        pages.append(page.items)
+        if page.next_cursor is None:
+            return pages
+        after = page.next_cursor
+
+
+def expected_order(make_consultation, filters):
+    records = [dict(make_consultation(i), id=i + 1) for i in range(130)]
+    matching = [r for r in records if filters.matches(r)]
+    return [r["id"] for r in sorted(matching, key=lambda r: (r["date"], r["id"]), reverse=True)]
+
+
+@pytest.mark.parametrize("filters", [
+    ConsultationFilter(),
+    ConsultationFilter(date_from=date(2026, 2, 1), date_to=date(2026, 3, 31)),
+    ConsultationFilter(complaint="COUGH"),
+    ConsultationFilter(remedy="nux"),
+    ConsultationFilter(date_to=date(2026, 4, 15), complaint="mig", remedy="bryonia"),
+    ConsultationFilter(remedy="Hepar"),
+])
+def test_pages_cover_every_match_once_in_order(history, make_consultation, filters):
+    pages = walk(history, filters, limit=9)
+    ids = [item.id for items in pages for item in items]
+    assert ids == expected_order(make_consultation, filters)
+    assert all(len(items) <= 9 for items in pages)
+
+
+def test_summaries_carry_remedies_and_details_load_lazily(history):
+    first = history.consultation_page(limit=1).items[0]
+    full = history.get_consultation(first.id)
+    assert first.remedies == [r["medicine"] for r in full["prescription"]["remedies"]]
+    assert full["id"] == first.id and full["consultation_messages"]
+    assert history.get_consultation(10_000) is None
+
+
+def test_like_wildcards_are_literal(tmp_path, make_consultation):
+    storage = SQLiteStorage(str(tmp_path / "clinic.db"))
+    storage.save_consultation(dict(make_consultation(0), chief_complaint="Pain 100% of the time"))
+    storage.save_consultation(dict(make_consultation(1), chief_complaint="Pain 1000 times"))
+    page = storage.consultation_page(ConsultationFilter(complaint="100%"))
+    assert [item.chief_complaint for item in page.items] == ["Pain 100% of the time"]
+
+
+def test_existing_database_is_migrated(tmp_path, make_consultation):
+    path = str(tmp_path / "legacy.db")
+    conn = sqlite3.connect(path)
+    conn.executescript("""
+        CREATE TABLE consultations (id INTEGER PRIMARY KEY AUTOINCREMENT, session_id TEXT NOT NULL,
+            date TEXT NOT NULL, chief_complaint TEXT, diagnosis TEXT, data TEXT NOT NULL);
+    """)
+    record = make_consultation(2)
+    conn.execute("INSERT INTO consultations (session_id, date, chief_complaint, diagnosis, data) VALUES (?, ?, ?, ?, ?)",
+                 (record["session_id"], record["date"], record["chief_complaint"], record["diagnosis"], json.dumps(record)))
+    conn.commit()
+    conn.close()
+
+    storage = SQLiteStorage(path)
+    assert storage._conn.execute("PRAGMA user_version").fetchone()[0] >= 1
+    assert [i.id for i in storage.consultation_page(ConsultationFilter(remedy="nux")).items] == [1]
+    storage.close()
+    # Reopening does not backfill twice
+    storage = SQLiteStorage(path)
+    assert storage.consultation_page().items[0].remedies == ["Nux vomica", "Arsenicum album"]
+    storage.close()
+
+
+def test_search_ranks_and_facets(history, make_consultation):
+    history.save_consultation(dict(make_consultation(0), chief_complaint="Sunstroke headache",
+                                   consultation_messages=[{"role": "user", "content": "Throbbing, worse in the sun"}]))
+    result = history.search_consultations("sun")
+    assert result.total == 1
+    assert result.hits[0].summary.chief_complaint == "Sunstroke headache"
+
+    result = history.search_consultations("cough nux", limit=5)
+    # Dry cough consultations prescribed Nux vomica: i % 3 == 1 and Nux at position 0 or 1
+    expected = [i for i in range(130) if i % 3 == 1 and 2 in (i % 4, (i + 1) % 4)]
+    assert result.total == len(expected)
+    assert len(result.hits) == 5
+    assert [s.score for s in result.hits] == sorted((s.score for s in result.hits), reverse=True)
+    remedies = dict(result.facets["remedy"])
+    assert remedies["Nux vomica"] == len(expected)
+    assert dict(result.facets["complaint"]) == {"Dry cough": len(expected)}
+
+
+def test_search_respects_filters_and_odd_input(history):
+    filtered = history.search_consultations("migraine", ConsultationFilter(remedy="bella"))
+    assert filtered.total and all("Belladonna" in hit.summary.remedies for hit in filtered.hits)
+    assert history.search_consultations('"AND( *').total == 0
+    assert history.search_consultations("").hits == []
+
+
+def test_search_index_is_migrated_and_cleared(tmp_path, make_consultation):
+    path = str(tmp_path / "clinic.db")
+    storage = SQLiteStorage(path)
+    storage.save_consultation(make_consultation(0))
+    # Simulate a database from before the index existed
+    storage._conn.execute("INSERT INTO consultations_fts (consultations_fts) VALUES ('delete-all')")
+    storage._conn.execute("PRAGMA user_version = 1")
+    storage.close()
+    storage = SQLiteStorage(path)
+    assert storage.search_consultations("migraine").total == 1
+    storage.clear()
+    assert storage.search_consultations("migraine").total == 0
+    storage.close()
@@ -0,0 +1,186 @@
+"""Shared consultation state: serialization, compare-and-set saves and turns served by different processes."""
+import multiprocessing
+import os
+
+import pytest
+
+from homeoclinic.consultation_state import (ConsultationState, SQLiteStateStore, StaleStateError, StatePublisher,
+                                            open_state_store)
+from homeoclinic.context_window import ContextWindow
+from homeoclinic.fakes import FakeStreamingModel
+
+PROMPT = "You are a careful homeopath."
+ACK = "Understood."
+TURNS = 6
+
+
+def sample_state(session_id="s1"):
+    return ConsultationState(
+        session_id=session_id,
+        messages=[{"role": "user", "content": "Headache", "timestamp": "2024-01-01T10:00:00"}],
+        patient_info={"name": "Ana", "symptoms": {"headache": {"status": "present"}}},
+        symptoms_collected=["headache"],
+        model={"name": "gemini", "prompt_version": "abc"},
+    )
+
+
+def test_json_round_trip_keeps_everything_but_the_version():
+    state = sample_state()
+    restored = ConsultationState.from_json(state.to_json(), 7)
+    assert restored.version == 7
+    restored.version = 0
+    assert restored == state
+    with pytest.raises(ValueError, match="newer"):
+        ConsultationState.from_json('{"session_id": "s1", "format": 99}', 1)
+
+
+def test_sqlite_saves_are_compare_and_set(tmp_path):
+    path = str(tmp_path / "state.db")
+    first, second = SQLiteStateStore(path), open_state_store(f"sqlite:///{path}")
+    state = sample_state()
+    assert first.save(state) == 1 and second.version("s1") == 1
+
+    mine, theirs = first.load("s1"), second.load("s1")
+    theirs.messages.append({"role": "assistant", "content": "Since when?"})
+    assert second.save(theirs) == 2
+    with pytest.raises(StaleStateError):
+        first.save(mine)
+    # A second "first save" of the same consultation conflicts too
+    with pytest.raises(StaleStateError):
+        first.save(sample_state())
+    assert first.load("s1").messages[-1]["content"] == "Since when?"
+
+    first.delete("s1")
+    assert first.load("s1") is None and first.version("s1") == 0
+    with pytest.raises(ValueError):
+        open_state_store("postgres://db")
+
+
+def test_publisher_writes_in_the_background_and_adopts_newer_copies(tmp_path):
+    path = str(tmp_path / "state.db")
+    here, there = StatePublisher(SQLiteStateStore(path), delay=30), StatePublisher(SQLiteStateStore(path), delay=30)
+    for count in (1, 2, 3):
+        state = sample_state()
+        state.messages = state.messages * count
+        here.publish(state)
+    # Queued, not written: the request path does not wait on the store
+    assert here.store.version("s1") == 0 and len(here.current("s1").messages) == 3
+    here.flush()
+    assert here.store.version("s1") == 1 and here.newer("s1") is None
+
+    # Another replica continues the consultation; this one sees and adopts its copy
+    theirs = there.current("s1")
+    theirs.messages.append({"role": "assistant", "content": "Since when?"})
+    there.publish(theirs)
+    there.flush()
+    assert here.newer("s1").messages[-1]["content"] == "Since when?"
+
+    # Both replicas continue from version 2; the later write merges instead of dropping its turn
+    mine = here.current("s1")
+    theirs = there.current("s1")
+    theirs.messages.append({"role": "user", "content": "Worse at night", "timestamp": "2024-01-01T10:05:00"})
+    there.publish(theirs)
+    there.flush()
+    mine.messages.append({"role": "user", "content": "And thirsty", "timestamp": "2024-01-01T10:06:00"})
+    mine.patient_info["age"] = 40
+    here.publish(mine)
+    here.flush()
+    stored = here.store.load("s1")
+    assert [m["content"] for m in stored.messages[-3:]] == ["Since when?", "Worse at night", "And thirsty"]
+    assert stored.patient_info["age"] == 40 and stored.version == 4
+    assert here.newer("s1") == stored and here.take_merged("s1") and not here.take_merged("s1")
+    assert here.newer("s1") is None
+
+    here.clear()
+    assert here.store.load("s1") is None and here.current("s1") is None
+    here.close()
+    there.close()
+
+
+def test_summary_checkpoint_survives_the_store(tmp_path):
+    messages = []
+    for i in range(12):
+        messages.append({"role": "user", "content": f"Symptom {i} is worse at night."})
+        messages.append({"role": "assistant", "content": "Tell me more."})
+    window = ContextWindow(PROMPT, ACK, token_budget=50, keep_recent_turns=2)
+    window.start_chat(FakeStreamingModel(first_token_delay=0), messages)
+    assert window.checkpoint_index > 0
+
+    store = SQLiteStateStore(str(tmp_path / "state.db"))
+    state = sample_state()
+    state.messages, state.context = messages, window.checkpoint_state()
+    store.save(state)
+
+    restored = ContextWindow(PROMPT, ACK, token_budget=50, keep_recent_turns=2)
+    restored.restore_checkpoint(store.load("s1").context)
+    assert restored.checkpoint_index == window.checkpoint_index
+    assert restored.build_history(messages) == window.build_history(messages)
+
+
+def test_redis_store():
+    fakeredis = pytest.importorskip("fakeredis")
+    from homeoclinic.consultation_state import RedisStateStore
+
+    client = fakeredis.FakeRedis()
+    first, second = RedisStateStore(client=client), RedisStateStore(client=client)
+    assert first.save(sample_state()) == 1
+    mine, theirs = first.load("s1"), second.load("s1")
+    assert second.save(theirs) == 2
+    with pytest.raises(StaleStateError):
+        first.save(mine)
+    assert first.load("s1").patient_info == sample_state().patient_info
+
+    # A conflicting background write merges on Redis too
+    publisher = StatePublisher(first, delay=30)
+    late = publisher.current("s1")
+    second.save(second.load("s1"))
+    late.messages.append({"role": "assistant", "content": "Since when?"})
+    publisher.publish(late)
+    publisher.flush()
+    assert second.load("s1").messages[-1]["content"] == "Since when?" and publisher.take_merged("s1")
+
+    first.clear()
+    assert first.load("s1") is None and first.version("s1") == 0
+    publisher.close()
+
+
+def serve_turns(path, requests, replies):
+    """One app replica: serves whichever turn it is handed from the shared state alone"""
+    store = SQLiteStateStore(path)
+    model = FakeStreamingModel(first_token_delay=0, script=[f"reply {i}" for i in range(TURNS)])
+    for text in iter(requests.get, None):
+        state = store.load("s1")
+        window = ContextWindow(PROMPT, ACK, token_budget=100_000).restore_checkpoint(state.context)
+        chat = window.start_chat(model, state.messages)
+        reply = chat.send_message(text).text
+        state.messages += [{"role": "user", "content": text}, {"role": "assistant", "content": reply}]
+        state.context = window.checkpoint_state()
+        store.save(state)
+        replies.put((os.getpid(), reply))
+
+
+def test_consecutive_turns_served_by_different_processes(tmp_path):
+    path = str(tmp_path / "state.db")
+    SQLiteStateStore(path).save(ConsultationState(session_id="s1"))
+    context = multiprocessing.get_context("spawn")
+    replies = context.Queue()
+    queues = [context.Queue() for _ in range(3)]
+    workers = [context.Process(target=serve_turns, args=(path, q, replies)) for q in queues]
+    for worker in workers:
+        worker.start()
+    try:
+        served = []
+        for i in range(TURNS):
+            queues[i % 3].put(f"turn {i}")
+            served.append(replies.get(timeout=60))
+    finally:
+        for q in queues:
+            q.put(None)
+        for worker in workers:
+            worker.join(timeout=30)
+
+    # Each process continued the conversation the previous one saved
+    assert [reply for _, reply in served] == [f"reply {i}" for i in range(TURNS)]
+    assert all(a[0] != b[0] for a, b in zip(served, served[1:]))
+    state = SQLiteStateStore(path).load("s1")
+    assert state.version == TURNS + 1 and len(state.messages) == 2 * TURNS
@@ -0,0 +1,100 @@
+"""Round trips through the streaming export and importer."""
+import gzip
+import io
+import json
+import os
+import time
+
+import pytest
+
+from homeoclinic.export import (IMPORT_ERRORS, ExportCheckpoint, available_compressions, export_data, import_data,
+                                iter_export_records, remove_stale_exports)
+from homeoclinic.storage import SQLiteStorage
+
+
+@pytest.fixture
+def source(storage, make_session, make_consultation):
+    for i in range(12):
+        storage.save_session(make_session(i, f"2026-03-{1 + i:02d}T12:00:00"))
+        storage.save_consultation(make_consultation(i))
+    return storage
+
+
+@pytest.mark.parametrize("compression", available_compressions())
+def test_round_trip(source, tmp_path, compression):
+    result = export_data(source, str(tmp_path), compression)
+    assert (result.sessions, result.consultations) == (12, 12)
+    assert result.checkpoint.session_updated == "2026-03-12T12:00:00"
+
+    target = SQLiteStorage(str(tmp_path / "target.db"))
+    with open(result.path, "rb") as f:
+        counts = import_data(target, f)
+    assert counts == {"sessions": 12, "consultations": 12, "skipped_consultations": 0}
+    assert target.list_sessions() == source.list_sessions()
+    assert target.all_consultations() == source.all_consultations()
+    # Importing again adds nothing
+    with open(result.path, "rb") as f:
+        assert import_data(target, f)["skipped_consultations"] == 12
+    assert len(target.all_consultations()) == 12
+    target.close()
+
+
+def test_incremental_export_only_contains_newer_records(source, tmp_path, make_session, make_consultation):
+    first = export_data(source, str(tmp_path), "gzip")
+    source.save_session(make_session(3, "2026-04-01T09:00:00"))  # an existing session changed
+    source.save_session(make_session(20, "2026-04-02T09:00:00"))
+    source.save_consultation(make_consultation(20))
+
+    second = export_data(source, str(tmp_path), "gzip", since=first.checkpoint)
+    with open(second.path, "rb") as f:
+        records = list(iter_export_records(f))
+    assert [r["data"]["session_id"] for r in records if r["type"] == "session"] == ["s3", "s20"]
+    assert [r["data"]["session_id"] for r in records if r["type"] == "consultation"] == ["s20"]
+    assert records[-1]["checkpoint"] == {"consultation_id": 13, "session_updated": "2026-04-02T09:00:00"}
+
+    third = export_data(source, str(tmp_path), "none", since=second.checkpoint)
+    assert (third.sessions, third.consultations) == (0, 0)
+
+
+def test_checkpoint_file_and_journal_messages(source, tmp_path):
+    path = str(tmp_path / "checkpoint.json")
+    assert ExportCheckpoint.load(path) == ExportCheckpoint()
+    journal = {"s1": [{"role": "user", "content": "from the journal"}]}
+    result = export_data(source, str(tmp_path), "none", session_messages=journal.get)
+    result.checkpoint.save(path)
+    assert ExportCheckpoint.load(path) == result.checkpoint
+    with open(result.path, "rb") as f:
+        sessions = {r["data"]["session_id"]: r["data"] for r in iter_export_records(f) if r["type"] == "session"}
+    assert sessions["s1"]["messages"] == journal["s1"]
+    assert sessions["s2"]["messages"][0]["content"] == "hello 2 – ünïcode"
+
+
+def test_legacy_json_export_and_bad_lines(tmp_path, make_session, make_consultation):
+    legacy = {"sessions": [make_session(1, "2026-01-01")], "consultations": [make_consultation(1)], "export_date": "x"}
+    target = SQLiteStorage(str(tmp_path / "target.db"))
+    counts = import_data(target, io.BytesIO(json.dumps(legacy, indent=2).encode()))
+    assert counts == {"sessions": 1, "consultations": 1, "skipped_consultations": 0}
+    with pytest.raises(ValueError, match="line 2"):
+        import_data(target, io.BytesIO(gzip.compress(b'{"type":"header"}\nnot json\n')))
+    target.close()
+
+
+@pytest.mark.parametrize("damage", ["truncated", "bad header"])
+def test_damaged_compressed_uploads_raise_import_errors(source, tmp_path, damage):
+    result = export_data(source, str(tmp_path), "gzip")
+    with open(result.path, "rb") as f:
+        data = f.read()
+    data = data[:len(data) // 2] if damage == "truncated" else data[:2] + b"\xff" + data[3:]
+    target = SQLiteStorage(str(tmp_path / "target.db"))
+    with pytest.raises(IMPORT_ERRORS):
+        import_data(target, io.BytesIO(data))
+    target.close()
+
+
+def test_stale_exports_are_removed(source, tmp_path):
+    old, fresh = export_data(source, str(tmp_path), "none"), export_data(source, str(tmp_path), "none")
+    os.utime(old.path, (time.time() - 7200,) * 2)
+    (tmp_path / "unrelated.txt").write_text("keep")
+    assert remove_stale_exports(str(tmp_path), max_age=3600) == 1
+    assert not os.path.exists(old.path) and os.path.exists(fresh.path)
+    assert (tmp_path / "unrelated.txt").exists()
@@ -0,0 +1,129 @@
+"""Model gateway: circuit breaker states, retries with backoff and the concurrency cap."""
+import threading
+
+import pytest
+
+from homeoclinic.fakes import FakeStreamingModel
+from homeoclinic.gateway import CircuitBreaker, CircuitOpenError, LLMGateway
+
+google_exceptions = pytest.importorskip("google.api_core.exceptions")
+
+
+class ScriptedSession:
+    """Chat session whose calls raise the given errors in turn, then reply"""
+
+    def __init__(self, *errors):
+        self.errors = list(errors)
+        self.calls = 0
+
+    async def send_message_async(self, content, **kwargs):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return f"reply to {content}"
+
+
+@pytest.fixture
+def gateway():
+    gateway = LLMGateway(None, max_retries=2, base_delay=0.001, max_delay=0.01, request_timeout=5,
+                         breaker=CircuitBreaker(failure_threshold=2, reset_timeout=60))
+    yield gateway
+    gateway.close()
+
+
+def half_open(breaker):
+    breaker.opened_at -= breaker.reset_timeout
+
+
+def test_breaker_opens_lets_one_trial_through_and_closes():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+    breaker.record_failure()
+    assert breaker.state == 'closed' and breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == 'open' and not breaker.allow()
+
+    half_open(breaker)
+    assert breaker.state == 'half-open'
+    assert breaker.allow() and not breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == 'open'
+
+    half_open(breaker)
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == 'closed' and breaker.failures == 0 and breaker.allow()
+
+
+def test_transient_errors_are_retried_then_open_the_breaker(gateway):
+    session = ScriptedSession(google_exceptions.ServiceUnavailable("503"))
+    assert gateway.send_message(session, "hi") == "reply to hi"
+    assert session.calls == 2 and gateway.stats['retries'] == 1
+
+    failing = ScriptedSession(*[google_exceptions.ServiceUnavailable("503")] * 5)
+    with pytest.raises(CircuitOpenError):
+        gateway.send_message(failing, "hi")
+    assert failing.calls == 2 and gateway.breaker.state == 'open'
+    with pytest.raises(CircuitOpenError):
+        gateway.send_message(ScriptedSession(), "hi")
+    assert gateway.stats['rejected'] == 2
+
+
+def test_non_retryable_error_during_the_trial_does_not_lock_the_breaker(gateway):
+    gateway.breaker.record_failure()
+    gateway.breaker.record_failure()
+    half_open(gateway.breaker)
+
+    session = ScriptedSession(ValueError("blocked prompt"))
+    with pytest.raises(ValueError):
+        gateway.send_message(session, "hi")
+    assert session.calls == 1 and gateway.stats['failures'] == 1
+    # Still half-open: the next call is the trial, and closes the breaker
+    assert gateway.send_message(session, "again") == "reply to again"
+    assert gateway.breaker.state == 'closed'
+
+
+def test_backoff_is_bounded_by_the_exponential_cap(gateway):
+    for attempt in range(8):
+        cap = min(gateway.max_delay, gateway.base_delay * 2 ** attempt)
+        assert all(0 <= gateway.backoff(attempt) <= cap for _ in range(50))
+
+
+def test_concurrency_is_capped_below_the_provider_quota():
+    model = FakeStreamingModel(first_token_delay=0.05, max_concurrent=2)
+    gateway = LLMGateway(model, max_concurrency=2, max_retries=0)
+    replies = []
+    try:
+        threads = [threading.Thread(target=lambda: replies.append(
+            gateway.send_message(model.start_chat([]), "hi").text)) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        gateway.close()
+    assert len(replies) == 8
+    assert model.rejected == 0 and model.peak_in_flight == 2
+    assert gateway.stats['requests'] == 8 and gateway.stats['in_flight'] == 0
+
+
+def test_streamed_replies_hold_their_quota_slot_until_read():
+    model = FakeStreamingModel(first_token_delay=0, chunk_delay=0.01, max_concurrent=1)
+    response = model.start_chat([]).send_message("hi", stream=True)
+    assert model.in_flight == 1
+    with pytest.raises(google_exceptions.ResourceExhausted):
+        model.start_chat([]).send_message("hi", stream=True)
+    assert "".join(chunk.text for chunk in response) == response.text
+    assert model.in_flight == 0 and model.start_chat([]).send_message("hi").text
+
+    # Through the gateway every stream counts until its last chunk arrives
+    model = FakeStreamingModel(first_token_delay=0, chunk_delay=0.02, max_concurrent=3)
+    gateway = LLMGateway(model, max_concurrency=3, max_retries=0)
+    try:
+        streams = [gateway.stream_message(model.start_chat([]), "hi") for _ in range(3)]
+        first = next(iter(streams[0]))
+        assert first.text and model.in_flight == 3
+        for stream in streams:
+            list(stream)
+    finally:
+        gateway.close()
+    assert model.peak_in_flight == 3 and model.in_flight == 0 and model.rejected == 0
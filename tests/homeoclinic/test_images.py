@@ -0,0 +1,95 @@
+"""Image preprocessing (downscale, re-encode, near-duplicate detection) and stored images in the chat history."""
+import io
+
+import pytest
+
+from homeoclinic.chat_history import build_chat_history
+from homeoclinic.images import (ImagePart, ImagePipeline, ImageStore, attached_image_hashes, hamming, image_attachment,
+                                prepare_image)
+
+Image = pytest.importorskip("PIL.Image")
+
+
+def photo(width=3000, height=2000, seed=0, fmt="PNG", **save):
+    """A gradient with a few blocks, so perceptual hashes tell photos apart"""
+    img = Image.linear_gradient("L").resize((width, height)).convert("RGB")
+    for i in range(4):
+        x = (seed * 37 + i * 53) % (width // 2)
+        y = (seed * 91 + i * 29) % (height // 2)
+        img.paste((255 * (i % 2), 40 * i, 255 - 60 * i), (x, y, x + width // 4, y + height // 4))
+    buffer = io.BytesIO()
+    img.save(buffer, format=fmt, **save)
+    return buffer.getvalue()
+
+
+def part(name, data=b"fake webp bytes", phash=0x0F0F):
+    return ImagePart(name, data, "image/webp", 640, 480, phash, 10 * len(data))
+
+
+def test_large_photos_are_downscaled_and_re_encoded():
+    data = photo(3000, 2000, fmt="JPEG", quality=95)
+    part = prepare_image("IMG_0001.jpg", data, max_pixels=600_000, fmt="webp")
+    assert part.width * part.height <= 600_000 and abs(part.width / part.height - 1.5) < 0.01
+    assert part.mime == "image/webp" and part.original_bytes == len(data) and len(part.data) < len(data)
+    with Image.open(io.BytesIO(part.data)) as img:
+        assert img.format == "WEBP" and img.size == (part.width, part.height)
+
+
+def test_small_images_keep_their_original_bytes():
+    data = photo(40, 30)
+    part = prepare_image("icon.png", data, max_pixels=1_000_000)
+    # Re-encoding would not make it smaller, so the upload is sent as it came
+    assert (part.width, part.height, part.mime, part.data) == (40, 30, "image/png", data)
+
+
+def test_near_duplicates_are_detected_across_resizes_and_earlier_uploads():
+    original = photo(1600, 1200, seed=1)
+    with Image.open(io.BytesIO(original)) as img:
+        buffer = io.BytesIO()
+        img.resize((800, 600)).save(buffer, format="JPEG", quality=60)
+    resized = buffer.getvalue()
+    other = photo(1600, 1200, seed=7)
+    pipeline = ImagePipeline(max_pixels=300_000)
+    parts, errors = pipeline.process([("a.png", original), ("b.jpg", resized), ("c.png", other)])
+    assert errors == [] and [p.duplicate_of for p in parts] == [None, "a.png", None]
+    assert hamming(parts[0].phash, parts[2].phash) > pipeline.dedupe_distance
+
+    # An image sent in an earlier turn counts as well
+    parts, _ = pipeline.process([("again.png", original)], seen=[("first.png", parts[0].phash)])
+    assert parts[0].duplicate_of == "first.png"
+    pipeline.close()
+
+
+def test_unreadable_uploads_are_reported_and_the_rest_processed():
+    pipeline = ImagePipeline()
+    parts, errors = pipeline.process([("broken.jpg", b"not an image"), ("ok.png", photo(200, 100))])
+    assert [p.name for p in parts] == ["ok.png"]
+    assert errors == ["broken.jpg: could not be read as an image (UnidentifiedImageError)"]
+    pipeline.close()
+
+
+def test_images_are_stored_once_per_content(tmp_path):
+    store = ImageStore(str(tmp_path))
+    ref = store.put(part("rash.png"))
+    assert store.put(part("rash-again.png")) == ref and ref.endswith(".webp")
+    assert store.get(ref) == b"fake webp bytes"
+    assert store.get("../../etc/passwd") is None
+    store.clear()
+    assert store.get(ref) is None
+
+
+def test_image_attachments_rebuild_into_the_history(tmp_path):
+    store = ImageStore(str(tmp_path))
+    attachment = image_attachment(part("rash.png"), store.put(part("rash.png")))
+    missing = image_attachment(part("old.png", b"other"), "0" * 64 + ".webp")
+    messages = [{"role": "user", "content": "Uploaded 2 file(s): rash.png, old.png",
+                 "attachments": [attachment, missing]},
+                {"role": "assistant", "content": "I see a red rash."}]
+
+    parts = build_chat_history(messages, "SYSTEM", "ACK", load_image=store.load_part)[2]["parts"]
+    assert parts[0] == "Uploaded 2 file(s): rash.png, old.png"
+    assert parts[1] == {"mime_type": "image/webp", "data": b"fake webp bytes"}
+    assert "old.png was shared here but is no longer available" in parts[2]
+
+    # Uploads after a reload are still deduplicated against the images already sent
+    assert attached_image_hashes(messages) == [("rash.png", 0x0F0F), ("old.png", 0x0F0F)]
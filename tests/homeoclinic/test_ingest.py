@@ -0,0 +1,118 @@
+"""Document ingestion: per-format extractors, upload limits, the content-hash cache and the summariser."""
+import io
+import zipfile
+
+import pytest
+
+from homeoclinic.ingest import (DocumentIngestor, IngestError, IngestLimits, extract_document, is_supported,
+                                summarise_text)
+from homeoclinic.render_cache import RenderCache
+
+W = 'xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main"'
+
+
+def make_pdf(pages):
+    """A minimal PDF with one line of Helvetica text per page"""
+    count = len(pages)
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>",
+               f"<< /Type /Pages /Kids [{' '.join(f'{4 + 2 * i} 0 R' for i in range(count))}] /Count {count} >>",
+               "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    for i, text in enumerate(pages):
+        stream = f"BT /F1 12 Tf 72 720 Td ({text}) Tj ET"
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+                       f"/Resources << /Font << /F1 3 0 R >> >> /Contents {5 + 2 * i} 0 R >>")
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+    out, offsets = io.BytesIO(), []
+    out.write(b"%PDF-1.4\n")
+    for number, body in enumerate(objects, 1):
+        offsets.append(out.tell())
+        out.write(f"{number} 0 obj\n{body}\nendobj\n".encode("latin-1"))
+    xref = out.tell()
+    out.write(f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode())
+    for offset in offsets:
+        out.write(f"{offset:010d} 00000 n \n".encode())
+    out.write(f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode())
+    return out.getvalue()
+
+
+def make_docx(paragraphs):
+    """document.xml only; None stands for a paragraph holding a page break"""
+    body = []
+    for text in paragraphs:
+        if text is None:
+            body.append('<w:p><w:r><w:br w:type="page"/></w:r></w:p>')
+        else:
+            body.append(f"<w:p><w:r><w:t>{text}</w:t></w:r></w:p>")
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        archive.writestr("word/document.xml", f'<w:document {W}><w:body>{"".join(body)}</w:body></w:document>')
+    return buffer.getvalue()
+
+
+def test_pdf_pages():
+    document = extract_document("labs.pdf", make_pdf(["Haemoglobin 10.2 L", "Ferritin 8 L"]))
+    assert document.page_count == 2
+    assert "Haemoglobin 10.2" in document.pages[0] and "Ferritin 8" in document.pages[1]
+
+
+def test_docx_splits_at_page_breaks():
+    document = extract_document("letter.docx", make_docx(["Dear colleague,", "Chronic eczema.", None, "Page two"]))
+    assert document.pages == ["Dear colleague,\nChronic eczema.", "Page two"]
+
+
+def test_rtf_strips_control_words_and_keeps_unicode():
+    rtf = (rb"{\rtf1\ansi{\fonttbl{\f0 Arial;}}{\*\generator Word;}\f0 Caf\'e9 \b bold\b0\par"
+           rb" Na\u239?ve\page Second page}")
+    document = extract_document("note.rtf", rtf)
+    assert document.pages == ["Café bold\nNaïve", "Second page"]
+
+
+def test_txt_blocks_and_unsupported_types():
+    document = extract_document("notes.txt", "First page\fSecond page".encode("cp1252"))
+    assert document.pages == ["First page", "Second page"]
+    assert not is_supported("scan.tiff")
+    with pytest.raises(IngestError, match="unsupported"):
+        extract_document("scan.tiff", b"II*\x00")
+    with pytest.raises(IngestError, match="could not be read"):
+        extract_document("broken.docx", b"not a zip")
+
+
+def test_size_and_page_limits():
+    with pytest.raises(IngestError, match="exceeds"):
+        extract_document("big.txt", b"x" * 2048, IngestLimits(max_bytes=1024))
+    document = extract_document("long.txt", "\f".join(f"page {i}" for i in range(5)).encode(),
+                                IngestLimits(max_pages=2))
+    assert document.pages == ["page 0", "page 1"] and document.truncated
+
+
+def test_ingestor_caches_by_content_and_page_limit(tmp_path):
+    data = make_docx(["Thyroid panel", "TSH 6.1 (H)"])
+    ingestor = DocumentIngestor(cache=RenderCache(disk_dir=str(tmp_path)), limits=IngestLimits(max_bytes=10_000))
+    [(_, first, error)] = ingestor.ingest([("panel.docx", data)])
+    assert error is None and ingestor.stats == {'cached': 0, 'inline': 1, 'pooled': 0, 'rejected': 0}
+
+    # Same bytes under another name come from the cache, renamed
+    [(name, again, _)] = ingestor.ingest([("copy.docx", data)])
+    [(_, _, too_big)] = ingestor.ingest([("huge.txt", b"x" * 20_000)])
+    assert (name, again.name, again.pages) == ("copy.docx", "copy.docx", first.pages)
+    assert "exceeds" in too_big and ingestor.stats['cached'] == 1 and ingestor.stats['rejected'] == 1
+
+    # A different page limit is a different cache entry
+    ingestor.limits = IngestLimits(max_bytes=10_000, max_pages=1)
+    [(_, truncated, _)] = ingestor.ingest([("panel.docx", data)])
+    assert truncated.pages == ["Thyroid panel\nTSH 6.1 (H)"] and ingestor.stats['inline'] == 2
+    ingestor.close()
+
+
+def test_summary_prefers_flagged_lines_not_units():
+    report = "\n".join([
+        "Patient seen in outpatient clinic for review today",
+        "Sodium 140 mmol/L (135-145)",
+        "Potassium 4.1 mmol/L (3.5-5.0)",
+        "Ferritin 8 L (15-150 ng/mL)",
+        "Impression: iron deficiency",
+    ])
+    summary = summarise_text(report, max_chars=60)
+    assert summary == "Ferritin 8 L (15-150 ng/mL) Impression: iron deficiency"
+    # With room for everything the document order is kept
+    assert summarise_text(report, max_chars=1000).startswith("Patient seen")
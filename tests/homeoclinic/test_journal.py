@@ -0,0 +1,41 @@
+"""Message journal: appends, rewinds and recovery from a crash mid-append."""
+from homeoclinic.journal import MessageJournal
+
+
+def messages(n):
+    return [{"role": "user" if i % 2 == 0 else "assistant", "content": f"message {i}"} for i in range(n)]
+
+
+def test_only_new_messages_are_appended_and_rewinds_are_replayed(tmp_path):
+    journal = MessageJournal(str(tmp_path))
+    assert journal.read("s1") is None
+    first = journal.sync("s1", messages(2))
+    assert journal.sync("s1", messages(2)) == 0
+    assert 0 < journal.sync("s1", messages(3)) < first
+    journal.sync("s1", messages(1))
+    assert journal.read("s1") == messages(1)
+    journal.compact("s1")
+    assert journal.read("s1") == messages(1) and MessageJournal(str(tmp_path)).length("s1") == 1
+
+
+def test_appends_after_a_torn_tail_are_kept(tmp_path):
+    journal = MessageJournal(str(tmp_path))
+    journal.sync("s1", messages(3))
+    with open(journal._path("s1"), "ab") as f:
+        f.write(b'{"seq": 3, "message": {"role": "assis')
+
+    # A restarted process drops the torn record and keeps appending
+    restarted = MessageJournal(str(tmp_path))
+    restarted.sync("s1", messages(4))
+    restarted.sync("s1", messages(5))
+    assert restarted.read("s1") == messages(5)
+    assert MessageJournal(str(tmp_path)).read("s1") == messages(5)
+
+
+def test_a_bad_line_in_the_middle_is_skipped(tmp_path):
+    journal = MessageJournal(str(tmp_path))
+    journal.sync("s1", messages(2))
+    with open(journal._path("s1"), "ab") as f:
+        f.write(b'not json\n')
+    journal.sync("s1", messages(4))
+    assert MessageJournal(str(tmp_path)).read("s1") == messages(4)
@@ -0,0 +1,74 @@
+"""The PDF process pool: single renders, batch progress, partial failures and the batch outputs."""
+import io
+import zipfile
+
+import pytest
+from PyPDF2 import PdfReader, PdfWriter
+
+from homeoclinic.pdf_service import BatchJob, PDFRenderService, prescription_filename
+
+
+def fake_render(prescription):
+    """Stands in for WeasyPrint: one blank page per remedy"""
+    if prescription.get("fail"):
+        raise ValueError("layout overflow")
+    writer = PdfWriter()
+    for _ in prescription["remedies"]:
+        writer.add_blank_page(width=595, height=842)
+    buffer = io.BytesIO()
+    writer.write(buffer)
+    return buffer.getvalue()
+
+
+def prescription(i, remedies=1, **fields):
+    return dict({"date": f"2026-03-{1 + i:02d}T10:00:00",
+                 "remedies": [{"medicine": "Nux vomica", "potency": "30C"}] * remedies}, **fields)
+
+
+@pytest.fixture(scope="module")
+def service():
+    # Workers are spawned, so the render function must be importable by name
+    service = PDFRenderService(max_workers=2, render_fn=fake_render)
+    yield service
+    service.close()
+
+
+def test_prescription_filename_is_safe_and_ordered():
+    assert prescription_filename(prescription(0), 0) == "0001_2026-03-01T10-00-00_Nux_vomica.pdf"
+    named = prescription(1, patient_name="Anna / O'Brien")
+    assert prescription_filename(named, 11) == "0012_2026-03-02T10-00-00_Anna_O_Brien.pdf"
+    assert prescription_filename({}, 2) == "0003_undated_prescription.pdf"
+
+
+def test_single_render_runs_on_the_pool(service):
+    assert len(PdfReader(io.BytesIO(service.render(prescription(0, remedies=2), timeout=60))).pages) == 2
+    with pytest.raises(ValueError, match="layout overflow"):
+        service.render(prescription(0, fail=True), timeout=60)
+
+
+def test_zip_batch_keeps_rendered_files_and_reports_failures(service):
+    batch = [prescription(0), prescription(1, fail=True), prescription(2)]
+    job = service.submit_batch(batch)
+    archive = zipfile.ZipFile(io.BytesIO(job.result(timeout=60)))
+    names = [prescription_filename(p, i) for i, p in enumerate(batch)]
+    assert archive.namelist() == [names[0], names[2]]
+    assert job.errors == {names[1]: "ValueError: layout overflow"}
+    assert job.done() and job.completed == 3 and job.fraction == 1.0
+
+
+def test_pdf_batch_combines_pages_in_order(service):
+    job = service.submit_batch([prescription(0, remedies=1), prescription(1, remedies=3)], output="pdf",
+                               names=["first.pdf", "second.pdf"])
+    assert len(PdfReader(io.BytesIO(job.result(timeout=60))).pages) == 4 and not job.errors
+
+
+def test_empty_failed_and_unknown_batches(service):
+    empty = BatchJob([], "zip")
+    assert empty.done() and empty.fraction == 1.0 and empty.result(timeout=0) is None
+    failed = service.submit_batch([prescription(0, fail=True)])
+    assert failed.result(timeout=60) is None and len(failed.errors) == 1
+    with pytest.raises(ValueError, match="Unknown batch output"):
+        service.submit_batch([prescription(0)], output="tar")
+    pending = BatchJob(["waiting.pdf"], "zip")
+    with pytest.raises(TimeoutError, match="0/1"):
+        pending.result(timeout=0)
@@ -0,0 +1,132 @@
+"""Corpus, fuzz and timing tests for prescription JSON extraction."""
+import json
+import os
+import random
+import re
+import time
+
+import pytest
+
+from homeoclinic.fakes import SAMPLE_PRESCRIPTION
+from homeoclinic.prescription_json import (
+    PRESCRIPTION_MARKER, Prescription, PrescriptionSchemaError, extract_prescription, repair_json,
+)
+from homeoclinic.streaming import StreamAccumulator
+
+CORPUS_PATH = os.path.join(os.path.dirname(__file__), "data", "prescription_replies.json")
+with open(CORPUS_PATH, encoding="utf-8") as f:
+    CORPUS = json.load(f)
+
+NOISE = '{}[]",\'“”`\\:\n abc0'
+
+
+def first_medicine(prescription):
+    return prescription["remedies"][0]["medicine"] if prescription else None
+
+
+def stream(reply, rng):
+    accumulator = StreamAccumulator()
+    i = 0
+    while i < len(reply):
+        step = rng.randint(1, 40)
+        accumulator.feed(reply[i:i + step])
+        i += step
+    accumulator.finish()
+    return accumulator
+
+
+@pytest.mark.parametrize("case", CORPUS, ids=[c["name"] for c in CORPUS])
+def test_corpus(case):
+    result = extract_prescription(case["reply"])
+    expected = case["expected"]
+    if expected is None:
+        assert result.prescription is None
+        assert result.errors
+    else:
+        assert first_medicine(result.prescription) == expected["medicine"]
+        assert result.repaired == expected["repaired"]
+
+
+@pytest.mark.parametrize("case", CORPUS, ids=[c["name"] for c in CORPUS])
+def test_streaming_matches_full_reply(case):
+    rng = random.Random(case["name"])
+    for _ in range(5):
+        accumulator = stream(case["reply"], rng)
+        assert accumulator.prescription == extract_prescription(case["reply"]).prescription
+
+
+def test_fuzzed_replies_never_raise():
+    rng = random.Random(1234)
+    for _ in range(400):
+        reply = list(rng.choice(CORPUS)["reply"])
+        for _ in range(rng.randint(1, 8)):
+            position = rng.randrange(len(reply) + 1)
+            action = rng.random()
+            if action < 0.4:
+                reply.insert(position, rng.choice(NOISE))
+            elif action < 0.7 and reply:
+                del reply[min(position, len(reply) - 1)]
+            else:
+                del reply[position:]
+        result = extract_prescription("".join(reply))
+        if result.prescription is not None:
+            assert result.prescription["remedies"]
+            assert all(r["medicine"].strip() for r in result.prescription["remedies"])
+
+
+def test_surrounding_prose_and_braces_do_not_matter():
+    rng = random.Random(99)
+    body = json.dumps(SAMPLE_PRESCRIPTION, indent=rng.choice([None, 2]))
+    for _ in range(100):
+        before = "".join(rng.choice("abc {}[]\n.") for _ in range(rng.randint(0, 200)))
+        after = "".join(rng.choice("abc {}[]\n.`") for _ in range(rng.randint(0, 200)))
+        fence = rng.random() < 0.5
+        block = f"```json\n{body}\n```" if fence else body
+        reply = f"{before.replace('`', '')}\n{PRESCRIPTION_MARKER}\n{block}\n{after}"
+        result = extract_prescription(reply)
+        assert first_medicine(result.prescription) == "Belladonna", reply
+
+
+def test_repair_leaves_valid_json_unchanged():
+    rng = random.Random(7)
+    for _ in range(50):
+        value = {"remedies": [{"medicine": "Nux vomica", "notes": "".join(rng.choice('ab"\\{}[],\'’ ') for _ in range(20))}],
+                 "flag": rng.choice([True, False, None]), "count": rng.randint(0, 9)}
+        text = json.dumps(value, ensure_ascii=rng.random() < 0.5)
+        assert json.loads(repair_json(text)) == value
+
+
+def test_schema_coerces_and_rejects():
+    coerced = Prescription.from_dict({
+        "remedies": {"medicine": "Arnica", "potency": 30}, "precautions": "Rest", "custom": 1,
+    }).to_dict()
+    assert coerced["remedies"] == [{"medicine": "Arnica", "potency": "30"}]
+    assert coerced["precautions"] == ["Rest"]
+    assert coerced["custom"] == 1
+    with pytest.raises(PrescriptionSchemaError):
+        Prescription.from_dict({"remedies": [{"potency": "30C"}]})
+
+
+def test_extraction_time_is_linear_in_reply_length():
+    body = f"{PRESCRIPTION_MARKER}\n```json\n{json.dumps(SAMPLE_PRESCRIPTION)}\n```\n"
+
+    def timed(repeat):
+        # Prose full of unbalanced braces on both sides of the JSON
+        reply = "Consider {this " * repeat + body + "{ and [ " * repeat
+        start = time.perf_counter()
+        result = extract_prescription(reply)
+        assert first_medicine(result.prescription) == "Belladonna"
+        return time.perf_counter() - start
+
+    timed(1000)  # warm up
+    small, large = timed(5_000), timed(40_000)
+    # 8x the text should cost roughly 8x the time; a backtracking scan would be far worse
+    assert large < max(small, 0.005) * 30
+
+
+def test_legacy_greedy_regex_fails_where_extractor_succeeds():
+    case = next(c for c in CORPUS if c["name"] == "bare_json_then_braces")
+    legacy = re.search(r'\{[\s\S]*\}', case["reply"]).group()
+    with pytest.raises(ValueError):
+        json.loads(legacy)
+    assert first_medicine(extract_prescription(case["reply"]).prescription) == "Belladonna"
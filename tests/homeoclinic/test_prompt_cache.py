@@ -0,0 +1,107 @@
+"""Prompt-prefix caching: versioning, context-cache use and the local fallback."""
+from homeoclinic.context_window import ContextWindow
+from homeoclinic.fakes import FakeStreamingModel
+from homeoclinic.prompt_cache import PromptPrefixCache, prefix_key
+
+PROMPT = "You are a careful homeopath. " * 200
+ACK = "Understood."
+MESSAGES = [{"role": "user", "content": "Headache"}, {"role": "assistant", "content": "Since when?"},
+            {"role": "user", "content": "Two days"}]
+
+
+class FakeContextCache:
+    def __init__(self, fail=False, tokens=1234):
+        self.fail = fail
+        self.tokens = tokens
+        self.created = []
+        self.extended = 0
+        self.model = FakeStreamingModel(first_token_delay=0)
+
+    def create(self, model_name, display_name, history, ttl):
+        if self.fail:
+            raise RuntimeError("model does not support caching")
+        self.created.append((model_name, display_name, history))
+        return object(), self.model, self.tokens
+
+    def extend(self, cached, ttl):
+        self.extended += 1
+
+
+class Usage:
+    def __init__(self, cached_content_token_count=0):
+        self.prompt_token_count = 100
+        self.candidates_token_count = 10
+        self.cached_content_token_count = cached_content_token_count
+
+
+def test_key_changes_with_any_part_of_the_prefix():
+    key = prefix_key("m", PROMPT, ACK)
+    assert key == prefix_key("m", PROMPT, ACK)
+    assert len({key, prefix_key("m2", PROMPT, ACK), prefix_key("m", PROMPT + ".", ACK), prefix_key("m", PROMPT, "")}) == 4
+
+
+def test_context_cache_is_created_once_and_chats_omit_the_prefix():
+    backend = FakeContextCache()
+    cache = PromptPrefixCache("m", PROMPT, ACK, backend=backend)
+    model = FakeStreamingModel(first_token_delay=0)
+    windows = [ContextWindow(PROMPT, ACK, prefix_cache=cache) for _ in range(3)]
+    chats = [window.start_chat(model, MESSAGES) for window in windows]
+
+    assert len(backend.created) == 1 and backend.created[0][1] == f"homeoclinic-prefix-{cache.key}"
+    assert cache.mode == "context-cache" and cache.tokens == 1234
+    assert all(chat.model is backend.model for chat in chats)
+    assert chats[0].history[0]["parts"] == ["Headache"]
+    assert windows[0].history_tokens([]) == 1234
+
+    # Savings come from the reported usage, else from the cached prefix size
+    windows[0].record_turn(MESSAGES, 100, 10, 0.1, cached_tokens=windows[0].cached_tokens(Usage(900)))
+    windows[0].record_turn(MESSAGES, 100, 10, 0.1, cached_tokens=windows[0].cached_tokens(Usage()))
+    assert windows[0].tokens_saved == 900 + 1234
+
+
+def test_fallback_shares_the_prefix_and_counts_tokens_once(tmp_path):
+    path = str(tmp_path / "prefix.json")
+    counted = []
+
+    def count_tokens(history):
+        counted.append(history)
+        return 1500
+
+    backend = FakeContextCache(fail=True)
+    cache = PromptPrefixCache("m", PROMPT, ACK, path=path, backend=backend, count_tokens=count_tokens)
+    model = FakeStreamingModel(first_token_delay=0)
+    window = ContextWindow(PROMPT, ACK, prefix_cache=cache)
+    chat = window.start_chat(model, MESSAGES)
+    window.start_chat(model, MESSAGES)
+
+    assert cache.mode == "local" and cache.stats["context_cache_failures"] == 1
+    assert "does not support caching" in cache.last_error
+    assert chat.model is model and chat.history[0] is cache.history[0]
+    assert window.cached_tokens(Usage()) == 0
+    assert window.history_tokens([]) == 1500
+
+    # A new process reads the measured count from disk; an edited prompt is measured again
+    assert PromptPrefixCache("m", PROMPT, ACK, path=path, count_tokens=count_tokens).tokens == 1500
+    assert len(counted) == 1
+    PromptPrefixCache("m", PROMPT + " Be brief.", ACK, path=path, count_tokens=count_tokens).tokens
+    assert len(counted) == 2
+
+
+def test_failed_context_cache_is_retried_later_and_refreshed():
+    backend = FakeContextCache(fail=True)
+    cache = PromptPrefixCache("m", PROMPT, ACK, backend=backend, ttl=100, retry_after=0)
+    model = FakeStreamingModel(first_token_delay=0)
+    assert cache.start_chat(model, ContextWindow(PROMPT, ACK).build_history([]))[1] is False
+    backend.fail = False
+    assert cache.start_chat(model, ContextWindow(PROMPT, ACK).build_history([]))[1] is True
+
+    cache._expires_at -= 60
+    cache.keep_alive()
+    assert backend.extended == 1 and len(backend.created) == 1
+
+
+def test_other_histories_are_passed_through():
+    cache = PromptPrefixCache("m", PROMPT, ACK, backend=FakeContextCache())
+    model = FakeStreamingModel(first_token_delay=0)
+    chat, cached = cache.start_chat(model, [{"role": "user", "parts": ["different"]}])
+    assert not cached and chat.model is model and cache.stats["chats"] == 0
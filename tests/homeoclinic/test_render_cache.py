@@ -0,0 +1,67 @@
+"""The rendered-output cache: memory LRU, the disk tier and its size bound."""
+import os
+import time
+
+from homeoclinic.render_cache import RenderCache, prescription_key
+
+
+class Renderer:
+    """Render callback that counts its calls"""
+
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, name, size=10):
+        def render():
+            self.calls.append(name)
+            return name.encode() * size
+        return render
+
+
+def test_prescription_key_ignores_key_order():
+    first = {"remedies": [{"medicine": "Arnica", "potency": "30C"}], "date": "2026-03-01"}
+    second = {"date": "2026-03-01", "remedies": [{"potency": "30C", "medicine": "Arnica"}]}
+    assert prescription_key(first) == prescription_key(second)
+    assert prescription_key(first) != prescription_key(dict(first, date="2026-03-02"))
+
+
+def test_memory_tier_evicts_the_least_recently_used_entry():
+    cache, render = RenderCache(max_entries=2), Renderer()
+    cache.get_or_render("a", "pdf", render("a"))
+    cache.get_or_render("b", "pdf", render("b"))
+    assert cache.get("a", "pdf") == b"a" * 10  # a is now the most recent
+    cache.get_or_render("c", "pdf", render("c"))
+    assert cache.get("b", "pdf") is None and cache.get("a", "pdf") is not None
+    # The format is part of the key
+    cache.get_or_render("a", "html", render("a"))
+    assert render.calls == ["a", "b", "c", "a"]
+    assert cache.stats == {'hits': 2, 'disk_hits': 0, 'misses': 4}
+
+
+def test_disk_tier_survives_restarts_and_keeps_text_as_text(tmp_path):
+    render = Renderer()
+    cache = RenderCache(disk_dir=str(tmp_path))
+    cache.get_or_render("k", "pdf", render("k"))
+    cache.get_or_render("k", "html", lambda: "<p>Arnica 30C – ünïcode</p>")
+
+    restarted = RenderCache(disk_dir=str(tmp_path))
+    assert restarted.get_or_render("k", "pdf", render("k")) == b"k" * 10
+    assert restarted.get("k", "html") == "<p>Arnica 30C – ünïcode</p>"
+    assert render.calls == ["k"] and restarted.stats == {'hits': 0, 'disk_hits': 2, 'misses': 0}
+    # Disk hits are promoted to memory
+    assert restarted.get("k", "pdf") is not None and restarted.stats['hits'] == 1
+
+
+def test_disk_tier_is_trimmed_least_recently_used_first(tmp_path):
+    cache, render = RenderCache(max_entries=1, disk_dir=str(tmp_path), max_disk_bytes=250), Renderer()
+    for name in "abc":
+        cache.get_or_render(name, "pdf", render(name, size=100))
+        time.sleep(0.01)  # distinct modification times for the LRU order
+    assert sorted(os.listdir(tmp_path)) == ["b.pdf.bin", "c.pdf.bin"]
+
+    # Reading b from disk refreshes it, so c is the next to go
+    assert cache.get("b", "pdf") is not None and cache.stats['disk_hits'] == 1
+    time.sleep(0.01)
+    cache.get_or_render("d", "pdf", render("d", size=100))
+    assert sorted(os.listdir(tmp_path)) == ["b.pdf.bin", "d.pdf.bin"]
+    assert sum(entry.stat().st_size for entry in os.scandir(tmp_path)) <= 250
@@ -0,0 +1,71 @@
+"""Repertorization: rarity weighting, deterministic ranking and the repertory file format."""
+import math
+
+import pytest
+
+pytest.importorskip("scipy")
+
+from homeoclinic.repertory import Repertory, load_repertory_file  # noqa: E402
+from homeoclinic.symptoms import SymptomExtractor  # noqa: E402
+
+REPERTORY = """\
+# rubric\tchapter\tremedies
+fever\tFever\tBelladonna:3|Aconite:2|Bryonia:1|Gelsemium:2
+thirstless\tStomach\tGelsemium:3|Pulsatilla:3
+worse from motion\tGeneralities\tBryonia:3
+Fever\tFever\tBryonia:2
+"""
+
+
+@pytest.fixture
+def repertory(tmp_path):
+    path = tmp_path / "repertory.tsv"
+    path.write_text(REPERTORY, encoding="utf-8")
+    return Repertory.from_file(str(path))
+
+
+def test_scores_weight_grades_by_rarity(repertory):
+    assert repertory.shape == (3, 5)
+    fever, thirstless, motion = (math.log1p(5 / n) for n in (4, 2, 1))
+    shortlist = repertory.shortlist({"Fever": 1, "thirstless": 2, "unknown": 1}, k=10)
+    assert shortlist.rubrics == ["fever", "thirstless"] and shortlist.unmatched == ["unknown"]
+    scores = {r.remedy: r.score for r in shortlist.remedies}
+    assert scores["Gelsemium"] == pytest.approx(2 * fever + 2 * 3 * thirstless, abs=0.01)
+    # The duplicate 'Fever' line keeps Bryonia's higher grade
+    assert scores["Bryonia"] == pytest.approx(2 * fever, abs=0.01)
+    assert [r.remedy for r in shortlist.remedies] == ["Gelsemium", "Pulsatilla", "Belladonna", "Aconite", "Bryonia"]
+    assert shortlist.remedies[0].rubrics_covered == 2 and shortlist.remedies[0].grade_total == 5
+    assert "Bryonia" not in {r.remedy for r in repertory.shortlist({"thirstless": 1}).remedies}
+
+
+def test_a_rare_rubric_outweighs_a_common_one(repertory):
+    ranked = repertory.shortlist({"fever": 1, "worse from motion": 1}, k=1).remedies
+    assert ranked[0].remedy == "Bryonia" and ranked[0].rubrics_covered == 2
+
+
+def test_ties_break_deterministically(repertory):
+    first = repertory.shortlist({"thirstless": 1}, k=1).remedies
+    assert [r.remedy for r in first] == ["Gelsemium"]
+    assert repertory.shortlist({"nothing here": 1}).remedies == []
+
+
+def test_prompt_block(repertory):
+    prompt = repertory.shortlist({"fever": 1, "thirstless": 1}, k=2).to_prompt()
+    assert prompt.splitlines()[0] == "[Local repertorization of 2 rubric(s): fever, thirstless]"
+    assert "Gelsemium" in prompt and "(2/2)" in prompt
+
+
+def test_sample_rubrics_match_the_symptom_vocabulary():
+    repertory = Repertory.from_file()
+    terms = {m.term for m in SymptomExtractor.from_file().extract(
+        "Throbbing headache, red face and fever since the sun this afternoon")}
+    shortlist = repertory.shortlist({term: 1 for term in terms}, k=3)
+    assert not shortlist.unmatched
+    assert shortlist.remedies[0].remedy == "Belladonna"
+
+
+def test_bad_lines_are_reported(tmp_path):
+    path = tmp_path / "repertory.tsv"
+    path.write_text("fever\tFever\tBelladonna:9\n", encoding="utf-8")
+    with pytest.raises(ValueError, match=":1: bad remedy entry"):
+        load_repertory_file(str(path))
@@ -0,0 +1,59 @@
+"""Trigger-maintained totals and the recent-sessions index."""
+import json
+import sqlite3
+
+from homeoclinic.storage import SQLiteStorage
+
+
+def test_totals_follow_inserts_updates_and_clear(storage, make_session):
+    assert storage.stats() == {"sessions": 0, "consultations": 0, "messages": 0}
+    for i in range(6):
+        storage.save_session(make_session(i, f"2026-01-{i + 1:02d}T10:00:00", 2 * i))
+    storage.save_session(make_session(2, "2026-02-01T10:00:00", 20))  # update: 4 -> 20 messages
+    for i in range(3):
+        storage.save_consultation({"session_id": f"s{i}", "date": f"2026-01-0{i + 1}"})
+    assert storage.stats() == {"sessions": 6, "consultations": 3, "messages": 0 + 2 + 20 + 6 + 8 + 10}
+    storage.clear()
+    assert storage.stats() == {"sessions": 0, "consultations": 0, "messages": 0}
+
+
+def test_recent_sessions_are_newest_first(storage, make_session):
+    for i in range(15):
+        storage.save_session(make_session(i, f"2026-01-{i + 1:02d}T10:00:00", i))
+    storage.save_session(make_session(3, "2026-03-01T10:00:00", 7))
+    recent = storage.recent_sessions(4)
+    assert [(s.session_id, s.message_count) for s in recent] == [("s3", 7), ("s14", 14), ("s13", 13), ("s12", 12)]
+
+
+def test_totals_are_seeded_for_existing_databases(tmp_path, make_session):
+    path = str(tmp_path / "clinic.db")
+    conn = sqlite3.connect(path)
+    conn.executescript("""
+        CREATE TABLE sessions (session_id TEXT PRIMARY KEY, last_updated TEXT,
+            message_count INTEGER NOT NULL DEFAULT 0, data TEXT NOT NULL);
+        CREATE INDEX idx_sessions_last_updated ON sessions(last_updated);
+        CREATE TABLE consultations (id INTEGER PRIMARY KEY AUTOINCREMENT, session_id TEXT NOT NULL,
+            date TEXT NOT NULL, chief_complaint TEXT, diagnosis TEXT, data TEXT NOT NULL);
+    """)
+    for i in range(4):
+        conn.execute("INSERT INTO sessions VALUES (?, ?, ?, ?)",
+                     (f"s{i}", f"2026-01-0{i + 1}", 3, json.dumps(make_session(i, f"2026-01-0{i + 1}", 3))))
+    conn.execute("INSERT INTO consultations (session_id, date, data) VALUES ('s0', '2026-01-01', '{}')")
+    conn.commit()
+    conn.close()
+
+    storage = SQLiteStorage(path)
+    assert storage.stats() == {"sessions": 4, "consultations": 1, "messages": 12}
+    indexes = {row[0] for row in storage._conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+    assert "idx_sessions_recent" in indexes and "idx_sessions_last_updated" not in indexes
+    storage.save_session(make_session(9, "2026-02-01", 5))
+    assert storage.stats()["messages"] == 17
+    storage.close()
+
+
+def test_session_summaries_only_return_stored_sessions(storage, make_session):
+    storage.save_session(make_session(1, "2026-01-01T10:00:00", 4))
+    storage.save_session(make_session(2, "2026-01-02T10:00:00", 6))
+    summaries = storage.session_summaries(["s2", "missing"])
+    assert list(summaries) == ["s2"] and summaries["s2"].message_count == 6
+    assert storage.session_summaries([]) == {}
@@ -0,0 +1,77 @@
+"""Symptom extraction: whole-word matching, longest match, negation and session bookkeeping."""
+import pytest
+
+from homeoclinic.symptoms import (SymptomExtractor, TermAutomaton, VocabularyEntry, load_vocabulary,
+                                  record_mentions)
+
+
+@pytest.fixture(scope="module")
+def extractor():
+    return SymptomExtractor.from_file()
+
+
+def found(extractor, text):
+    return [(m.term, m.negated) for m in extractor.extract(text)]
+
+
+def test_terms_match_whole_words_only(extractor):
+    entries = [VocabularyEntry("sore", "Generalities", ()), VocabularyEntry("itch", "Skin", ())]
+    small = SymptomExtractor(entries)
+    assert found(small, "Pressure behind the eyes, a twitch in the lid") == []
+    assert found(small, "A sore spot that itches") == [("sore", False), ("itch", False)]
+
+
+def test_longest_match_wins_and_synonyms_map_to_canonical(extractor):
+    mentions = extractor.extract("Sore throat and head pains; also very dizzy.")
+    assert [(m.term, m.category, m.text) for m in mentions] == [
+        ("sore throat", "Throat", "Sore throat"), ("headache", "Head", "head pains"), ("vertigo", "Vertigo", "dizzy")]
+    text = "Sore throat and head pains"
+    assert [text[m.start:m.end] for m in mentions[:2]] == ["Sore throat", "head pains"]
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("No fever, cough or cold but terrible headaches.", [("fever", True), ("cough", True), ("cold", True),
+                                                        ("headache", False)]),
+    ("Denies nausea. Vomiting twice today", [("nausea", True), ("vomiting", False)]),
+    ("I don’t have any back pain", [("back pain", True)]),
+    ("The headache is gone now", [("headache", True)]),
+    ("The headache is not gone yet", [("headache", False)]),
+    ("Nausea hasn't resolved", [("nausea", False)]),
+    ("Not only headache, nausea too", [("headache", False), ("nausea", False)]),
+    ("Can't sleep at night", [("insomnia", False)]),
+])
+def test_negation(extractor, text, expected):
+    assert found(extractor, text) == expected
+
+
+def test_record_mentions_deduplicates_and_tracks_status(extractor):
+    collected, findings = ["pain"], {}
+    added = record_mentions(extractor.extract("Headache and pain, no fever"), collected, findings, "t1")
+    assert added == ["headache"] and collected == ["pain", "headache"]
+    assert findings["fever"]["status"] == "absent" and "fever" not in collected
+
+    record_mentions(extractor.extract("Headaches again, and now a fever"), collected, findings, "t2")
+    assert collected == ["pain", "headache", "fever"]
+    assert findings["headache"] == {"category": "Head", "status": "present", "mentions": 2,
+                                    "phrases": ["headache", "headaches"], "first_reported": "t1",
+                                    "last_reported": "t2"}
+    assert findings["fever"]["status"] == "present"
+
+
+def test_automaton_reports_overlapping_patterns():
+    automaton = TermAutomaton()
+    for value, pattern in enumerate([["a", "b", "c"], ["b", "c"], ["c"], ["b", "c", "d"]]):
+        automaton.add(pattern, value)
+    assert not automaton.add(["c"], 9)
+    automaton.compile()
+    assert sorted(automaton.find(["a", "b", "c", "d"])) == [(0, 3, 0), (1, 3, 1), (1, 4, 3), (2, 3, 2)]
+
+
+def test_vocabulary_file(tmp_path):
+    path = tmp_path / "vocab.tsv"
+    path.write_text("# comment\n\nfever\tFever\tpyrexia| febrile \nchills\tChill\n", encoding="utf-8")
+    assert list(load_vocabulary(str(path))) == [VocabularyEntry("fever", "Fever", ("pyrexia", "febrile")),
+                                                VocabularyEntry("chills", "Chill", ())]
+    path.write_text("just one column\n", encoding="utf-8")
+    with pytest.raises(ValueError, match=":1:"):
+        list(load_vocabulary(str(path)))
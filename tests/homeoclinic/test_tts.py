@@ -0,0 +1,153 @@
+"""Text-to-speech: chunking, the audio cache, engine fallback and the background prefetcher."""
+import io
+import os
+import threading
+import time
+import wave
+
+from homeoclinic.fakes import FakeTTSEngine
+from homeoclinic.render_cache import RenderCache
+from homeoclinic.tts import TTSPrefetcher, TTSService, clean_text, join_wav, split_sentences
+
+SENTENCES = "The remedy is Belladonna. Take three pills. Repeat at night. Stop when better."
+
+
+class CountingEngine(FakeTTSEngine):
+    """Fake engine that records how many calls overlap"""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.active = 0
+        self.peak = 0
+        self._active_lock = threading.Lock()
+
+    def synthesize(self, text):
+        with self._active_lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        try:
+            return super().synthesize(text)
+        finally:
+            with self._active_lock:
+                self.active -= 1
+
+
+def wait_for(condition, timeout=5.0):
+    # Done callbacks update the stats just after result() returns
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def make_service(engine, chunk_chars=400):
+    # One chunk at a time per message, so only the prefetcher bounds concurrency
+    return TTSService([engine], cache=RenderCache(max_entries=16), max_chunk_chars=chunk_chars, max_workers=1)
+
+
+def frames(audio):
+    with wave.open(io.BytesIO(audio), "rb") as wav:
+        return wav.getnframes()
+
+
+def test_split_sentences_keeps_whole_sentences_within_the_limit():
+    assert split_sentences(SENTENCES, max_chars=45) == [
+        "The remedy is Belladonna. Take three pills.", "Repeat at night. Stop when better."]
+    assert split_sentences("Short one.", max_chars=400) == ["Short one."]
+    # A sentence longer than the limit is split at spaces
+    long = "word " * 30
+    chunks = split_sentences(long.strip(), max_chars=42)
+    assert all(len(chunk) <= 42 for chunk in chunks) and " ".join(chunks) == long.strip()
+    assert clean_text("**Take** `Arnica`\n\n# now") == "Take Arnica now"
+
+
+def test_join_wav_concatenates_frames():
+    engine = FakeTTSEngine(delay_per_char=0)
+    parts = [engine.synthesize("First sentence."), engine.synthesize("Second, longer sentence.")]
+    joined = join_wav(parts)
+    assert frames(joined) == sum(frames(part) for part in parts)
+    with wave.open(io.BytesIO(joined), "rb") as wav:
+        assert (wav.getnchannels(), wav.getframerate()) == (1, 8000)
+
+
+def test_cache_hit_and_miss():
+    engine = FakeTTSEngine(delay_per_char=0)
+    service = make_service(engine, chunk_chars=30)
+    chunks = len(split_sentences(SENTENCES, 30))
+    audio, mime = service.synthesize(SENTENCES)
+    assert mime == "audio/wav" and chunks > 1 and engine.calls == chunks
+    # Markdown and spacing do not change the cache key
+    assert service.synthesize(f"**{SENTENCES}**  ") == (audio, mime)
+    assert engine.calls == chunks and service.metrics.requests == 2 and service.metrics.hit_rate == 0.5
+    assert service.synthesize("   ") is None
+
+
+def test_disk_tier_is_trimmed_to_its_size_bound(tmp_path):
+    engine = FakeTTSEngine(delay_per_char=0)
+    one_reply = len(engine.synthesize("Reply number 0."))
+    cache = RenderCache(max_entries=1, disk_dir=str(tmp_path), max_disk_bytes=2 * one_reply)
+    service = TTSService([engine], cache=cache)
+    for i in range(4):
+        service.synthesize(f"Reply number {i}.")
+        time.sleep(0.01)  # distinct modification times for the LRU order
+    assert sum(entry.stat().st_size for entry in os.scandir(tmp_path)) <= 2 * one_reply
+    calls = engine.calls
+    assert service.synthesize("Reply number 3.") is not None and engine.calls == calls
+    # The oldest reply was evicted from both tiers and is synthesized again
+    assert service.synthesize("Reply number 0.") is not None and engine.calls == calls + 1
+
+
+def test_failed_engine_falls_back_to_the_next_one():
+    broken, spare = FakeTTSEngine(delay_per_char=0, fail_on="pills"), FakeTTSEngine(delay_per_char=0)
+    spare.name = "spare"
+    service = TTSService([broken, spare], cache=RenderCache(max_entries=8), max_chunk_chars=30)
+    audio, _ = service.synthesize(SENTENCES)
+    assert spare.calls == len(split_sentences(SENTENCES, 30)) and frames(audio) > 0
+    # The partial result of the failed engine was not cached under its name
+    assert service.cache.get(service.cache_key(broken, SENTENCES), "wav") is None
+    assert service.cached(SENTENCES) == (audio, "audio/wav")
+
+    failing = TTSService([FakeTTSEngine(delay_per_char=0, fail_on="e")])
+    assert failing.synthesize(SENTENCES) is None and failing.metrics.failures == 1
+
+
+def test_sessions_share_a_prefetch_and_one_cancel_does_not_kill_it():
+    service = make_service(FakeTTSEngine(delay_per_char=0.002))
+    prefetcher = TTSPrefetcher(service, max_concurrent=1)
+    first = prefetcher.prefetch("session-a", SENTENCES)
+    assert prefetcher.prefetch("session-b", SENTENCES) is first and prefetcher.stats['submitted'] == 1
+
+    assert prefetcher.cancel("session-a") == 0
+    assert first.result(timeout=10) is not None and service.cached(SENTENCES) is not None
+    assert wait_for(lambda: prefetcher.stats == {'submitted': 1, 'completed': 1, 'cancelled': 0, 'skipped': 0})
+    # Cached now: nothing more to prefetch
+    assert prefetcher.prefetch("session-c", SENTENCES) is None and prefetcher.stats['skipped'] == 1
+    prefetcher.close()
+
+
+def test_session_change_cancels_queued_and_running_prefetches():
+    engine = FakeTTSEngine(delay_per_char=0.004)
+    service = make_service(engine, chunk_chars=30)
+    prefetcher = TTSPrefetcher(service, max_concurrent=1)
+    running = prefetcher.prefetch("old", SENTENCES)
+    queued = [prefetcher.prefetch("old", f"Reply {i}. {SENTENCES}") for i in range(3)]
+    other = prefetcher.prefetch("new", "A reply for the new session.")
+    assert wait_for(lambda: engine.calls == 1)
+
+    assert prefetcher.cancel("old") == 4
+    assert all(future.cancelled() for future in queued)
+    # The running job stops before its next chunk and caches nothing
+    assert running.result(timeout=10) is None and service.cached(SENTENCES) is None
+    assert engine.calls < 4
+    assert other.result(timeout=10) is not None
+    assert wait_for(lambda: prefetcher.stats['cancelled'] == 4) and prefetcher.in_flight(SENTENCES) is None
+    prefetcher.close()
+
+
+def test_prefetches_run_at_most_max_concurrent_at_once():
+    engine = CountingEngine(delay_per_char=0.002)
+    prefetcher = TTSPrefetcher(make_service(engine), max_concurrent=2)
+    futures = [prefetcher.prefetch(f"s{i}", f"Reply number {i} about the remedy.") for i in range(8)]
+    assert all(future.result(timeout=10) is not None for future in futures)
+    assert engine.peak == 2 and wait_for(lambda: prefetcher.stats['completed'] == 8)
+    prefetcher.close()
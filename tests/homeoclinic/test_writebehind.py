@@ -0,0 +1,93 @@
+"""Write-behind queue: coalescing, flushes, discards during a write and failing backends."""
+import threading
+import time
+
+from homeoclinic.writebehind import WriteBehindQueue
+
+
+class Backend:
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.writes = []
+        self.entered = threading.Event()
+        self.release = threading.Event()
+        self.release.set()
+
+    def write(self, key, payload):
+        self.entered.set()
+        self.release.wait(5)
+        if self.fail:
+            raise OSError("disk full")
+        self.writes.append((key, payload))
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_saves_within_the_debounce_window_coalesce():
+    backend = Backend()
+    queue = WriteBehindQueue(backend.write, delay=0.2)
+    for turn in range(3):
+        queue.submit("s1", turn)
+    queue.submit("s2", "x")
+    assert queue.pending("s1") == 2
+    assert wait_for(lambda: len(backend.writes) == 2)
+    assert sorted(backend.writes) == [("s1", 2), ("s2", "x")]
+    assert queue.pending("s1") is None
+    queue.close()
+
+
+def test_flush_writes_immediately():
+    backend = Backend()
+    queue = WriteBehindQueue(backend.write, delay=30)
+    queue.submit("s1", 1)
+    queue.flush()
+    assert backend.writes == [("s1", 1)] and queue.stats['flushed'] == 1
+    queue.close()
+
+
+def test_discard_waits_for_the_write_in_progress():
+    backend = Backend()
+    backend.release.clear()
+    queue = WriteBehindQueue(backend.write, delay=30)
+    queue.submit("s1", 1)
+    flusher = threading.Thread(target=queue.flush)
+    flusher.start()
+    assert backend.entered.wait(5)
+    queue.submit("s2", 2)
+
+    discarder = threading.Thread(target=queue.discard)
+    discarder.start()
+    discarder.join(0.2)
+    assert discarder.is_alive()
+    backend.release.set()
+    discarder.join(5)
+    flusher.join(5)
+
+    # Once discard() returns nothing older can be written any more
+    assert backend.writes == [("s1", 1)]
+    queue.flush()
+    assert backend.writes == [("s1", 1)] and queue.pending("s2") is None
+    queue.close()
+
+
+def test_failed_writes_back_off_then_go_to_dead_letters(capsys):
+    backend = Backend(fail=True)
+    queue = WriteBehindQueue(backend.write, delay=0.01, max_retries=2, retry_delay=0.05)
+    queue.submit("s1", {"messages": 3})
+    assert wait_for(lambda: queue.stats['dead'] == 1)
+    assert queue.stats['failed'] == 3
+    assert list(queue.dead_letters) == [("s1", {"messages": 3}, "disk full")]
+    assert queue.pending("s1") is None
+    logged = capsys.readouterr().out
+    assert "gave up on s1 after 3 attempts: disk full" in logged and "messages" not in logged
+
+    # A newer write for the key is tried again from scratch
+    backend.fail = False
+    queue.submit("s1", {"messages": 4})
+    assert wait_for(lambda: backend.writes == [("s1", {"messages": 4})])
+    queue.close()